@@ -0,0 +1,336 @@
+import argparse
+import io
+import json
+import math
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+from flagscale.elastic.diagnostic import DiagnosticMatcher
+from flagscale.elastic.heartbeat import read_heartbeat
+from flagscale.elastic.log_collector import LogTailer
+from flagscale.runner.runner_base import JobStatus
+from flagscale.runner.train_metrics import TrainingMetricsParser
+from flagscale.runner.utils import logger
+
+# Fields of a node snapshot that are sent as deltas; "time" and "seq" are always sent.
+_SNAPSHOT_FIELDS = ("status", "num_children", "log_offset", "iteration", "elapsed_ms")
+
+
+def _read_pid(pid_file):
+    try:
+        with open(pid_file, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _process_state(pid):
+    """Return the ps state letter of a process, or "" if it does not exist."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # The state follows the parenthesized command name, which may contain spaces.
+            return f.read().rpartition(")")[2].split()[0]
+    except OSError:
+        pass
+    result = subprocess.run(["ps", "-p", str(pid), "-o", "state="], capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def _count_children(pid):
+    result = subprocess.run(["ps", "-eo", "ppid="], capture_output=True, text=True)
+    return sum(1 for ppid in result.stdout.split() if ppid == str(pid))
+
+
+class NodeAgent:
+    """
+    Lightweight on-node monitor started by the run script of a training node when a
+    collector is configured.
+
+    Every interval it checks the training process from the PID file, counts its child
+    processes, tails the node's `.output` log locally and classifies the new lines with a
+    DiagnosticMatcher. The progress of the node is read from the heartbeat file written by
+    the training processes (see HeartbeatWriter): the latest iteration and the time per
+    iteration between the last two heartbeats of different iterations. Without a heartbeat
+    the latest iteration logged on the node is used instead. Only the fields that changed
+    since the last message are pushed, as one sequence-numbered JSON line, to the
+    StatusCollector on the master, which writes the reports. The first message after
+    (re)connecting carries the full snapshot.
+    """
+
+    def __init__(
+        self,
+        host,
+        node_rank,
+        pid_file,
+        log_file,
+        monitor_dir,
+        collector_addr,
+        heartbeat_file=None,
+        interval=5,
+        startup_timeout=300,
+    ):
+        self.host = host
+        self.node_rank = node_rank
+        self.pid_file = pid_file
+        self.interval = interval
+        self.startup_timeout = startup_timeout
+        self.monitor_dir = monitor_dir
+        self.collector_addr = collector_addr
+        self.heartbeat_file = heartbeat_file
+        self._last_beat = None
+        self._beat_ms = None
+        os.makedirs(monitor_dir, exist_ok=True)
+        state_file = os.path.join(monitor_dir, f".agent_host_{node_rank}_{host}.offset.json")
+        self.tailer = LogTailer("localhost", log_file, state_file)
+        self.matcher = DiagnosticMatcher()
+        # Only the latest iteration is reported
+        self.metrics = TrainingMetricsParser(max_rows=1)
+        self.seq = 0
+        self._sock = None
+        self._last_sent = None
+        self._sent_counts = {}
+
+    def snapshot(self):
+        pid = _read_pid(self.pid_file)
+        status = _process_state(pid) if pid is not None else ""
+        num_children = _count_children(pid) if status not in ("", "Z") else 0
+        new_bytes = io.BytesIO()
+        if self.tailer.poll(new_bytes):
+            text = new_bytes.getvalue().decode("utf-8", errors="replace")
+            self.matcher.feed(text)
+            self.metrics.feed(text)
+        iteration = elapsed_ms = None
+        heartbeat = read_heartbeat(self.heartbeat_file) if self.heartbeat_file else None
+        if heartbeat is not None:
+            iteration, elapsed_ms = self._heartbeat_progress(heartbeat)
+        elif len(self.metrics):
+            iteration = self.metrics.columns["iteration"][-1]
+            elapsed_ms = self.metrics.columns["elapsed_ms"][-1]
+            elapsed_ms = None if math.isnan(elapsed_ms) else elapsed_ms
+        return {
+            "status": status,
+            "num_children": num_children,
+            "log_offset": self.tailer.offset,
+            "iteration": iteration,
+            "elapsed_ms": elapsed_ms,
+        }
+
+    def _heartbeat_progress(self, heartbeat):
+        """Return the iteration of a heartbeat and the time per iteration in ms."""
+        iteration, beat_time = heartbeat
+        if self._last_beat is None or iteration < self._last_beat[0]:
+            # First heartbeat, or the job restarted from a checkpoint
+            self._last_beat, self._beat_ms = heartbeat, None
+        elif iteration > self._last_beat[0]:
+            last_iteration, last_time = self._last_beat
+            self._beat_ms = 1000.0 * (beat_time - last_time) / (iteration - last_iteration)
+            self._last_beat = heartbeat
+        return iteration, self._beat_ms
+
+    def _connect(self):
+        if self._sock is not None:
+            return True
+        host, _, port = self.collector_addr.rpartition(":")
+        try:
+            self._sock = socket.create_connection((host, int(port)), timeout=self.interval)
+            # Resend everything after a reconnect, the collector may have restarted.
+            self._last_sent = None
+            self._sent_counts = {}
+            return True
+        except OSError as e:
+            logger.debug(f"Collector {self.collector_addr} not reachable: {e}")
+            return False
+
+    def build_message(self, snapshot):
+        """Return the delta between the snapshot and the last message that was sent."""
+        self.seq += 1
+        message = {
+            "seq": self.seq,
+            "host": self.host,
+            "node_rank": self.node_rank,
+            "time": time.time(),
+        }
+        if self._last_sent is None:
+            message["full"] = True
+        for field in _SNAPSHOT_FIELDS:
+            if self._last_sent is None or self._last_sent[field] != snapshot[field]:
+                message[field] = snapshot[field]
+        diagnosis = {
+            key: [count, self.matcher.line_numbers[key]]
+            for key, count in self.matcher.counts.items()
+            if self._sent_counts.get(key) != count
+        }
+        if diagnosis:
+            message["diagnosis"] = diagnosis
+        return message
+
+    def push(self, snapshot):
+        if not self._connect():
+            return False
+        message = self.build_message(snapshot)
+        try:
+            self._sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Lost connection to collector {self.collector_addr}: {e}")
+            self._sock.close()
+            self._sock = None
+            return False
+        self._last_sent = snapshot
+        self._sent_counts = dict(self.matcher.counts)
+        return True
+
+    def run(self):
+        start_time = time.time()
+        started = False
+        while True:
+            snapshot = self.snapshot()
+            running = snapshot["status"] not in ("", "Z")
+            started = started or running
+            self.push(snapshot)
+            if started and not running:
+                logger.info(f"Training process on {self.host} exited, stopping agent")
+                break
+            if not started and time.time() - start_time > self.startup_timeout:
+                logger.warning(f"Training process on {self.host} did not start, stopping agent")
+                break
+            time.sleep(self.interval)
+        self.tailer.close()
+        if self._sock is not None:
+            self._sock.close()
+
+
+class _CollectorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning(f"Dropping malformed agent message from {self.client_address}")
+                continue
+            self.server.collector.apply(message)
+
+
+class _CollectorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class StatusCollector:
+    """
+    Master-side endpoint that receives the deltas pushed by the NodeAgents.
+
+    It keeps the latest status, child count, log offset, progress and diagnosis of every
+    node and derives the job status from them, so the master never has to poll the nodes
+    over ssh. Every message is a heartbeat of its node, its arrival time is `last_seen`.
+    Messages carry absolute values, so a lost message is healed by the next change; stale
+    or reordered messages are dropped by sequence number.
+    """
+
+    def __init__(self, port=0, host="0.0.0.0", stale_after=30):
+        self.stale_after = stale_after
+        self.nodes = {}
+        self._lock = threading.Lock()
+        self._server = _CollectorServer((host, port), _CollectorHandler)
+        self._server.collector = self
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Status collector listening on port {self.port}")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def apply(self, message):
+        key = (message["host"], message["node_rank"])
+        with self._lock:
+            node = self.nodes.get(key)
+            if message.get("full") or node is None:
+                node = {"seq": 0, "status": "", "num_children": 0, "log_offset": 0}
+                node["iteration"], node["elapsed_ms"] = None, None
+                node["counts"], node["line_numbers"] = {}, {}
+                self.nodes[key] = node
+            elif message["seq"] <= node["seq"]:
+                return
+            elif message["seq"] != node["seq"] + 1:
+                logger.debug(f"Missed {message['seq'] - node['seq'] - 1} messages from {key}")
+            node["seq"] = message["seq"]
+            node["last_seen"] = time.time()
+            for field in _SNAPSHOT_FIELDS:
+                if field in message:
+                    node[field] = message[field]
+            for signature, (count, line_numbers) in message.get("diagnosis", {}).items():
+                node["counts"][signature] = count
+                node["line_numbers"][signature] = line_numbers
+
+    def get_node(self, host, node_rank):
+        with self._lock:
+            node = self.nodes.get((host, node_rank))
+            return dict(node) if node is not None else None
+
+    def get_job_status(self, hosts):
+        """
+        Derive the job status from the nodes' reports.
+        Args:
+            hosts (list): (host, node_rank) of all nodes of the job.
+        Returns:
+            JobStatus: RUNNING if all nodes run, COMPLETED_OR_IDLE if all nodes reported that
+            their process exited, TRANSITIONAL otherwise (incl. silent or stale nodes).
+            An agent stops pushing once its process exited, so a node whose last report is
+            an exit never goes stale.
+        """
+        now = time.time()
+        results = []
+        for host, node_rank in hosts:
+            node = self.get_node(host, node_rank)
+            if node is None:
+                return JobStatus.TRANSITIONAL
+            exited = node["status"] in ("", "Z")
+            if not exited and now - node["last_seen"] > self.stale_after:
+                return JobStatus.TRANSITIONAL
+            results.append(node["status"])
+        if all(status not in ("", "Z") for status in results):
+            return JobStatus.RUNNING
+        if all(status in ("", "Z") for status in results):
+            return JobStatus.COMPLETED_OR_IDLE
+        return JobStatus.TRANSITIONAL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FlagScale on-node monitoring agent")
+    parser.add_argument("--host", type=str, required=True, help="Host name of this node")
+    parser.add_argument("--node-rank", type=int, required=True, help="Rank of this node")
+    parser.add_argument("--pid-file", type=str, required=True, help="PID file of the job")
+    parser.add_argument("--log-file", type=str, required=True, help="Output log of the job")
+    parser.add_argument("--monitor-dir", type=str, required=True, help="Directory for reports")
+    parser.add_argument("--collector", type=str, required=True, help="Collector address host:port")
+    parser.add_argument(
+        "--heartbeat-file", type=str, default=None, help="Heartbeat file of the training"
+    )
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between reports")
+    args = parser.parse_args()
+
+    NodeAgent(
+        args.host,
+        args.node_rank,
+        args.pid_file,
+        args.log_file,
+        args.monitor_dir,
+        args.collector,
+        heartbeat_file=args.heartbeat_file,
+        interval=args.interval,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import re
 
 from datetime import datetime
 
@@ -18,6 +19,8 @@ error_types = {
     "rendezvous": "RendezvousError: Rendezvous coordination failed between nodes.",
     "connection refused": "ConnectionError: Network connection refused.",
     "connection timeout": "ConnectionTimeout: Network connection timeout.",
+    "connectionrefusederror": "ConnectionRefusedError: A connection was refused.",
+    "distnetworkerror": "DistNetworkError: Connection to the distributed store failed.",
     
     # Import and code errors
     "importerror": "ImportError: Failed to import required modules.",
@@ -27,6 +30,7 @@ error_types = {
     
     # Process errors
     "killed": "ProcessKilled: Training process was killed.",
+    "sigkill": "ProcessKilled: Training process was killed by SIGKILL.",
     "segmentation fault": "SegmentationFault: Process crashed due to memory access error.",
     "core dumped": "CoreDump: Process crashed and dumped core.",
     
@@ -46,7 +50,133 @@ error_types = {
 }
 
 
-def generate_diagnostic_report(config, host, node_rank, log_file, return_content=False):
+# Characters read from a log file per streaming step.
+_CHUNK_SIZE = 1 << 20
+
+# Line numbers remembered per signature; counts are always exact.
+_MAX_LINES_PER_SIGNATURE = 10
+
+
+def _compile_signatures(signatures):
+    """
+    Compile all signatures into one alternation, longest first, so that a match at a
+    position is always the longest signature starting there. Shorter signatures that
+    start at the same position are its prefixes and are credited alongside it.
+    """
+    keys = sorted(signatures, key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(key) for key in keys))
+    prefixes = {
+        key: [other for other in signatures if other != key and key.startswith(other)]
+        for key in signatures
+    }
+    return pattern, prefixes
+
+
+class DiagnosticMatcher:
+    """
+    Streaming, case-insensitive matcher for the signatures in `error_types`.
+
+    Every chunk fed to the matcher is scanned once by a single compiled pattern, and
+    all (also overlapping) signature occurrences are counted together with the line
+    numbers they appear on. Incomplete trailing lines are carried over to the next
+    chunk, so a log can be fed in arbitrary pieces as it grows.
+    """
+
+    def __init__(self, signatures=None):
+        self.signatures = signatures if signatures is not None else error_types
+        self._pattern, self._prefixes = _compile_signatures(self.signatures)
+        self._partial_line = ""
+        self.num_lines = 0
+        self.counts = {}
+        self.line_numbers = {}
+
+    def feed(self, text):
+        """Scan the complete lines of `text`, keeping an unfinished last line for later."""
+        text = self._partial_line + text
+        end = text.rfind("\n") + 1
+        self._partial_line = text[end:]
+        if end:
+            self._scan(text[:end])
+
+    def flush(self):
+        """Scan the pending unfinished line, e.g. at the end of a file."""
+        if self._partial_line:
+            self._scan(self._partial_line + "\n")
+            self._partial_line = ""
+
+    def _scan(self, text):
+        text = text.lower()
+        search = self._pattern.search
+        line_number = self.num_lines + 1
+        last_pos = 0
+        match = search(text)
+        while match:
+            pos = match.start()
+            line_number += text.count("\n", last_pos, pos)
+            last_pos = pos
+            key = match.group()
+            self._record(key, line_number)
+            for prefix in self._prefixes[key]:
+                self._record(prefix, line_number)
+            # Restart right after the match start to also catch overlapping signatures.
+            match = search(text, pos + 1)
+        self.num_lines += text.count("\n")
+
+    def _record(self, key, line_number):
+        self.counts[key] = self.counts.get(key, 0) + 1
+        lines = self.line_numbers.setdefault(key, [])
+        if len(lines) < _MAX_LINES_PER_SIGNATURE and (not lines or lines[-1] != line_number):
+            lines.append(line_number)
+
+    def matched(self):
+        """Return the matched signatures in the order of `signatures`."""
+        return [key for key in self.signatures if key in self.counts]
+
+
+def format_diagnosis(counts, line_numbers, signatures=None):
+    """
+    Format matched signatures as the analysis lines of a diagnostic report.
+    Args:
+        counts (dict): Number of occurrences per signature.
+        line_numbers (dict): Line numbers per signature.
+        signatures (dict): Signature descriptions, `error_types` by default.
+    Returns:
+        str: One "- <description> (count: n, lines: ...)" line per matched signature.
+    """
+    signatures = signatures if signatures is not None else error_types
+    content = ""
+    for key, desc in signatures.items():
+        if counts.get(key):
+            lines = ", ".join(str(line) for line in line_numbers.get(key, []))
+            content += f"- {desc} (count: {counts[key]}, lines: {lines})\n"
+    if not content:
+        content = "- No errors or unknown error detected in logs.\n"
+    return content
+
+
+def write_diagnostic_report(report_file, host, node_rank, counts, line_numbers):
+    """
+    Write the accumulated diagnosis of a host, replacing the previous report.
+    Args:
+        report_file (str): Path of the report, typically `host_<rank>_<host>_diagnostic.txt`.
+        host (str): Hostname or IP.
+        node_rank (int): Node rank.
+        counts (dict): Number of occurrences per signature.
+        line_numbers (dict): Line numbers per signature.
+    """
+    content = f"Diagnostic Report for {host} (node {node_rank})\n"
+    content += f"Generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    content += "Analysis:\n"
+    content += format_diagnosis(counts, line_numbers)
+    tmp_file = report_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(content)
+    os.replace(tmp_file, report_file)
+
+
+def generate_diagnostic_report(
+    config, host, node_rank, log_file, return_content=False, matcher=None
+):
     """
     Generate a diagnostic report from a log file.
     Args:
@@ -55,6 +185,9 @@ def generate_diagnostic_report(config, host, node_rank, log_file, return_content
         node_rank (int): Node rank.
         log_file (str): Path to the log file.
         return_content (bool): If True, return report as string instead of writing to file.
+        matcher (DiagnosticMatcher): Matcher holding the state of previous log chunks of this
+            host. The log file is fed into it and the report covers everything it has seen.
+            If None, only the given log file is analyzed.
     Returns:
         str: Diagnostic report content if return_content=True, else None.
     """
@@ -68,21 +201,22 @@ def generate_diagnostic_report(config, host, node_rank, log_file, return_content
             report_content += "- Log file is empty or does not exist, no analysis possible.\n"
             return report_content if return_content else None
         else:
-            with open(log_file, 'r') as f:
-                log_content = f.read()
-            if not log_content.strip():
+            standalone = matcher is None
+            if standalone:
+                matcher = DiagnosticMatcher()
+            has_content = False
+            with open(log_file, 'r', errors='replace') as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), ""):
+                    has_content = has_content or bool(chunk.strip())
+                    matcher.feed(chunk)
+            if standalone:
+                matcher.flush()
+            if not has_content:
                 report_content += "- Log file is empty, no analysis possible.\n"
             else:
-                matched_errors = []
-                for key, desc in error_types.items():
-                    if key in log_content.lower():
-                        matched_errors.append(desc)
-
-                if matched_errors:
-                    for err in matched_errors:
-                        report_content += f"- {err}\n"
-                else:
-                    report_content += "- No errors or unknown error detected in logs.\n"
+                report_content += format_diagnosis(
+                    matcher.counts, matcher.line_numbers, matcher.signatures
+                )
     except Exception as e:
         logger.error(f"Failed to read log file {log_file} for {host} (node {node_rank}): {e}")
         report_content += f"- Error reading log file: {e}\n"
@@ -0,0 +1,66 @@
+import os
+import time
+
+# Set by the run script of a node that runs a NodeAgent, the training processes inherit it.
+HEARTBEAT_FILE_ENV = "FLAGSCALE_HEARTBEAT_FILE"
+
+
+class HeartbeatWriter:
+    """
+    Record the latest iteration of a training node for its NodeAgent.
+
+    Megatron logs `training_log` on the last rank only, so the log of the other nodes shows
+    no progress. Instead the first local rank of every node writes `<iteration> <time>` to
+    the heartbeat file after each training step. Writes are throttled to one per
+    `min_interval` seconds and replace the file atomically, so the agent never reads a
+    partial line.
+    """
+
+    def __init__(self, path, min_interval=1.0):
+        self.path = path
+        self.min_interval = min_interval
+        self._last_write = None
+
+    def write(self, iteration, now=None):
+        now = time.time() if now is None else now
+        if self._last_write is not None and now - self._last_write < self.min_interval:
+            return
+        tmp_file = self.path + ".tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                f.write(f"{iteration} {now}\n")
+            os.replace(tmp_file, self.path)
+        except OSError:
+            # Monitoring must never fail the training step
+            return
+        self._last_write = now
+
+
+def read_heartbeat(path):
+    """
+    Read a heartbeat file.
+    Returns:
+        tuple: (iteration, time) of the latest heartbeat, or None if there is none yet.
+    """
+    try:
+        with open(path, "r") as f:
+            iteration, beat_time = f.read().split()
+        return int(iteration), float(beat_time)
+    except (OSError, ValueError):
+        return None
+
+
+_writer = None
+
+
+def get_heartbeat_writer():
+    """Return the heartbeat writer of this process, or None if it does not write one."""
+    global _writer
+    if _writer is None:
+        path = os.environ.get(HEARTBEAT_FILE_ENV)
+        # One writer per node, torchrun numbers the ranks of a node by LOCAL_RANK
+        if path and os.environ.get("LOCAL_RANK", "0") == "0":
+            _writer = HeartbeatWriter(path)
+        else:
+            _writer = False
+    return _writer or None
@@ -1,16 +1,295 @@
+import contextlib
+import json
 import os
+import select
 import shlex
+import subprocess
+import threading
 
 from datetime import datetime
 
-from flagscale.runner.utils import logger, run_local, run_scp
+from flagscale.runner.utils import get_ssh_pool, logger
 
-_log_offsets = {}
+# Bytes copied per read when streaming a chunk into the destination file.
+_COPY_BLOCK_SIZE = 1 << 20
+
+# Remote side of the tail channel. For every poll it prints a header line
+# "<inode> <size> <start> <count>" (or "missing") followed by exactly <count>
+# bytes of the log starting at byte offset <start>. The output is padded with
+# NUL bytes if the file shrinks between `stat` and `tail`, so the stream stays
+# framed; the shrink itself is detected as a truncation on the next poll.
+_REMOTE_POLL_SCRIPT = """\
+set -- $(stat -c '%i %s' {src} 2>/dev/null)
+if [ $# -ne 2 ]; then
+    echo missing
+else
+    off={offset}
+    if [ "$1" != "{inode}" ] || [ "$2" -lt "$off" ]; then off=0; fi
+    cnt=$(($2 - off))
+    echo "$1 $2 $off $cnt"
+    if [ "$cnt" -gt 0 ]; then
+        {{ tail -c +$((off + 1)) {src} | head -c $cnt; head -c $cnt /dev/zero; }} | head -c $cnt
+    fi
+fi
+"""
+
+_log_tailers = {}
+_log_tailers_lock = threading.Lock()
+
+
+class LogTailer:
+    """
+    Incrementally tail the `.output` log of one host.
+
+    The byte offset and inode of the source file are persisted to `state_file`, so a
+    restarted monitor resumes where the previous one stopped. A changed inode is treated
+    as a log rotation and a size smaller than the saved offset as a truncation; in both
+    cases the file is re-read from the beginning. Remote hosts are served by a single
+    long-lived `ssh ... bash -s` channel that only ships the newly appended bytes. A
+    channel that sends nothing for `read_timeout` seconds is killed and reopened on the
+    next poll, so a hung host cannot block its tailer.
+    """
+
+    def __init__(self, host, src_log_file, state_file, ssh_port=22, read_timeout=30):
+        self.host = host
+        self.src_log_file = src_log_file
+        self.state_file = state_file
+        self.ssh_port = ssh_port
+        self.read_timeout = read_timeout
+        self.inode = None
+        self.offset = 0
+        self._channel = None
+        # Bytes read from the channel but not consumed yet
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            if state.get("src_log_file") == self.src_log_file:
+                self.inode = state.get("inode")
+                self.offset = int(state.get("offset", 0))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable log offset state {self.state_file}: {e}")
+
+    def _save_state(self):
+        state = {"src_log_file": self.src_log_file, "inode": self.inode, "offset": self.offset}
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _advance(self, inode, size, start, count):
+        if start != self.offset:
+            reason = "rotated" if inode != self.inode else "truncated"
+            logger.info(
+                f"Log {self.src_log_file} on {self.host} was {reason}, re-reading from the start"
+            )
+        self.inode = inode
+        self.offset = start + count
+        self._save_state()
+
+    def poll(self, dest_file, dryrun=False):
+        """
+        Append the bytes written since the last poll to `dest_file`.
+        Args:
+            dest_file (str or file object): Path or binary file object receiving the new bytes.
+            dryrun (bool): If True, only log what would be transferred.
+        Returns:
+            int or None: Number of bytes transferred, or None if the source log does not exist.
+        """
+        with self._lock:
+            if dryrun:
+                logger.info(
+                    f"Dryrun: tail {self.src_log_file} on {self.host} from byte {self.offset}"
+                )
+                return 0
+            if self.host == "localhost":
+                return self._poll_local(dest_file)
+            return self._poll_remote(dest_file)
+
+    def _poll_local(self, dest_file):
+        try:
+            stat = os.stat(self.src_log_file)
+        except FileNotFoundError:
+            return None
+        start = self.offset
+        if stat.st_ino != self.inode or stat.st_size < start:
+            start = 0
+        count = stat.st_size - start
+        if count > 0:
+            with open(self.src_log_file, "rb") as src, _open_dest(dest_file) as dest:
+                src.seek(start)
+                count = _copy_bytes(src, dest, count)
+        self._advance(stat.st_ino, stat.st_size, start, count)
+        return count
+
+    def _open_channel(self):
+        cmd = ["ssh", "-p", str(self.ssh_port), "-o", "BatchMode=yes", "-o", "ServerAliveCountMax=3"]
+        # Multiplex the channel over the host's pooled master connection
+        cmd += get_ssh_pool().ssh_options() + [self.host, "bash -s"]
+        self._channel = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        logger.debug(f"Opened log tail channel to {self.host}")
+
+    def _poll_remote(self, dest_file):
+        if self._channel is None or self._channel.poll() is not None:
+            self._open_channel()
+        script = _REMOTE_POLL_SCRIPT.format(
+            src=shlex.quote(self.src_log_file),
+            offset=self.offset,
+            inode=self.inode if self.inode is not None else -1,
+        )
+        try:
+            self._channel.stdin.write(script.encode("utf-8"))
+            self._channel.stdin.flush()
+            header = self._read_line().decode("utf-8").split()
+            if not header:
+                raise EOFError("tail channel closed")
+            if header[0] == "missing":
+                return None
+            inode, size, start, count = (int(v) for v in header)
+            with _open_dest(dest_file) as dest:
+                self._copy_remote(dest, count)
+        except Exception:
+            # The stream position is unknown now, drop the channel and retry next poll.
+            self.close()
+            raise
+        self._advance(inode, size, start, count)
+        return count
+
+    def _recv(self):
+        """Read the next bytes of the channel, waiting at most read_timeout for them."""
+        fd = self._channel.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], self.read_timeout)
+        if not ready:
+            raise TimeoutError(f"tail channel to {self.host} sent nothing in {self.read_timeout}s")
+        block = os.read(fd, _COPY_BLOCK_SIZE)
+        if not block:
+            raise EOFError("tail channel closed")
+        self._buffer += block
+
+    def _read_line(self):
+        while b"\n" not in self._buffer:
+            self._recv()
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line
+
+    def _copy_remote(self, dest, count):
+        copied = 0
+        while copied < count:
+            if not self._buffer:
+                self._recv()
+            block = self._buffer[: count - copied]
+            self._buffer = self._buffer[len(block) :]
+            dest.write(block)
+            copied += len(block)
+
+    def close(self):
+        self._buffer = b""
+        if self._channel is None:
+            return
+        try:
+            self._channel.stdin.close()
+            self._channel.terminate()
+            self._channel.wait(timeout=5)
+        except Exception:
+            self._channel.kill()
+        self._channel = None
+
+
+def _open_dest(dest_file):
+    if isinstance(dest_file, str):
+        return open(dest_file, "ab")
+    return contextlib.nullcontext(dest_file)
+
+
+def _copy_bytes(src, dest, count):
+    copied = 0
+    while copied < count:
+        block = src.read(min(_COPY_BLOCK_SIZE, count - copied))
+        if not block:
+            break
+        dest.write(block)
+        copied += len(block)
+    return copied
+
+
+def get_log_tailer(config, host, node_rank, destination_dir, read_timeout=None):
+    """
+    Return the LogTailer of a host, creating it on first use.
+    Args:
+        config (DictConfig): Configuration object containing experiment and logging details.
+        host (str): Hostname or IP of the node.
+        node_rank (int): Rank of the node.
+        destination_dir (str): Directory holding the collected logs and tail state.
+        read_timeout (float): Seconds a remote channel may stay silent, 30 if None.
+    Returns:
+        LogTailer: The tailer bound to the host's `.output` file.
+    """
+    log_key = f"{host}_{node_rank}"
+    with _log_tailers_lock:
+        tailer = _log_tailers.get(log_key)
+        if tailer is None:
+            logging_config = config.train.system.logging
+            no_shared_fs = config.experiment.runner.get("no_shared_fs", False)
+            src_log_file = os.path.join(
+                logging_config.log_dir,
+                f"host{'_' + str(node_rank) + '_' + host if not no_shared_fs else ''}.output",
+            )
+            state_file = os.path.join(destination_dir, f".host_{node_rank}_{host}.offset.json")
+            ssh_port = config.experiment.runner.get("ssh_port", 22)
+            tailer = LogTailer(host, src_log_file, state_file, ssh_port)
+            _log_tailers[log_key] = tailer
+        if read_timeout is not None:
+            tailer.read_timeout = read_timeout
+        return tailer
+
+
+def close_log_tailers():
+    """Close all open tail channels. The persisted offsets are kept."""
+    with _log_tailers_lock:
+        for tailer in _log_tailers.values():
+            tailer.close()
+        _log_tailers.clear()
+
+
+def stream_logs(config, host, node_rank, destination_dir, sink, dryrun=False, timeout=None):
+    """
+    Stream the bytes appended to a host's log since the previous collection into a sink.
+    Args:
+        config (DictConfig): Configuration object containing experiment and logging details.
+        host (str): Hostname or IP of the node.
+        node_rank (int): Rank of the node.
+        destination_dir (str): Directory holding the tail state of the host.
+        sink (str or object): Path to append to, or any object with a `write(bytes)` method.
+        dryrun (bool): If True, simulate the collection without executing commands.
+        timeout (float): Seconds a remote host may stay silent before the read is abandoned.
+    Returns:
+        int: Number of new bytes, or None if the log does not exist or could not be read.
+    """
+    try:
+        tailer = get_log_tailer(config, host, node_rank, destination_dir, timeout)
+        num_bytes = tailer.poll(sink, dryrun)
+    except Exception as e:
+        logger.error(f"Failed to collect logs from {host} (node {node_rank}): {e}")
+        return None
+    if num_bytes is None:
+        logger.warning(f"Log file {tailer.src_log_file} not found on {host}")
+    elif num_bytes == 0:
+        logger.debug(f"No new log content from {host} (node {node_rank})")
+    return num_bytes
 
 
 def collect_logs(config, host, node_rank, destination_dir, dryrun=False):
     """
     Collect logs incrementally from a specified host and node rank, saving to destination_dir.
+    Only the bytes appended since the previous collection are transferred.
     Args:
         config (DictConfig): Configuration object containing experiment and logging details.
         host (str): Hostname or IP of the node.
@@ -18,49 +297,20 @@ def collect_logs(config, host, node_rank, destination_dir, dryrun=False):
         destination_dir (str): Directory to store collected logs.
         dryrun (bool): If True, simulate the collection without executing commands.
     Returns:
-        str: Path to the collected log file.
+        str: Path to the collected log file, or None if there were no new bytes.
     """
-    logging_config = config.train.system.logging
-    no_shared_fs = config.experiment.runner.get("no_shared_fs", False)
-    log_dir = logging_config.log_dir
-    src_log_file = os.path.join(
-        log_dir, f"host{'_' + str(node_rank) + '_' + host if not no_shared_fs else ''}.output"
-    )
+    os.makedirs(destination_dir, exist_ok=True)
     dest_log_file = os.path.join(
         destination_dir,
         f"host_{node_rank}_{host}_temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log",
     )
 
-    os.makedirs(destination_dir, exist_ok=True)
-
-    log_key = f"{host}_{node_rank}"
-    offset = _log_offsets.get(log_key, 0)
-
-    try:
-        if host != "localhost":
-            ssh_port = config.experiment.runner.get("ssh_port", 22)
-            command = f"tail -c +{offset + 1} {src_log_file} > {dest_log_file}"
-            run_scp(host, src_log_file, dest_log_file, ssh_port, dryrun, incremental=True)
-            logger.debug(
-                f"Collected incremental log from {host} (node {node_rank}) to {dest_log_file}"
-            )
-        else:
-            command = f"tail -c +{offset + 1} {src_log_file} > {dest_log_file}"
-            run_local(command, dryrun)
-            logger.debug(f"Collected incremental local log to {dest_log_file}")
-
-        if os.path.exists(dest_log_file) and os.path.getsize(dest_log_file) > 0:
-            new_offset = os.path.getsize(src_log_file)
-            _log_offsets[log_key] = new_offset
-            return dest_log_file
-        else:
-            logger.warning(f"Log file {src_log_file} not found or empty")
-            if os.path.exists(dest_log_file):
-                os.remove(dest_log_file)
-            return None
-
-    except Exception as e:
-        logger.error(f"Failed to collect logs from {host} (node {node_rank}): {e}")
+    num_bytes = stream_logs(config, host, node_rank, destination_dir, dest_log_file, dryrun)
+    if not num_bytes:
         if os.path.exists(dest_log_file):
             os.remove(dest_log_file)
-        return None
\ No newline at end of file
+        return None
+    logger.debug(
+        f"Collected {num_bytes} new bytes from {host} (node {node_rank}) to {dest_log_file}"
+    )
+    return dest_log_file
@@ -0,0 +1,173 @@
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+from flagscale.runner.utils import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SEGMENT_PATTERN = re.compile(r"^segment_(\d+)\.log(\.gz|\.zst)?$")
+
+_COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _segment_index(path):
+    return int(_SEGMENT_PATTERN.match(os.path.basename(path)).group(1))
+
+
+def _compress_file(src, dst, compression):
+    with open(src, "rb") as fin:
+        if compression == "zstd":
+            with open(dst, "wb") as fout:
+                zstandard.ZstdCompressor().copy_stream(fin, fout)
+        else:
+            with gzip.open(dst, "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+
+
+class SegmentedLogStore:
+    """
+    Append-only store for the collected log of one host.
+
+    Bytes are appended to an active segment `segment_<n>.log`. The segment is sealed
+    once it exceeds `max_segment_bytes` or is older than `max_segment_age` seconds;
+    sealed segments are compressed (zstd if `zstandard` is installed, gzip otherwise)
+    and only the newest `max_segments` of them are kept, so disk usage is bounded.
+    The segment list is scanned once at startup and then maintained in memory.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_segment_bytes=64 * 1024 * 1024,
+        max_segment_age=3600,
+        max_segments=50,
+        compression="auto",
+    ):
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        if compression not in _COMPRESSED_SUFFIXES:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.max_segments = max_segments
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._sealed = []
+        self._active = None
+        self._active_path = None
+        self._active_index = -1
+        self._active_size = 0
+        self._active_opened_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load_segments()
+
+    def _load_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(1)), name, match.group(2) is not None))
+        segments.sort()
+        for index, name, compressed in segments:
+            self._active_index = index
+            if compressed:
+                self._sealed.append(os.path.join(self.directory, name))
+        # Resume appending to the unsealed newest segment of a previous run.
+        if segments and not segments[-1][2]:
+            self._open_segment(segments[-1][0])
+        for index, name, compressed in segments[:-1]:
+            if not compressed:
+                self._seal(os.path.join(self.directory, name), prune=False)
+        # Leftover segments were sealed after the compressed ones, restore the index order
+        # so that retention deletes the oldest segments.
+        self._sealed.sort(key=_segment_index)
+        self._prune()
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"segment_{index:06d}.log")
+
+    def _open_segment(self, index):
+        self._active_index = index
+        self._active_path = self._segment_path(index)
+        self._active = open(self._active_path, "ab")
+        self._active_size = self._active.tell()
+        self._active_opened_at = time.time()
+
+    def _seal(self, path, prune=True):
+        sealed_path = path + _COMPRESSED_SUFFIXES[self.compression]
+        try:
+            _compress_file(path, sealed_path, self.compression)
+            os.remove(path)
+        except Exception as e:
+            logger.error(f"Failed to compress log segment {path}: {e}")
+            sealed_path = path
+        self._sealed.append(sealed_path)
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        while len(self._sealed) > self.max_segments:
+            os.remove(self._sealed.pop(0))
+
+    def _needs_rotation(self):
+        if self._active is None or self._active_size == 0:
+            return False
+        return (
+            self._active_size >= self.max_segment_bytes
+            or time.time() - self._active_opened_at >= self.max_segment_age
+        )
+
+    def rotate(self):
+        """Seal the active segment, a new one is opened on the next write."""
+        with self._lock:
+            self._rotate()
+
+    def _rotate(self):
+        if self._active is None:
+            return
+        self._active.close()
+        self._active = None
+        self._seal(self._active_path)
+        self._active_path = None
+
+    def write(self, data):
+        """Append bytes to the active segment, rotating it first if it is full or too old."""
+        with self._lock:
+            if self._needs_rotation():
+                self._rotate()
+            if self._active is None:
+                self._open_segment(self._active_index + 1)
+            self._active.write(data)
+            self._active.flush()
+            self._active_size += len(data)
+            return len(data)
+
+    @property
+    def latest_segment(self):
+        """Path of the segment written last, without touching the file system."""
+        with self._lock:
+            if self._active_path is not None:
+                return self._active_path
+            return self._sealed[-1] if self._sealed else None
+
+    def segments(self):
+        """Paths of all segments, oldest first."""
+        with self._lock:
+            active = [self._active_path] if self._active_path is not None else []
+            return list(self._sealed) + active
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
@@ -1,3 +1,5 @@
+import codecs
+import json
 import os
 import time
 import threading
@@ -7,9 +9,43 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 
 from flagscale.runner.runner_base import JobStatus
-from flagscale.runner.utils import logger
-from flagscale.elastic.log_collector import collect_logs
-from flagscale.elastic.diagnostic import generate_diagnostic_report
+from flagscale.runner.train_metrics import TrainingMetricsParser, metrics_file
+from flagscale.runner.utils import HostFanout, get_ssh_pool, logger
+from flagscale.elastic.log_collector import close_log_tailers, stream_logs
+from flagscale.elastic.log_store import SegmentedLogStore
+from flagscale.elastic.progress import ProgressTracker
+from flagscale.elastic.recovery import RESTART, RecoveryDecision
+from flagscale.elastic.telemetry import MetricsServer, get_metrics_registry
+from flagscale.elastic.diagnostic import DiagnosticMatcher, write_diagnostic_report
+
+# 每个主机内存中保留的训练指标行数，更早的行已追加写入指标文件
+_MAX_METRICS_ROWS = 1024
+
+
+class _HostLogSink:
+    """接收一个主机新收集的日志字节：追加到该主机的分段存储，并增量送入诊断匹配器和指标解析器"""
+
+    def __init__(self, store=None, matcher=None, metrics=None):
+        self.store = store
+        self.matcher = matcher
+        self.metrics = metrics
+        # 多字节字符可能被拆到两次收集中，解码状态需要跨轮保留
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # 本轮解析（诊断和指标）耗时，用于从收集耗时中区分出诊断阶段
+        self.parse_seconds = 0.0
+
+    def write(self, data):
+        if self.store is not None:
+            self.store.write(data)
+        if self.matcher is not None or self.metrics is not None:
+            start = time.perf_counter()
+            text = self._decoder.decode(data)
+            if self.matcher is not None:
+                self.matcher.feed(text)
+            if self.metrics is not None:
+                self.metrics.feed(text)
+            self.parse_seconds += time.perf_counter() - start
+        return len(data)
 
 
 class MonitorService:
@@ -17,8 +53,23 @@ class MonitorService:
     独立的监控服务，用于后台监控训练任务状态、收集日志和生成诊断报告。
     解决runner_train.py中阻塞终端的问题。
     """
-    
-    def __init__(self, config, runner_instance, interval=10):
+
+    def __init__(
+        self,
+        config,
+        runner_instance,
+        interval=10,
+        max_workers=32,
+        host_timeout=None,
+        collector=None,
+        max_segment_bytes=64 * 1024 * 1024,
+        max_segment_age=3600,
+        max_segments=50,
+        min_hang_timeout=120.0,
+        recovery=None,
+        metrics_port=None,
+        metrics_registry=None,
+    ):
         """
         初始化监控服务
         
@@ -26,31 +77,64 @@ class MonitorService:
             config: 配置对象
             runner_instance: runner实例，用于查询状态
             interval: 监控间隔时间(秒)
+            max_workers: 并发处理的最大主机数
+            host_timeout: 单个主机每轮处理的超时时间(秒)，默认为 interval 的一半
+            collector: 接收节点 agent 推送状态的 StatusCollector，
+                设置后状态和诊断均来自 agent，不再通过 ssh 轮询各节点
+            max_segment_bytes: 单个日志分段的最大字节数，超过后封存并压缩
+            max_segment_age: 单个日志分段的最长写入时间(秒)，超过后封存并压缩
+            max_segments: 每个主机保留的已封存分段数，更早的分段会被删除
+            min_hang_timeout: 判定训练卡住的最短无进展时间(秒)，实际超时为
+                max(min_hang_timeout, 10 倍迭代耗时中位数)
+            recovery: RecoveryManager，设置后任务因故障退出或卡住时按诊断结果自动停止并重启任务
+            metrics_port: 本地 HTTP 指标端口，设置后在 127.0.0.1 上提供 /metrics（Prometheus 格式）
+                和 /metrics.json，0 表示随机端口
+            metrics_registry: 记录监控自身指标的 MetricsRegistry，默认为进程内共享的实例
         """
         self.config = config
         self.runner = runner_instance
         self.interval = interval
+        self.max_workers = max_workers
+        self.host_timeout = host_timeout if host_timeout is not None else interval / 2
+        self.collector = collector
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.max_segments = max_segments
         self.is_running = False
         self.monitor_thread = None
         self.log_collection_enabled = True
         self.diagnostic_enabled = True
-        
+        # 每个主机的日志分段存储、增量诊断状态、训练指标，以及最近一次写入报告时的匹配计数
+        self.log_stores = {}
+        self.diagnostic_matchers = {}
+        self.training_metrics = {}
+        self._log_sinks = {}
+        self._report_counts = {}
+        # 各节点的训练进度，用于检测卡住（hang）和慢节点（straggler）
+        self.min_hang_timeout = min_hang_timeout
+        self.progress = ProgressTracker(min_hang_timeout=min_hang_timeout)
+        self.recovery = recovery
+        # 监控自身的耗时、传输字节数和失败次数，runner 的状态查询也记录在同一实例中
+        self.metrics = metrics_registry if metrics_registry is not None else get_metrics_registry()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+
         # 创建监控日志目录
         self.monitor_log_dir = os.path.join(
             config.train.system.logging.log_dir, "monitor"
         )
         os.makedirs(self.monitor_log_dir, exist_ok=True)
-        
+
         # 设置信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
-    
+
     def _signal_handler(self, signum, frame):
         """处理中断信号，优雅停止监控服务"""
         logger.info(f"Received signal {signum}, stopping monitor service...")
         self.stop()
         sys.exit(0)
-    
+
     def start_monitoring(self, enable_log_collection=True, enable_diagnostic=True):
         """
         启动监控服务（非阻塞）
@@ -62,165 +146,417 @@ class MonitorService:
         if self.is_running:
             logger.warning("Monitor service is already running")
             return
-        
+
         self.log_collection_enabled = enable_log_collection
         self.diagnostic_enabled = enable_diagnostic
         self.is_running = True
-        
+        self.metrics.add_collector(self._collect_ssh_metrics)
+        self.metrics.add_collector(self._collect_progress_metrics)
+        if self.metrics_port is not None and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port=self.metrics_port).start()
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint on port {self.metrics_port}: {e}")
+
+        # 预先建立到各主机的复用 ssh 连接（agent 模式下不需要）
+        if self.collector is None:
+            ssh_port = self.config.experiment.runner.get("ssh_port", 22)
+            get_ssh_pool().warm([host for host, _ in self._get_hosts()], ssh_port, self.max_workers)
+
         # 在独立线程中运行监控逻辑
         self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self.monitor_thread.start()
-        
+
         logger.info(f"Monitor service started with interval={self.interval}s")
         logger.info(f"Log collection enabled: {enable_log_collection}")
         logger.info(f"Diagnostic enabled: {enable_diagnostic}")
         logger.info(f"Monitor logs will be saved to: {self.monitor_log_dir}")
-    
+
     def stop(self):
         """停止监控服务"""
         if not self.is_running:
             return
-        
+
         self.is_running = False
         if self.monitor_thread and self.monitor_thread.is_alive():
             self.monitor_thread.join(timeout=5)
-        
+        close_log_tailers()
+        self._flush_metrics()
+        for store in self.log_stores.values():
+            store.close()
+        if self.collector is not None:
+            self.collector.stop()
+        self._write_metrics_snapshot()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.metrics.remove_collector(self._collect_ssh_metrics)
+        self.metrics.remove_collector(self._collect_progress_metrics)
+
         logger.info("Monitor service stopped")
-    
+
     def _monitor_loop(self):
         """监控主循环（在独立线程中运行）"""
         logger.info("Starting monitoring loop...")
-        
+
         # 等待任务启动
         time.sleep(self.interval)
-        
+
         try:
             while self.is_running:
                 start_time = time.time()
-                
+
                 # 查询任务状态
                 try:
-                    job_status = self._get_job_status()
+                    if self.recovery is not None:
+                        # 退避时间已过的恢复在这里重启任务，退避期间监控照常运行
+                        self.recovery.poll()
+                    with self.metrics.timer("flagscale_monitor_phase_seconds", phase="status"):
+                        job_status = self._get_job_status()
                     logger.info(f"Job Status: {job_status.name}")
-                    
+
                     # 记录状态到监控日志
                     self._log_status(job_status)
-                    
-                    # 如果任务完成，停止监控
-                    if job_status == JobStatus.COMPLETED_OR_IDLE:
+
+                    if self.recovery is not None and job_status == JobStatus.RUNNING:
+                        self.recovery.on_running()
+
+                    # 如果任务完成，停止监控；启用自动恢复时先判断任务是否因故障退出
+                    if job_status == JobStatus.COMPLETED_OR_IDLE and not self._recover_if_failed():
                         logger.info("Job completed, stopping monitoring")
                         break
-                    
-                    # 收集日志（如果启用）
-                    if self.log_collection_enabled:
-                        self._collect_logs()
-                    
-                    # 生成诊断报告（如果启用）
-                    if self.diagnostic_enabled:
-                        self._generate_diagnostics()
-                
+
+                    # 并发收集日志并生成诊断报告（如果启用）
+                    if self.collector is not None:
+                        # agent 已在节点本地完成日志分析，只需落盘诊断结果
+                        if self.diagnostic_enabled:
+                            with self.metrics.timer(
+                                "flagscale_monitor_phase_seconds", phase="diagnose"
+                            ):
+                                self._write_agent_diagnostics()
+                    elif self.log_collection_enabled or self.diagnostic_enabled:
+                        with self.metrics.timer("flagscale_monitor_phase_seconds", phase="hosts"):
+                            self._process_hosts()
+                    with self.metrics.timer("flagscale_monitor_phase_seconds", phase="progress"):
+                        self._check_progress()
+
                 except Exception as e:
                     logger.error(f"Error in monitoring loop: {e}")
-                
+                    self.metrics.inc("flagscale_monitor_tick_errors_total")
+
                 # 计算睡眠时间，确保监控间隔准确
                 elapsed = time.time() - start_time
                 sleep_time = max(0, self.interval - elapsed)
-                
+                self._record_tick(elapsed)
+
                 if self.is_running:  # 检查是否仍在运行
                     time.sleep(sleep_time)
-        
+
         except Exception as e:
             logger.error(f"Monitor loop crashed: {e}")
         finally:
             logger.info("Monitor loop ended")
             self.is_running = False
-    
+
     def _get_job_status(self) -> JobStatus:
         """获取任务状态"""
+        if self.collector is not None:
+            return self.collector.get_job_status(self._get_hosts())
         return self.runner._query_status()
-    
+
     def _log_status(self, status: JobStatus):
         """记录状态到监控日志文件"""
         status_log_file = os.path.join(self.monitor_log_dir, "status.log")
-        
+
         try:
             with open(status_log_file, "a", encoding="utf-8") as f:
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 f.write(f"[{timestamp}] Status: {status.name}\n")
         except Exception as e:
             logger.error(f"Failed to write status log: {e}")
-    
-    def _collect_logs(self):
-        """收集日志"""
+
+    def _get_hosts(self):
+        """返回需要监控的 (host, node_rank) 列表"""
         if not hasattr(self.runner, 'resources') or self.runner.resources is None:
             # 本地模式
-            self._collect_logs_for_host("localhost", 0)
+            return [("localhost", 0)]
+        # 多节点模式
+        return [(host, node_rank) for node_rank, host in enumerate(self.runner.resources.keys())]
+
+    def _fan_out(self, func):
+        """在所有主机上并发执行 func(host, node_rank)，单个主机超时或失败不影响其他主机"""
+        hosts = self._get_hosts()
+        with HostFanout(min(len(hosts), self.max_workers), self.host_timeout) as fanout:
+            results = fanout.map(func, hosts)
+        for result in results:
+            if not result.ok:
+                self.metrics.inc(
+                    "flagscale_monitor_host_failures_total", host=result.host, phase="hosts"
+                )
+        return results
+
+    def _process_hosts(self):
+        """每个主机依次执行日志收集和诊断，主机之间并发执行"""
+        return self._fan_out(self._process_host)
+
+    def _process_host(self, host: str, node_rank: int):
+        """
+        单个主机的日志收集与诊断流水线
+
+        新增的日志字节只传输一次：边写入该主机的分段存储，边送入诊断匹配器和训练指标解析器，
+        匹配状态在各轮之间累积，报告覆盖该主机的全部日志。
+        解析出的每轮迭代指标写入列式文件 host_{rank}_{host}_metrics.arrow（无 pyarrow 时为 .npz）。
+        """
+        sink = self._get_log_sink(host, node_rank)
+        num_rows = sink.metrics.total_rows
+        sink.parse_seconds = 0.0
+        start = time.perf_counter()
+        # 远程读取受 host_timeout 限制，挂起的主机不会占住工作线程
+        num_bytes = stream_logs(
+            self.config, host, node_rank, self.monitor_log_dir, sink, timeout=self.host_timeout
+        )
+        collect_seconds = time.perf_counter() - start - sink.parse_seconds
+        self.metrics.observe("flagscale_monitor_phase_seconds", collect_seconds, phase="collect")
+        if not num_bytes:
+            return
+        self.metrics.inc("flagscale_monitor_log_bytes_total", num_bytes, host=host)
+        start = time.perf_counter()
+        self._record_progress(host, node_rank, sink.metrics, num_rows)
+        if sink.matcher is not None:
+            self._write_diagnostic(
+                host, node_rank, sink.matcher.counts, sink.matcher.line_numbers
+            )
+        if self.log_collection_enabled:
+            try:
+                sink.metrics.save(self._metrics_file(host, node_rank))
+            except Exception as e:
+                logger.error(f"Failed to write metrics for {host} (node {node_rank}): {e}")
+        diagnose_seconds = time.perf_counter() - start + sink.parse_seconds
+        self.metrics.observe("flagscale_monitor_phase_seconds", diagnose_seconds, phase="diagnose")
+
+    def _flush_metrics(self):
+        """停止时把各主机尚未写入的训练指标行（包括最后一行）追加到指标文件"""
+        if not self.log_collection_enabled:
+            return
+        for host_key, metrics in self.training_metrics.items():
+            host, _, node_rank = host_key.rpartition("_")
+            try:
+                metrics.save(self._metrics_file(host, int(node_rank)), final=True)
+            except Exception as e:
+                logger.error(f"Failed to write metrics for {host} (node {node_rank}): {e}")
+
+    def _metrics_file(self, host: str, node_rank: int):
+        """主机训练指标文件的路径"""
+        return metrics_file(self.monitor_log_dir, f"host_{node_rank}_{host}_metrics")
+
+    def _get_log_sink(self, host: str, node_rank: int):
+        """返回主机的日志接收端，首次使用时创建分段存储、诊断匹配器和指标解析器"""
+        host_key = f"{host}_{node_rank}"
+        sink = self._log_sinks.get(host_key)
+        if sink is None:
+            store = self.log_stores.get(host_key)
+            matcher = None
+            if self.log_collection_enabled and store is None:
+                store = SegmentedLogStore(
+                    os.path.join(self.monitor_log_dir, f"host_{node_rank}_{host}"),
+                    max_segment_bytes=self.max_segment_bytes,
+                    max_segment_age=self.max_segment_age,
+                    max_segments=self.max_segments,
+                )
+                self.log_stores[host_key] = store
+            if self.diagnostic_enabled or self.recovery is not None:
+                matcher = self.diagnostic_matchers.setdefault(host_key, DiagnosticMatcher())
+            metrics = self.training_metrics.setdefault(
+                host_key, TrainingMetricsParser(max_rows=_MAX_METRICS_ROWS)
+            )
+            sink = self._log_sinks[host_key] = _HostLogSink(store, matcher, metrics)
+        return sink
+
+    def _record_progress(self, host: str, node_rank: int, metrics, num_rows: int):
+        """把本轮新解析出的最新一次迭代记入进度跟踪；收集到日志即视为心跳"""
+        source = f"{host}_{node_rank}"
+        if metrics.total_rows > num_rows:
+            self.progress.record_progress(
+                source, metrics.columns["iteration"][-1], metrics.columns["elapsed_ms"][-1]
+            )
         else:
-            # 多节点模式
-            for node_rank, (host, _) in enumerate(self.runner.resources.items()):
-                self._collect_logs_for_host(host, node_rank)
-    
-    def _collect_logs_for_host(self, host: str, node_rank: int):
-        """为指定主机收集日志"""
+            self.progress.record_heartbeat(source)
+
+    def _check_progress(self):
+        """检测卡住和慢节点，新出现的告警写入 alerts.log"""
+        if self.collector is not None:
+            # agent 模式下每条消息都是心跳，进度来自各节点训练进程的心跳迭代和迭代耗时
+            for host, node_rank in self._get_hosts():
+                node = self.collector.get_node(host, node_rank)
+                if node is None:
+                    continue
+                source = f"{host}_{node_rank}"
+                self.progress.record_heartbeat(source, node["last_seen"])
+                if node.get("iteration") is not None:
+                    self.progress.record_progress(source, node["iteration"], node["elapsed_ms"])
+        alerts = self.progress.check()
+        if not alerts:
+            return
+        hangs = [alert for alert in alerts if alert.kind == "hang"]
+        alerts_log_file = os.path.join(self.monitor_log_dir, "alerts.log")
         try:
-            log_file = collect_logs(
-                self.config, 
-                host, 
-                node_rank, 
-                self.monitor_log_dir, 
-                dryrun=False
-            )
-            
-            if log_file:
-                logger.debug(f"Collected logs for {host} (node {node_rank}): {log_file}")
+            with open(alerts_log_file, "a", encoding="utf-8") as f:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for alert in alerts:
+                    logger.warning(f"[{alert.kind}] {alert.message}")
+                    f.write(f"[{timestamp}] {alert.kind.upper()}: {alert.message}\n")
         except Exception as e:
-            logger.error(f"Failed to collect logs for {host} (node {node_rank}): {e}")
-    
-    def _generate_diagnostics(self):
-        """生成诊断报告"""
-        if not hasattr(self.runner, 'resources') or self.runner.resources is None:
-            # 本地模式
-            self._generate_diagnostic_for_host("localhost", 0)
-        else:
-            # 多节点模式
-            for node_rank, (host, _) in enumerate(self.runner.resources.items()):
-                self._generate_diagnostic_for_host(host, node_rank)
-    
-    def _generate_diagnostic_for_host(self, host: str, node_rank: int):
-        """为指定主机生成诊断报告"""
+            logger.error(f"Failed to write alerts log: {e}")
+        if self.recovery is not None and hangs and not self.recovery.awaiting_start:
+            # 卡住的任务不会自行退出，交给恢复策略处理
+            host, _, node_rank = hangs[0].source.rpartition("_")
+            decision = self.recovery.policy.decide({(host, int(node_rank)): {"hanging": 1}})
+            if decision is not None:
+                self._recover(decision)
+
+    def _recover_if_failed(self) -> bool:
+        """
+        任务退出后根据诊断结果决定是否自动恢复
+
+        Returns:
+            bool: True 表示任务已被重启（或正在重启中），监控应继续
+        """
+        if self.recovery is None:
+            return False
+        # 先收集最后一轮日志，确保进程退出前的报错已被诊断
+        if self.collector is None:
+            self._process_hosts()
+        if self.recovery.awaiting_start:
+            if not any(source["iteration"] is not None for source in self.progress.summary()):
+                # 重启后进程尚未起来时同样表现为空闲状态
+                if not self.recovery.startup_timed_out():
+                    return True
+                decision = RecoveryDecision(RESTART, reason="job did not start after relaunch")
+                return self._recover(decision)
+            # 重启后的任务已有训练进度，只是在两次查询之间就已退出
+            self.recovery.on_running()
+        decision = self.recovery.policy.decide(self._collect_diagnoses())
+        if decision is None:
+            return False
+        return self._recover(decision)
+
+    def _recover(self, decision) -> bool:
+        """执行恢复决策，重启成功后重置各主机的诊断和进度状态"""
+        if not self.recovery.recover(decision):
+            return False
+        self.diagnostic_matchers = {}
+        self._log_sinks = {}
+        self._report_counts = {}
+        self.progress = ProgressTracker(min_hang_timeout=self.min_hang_timeout)
+        return True
+
+    def _collect_diagnoses(self):
+        """返回各主机本次运行的诊断计数 {(host, node_rank): {signature: count}}"""
+        diagnoses = {}
+        for host, node_rank in self._get_hosts():
+            if self.collector is not None:
+                node = self.collector.get_node(host, node_rank)
+                counts = node["counts"] if node is not None else {}
+            else:
+                matcher = self.diagnostic_matchers.get(f"{host}_{node_rank}")
+                counts = matcher.counts if matcher is not None else {}
+            diagnoses[(host, node_rank)] = counts
+        return diagnoses
+
+    def _write_agent_diagnostics(self):
+        """根据 agent 上报的诊断结果生成各主机的诊断报告"""
+        for host, node_rank in self._get_hosts():
+            node = self.collector.get_node(host, node_rank)
+            if node is not None:
+                self._write_diagnostic(host, node_rank, node["counts"], node["line_numbers"])
+
+    def _write_diagnostic(self, host: str, node_rank: int, counts, line_numbers):
+        """覆盖写入主机的诊断报告（仅在匹配计数变化时写入）"""
+        if self._report_counts.get((host, node_rank)) == counts:
+            return
+        report_file = os.path.join(self.monitor_log_dir, f"host_{node_rank}_{host}_diagnostic.txt")
         try:
-            # 查找最新的日志文件
-            log_files = [f for f in os.listdir(self.monitor_log_dir) 
-                        if f.startswith(f"host_{node_rank}_{host}_temp_") and f.endswith(".log")]
-            
-            if log_files:
-                # 使用最新的日志文件
-                latest_log = max(log_files, key=lambda f: os.path.getmtime(
-                    os.path.join(self.monitor_log_dir, f)))
-                log_file_path = os.path.join(self.monitor_log_dir, latest_log)
-                
-                diagnostic_file = generate_diagnostic_report(
-                    self.config, 
-                    host, 
-                    node_rank, 
-                    log_file_path, 
-                    return_content=False
+            write_diagnostic_report(report_file, host, node_rank, counts, line_numbers)
+            self._report_counts[(host, node_rank)] = dict(counts)
+            logger.debug(f"Updated diagnostic for {host} (node {node_rank}): {report_file}")
+        except Exception as e:
+            logger.error(f"Failed to write diagnostic for {host} (node {node_rank}): {e}")
+
+    def _record_tick(self, elapsed: float):
+        """记录一轮监控的耗时；超过监控间隔的轮次说明当前并发度或间隔不足以覆盖集群规模"""
+        self.metrics.inc("flagscale_monitor_ticks_total")
+        self.metrics.observe("flagscale_monitor_tick_seconds", elapsed)
+        if elapsed > self.interval:
+            self.metrics.inc("flagscale_monitor_tick_overruns_total")
+            logger.warning(
+                f"Monitor tick took {elapsed:.1f}s, longer than the interval of {self.interval}s"
+            )
+        self._write_metrics_snapshot()
+
+    def _collect_ssh_metrics(self, registry):
+        """把 ssh 连接池的累计计数同步到指标中（在每次导出前调用）"""
+        for host, metrics in get_ssh_pool().metrics().items():
+            registry.set(
+                "flagscale_ssh_round_trips_total", metrics["round_trips"], "counter", host=host
+            )
+            registry.set("flagscale_ssh_failures_total", metrics["failures"], "counter", host=host)
+            registry.set(
+                "flagscale_ssh_mean_latency_seconds", metrics["mean_latency_ms"] / 1000, host=host
+            )
+            registry.set(
+                "flagscale_ssh_max_latency_seconds", metrics["max_latency_ms"] / 1000, host=host
+            )
+
+    def _collect_progress_metrics(self, registry):
+        """把各节点的迭代耗时和慢节点判定同步到指标中（在每次导出前调用）"""
+        stragglers = {source for source, _, _ in self.progress.find_stragglers()}
+        for source in self.progress.summary():
+            if source["step_seconds"] is not None:
+                registry.set(
+                    "flagscale_node_step_seconds", source["step_seconds"], node=source["source"]
                 )
-                
-                if diagnostic_file:
-                    logger.debug(f"Generated diagnostic for {host} (node {node_rank}): {diagnostic_file}")
+            registry.set(
+                "flagscale_node_straggler",
+                int(source["source"] in stragglers),
+                node=source["source"],
+            )
+
+    def _write_metrics_snapshot(self):
+        """把当前指标的 JSON 快照原子地写入 metrics.json"""
+        snapshot_file = os.path.join(self.monitor_log_dir, "metrics.json")
+        try:
+            tmp_file = f"{snapshot_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.metrics.snapshot(), f, indent=1)
+            os.replace(tmp_file, snapshot_file)
         except Exception as e:
-            logger.error(f"Failed to generate diagnostic for {host} (node {node_rank}): {e}")
+            logger.error(f"Failed to write metrics snapshot: {e}")
     
     def get_status_summary(self) -> Dict[str, Any]:
         """获取监控服务状态摘要"""
         return {
             "is_running": self.is_running,
             "interval": self.interval,
+            "max_workers": self.max_workers,
+            "host_timeout": self.host_timeout,
             "log_collection_enabled": self.log_collection_enabled,
             "diagnostic_enabled": self.diagnostic_enabled,
             "monitor_log_dir": self.monitor_log_dir,
-            "thread_alive": self.monitor_thread.is_alive() if self.monitor_thread else False
+            "thread_alive": self.monitor_thread.is_alive() if self.monitor_thread else False,
+            "ssh_pool": get_ssh_pool().metrics(),
+            "collector_port": self.collector.port if self.collector is not None else None,
+            "progress": self.progress.summary(),
+            "stragglers": [
+                {"source": source, "step_seconds": step, "median_step_seconds": median}
+                for source, step, median in self.progress.find_stragglers()
+            ],
+            "active_alerts": [alert.message for alert in self.progress.active_alerts.values()],
+            "recovery": self.recovery.summary() if self.recovery is not None else None,
+            "metrics_port": self.metrics_server.port if self.metrics_server is not None else None,
+            "metrics": self.metrics.snapshot(),
+            "latest_log_segments": {
+                host_key: store.latest_segment for host_key, store in self.log_stores.items()
+            },
         }
 
 
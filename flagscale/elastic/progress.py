@@ -0,0 +1,200 @@
+import math
+import statistics
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from flagscale.runner.utils import logger
+
+# Scales the median absolute deviation to the standard deviation of a normal distribution.
+_MAD_SCALE = 1.4826
+
+
+@dataclass
+class ProgressAlert:
+    """A hang or straggler detected by the ProgressTracker."""
+
+    kind: str
+    source: str
+    message: str
+
+
+@dataclass
+class _SourceProgress:
+    iteration: Optional[int] = None
+    last_progress: Optional[float] = None
+    last_heartbeat: Optional[float] = None
+    step_seconds: Optional[float] = None
+
+
+class ProgressTracker:
+    """
+    Track training progress per source (a node) and detect hangs and stragglers.
+
+    Sources report iterations, e.g. the heartbeat iteration pushed by a NodeAgent or the
+    streamed `training_log` lines, and heartbeats, e.g. agent messages or new log bytes.
+    The step time of a source is the reported time per iteration, or the wall time between
+    two reported iterations.
+
+    A source is a straggler if its step time exceeds the median over all sources by more
+    than `straggler_threshold` scaled MADs and by at least `min_slowdown` of the median.
+    Sources whose last heartbeat is older than the hang timeout keep a stale step time and
+    are left out. A source hangs if it made no progress for `hang_factor` median step times, but never
+    less than `min_hang_timeout` seconds, so the timeout follows the speed of the job. A
+    stalled collective writes no log line, which is why progress and not log activity is
+    what is timed out.
+    """
+
+    def __init__(
+        self,
+        hang_factor=10.0,
+        min_hang_timeout=120.0,
+        straggler_threshold=3.0,
+        min_slowdown=0.1,
+        min_sources=3,
+    ):
+        self.hang_factor = hang_factor
+        self.min_hang_timeout = min_hang_timeout
+        self.straggler_threshold = straggler_threshold
+        self.min_slowdown = min_slowdown
+        self.min_sources = min_sources
+        self.sources: Dict[str, _SourceProgress] = {}
+        self.active_alerts: Dict[tuple, ProgressAlert] = {}
+        self._lock = threading.Lock()
+
+    def record_progress(self, source, iteration, elapsed_ms=None, now=None):
+        """
+        Record that a source reached an iteration.
+        Args:
+            source (str): Node or rank identifier.
+            iteration (int): Iteration reported by the source.
+            elapsed_ms (float): Logged time per iteration, derived from wall time if None.
+            now (float): Timestamp of the report, defaults to the current time.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            progress = self.sources.setdefault(source, _SourceProgress())
+            progress.last_heartbeat = max(progress.last_heartbeat or now, now)
+            if progress.iteration is not None and iteration <= progress.iteration:
+                if iteration < progress.iteration:
+                    # The job restarted from a checkpoint, the old rate no longer applies.
+                    progress.iteration, progress.last_progress = iteration, now
+                    progress.step_seconds = None
+                return
+            if elapsed_ms is not None and not math.isnan(elapsed_ms):
+                progress.step_seconds = elapsed_ms / 1000.0
+            elif progress.iteration is not None:
+                progress.step_seconds = (now - progress.last_progress) / (
+                    iteration - progress.iteration
+                )
+            progress.iteration = iteration
+            progress.last_progress = now
+
+    def record_heartbeat(self, source, now=None):
+        """Record that a source is alive, e.g. because its agent sent a message."""
+        now = time.time() if now is None else now
+        with self._lock:
+            progress = self.sources.setdefault(source, _SourceProgress())
+            progress.last_heartbeat = max(progress.last_heartbeat or now, now)
+
+    def _step_times(self, alive_since=None):
+        return {
+            source: progress.step_seconds
+            for source, progress in self.sources.items()
+            if progress.step_seconds is not None
+            and (alive_since is None or progress.last_heartbeat >= alive_since)
+        }
+
+    def median_step_seconds(self):
+        """Median step time over all sources, or None before the first step was timed."""
+        with self._lock:
+            step_times = list(self._step_times().values())
+        return statistics.median(step_times) if step_times else None
+
+    def hang_timeout(self):
+        """Seconds without progress after which a source is considered hung."""
+        median = self.median_step_seconds()
+        if median is None:
+            return self.min_hang_timeout
+        return max(self.min_hang_timeout, self.hang_factor * median)
+
+    def find_stragglers(self, now=None):
+        """
+        Return the live sources whose step time is an outlier.
+        Args:
+            now (float): Evaluation time, defaults to the current time.
+        Returns:
+            list: (source, step_seconds, median_step_seconds) of every straggler.
+        """
+        now = time.time() if now is None else now
+        alive_since = now - self.hang_timeout()
+        with self._lock:
+            step_times = self._step_times(alive_since)
+        if len(step_times) < self.min_sources:
+            return []
+        median = statistics.median(step_times.values())
+        mad = _MAD_SCALE * statistics.median(abs(t - median) for t in step_times.values())
+        limit = median + max(self.straggler_threshold * mad, self.min_slowdown * median)
+        return [
+            (source, step, median) for source, step in sorted(step_times.items()) if step > limit
+        ]
+
+    def _current_alerts(self, now):
+        alerts = {}
+        timeout = self.hang_timeout()
+        with self._lock:
+            stalled = {
+                source: (now - progress.last_progress, now - progress.last_heartbeat)
+                for source, progress in self.sources.items()
+                if progress.last_progress is not None and now - progress.last_progress > timeout
+            }
+        for source, (idle, silent) in stalled.items():
+            # A recent heartbeat means the node is up but the training is stuck
+            alerts[("hang", source)] = ProgressAlert(
+                "hang",
+                source,
+                f"No training progress from {source} for {idle:.0f}s (timeout {timeout:.0f}s),"
+                f" last heartbeat {silent:.0f}s ago",
+            )
+        for source, step, median in self.find_stragglers(now):
+            if source in stalled:
+                continue
+            alerts[("straggler", source)] = ProgressAlert(
+                "straggler",
+                source,
+                f"{source} is a straggler: {step:.3f}s per iteration vs median {median:.3f}s",
+            )
+        return alerts
+
+    def check(self, now=None):
+        """
+        Re-evaluate hangs and stragglers.
+        Args:
+            now (float): Evaluation time, defaults to the current time.
+        Returns:
+            list: The ProgressAlerts raised since the previous check. Alerts that still hold
+            are kept in `active_alerts` without being returned again.
+        """
+        now = time.time() if now is None else now
+        alerts = self._current_alerts(now)
+        raised = [alert for key, alert in alerts.items() if key not in self.active_alerts]
+        for key in self.active_alerts.keys() - alerts.keys():
+            logger.info(f"Resolved {key[0]} alert for {key[1]}")
+        self.active_alerts = alerts
+        return raised
+
+    def summary(self) -> List[dict]:
+        """Per-source progress, for status summaries and dashboards."""
+        with self._lock:
+            return [
+                {
+                    "source": source,
+                    "iteration": progress.iteration,
+                    "last_progress": progress.last_progress,
+                    "last_heartbeat": progress.last_heartbeat,
+                    "step_seconds": progress.step_seconds,
+                }
+                for source, progress in sorted(self.sources.items())
+            ]
@@ -0,0 +1,276 @@
+import json
+import os
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Sequence, Tuple
+
+from flagscale.runner.utils import logger
+
+RESTART = "restart"
+REPLACE_HOST = "replace_host"
+EXCLUDE_HOST = "exclude_host"
+ABORT = "abort"
+
+
+@dataclass
+class RecoveryRule:
+    """Map error signatures (keys of `error_types`) to a recovery action."""
+
+    action: str
+    signatures: Sequence[str]
+
+
+@dataclass
+class RecoveryDecision:
+    action: str
+    signature: Optional[str] = None
+    host: Optional[Tuple[str, int]] = None
+    reason: str = ""
+    time: float = field(default_factory=time.time)
+
+
+# Rules are checked in order, the first rule with a signature seen on any host decides.
+# Transient failures are restarted on the same hosts, node-local crashes move the failed
+# node to a spare host (or restart in place if there is none) and errors a restart cannot
+# fix abort the job. Generic signatures such as "gpu", "cuda", "timeout", "rendezvous",
+# "connection refused" or "killed" also occur in the logs of healthy jobs (throughput per
+# GPU, argument dumps, torchrun info logs, retried connections) and are left out on
+# purpose; refused connections and killed workers are matched by the fatal lines that
+# report them, the exception name or the SIGKILL of torchrun's failure summary.
+DEFAULT_RECOVERY_RULES = [
+    RecoveryRule(
+        RESTART,
+        (
+            "out of memory",
+            "outofmemoryerror",
+            "cuda out of memory",
+            "rendezvousconne",
+            "connectionrefusederror",
+            "distnetworkerror",
+            "connection timeout",
+            "sigkill",
+            "hanging",
+        ),
+    ),
+    RecoveryRule(REPLACE_HOST, ("segmentation fault", "core dumped")),
+    RecoveryRule(
+        ABORT,
+        (
+            "importerror",
+            "modulenotfounderror",
+            "no such file",
+            "permission denied",
+            "disk space",
+            "traceback",
+        ),
+    ),
+]
+
+
+class RecoveryPolicy:
+    """
+    Decide how to recover from a failure given the diagnosis of every host.
+
+    The default rules can be replaced, or `decide` overridden, to plug in other policies.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else DEFAULT_RECOVERY_RULES
+
+    def decide(self, diagnoses):
+        """
+        Args:
+            diagnoses (dict): (host, node_rank) -> {signature: count} of the failed attempt.
+        Returns:
+            RecoveryDecision: The action for the first matching rule, or None if no host
+            reported a failure signature, i.e. the job completed.
+        """
+        for rule in self.rules:
+            for signature in rule.signatures:
+                for host, counts in diagnoses.items():
+                    if counts.get(signature):
+                        return RecoveryDecision(
+                            rule.action, signature, host, f"{signature} on {host[0]}"
+                        )
+        return None
+
+
+class RecoveryManager:
+    """
+    Stop, repair and relaunch a failed training job.
+
+    Each recovery stops the job through the runner, optionally replaces or excludes the
+    failed host in `runner.resources` and schedules the relaunch of the job from its
+    latest checkpoint after an exponential backoff. The relaunch is made by `poll`, which
+    the monitor calls every tick, so the backoff does not block the monitor thread. At
+    most `max_restarts` relaunches are made. The
+    time from detecting a failure until the job runs again is recorded per recovery and
+    averaged into the mean time to recovery (MTTR). Every step is appended as a JSON
+    line to `record_file`.
+    """
+
+    def __init__(
+        self,
+        runner,
+        policy=None,
+        max_restarts=3,
+        backoff=30.0,
+        backoff_factor=2.0,
+        max_backoff=600.0,
+        spare_hosts=None,
+        startup_timeout=600.0,
+        record_file=None,
+    ):
+        self.runner = runner
+        self.policy = policy if policy is not None else RecoveryPolicy()
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.spare_hosts = list(spare_hosts or [])
+        self.startup_timeout = startup_timeout
+        self.record_file = record_file
+        self.restarts = 0
+        self.recovery_times = []
+        self.awaiting_start = False
+        self._failure_time = None
+        self._relaunch_time = None
+        self._relaunch_at = None
+        self._backoff = None
+
+    @property
+    def mttr(self):
+        """Mean time to recovery in seconds, None before the first recovery finished."""
+        if not self.recovery_times:
+            return None
+        return sum(self.recovery_times) / len(self.recovery_times)
+
+    def next_backoff(self):
+        return min(self.max_backoff, self.backoff * self.backoff_factor**self.restarts)
+
+    def _record(self, event, **details):
+        entry = {"time": time.time(), "event": event, "restarts": self.restarts, **details}
+        if self.record_file is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.record_file), exist_ok=True)
+            with open(self.record_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to write recovery record: {e}")
+
+    def _replace_host(self, host):
+        resources = getattr(self.runner, "resources", None)
+        if resources is None or host not in resources or not self.spare_hosts:
+            return None
+        spare = self.spare_hosts.pop(0)
+        # Keep the position of the host, so the node ranks of the other hosts are unchanged
+        self.runner.resources = OrderedDict(
+            (spare, info) if name == host else (name, info) for name, info in resources.items()
+        )
+        return spare
+
+    def _exclude_host(self, host):
+        resources = getattr(self.runner, "resources", None)
+        if resources is None or host not in resources or len(resources) < 2:
+            return False
+        self.runner.resources = OrderedDict(
+            (name, info) for name, info in resources.items() if name != host
+        )
+        return True
+
+    def recover(self, decision):
+        """
+        Execute a recovery decision.
+        Args:
+            decision (RecoveryDecision): Decision of the policy.
+        Returns:
+            bool: True if the relaunch of the job was scheduled, False if it was given up.
+        """
+        self._failure_time = self._failure_time or decision.time
+        self._record(
+            "failure",
+            action=decision.action,
+            signature=decision.signature,
+            host=decision.host,
+            reason=decision.reason,
+        )
+        if decision.action == ABORT or self.restarts >= self.max_restarts:
+            reason = decision.reason if decision.action == ABORT else "restart budget exhausted"
+            logger.error(f"Giving up recovery of the job: {reason}")
+            self._record("abort", reason=reason)
+            self.awaiting_start = False
+            self._relaunch_at = None
+            return False
+
+        logger.info(f"Recovering from {decision.reason or 'failure'} with {decision.action}")
+        self.runner.stop()
+
+        host = decision.host[0] if decision.host else None
+        if decision.action == REPLACE_HOST:
+            spare = self._replace_host(host)
+            if spare is not None:
+                logger.info(f"Replaced host {host} with spare host {spare}")
+                self._record("replace_host", host=host, spare=spare)
+        elif decision.action == EXCLUDE_HOST and self._exclude_host(host):
+            logger.info(f"Excluded host {host} from the job")
+            self._record("exclude_host", host=host)
+
+        backoff = self.next_backoff()
+        self.restarts += 1
+        logger.info(
+            f"Relaunching job in {backoff:.0f}s (restart {self.restarts}/{self.max_restarts})"
+        )
+        self._relaunch_at = time.time() + backoff
+        self._relaunch_time = None
+        self._backoff = backoff
+        self.awaiting_start = True
+        return True
+
+    @property
+    def relaunch_pending(self):
+        return self._relaunch_at is not None
+
+    def poll(self, now=None):
+        """
+        Relaunch the job once the backoff of the scheduled recovery has passed.
+        Returns:
+            bool: True if the job was relaunched by this call.
+        """
+        now = time.time() if now is None else now
+        if self._relaunch_at is None or now < self._relaunch_at:
+            return False
+        self.runner.relaunch()
+        self._relaunch_at = None
+        self._relaunch_time = time.time()
+        self._record("relaunch", backoff=self._backoff)
+        return True
+
+    def startup_timed_out(self, now=None):
+        now = time.time() if now is None else now
+        if not self.awaiting_start or self._relaunch_time is None:
+            return False
+        return now - self._relaunch_time > self.startup_timeout
+
+    def on_running(self):
+        """Called once the relaunched job runs again, completes the current recovery."""
+        if not self.awaiting_start:
+            return
+        recovery_seconds = time.time() - self._failure_time
+        self.recovery_times.append(recovery_seconds)
+        self.awaiting_start = False
+        self._failure_time = None
+        logger.info(f"Job recovered in {recovery_seconds:.1f}s (MTTR {self.mttr:.1f}s)")
+        self._record("recovered", recovery_seconds=recovery_seconds, mttr=self.mttr)
+
+    def summary(self):
+        return {
+            "restarts": self.restarts,
+            "max_restarts": self.max_restarts,
+            "awaiting_start": self.awaiting_start,
+            "relaunch_pending": self.relaunch_pending,
+            "recovery_times": list(self.recovery_times),
+            "mttr": self.mttr,
+        }
@@ -1,9 +1,17 @@
 import argparse
+import os
 import random
+import signal
+import subprocess
+import sys
 import time
 
 from datetime import datetime
 
+from omegaconf import OmegaConf
+
+from flagscale.runner.runner_base import JobStatus
+
 error_keys_list = [
     "completed",
     "codeerror",
@@ -45,6 +53,134 @@ def SimulatedFaultLoop(log_file="", error_keys=None, interval=5, iterations=1, m
         time.sleep(interval)
 
 
+# Log lines written by the simulated training process for each injectable fault.
+# "hang" stops making progress without writing anything, like a stalled collective.
+fault_messages = {
+    "oom": "torch.OutOfMemoryError: CUDA out of memory. Tried to allocate 2.00 GiB",
+    "rendezvous": "torch.distributed.elastic.rendezvous.api.RendezvousConnectionError: "
+    "The connection to the C10d store has failed.",
+    # What torchrun reports for a worker killed e.g. by the OOM killer
+    "kill": "traceback : Signal 9 (SIGKILL) received by PID 1",
+    "segfault": "Segmentation fault (core dumped)",
+    "code": None,
+    "hang": None,
+}
+
+
+def _inject_fault(fault):
+    message = fault_messages[fault]
+    if message:
+        print(message, flush=True)
+    if fault == "hang":
+        while True:
+            time.sleep(60)
+    if fault == "code":
+        raise ValueError("Simulated code error")
+    if fault == "kill":
+        os.kill(os.getpid(), signal.SIGKILL)
+    if fault == "segfault":
+        os._exit(139)
+    sys.exit(1)
+
+
+def SimulatedTraining(
+    iterations=20, step_time=0.05, checkpoint_file=None, save_interval=5, fault=None, fault_at=1
+):
+    """
+    Simulate a Megatron training process on the CPU.
+
+    Prints one `training_log` line per iteration to stdout and saves the iteration to
+    `checkpoint_file` every `save_interval` iterations. A relaunched process resumes after
+    the saved iteration. If `fault` is set, it is injected before iteration `fault_at`.
+    """
+    start = 0
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, "r") as f:
+            start = int(f.read().strip())
+        print(f"loading checkpoint from {checkpoint_file} at iteration {start}", flush=True)
+    for iteration in range(start + 1, iterations + 1):
+        if fault and iteration == fault_at:
+            _inject_fault(fault)
+        time.sleep(step_time)
+        print(
+            f" [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] iteration {iteration:8d}/"
+            f"{iterations:8d} | elapsed time per iteration (ms): {step_time * 1000:.1f} |"
+            f" lm loss: {10.0 / iteration:.6E} | grad norm: 1.000 |",
+            flush=True,
+        )
+        if checkpoint_file and iteration % save_interval == 0:
+            with open(checkpoint_file + ".tmp", "w") as f:
+                f.write(str(iteration))
+            os.replace(checkpoint_file + ".tmp", checkpoint_file)
+    print("Simulated training completed", flush=True)
+
+
+class LocalFaultHarness:
+    """
+    Local, runner-compatible job for testing the monitor and recovery loop on one CPU machine.
+
+    It implements the runner interface used by MonitorService and RecoveryManager (`config`,
+    `resources`, `run`, `relaunch`, `stop`, `_query_status`) on top of a SimulatedTraining
+    process whose output goes to the `.output` log the monitor collects. `faults` lists the
+    fault injected into each launch as (fault, iteration) or None, later launches run clean.
+    """
+
+    def __init__(self, work_dir, faults=None, iterations=20, step_time=0.05, save_interval=5):
+        self.work_dir = os.path.abspath(work_dir)
+        log_dir = os.path.join(self.work_dir, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+        self.config = OmegaConf.create(
+            {
+                "train": {"system": {"logging": {"log_dir": log_dir}}},
+                "experiment": {"runner": {"no_shared_fs": False}},
+            }
+        )
+        self.resources = None
+        self.faults = list(faults or [])
+        self.iterations = iterations
+        self.step_time = step_time
+        self.save_interval = save_interval
+        self.log_file = os.path.join(log_dir, "host_0_localhost.output")
+        self.checkpoint_file = os.path.join(self.work_dir, "latest_checkpointed_iteration.txt")
+        self.attempts = 0
+        self.process = None
+
+    def run(self, *args, **kwargs):
+        fault = self.faults[self.attempts] if self.attempts < len(self.faults) else None
+        cmd = [
+            sys.executable,
+            "-m",
+            "flagscale.elastic.simulatedFault",
+            "--train",
+            "--iterations",
+            str(self.iterations),
+            "--step_time",
+            str(self.step_time),
+            "--save_interval",
+            str(self.save_interval),
+            "--checkpoint_file",
+            self.checkpoint_file,
+        ]
+        if fault is not None:
+            cmd += ["--fault", fault[0], "--fault_at", str(fault[1])]
+        self.attempts += 1
+        with open(self.log_file, "ab") as log:
+            self.process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+
+    def relaunch(self):
+        self.run()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def _query_status(self):
+        if self.process is not None and self.process.poll() is None:
+            return JobStatus.RUNNING
+        return JobStatus.COMPLETED_OR_IDLE
+
+
 def main():
     parser = argparse.ArgumentParser(description="Simulate faults by writing errors to log.")
     parser.add_argument("--log_file", type=str, default="output.log", help="Path to log file")
@@ -60,9 +196,30 @@ def main():
     parser.add_argument(
         "--mode", type=str, choices=["w", "a"], default="a", help="File mode: w=overwrite, a=append"
     )
+    parser.add_argument(
+        "--train", action="store_true", help="Run a simulated training process instead"
+    )
+    parser.add_argument("--step_time", type=float, default=0.05, help="Seconds per iteration")
+    parser.add_argument("--checkpoint_file", type=str, default=None, help="Checkpoint file")
+    parser.add_argument("--save_interval", type=int, default=5, help="Iterations per checkpoint")
+    parser.add_argument(
+        "--fault", type=str, choices=list(fault_messages), default=None, help="Fault to inject"
+    )
+    parser.add_argument("--fault_at", type=int, default=1, help="Iteration of the fault")
 
     args = parser.parse_args()
 
+    if args.train:
+        SimulatedTraining(
+            iterations=args.iterations,
+            step_time=args.step_time,
+            checkpoint_file=args.checkpoint_file,
+            save_interval=args.save_interval,
+            fault=args.fault,
+            fault_at=args.fault_at,
+        )
+        return
+
     SimulatedFaultLoop(
         log_file=args.log_file,
         error_keys=args.errors,
@@ -0,0 +1,289 @@
+import bisect
+import json
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flagscale.runner.utils import logger
+
+# Latency buckets in seconds, from a local status query to a slow ssh round trip.
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_HELP = {
+    "flagscale_monitor_ticks_total": "Monitor loop iterations.",
+    "flagscale_monitor_tick_seconds": "Duration of a monitor loop iteration.",
+    "flagscale_monitor_tick_overruns_total": "Monitor loop iterations longer than the interval.",
+    "flagscale_monitor_tick_errors_total": "Monitor loop iterations that raised an error.",
+    "flagscale_monitor_phase_seconds": "Duration of a phase of the monitor loop.",
+    "flagscale_monitor_log_bytes_total": "Log bytes collected from a host.",
+    "flagscale_monitor_host_failures_total": "Monitor calls on a host that failed or timed out.",
+    "flagscale_runner_query_seconds": "Duration of a job status query over all hosts.",
+    "flagscale_runner_query_host_seconds": "Duration of a job status query on one host.",
+    "flagscale_runner_query_failures_total": "Status queries on a host that failed or timed out.",
+    "flagscale_ssh_round_trips_total": "ssh round trips over the connection pool.",
+    "flagscale_ssh_failures_total": "ssh round trips that failed.",
+    "flagscale_ssh_mean_latency_seconds": "Mean latency of an ssh round trip.",
+    "flagscale_ssh_max_latency_seconds": "Max latency of an ssh round trip.",
+    "flagscale_node_step_seconds": "Time per training iteration of a node.",
+    "flagscale_node_straggler": "1 if the node is a straggler, 0 otherwise.",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to be observed on every call of a hot path."""
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """(upper bound, cumulative count) of every bucket, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls into."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of the counters, gauges and histograms of the monitor and the runner.
+
+    Metrics are created on first use and identified by name and labels. Collectors added
+    with `add_collector` are called before every snapshot or scrape, to refresh metrics
+    that are kept elsewhere (e.g. the ssh pool counters) instead of on every update.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._kinds = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, labels, factory):
+        registered = self._kinds.setdefault(name, kind)
+        if registered != kind:
+            raise ValueError(f"Metric {name} is a {registered}, not a {kind}")
+        series = self._metrics.setdefault(name, {})
+        key = _label_key(labels)
+        if key not in series:
+            series[key] = factory()
+        return series, key
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        with self._lock:
+            series, key = self._get("counter", name, labels, int)
+            series[key] += value
+
+    def set(self, name, value, kind="gauge", **labels):
+        """Set a gauge, or a counter that is maintained elsewhere, to an absolute value."""
+        with self._lock:
+            series, key = self._get(kind, name, labels, int)
+            series[key] = value
+
+    def observe(self, name, value, buckets=DEFAULT_LATENCY_BUCKETS, **labels):
+        """Add an observation to a histogram."""
+        with self._lock:
+            series, key = self._get("histogram", name, labels, lambda: Histogram(buckets))
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of the enclosed block in seconds, also if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        """Register collector(registry), called before every snapshot and scrape."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def _collect(self):
+        for collector in list(self._collectors):
+            try:
+                collector(self)
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+
+    def get(self, name, **labels):
+        """Current value of a counter or gauge, or the Histogram, None if not recorded."""
+        with self._lock:
+            return self._metrics.get(name, {}).get(_label_key(labels))
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: name -> {"type": kind, "series": [{"labels": {...}, "value": ...}]}, with
+            histograms summarized by count, sum, mean, max and estimated p50/p99.
+        """
+        self._collect()
+        result = {}
+        with self._lock:
+            for name in sorted(self._metrics):
+                kind = self._kinds[name]
+                result[name] = {
+                    "type": kind,
+                    "series": [
+                        {
+                            "labels": dict(key),
+                            "value": value.to_dict() if kind == "histogram" else value,
+                        }
+                        for key, value in sorted(self._metrics[name].items())
+                    ],
+                }
+        return result
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        self._collect()
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                kind = self._kinds[name]
+                if name in _HELP:
+                    lines.append(f"# HELP {name} {_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._metrics[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                        continue
+                    for bound, total in value.cumulative():
+                        le = (("le", _format_value(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+            self._kinds.clear()
+
+
+_metrics_registry = None
+
+
+def get_metrics_registry():
+    """Return the process-wide metrics registry shared by the monitor and the runner."""
+    global _metrics_registry
+    if _metrics_registry is None:
+        _metrics_registry = MetricsRegistry()
+    return _metrics_registry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        registry = self.server.registry
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics endpoint: {format % args}")
+
+
+class _MetricsHTTPServer(ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint of a MetricsRegistry.
+
+    Serves `/metrics` in the Prometheus text format and `/metrics.json` as a JSON snapshot.
+    It binds to 127.0.0.1 by default, so the metrics are only reachable from the master.
+    """
+
+    def __init__(self, registry=None, port=0, host="127.0.0.1"):
+        self.registry = registry if registry is not None else get_metrics_registry()
+        self._server = _MetricsHTTPServer((host, port), _MetricsHandler)
+        self._server.registry = self.registry
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics endpoint listening on port {self.port}")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
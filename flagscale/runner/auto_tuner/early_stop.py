@@ -0,0 +1,92 @@
+import codecs
+import math
+import statistics
+
+import numpy as np
+
+from omegaconf import DictConfig
+
+from flagscale.runner.train_metrics import TrainingMetricsParser
+
+
+def t_quantile(p, dof):
+    """Quantile of Student's t distribution, by the Cornish-Fisher expansion of the normal one."""
+    z = statistics.NormalDist().inv_cdf(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5 * z**5 + 16 * z**3 + 3 * z) / 96
+    g3 = (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384
+    return z + g1 / dof + g2 / dof**2 + g3 / dof**3
+
+
+class IterationStream:
+    """Follow a metric column of the training log of a running task."""
+
+    def __init__(self, path, column="elapsed_ms"):
+        self.path = path
+        self.column = column
+        self.offset = 0
+        self.parser = TrainingMetricsParser()
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def read(self):
+        """
+        Parse the lines appended to the log since the last read.
+        Returns:
+            np.ndarray: The values of all iterations logged so far.
+        """
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        self.parser.feed(self.decoder.decode(data))
+        values = np.asarray(self.parser.columns[self.column], dtype=np.float64)
+        return values[~np.isnan(values)]
+
+
+class EarlyStopper:
+    """
+    Decide from the iterations logged so far whether a running task can be stopped.
+
+    The first `warmup` iterations are skipped. Once `min_iters` iterations are left, a
+    `confidence` interval of the mean is fitted with Student's t distribution. The task
+    is stopped if the whole interval is worse than the best performance tuned so far, or
+    if the interval is narrower than `tolerance` times the mean, i.e. more iterations
+    would not change the recorded performance.
+    """
+
+    def __init__(self, config, order="ascend"):
+        early_stop = config.experiment.auto_tuner.control.get("early_stop", None)
+        self.enabled = bool(early_stop)
+        options = early_stop if isinstance(early_stop, (dict, DictConfig)) else {}
+        # The recorder skips the first iteration as well
+        self.warmup = options.get("warmup", 1)
+        self.min_iters = max(options.get("min_iters", 3), 2)
+        self.confidence = options.get("confidence", 0.95)
+        self.tolerance = options.get("tolerance", 0.02)
+        self.order = order
+
+    def interval(self, values):
+        """Returns the mean and the half width of its confidence interval."""
+        mean = float(np.mean(values))
+        std = float(np.std(values, ddof=1))
+        quantile = t_quantile(0.5 + self.confidence / 2, len(values) - 1)
+        return mean, quantile * std / math.sqrt(len(values))
+
+    def check(self, values, best=None):
+        """
+        Returns:
+            str: The reason to stop the task, or None to let it run.
+        """
+        samples = values[self.warmup :]
+        if len(samples) < self.min_iters:
+            return None
+        mean, half = self.interval(samples)
+        interval = f"{mean:.3f} +/- {half:.3f} over {len(samples)} iterations"
+        if best is not None:
+            if self.order == "ascend" and mean - half > best:
+                return f"worse than best {best}: {interval}"
+            if self.order == "descend" and mean + half < best:
+                return f"worse than best {best}: {interval}"
+        if half <= self.tolerance * mean:
+            return f"converged: {interval}"
+        return None
@@ -3,6 +3,8 @@ import os
 
 from omegaconf import OmegaConf
 
+from flagscale.runner.auto_tuner.search.searcher import _SERVE_LOAD_DIMS, _SERVE_SAMPLING_DIMS
+
 
 class Generator:
 
@@ -181,6 +183,25 @@ class ServeGenerator(Generator):
 
         return config
 
+    def gen_launch_key(self, strategy):
+        """Return the launch args of a strategy, strategies with equal keys share an engine."""
+        engine = strategy.get("engine", None)
+        return (engine,) + tuple(
+            (key, strategy[key]) for key in self.args_mapping if key in strategy
+        )
+
+    def gen_profile_args(self, strategy):
+        """Return the kwargs of the benchmark of a strategy from its runtime dims."""
+        profile_args = {
+            key: strategy[key] for key in _SERVE_LOAD_DIMS if strategy.get(key, None) is not None
+        }
+        profile_args["sampling_params"] = {
+            key: strategy[key]
+            for key in _SERVE_SAMPLING_DIMS
+            if strategy.get(key, None) is not None
+        }
+        return profile_args
+
     def gen_best_task(self, strategy, config):
         self._set_value(strategy, config)
         return config
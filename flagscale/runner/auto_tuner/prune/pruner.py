@@ -3,6 +3,7 @@ from flagscale.runner.auto_tuner.prune.memory import (
     prune_by_memory_model,
     prune_by_memory_model_util,
 )
+from flagscale.runner.auto_tuner.prune.time import prune_by_time_model
 
 
 class Pruner:
@@ -11,6 +12,7 @@ class Pruner:
         self.config = config
         self.pruned_count = 0
         self.pruned_by_memory_model = 0
+        self.pruned_by_time_model = 0
 
     def prune(self, strategy, history=[]):
         """Prune strategy based on history recorded strategies."""
@@ -23,6 +25,11 @@ class Pruner:
                 not_run = True
                 self.pruned_by_memory_model += 1
 
+        if not not_run and "time_model" in self.config.experiment.auto_tuner:
+            if prune_by_time_model(self.config, strategy, history):
+                not_run = True
+                self.pruned_by_time_model += 1
+
         if not not_run:
             for func in _HISTORY_BASED_PRUNE_FUNC:
                 if func(self.config, strategy, history):
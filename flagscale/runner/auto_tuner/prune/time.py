@@ -0,0 +1,31 @@
+import logging
+
+from flagscale.runner.auto_tuner.utils import trials
+
+logger = logging.getLogger("FlagScale-AutoTuner")
+
+
+def prune_by_time_model(config, strategy, history=[]):
+    """
+    Prune a strategy whose estimated step time is more than `time_model.prune_ratio` times
+    the estimate of the fastest strategy that has run successfully so far.
+    """
+    time_config = config.experiment.auto_tuner.get("time_model", None)
+    prune_ratio = time_config.get("prune_ratio", None) if hasattr(time_config, "get") else None
+    if prune_ratio is None or "time_model" not in strategy:
+        return False
+    estimates = [
+        task["time_model"]
+        for task in trials(history)
+        if task.get("performance") and "time_model" in task
+    ]
+    if estimates and strategy["time_model"] > prune_ratio * min(estimates):
+        logger.info(
+            f"The strategy {strategy} has been pruned by modeling time "
+            f"{strategy['time_model']:.3f}s (>{prune_ratio} x {min(estimates):.3f}s)."
+        )
+        strategy["max_mem"] = None
+        strategy["performance"] = None
+        strategy["pruned"] = True
+        return True
+    return False
@@ -0,0 +1,213 @@
+import contextlib
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.utils import strategy_key
+from flagscale.runner.utils import parse_hostfile
+
+DEFAULT_CACHE_PATH = os.path.join("~", ".cache", "flagscale", "auto_tuner.db")
+
+# Model config keys that change the step time of a strategy
+_MODEL_SHAPE_KEYS = (
+    "num_layers",
+    "hidden_size",
+    "ffn_hidden_size",
+    "num_attention_heads",
+    "num_query_groups",
+    "kv_channels",
+    "seq_length",
+    "global_batch_size",
+    "swiglu",
+    "num_experts",
+    "moe_ffn_hidden_size",
+    "moe_router_topk",
+    "moe_shared_expert_intermediate_size",
+    "multi_latent_attention",
+    "q_lora_rank",
+    "kv_lora_rank",
+    "qk_head_dim",
+    "v_head_dim",
+    "untie_embeddings_and_output_weights",
+)
+
+# System config keys that change the step time of a strategy
+_SYSTEM_KEYS = ("use_flash_attn", "transformer_impl", "overlap_grad_reduce", "overlap_param_gather")
+
+_PRECISION_KEYS = ("fp16", "bf16", "fp8")
+
+# Packages whose versions make the results of a run incomparable to another one
+_PACKAGES = ("flagscale", "torch", "transformer_engine", "flash_attn")
+
+# Keys of a tuned strategy that only make sense in the run that tried it
+_RUN_KEYS = {
+    "idx",
+    "performance",
+    "max_mem",
+    "error",
+    "pruned",
+    "cached",
+    "stopped_by_tuner",
+    "elapsed_time",
+    "start_time",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    signature TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    dims TEXT NOT NULL,
+    performance REAL,
+    max_mem TEXT,
+    error TEXT,
+    context TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (signature, strategy)
+)
+"""
+
+
+def _cache_options(config):
+    """The `auto_tuner.cache` config, which can also be just `true`."""
+    cache_config = config.experiment.auto_tuner.get("cache", None)
+    return cache_config if OmegaConf.is_config(cache_config) else {}
+
+
+def model_shape(config):
+    """
+    The model config keys that matter for performance, with the defaults Megatron derives
+    filled in, so that equivalent configs written differently share a signature.
+    """
+    model = config.train.model
+    shape = {key: model.get(key) for key in _MODEL_SHAPE_KEYS if model.get(key) is not None}
+    for key in ("swiglu", "multi_latent_attention", "untie_embeddings_and_output_weights"):
+        shape[key] = bool(shape.get(key, False))
+    hidden_size = shape.get("hidden_size")
+    if hidden_size is not None and "ffn_hidden_size" not in shape:
+        if shape["swiglu"]:
+            shape["ffn_hidden_size"] = int((4 * hidden_size * 2 / 3) / 64) * 64
+        else:
+            shape["ffn_hidden_size"] = 4 * hidden_size
+    if "num_attention_heads" in shape and "num_query_groups" not in shape:
+        shape["num_query_groups"] = shape["num_attention_heads"]
+
+    system = config.train.get("system", None) or {}
+    for key in _SYSTEM_KEYS:
+        if system.get(key) is not None:
+            shape[key] = system.get(key)
+    precision = system.get("precision", None) or {}
+    shape["precision"] = next((key for key in _PRECISION_KEYS if precision.get(key)), "fp32")
+    return shape
+
+
+def hardware_type(config):
+    """The device type from the cache config, else from the hostfile, else 'unknown'."""
+    hardware = _cache_options(config).get("hardware", None)
+    if hardware:
+        return str(hardware)
+    resources = parse_hostfile(config.experiment.get("runner", {}).get("hostfile", None))
+    if resources:
+        types = sorted({str(info["type"]) for info in resources.values() if info["type"]})
+        if types:
+            return "+".join(types)
+    return "unknown"
+
+
+def software_versions():
+    versions = {}
+    for package in _PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            continue
+    return versions
+
+
+class TuningCache:
+    """
+    SQLite database of tuning results, shared by the runs of the auto tuner.
+
+    Results are keyed by a signature of the run, i.e. the normalized model shape,
+    hardware type, nodes and cards, software versions and the performance metric, and by
+    the built-in dims of the strategy. A later run with the same signature reuses the
+    results instead of running the trials again.
+    """
+
+    def __init__(self, config, metric):
+        self.logger = logging.getLogger("FlagScale-AutoTuner")
+        self.path = os.path.expanduser(_cache_options(config).get("path", DEFAULT_CACHE_PATH))
+        self.context = {
+            "model": model_shape(config),
+            "hardware": hardware_type(config),
+            "nnodes": config.experiment.auto_tuner.nnodes,
+            "nproc_per_node": config.experiment.auto_tuner.nproc_per_node,
+            "versions": software_versions(),
+            "metric": metric,
+        }
+        encoded = json.dumps(self.context, sort_keys=True)
+        self.signature = hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(_SCHEMA)
+        self.logger.info(f"TuningCache: {self.path}, signature {self.signature} of {encoded}")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Runs on a shared file system may write at the same time, wait for their locks
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def load(self):
+        """
+        Returns:
+            dict: strategy_key -> strategy with the results of an earlier run, marked cached.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT strategy, dims, performance, max_mem, error FROM results "
+                "WHERE signature = ?",
+                (self.signature,),
+            ).fetchall()
+        results = {}
+        for key, dims, performance, max_mem, error in rows:
+            strategy = json.loads(dims)
+            strategy.update(performance=performance, max_mem=json.loads(max_mem), error=error)
+            strategy["cached"] = True
+            results[key] = strategy
+        self.logger.info(f"TuningCache: loaded {len(results)} results of earlier runs.")
+        return results
+
+    def put(self, strategy):
+        """Store the result of a trial, skipping pruned, reused and unfinished strategies."""
+        if strategy.get("pruned", False) or strategy.get("cached", False):
+            return
+        if strategy.get("performance") is None and strategy.get("max_mem") != "OOM":
+            return
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.signature,
+                    strategy_key(strategy),
+                    json.dumps(
+                        {key: value for key, value in strategy.items() if key not in _RUN_KEYS},
+                        default=str,
+                    ),
+                    strategy["performance"],
+                    json.dumps(strategy.get("max_mem")),
+                    strategy.get("error"),
+                    json.dumps(self.context, sort_keys=True),
+                    time.time(),
+                ),
+            )
@@ -1,10 +1,35 @@
+import json
 import logging
 import os
 import re
 import subprocess
 
+import numpy as np
 import pandas as pd
 
+from flagscale.runner.train_metrics import parse_metrics_file
+
+# Log patterns that are served by the structured metrics parser instead of a regex scan
+_METRIC_COLUMNS = {
+    r"elapsed time per iteration \(ms\):": "elapsed_ms",
+    "max reserved": "max_reserved_mb",
+    "max allocated": "max_allocated_mb",
+}
+
+# Whether a lower (ascend) or a higher (descend) value of a serve metric is better
+_SERVE_METRIC_ORDERS = {
+    "e2e_latency": "ascend",
+    "request_throughput": "descend",
+    "token_throughput": "descend",
+    "ttft": "ascend",
+    "itl": "ascend",
+    "topt": "ascend",
+    "p99_ttft": "ascend",
+    "p99_tpot": "ascend",
+    "p99_itl": "ascend",
+    "p99_e2el": "ascend",
+}
+
 
 class Recorder:
 
@@ -21,6 +46,8 @@ class Recorder:
             )
         else:
             self.metric = "elapsed time per iteration \(ms\):"
+        # Column of the metric in the structured metrics of a log, None for custom patterns
+        self.metric_column = _METRIC_COLUMNS.get(self.metric)
 
         # Sort order of performance, order just in [ascend, and descend], default ascend
         if (
@@ -145,11 +172,18 @@ class Recorder:
         if not os.path.exists(path):
             raise ValueError(f"The path do not exist: {path}")
         memory_pattern = pattern + r":* *(\d+(\.\d*)?)|(\d+(\.\d*)?) *" + pattern
+        column = _METRIC_COLUMNS.get(pattern)
         max_memory = None
         for item in os.listdir(path):
             if not item.startswith("host_") and not item.endswith(".output"):
                 continue
             file_path = os.path.join(path, item)
+            if column is not None:
+                values = parse_metrics_file(file_path).to_arrays()[column]
+                values = values[~np.isnan(values)]
+                if values.size and (max_memory is None or values.max() > max_memory):
+                    max_memory = float(values.max())
+                continue
             with open(file_path, "rb") as f:
                 for _ in f:
                     try:
@@ -222,6 +256,25 @@ class Recorder:
         metric_pattern = pattern + r":* *(\d+(\.\d*)?)|(\d+(\.\d*)?) *" + pattern
         if not path or not os.path.exists(path):
             return None
+        column = _METRIC_COLUMNS.get(pattern)
+        if column is not None:
+            values = parse_metrics_file(path).to_arrays()[column]
+            performance = values[~np.isnan(values)].tolist()
+        else:
+            performance = self._grep_values(path, metric_pattern)
+        if not performance:
+            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {None}")
+            return None
+        if len(performance) == 1:
+            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {performance[0]} ms")
+            return round(performance[0], 3)
+        else:
+            average = sum(performance[1:]) / (len(performance) - 1)
+            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {average} ms")
+            return round(average, 3)
+
+    def _grep_values(self, path, metric_pattern):
+        """Return the values of a custom metric pattern, one per matching line."""
         performance = []
         with open(path, "rb") as f:
             for _ in f:
@@ -240,16 +293,7 @@ class Recorder:
                         except:
                             continue
                     assert value is not None, "Can't grep the performance"
-        if not performance:
-            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {None}")
-            return None
-        if len(performance) == 1:
-            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {performance[0]} ms")
-            return round(performance[0], 3)
-        else:
-            average = sum(performance[1:]) / (len(performance) - 1)
-            self.logger.info(f"task_{self.cur_strategy['idx']} performance: {average} ms")
-            return round(average, 3)
+        return performance
 
     def grep_error(self, path, pattern="Error:"):
         """Read the log file and return the error"""
@@ -282,7 +326,8 @@ class Recorder:
     def sort(self, history):
         no_pruned_history = []
         for strategy in history:
-            if not strategy.get("pruned", False):
+            # Strategies still running in parallel have no performance recorded yet
+            if not strategy.get("pruned", False) and "performance" in strategy:
                 no_pruned_history.append(strategy)
 
         sorted_history = None
@@ -310,6 +355,8 @@ class Recorder:
         cols = df.columns.tolist()
         cols.insert(0, cols.pop(cols.index("idx")))
         df = df.reindex(columns=cols)
+        # Results reused from the tuning cache have no task id
+        df["idx"] = df["idx"].astype("Int64")
         if "stopped_by_tuner" in df.columns:
             df = df.drop(columns=["stopped_by_tuner"])
         df.to_csv(self.path, index=False, escapechar="\\")
@@ -322,29 +369,55 @@ class ServeRecorder(Recorder):
             "auto_tuner" in self.config.experiment
             and "performance" in self.config.experiment.auto_tuner
         ):
-            self.metric = self.config.experiment.auto_tuner.performance.get("metric", "itl")
+            performance_config = self.config.experiment.auto_tuner.performance
         else:
-            self.metric = "itl"
+            performance_config = {}
+        self.metric = performance_config.get("metric", "itl")
 
         # Sort order of performance, order just in [ascend, and descend], default ascend
-        if (
-            "auto_tuner" in self.config.experiment
-            and "performance" in self.config.experiment.auto_tuner
-        ):
-            self.sorted_order = self.config.experiment.auto_tuner.performance.get("order", "ascend")
-        else:
-            self.sorted_order = "ascend"
+        self.sorted_order = performance_config.get("order", "ascend")
+
+        # SLO tiers like {"interactive": {"p99_ttft": 200}}, a tier bounds latencies from above
+        # and throughputs from below. The first tier chooses the best strategy.
+        self.slo = {
+            tier: dict(bounds) for tier, bounds in performance_config.get("slo", {}).items()
+        }
+        # Metrics of the Pareto front, the metric and the SLO metrics by default
+        objectives = performance_config.get("pareto", None)
+        if objectives is None:
+            objectives = [self.metric]
+            for bounds in self.slo.values():
+                objectives += [metric for metric in bounds if metric not in objectives]
+        self.objectives = list(objectives)
+        for metric in self.objectives + [m for bounds in self.slo.values() for m in bounds]:
+            if metric not in _SERVE_METRIC_ORDERS:
+                raise ValueError(
+                    f"The serve metric {metric} is not supported, "
+                    f"supported are {list(_SERVE_METRIC_ORDERS.keys())}."
+                )
+
         self.logger = logging.getLogger("FlagScale-AutoTuner")
         self.cur_strategy = None
         self.path = os.path.join(config.experiment.exp_dir, "auto_tuner", "history.csv")
+        self.report_path = os.path.join(config.experiment.exp_dir, "auto_tuner", "pareto.json")
 
     def record(self, strategy, performance):
+        if performance is None:
+            # The engine failed to serve or to be profiled
+            metrics = ["e2e_latency", "request_throughput", "token_throughput", "ttft", "itl"]
+            strategy.update(dict.fromkeys(metrics + ["topt"]))
+            strategy.update(dict.fromkeys(["p99_ttft", "p99_tpot", "p99_itl", "p99_e2el"]))
+            self.cur_strategy = strategy
+            return
         strategy["e2e_latency"] = round(performance["mean_e2el_ms"], 2)
         strategy["request_throughput"] = round(performance["request_throughput"], 2)
         strategy["token_throughput"] = round(performance["total_token_throughput"], 2)
         strategy["ttft"] = round(performance["mean_ttft_ms"], 2)
         strategy["itl"] = round(performance["mean_itl_ms"], 2)
         strategy["topt"] = round(performance["mean_tpot_ms"], 2)
+        for name in ["ttft", "tpot", "itl", "e2el"]:
+            value = performance.get(f"p99_{name}_ms", None)
+            strategy[f"p99_{name}"] = round(value, 2) if value is not None else None
         self.cur_strategy = strategy
 
     def sort(self, history):
@@ -364,3 +437,61 @@ class ServeRecorder(Recorder):
             raise ValueError(f"The sorted order {self.sorted_order} is not supported.")
         assert sorted_history is not None
         return sorted_history
+
+    def _costs(self, strategy):
+        """Return the objectives of a strategy as costs to minimize, None if not measured."""
+        costs = []
+        for metric in self.objectives:
+            value = strategy.get(metric, None)
+            if value is None:
+                return None
+            costs.append(value if _SERVE_METRIC_ORDERS[metric] == "ascend" else -value)
+        return costs
+
+    def meets_slo(self, strategy, tier):
+        """Return True if the measured metrics of a strategy are within the bounds of a tier."""
+        for metric, bound in self.slo[tier].items():
+            value = strategy.get(metric, None)
+            if value is None:
+                return False
+            if _SERVE_METRIC_ORDERS[metric] == "ascend" and value > bound:
+                return False
+            if _SERVE_METRIC_ORDERS[metric] == "descend" and value < bound:
+                return False
+        return True
+
+    def pareto_front(self, history):
+        """Return the strategies no other strategy is at least as good as on every objective."""
+        points = [(self._costs(strategy), strategy) for strategy in history]
+        points = [(costs, strategy) for costs, strategy in points if costs is not None]
+        front = []
+        for costs, strategy in points:
+            dominated = any(
+                other != costs and all(o <= c for o, c in zip(other, costs)) for other, _ in points
+            )
+            if not dominated:
+                front.append(strategy)
+        return front
+
+    def operating_points(self, history):
+        """Return the best strategy meeting each SLO tier, None for a tier no one meets."""
+        points = {}
+        for tier in self.slo:
+            sorted_history = self.sort([s for s in history if self.meets_slo(s, tier)])
+            if sorted_history and sorted_history[0][self.metric] is not None:
+                points[tier] = sorted_history[0]
+            else:
+                points[tier] = None
+        return points
+
+    def report(self, history):
+        """Store the Pareto front and the operating point of each SLO tier to a json file."""
+        report = {
+            "objectives": self.objectives,
+            "front": self.pareto_front(history),
+            "slo": self.slo,
+            "operating_points": self.operating_points(history),
+        }
+        with open(self.report_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        return report
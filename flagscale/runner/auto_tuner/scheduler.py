@@ -0,0 +1,91 @@
+import copy
+import logging
+import os
+
+from flagscale.runner.utils import ResourceManager, parse_hostfile
+
+
+class Trial:
+    """A tuning task and the slice of the cluster it runs on."""
+
+    def __init__(self, strategy, task, hosts=None, runner=None, start_time=None):
+        self.strategy = strategy
+        self.task = task
+        self.hosts = hosts
+        self.runner = runner
+        self.start_time = start_time
+        # Whether the job and the sub process have been seen running
+        self.running = False
+        self.sub_process_running = False
+        # Iterations logged by the task so far, followed for early stopping
+        self.stream = None
+
+
+class TrialScheduler:
+    """
+    Place tuning tasks side by side on disjoint slices of the cluster.
+
+    A strategy of the search space needs `auto_tuner.nnodes` nodes, which can be fewer
+    than the nodes of the hostfile. The hostfile is split into slices of that many whole
+    nodes and every trial gets a slice of its own, allocated with a ResourceManager, so
+    up to `control.parallel_trials` tasks run and are monitored at the same time.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger("FlagScale-AutoTuner")
+        self.nnodes = config.experiment.auto_tuner.nnodes
+        self.resources = parse_hostfile(config.experiment.runner.get("hostfile", None))
+        if self.resources is None:
+            raise ValueError("Running tuning tasks in parallel needs a hostfile.")
+        self.resource_manager = ResourceManager(
+            [
+                [host, {"slots": info["slots"], "type": info["type"] or "gpu"}]
+                for host, info in self.resources.items()
+            ]
+        )
+        parallel_trials = config.experiment.auto_tuner.control.get("parallel_trials", 1)
+        self.slots = min(parallel_trials, len(self.resources) // self.nnodes)
+        self.logger.info(
+            f"TrialScheduler: {self.slots} slices of {self.nnodes} nodes "
+            f"out of {len(self.resources)} nodes."
+        )
+
+    def allocate(self):
+        """Return the hosts of a free slice, or None if all slices are taken."""
+        free = [node for node in self.resource_manager.nodes if node["used"] == 0]
+        if len(free) < self.nnodes:
+            return None
+        hosts = []
+        for node in free[: self.nnodes]:
+            self.resource_manager.get_available_card_ids(
+                resource_type=node["type"], address=node["address"], num=node["slots"]
+            )
+            hosts.append(node["address"])
+        return hosts
+
+    def release(self, hosts):
+        """Give the slice of a finished trial back."""
+        for node in self.resource_manager.nodes:
+            if node["address"] in hosts:
+                self.resource_manager.release_card_ids(
+                    resource_type=node["type"], address=node["address"], num=node["slots"]
+                )
+
+    def place(self, task, hosts):
+        """
+        Restrict a task to a slice by giving it a hostfile with the hosts of the slice.
+        Returns:
+            DictConfig: The task config with the hostfile of the slice.
+        """
+        task = copy.deepcopy(task)
+        os.makedirs(task.experiment.exp_dir, exist_ok=True)
+        hostfile = os.path.join(task.experiment.exp_dir, "hostfile")
+        with open(hostfile, "w") as f:
+            for host in hosts:
+                info = self.resources[host]
+                machine_type = f" type={info['type']}" if info["type"] else ""
+                f.write(f"{host} slots={info['slots']}{machine_type}\n")
+        task.experiment.runner.hostfile = hostfile
+        task.experiment.runner.nnodes = len(hosts)
+        return task
@@ -1,11 +1,25 @@
+import collections
+import itertools
+import logging
+import math
+import random
+
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+from flagscale.runner.auto_tuner.time_model import StepTimeModel
 from flagscale.runner.auto_tuner.utils import (
     sort_by_memory,
     sort_by_memory_model,
     sort_by_performance,
+    sort_by_time_model,
+    strategy_key,
 )
 
+# Keys added to the strategies by the searcher that are not dims of the search space
+_NON_DIM_KEYS = {"memory_model", "gpu_utilization", "time_model"}
+
 
 class Algo(ABC):
     def __init__(self, strategies, config):
@@ -20,40 +34,405 @@ class Algo(ABC):
     def has_done(self):
         pass
 
+    def warm_start(self, results):
+        """Learn from the results of earlier runs before the first search."""
+        pass
+
 
 class GridAlgo(Algo):
+    """
+    Return the strategies in the order of the search space.
+
+    The strategies are pulled from the (possibly lazy) space one at a time. Once an order
+    is set by `checkout`, the strategies still to run are sorted in windows of
+    `algo.window` strategies, so sorting does not enumerate and score a huge space up
+    front. The default window of 65536 strategies sorts any practical space as a whole,
+    like a sort of the full list. A space larger than the window is only sorted within
+    each window, e.g. the strategy with the lowest modeled memory may run after windows
+    of others.
+    """
 
     def __init__(self, strategies, config):
         super().__init__(strategies, config)
         self.idx = 0
-        # Sort by modeling memory
-        if "memory_model" in self.config.experiment.auto_tuner:
+        self.window = config.experiment.auto_tuner.get("algo", {}).get("window", 1 << 16)
+        self._pending = iter(strategies)
+        self._buffer = collections.deque()
+        self._sort = None
+        # Sort by the estimated step time, else by modeling memory
+        if "time_model" in self.config.experiment.auto_tuner:
+            self.checkout(mode="time_model")
+        elif "memory_model" in self.config.experiment.auto_tuner:
             self.checkout(mode="memory_model")
 
     def checkout(self, mode):
         if mode == "memory":
-            if self.idx > 0 and self.idx < len(self.strategies):
-                self.strategies = self.strategies[: self.idx] + sorted(
-                    self.strategies[self.idx :], key=sort_by_memory
-                )
+            if self.idx > 0 and not self.has_done():
+                self._set_sort(sort_by_memory)
         elif mode == "memory_model":
-            self.strategies = sorted(self.strategies, key=sort_by_memory_model, reverse=True)
+            self._set_sort(sort_by_memory_model, reverse=True)
+        elif mode == "time_model":
+            self._set_sort(sort_by_time_model)
         elif mode == "performance":
-            if self.idx > 0 and self.idx < len(self.strategies):
-                self.strategies = self.strategies[: self.idx] + sorted(
-                    self.strategies[self.idx :], key=sort_by_performance
-                )
+            if self.idx > 0 and not self.has_done():
+                self._set_sort(sort_by_performance)
+
+    def _set_sort(self, key, reverse=False):
+        # Strategies pulled ahead are sorted together with the next window
+        self._sort = (key, reverse)
+        self._pending = itertools.chain(self._buffer, self._pending)
+        self._buffer = collections.deque()
+
+    def _fill(self):
+        if self._buffer:
+            return
+        size = 1 if self._sort is None else self.window
+        self._buffer.extend(itertools.islice(self._pending, size))
+        if self._sort is not None:
+            key, reverse = self._sort
+            self._buffer = collections.deque(sorted(self._buffer, key=key, reverse=reverse))
 
     def search(self):
         """Return a task iteratively."""
+        self._fill()
         strategy = None
-        if self.idx < len(self.strategies):
-            strategy = self.strategies[self.idx]
+        if self._buffer:
+            strategy = self._buffer.popleft()
             self.idx += 1
         return strategy
 
     def has_done(self):
         """Return True if the task space is empyt."""
-        if self.idx >= len(self.strategies):
+        self._fill()
+        return not self._buffer
+
+
+def _encode_strategies(strategies):
+    """
+    Encode the dims of the strategies.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Features scaled to [0, 1], numeric dims on a log
+        scale and categorical dims one-hot, and the category code of every dim.
+    """
+    if not strategies:
+        return np.zeros((0, 0)), np.zeros((0, 0), dtype=int)
+    dims = [dim for dim in strategies[0] if dim not in _NON_DIM_KEYS]
+    features = []
+    codes = []
+    for dim in dims:
+        values = [strategy.get(dim) for strategy in strategies]
+        categories = {value: code for code, value in enumerate(sorted(set(map(str, values))))}
+        codes.append([categories[str(value)] for value in values])
+        if all(value is None or isinstance(value, (bool, int, float)) for value in values):
+            features.append([math.log2(1 + float(value or 0)) for value in values])
+        elif len(categories) > 1:
+            for category in categories:
+                features.append([float(str(value) == category) for value in values])
+    features = np.array(features, dtype=float).T.reshape(len(strategies), -1)
+    low, high = features.min(axis=0, initial=np.inf), features.max(axis=0, initial=-np.inf)
+    keep = high > low
+    features = (features[:, keep] - low[keep]) / (high - low)[keep]
+    codes = np.array(codes, dtype=int).T.reshape(len(strategies), -1)
+    return features, codes
+
+
+def _squared_distances(a, b):
+    """Pairwise squared distances of the rows of a and b, without a rows x rows x dims array."""
+    distances = (a**2).sum(axis=1)[:, None] + (b**2).sum(axis=1)[None, :] - 2 * a @ b.T
+    return np.maximum(distances, 0.0)
+
+
+def _sample_strategies(strategies, size, seed=0):
+    """
+    Uniform sample of at most `size` strategies, kept in space order.
+
+    The sample is drawn in one pass (reservoir sampling), so a lazy space is never held
+    in memory as a whole.
+    """
+    rng = random.Random(seed)
+    sample = []
+    for count, strategy in enumerate(strategies):
+        if len(sample) < size:
+            sample.append((count, strategy))
+            continue
+        slot = rng.randrange(count + 1)
+        if slot < size:
+            sample[slot] = (count, strategy)
+    return [strategy for _, strategy in sorted(sample, key=lambda item: item[0])]
+
+
+def _normal_cdf(z):
+    return 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+
+
+def _normal_pdf(z):
+    return np.exp(-0.5 * z**2) / math.sqrt(2 * math.pi)
+
+
+def expected_improvement(mean, std, best, xi=0.0):
+    """Expected improvement of a minimized objective over `best` under a normal posterior."""
+    improvement = best - mean - xi
+    z = improvement / std
+    return improvement * _normal_cdf(z) + std * _normal_pdf(z)
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel.
+
+    The length scale is chosen from a small grid by marginal likelihood at every fit,
+    which is cheap for the few dozen trials a tuning run can afford.
+    """
+
+    def __init__(self, noise=1e-2, min_scale=0.2, length_scales=(0.1, 0.2, 0.4, 0.8, 1.6)):
+        self.noise = noise
+        self.min_scale = min_scale
+        self.length_scales = length_scales
+        self.length_scale = None
+
+    def _kernel(self, a, b):
+        return np.exp(-0.5 * _squared_distances(a, b) / self.length_scale**2)
+
+    def fit(self, x, y):
+        self.x = x
+        self.y_mean = y.mean()
+        # The scale is the prior uncertainty of unexplored points, keep it from collapsing
+        # after a few similar trials
+        self.y_scale = max(y.std(), self.min_scale)
+        y = (y - self.y_mean) / self.y_scale
+        best = None
+        num_dims = max(x.shape[1], 1)
+        for length_scale in self.length_scales:
+            self.length_scale = length_scale * math.sqrt(num_dims)
+            chol = np.linalg.cholesky(self._kernel(x, x) + self.noise * np.eye(len(x)))
+            alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, y))
+            likelihood = -0.5 * y @ alpha - np.log(np.diag(chol)).sum()
+            if best is None or likelihood > best[0]:
+                best = (likelihood, self.length_scale, chol, alpha)
+        _, self.length_scale, self._chol, self._alpha = best
+        return self
+
+    def predict(self, x):
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Posterior mean and standard deviation.
+        """
+        kernel = self._kernel(x, self.x)
+        mean = kernel @ self._alpha
+        v = np.linalg.solve(self._chol, kernel.T)
+        var = np.maximum(1.0 - (v**2).sum(axis=0), 1e-12)
+        return mean * self.y_scale + self.y_mean, np.sqrt(var) * self.y_scale
+
+
+class BayesianAlgo(Algo):
+    """
+    Bayesian optimization of the performance metric over the candidate strategies.
+
+    Every trial is a real launch on the cluster, so instead of walking the strategies in
+    order the next strategy is the untried one with the highest expected improvement.
+    The surrogate is a Gaussian process on the log of the metric whose prior mean is the
+    step time of the StepTimeModel, the `time_model` of the searcher if configured, else
+    the model with the default device profile, so the first trials follow the model and later
+    ones follow the measurements. The improvement is weighted by the probability that the
+    strategy runs at all, which starts from the memory model (if configured) and is
+    updated with the failures and OOMs of similar strategies.
+
+    The algorithm learns from the strategies it returned: the tuner records the result
+    of each trial into the same dict it appends to its history. Every candidate is scored
+    at every trial, so a lazy strategy space is enumerated once when the algorithm is
+    built and only a uniform sample of at most `max_candidates` strategies is kept.
+    """
+
+    def __init__(self, strategies, config):
+        auto_tuner_config = config.experiment.auto_tuner
+        algo_config = auto_tuner_config.get("algo", {})
+        self.max_candidates = algo_config.get("max_candidates", 4096)
+        if self.max_candidates is None:
+            strategies = list(strategies)
+        else:
+            strategies = _sample_strategies(strategies, self.max_candidates)
+        super().__init__(strategies, config)
+        self.logger = logging.getLogger("FlagScale-AutoTuner")
+        if self.max_candidates is not None and len(strategies) == self.max_candidates:
+            self.logger.info(
+                f"{type(self).__name__}: search over a sample of {len(strategies)} strategies"
+            )
+        self.max_trials = algo_config.get("max_trials", None)
+        self.xi = algo_config.get("xi", 0.01)
+        performance_config = auto_tuner_config.get("performance", {})
+        self.descend = performance_config.get("order", "ascend") == "descend"
+        self.idx = 0
+        self.proposed = []
+        strategies = self.strategies
+        self._remaining = set(range(len(strategies)))
+        self._features, self._codes = _encode_strategies(strategies)
+        try:
+            self._time_model = StepTimeModel(config)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            self.logger.info(f"BayesianAlgo: no step time prior, the time model failed: {e}")
+            self._time_model = None
+        self._prior = np.array([self._prior_objective(s) for s in strategies], dtype=float)
+        self._runnable_prior = np.array([self._prior_runnable(s) for s in strategies], dtype=float)
+
+    def _prior_objective(self, strategy):
+        """Log of the estimated step time; also the prior of -log(throughput) metrics."""
+        if strategy.get("time_model"):
+            return math.log(strategy["time_model"])
+        if self._time_model is None:
+            return 0.0
+        try:
+            return math.log(self._time_model(strategy))
+        except (ImportError, KeyError, TypeError, ValueError, ZeroDivisionError):
+            return 0.0
+
+    def _prior_runnable(self, strategy):
+        """Prior probability that a strategy fits in memory."""
+        memory_config = self.config.experiment.auto_tuner.get("memory_model", None)
+        if "memory_model" not in strategy or "gpu_memory" not in (memory_config or {}):
+            return 0.8
+        ratio = strategy["memory_model"] / memory_config.gpu_memory
+        return 1 / (1 + math.exp(min(50.0, (ratio - 0.95) * 20)))
+
+    def _observe(self, strategy):
+        """
+        Returns:
+            Tuple[bool, float]: Whether the trial ran and its objective (lower is better),
+            or None if the strategy was pruned without a trial or is still running.
+        """
+        if strategy.get("max_mem") == "OOM":
+            return False, None
+        if strategy.get("pruned", False) or "performance" not in strategy:
+            return None
+        performance = strategy["performance"]
+        if not performance or performance <= 0:
+            return False, None
+        objective = math.log(performance)
+        return True, -objective if self.descend else objective
+
+    def _observations(self):
+        indices, runnable, objectives = [], [], []
+        for index in self.proposed:
+            observation = self._observe(self.strategies[index])
+            if observation is not None:
+                indices.append(index)
+                runnable.append(observation[0])
+                objectives.append(observation[1])
+        return np.array(indices, dtype=int), np.array(runnable, dtype=bool), objectives
+
+    def _runnable_probability(self, candidates, indices, runnable):
+        """Blend the memory prior with the outcomes of nearby trials, weighted by similarity."""
+        prior = self._runnable_prior[candidates]
+        if not len(indices):
+            return prior
+        distances = _squared_distances(self._features[candidates], self._features[indices])
+        weights = np.exp(-0.5 * distances / (0.2**2 * max(self._features.shape[1], 1)))
+        return (prior + weights @ runnable) / (1 + weights.sum(axis=1))
+
+    def acquisition(self, candidates):
+        """
+        Score candidate strategies (indices into `strategies`), the highest is tried next.
+        """
+        indices, runnable, objectives = self._observations()
+        probability = self._runnable_probability(candidates, indices, runnable)
+        measured = indices[runnable]
+        if not len(measured):
+            # Nothing ran yet, follow the priors
+            return probability * np.exp(-(self._prior[candidates] - self._prior.min()))
+        y = np.array([objectives[i] for i in np.flatnonzero(runnable)])
+        gp = GaussianProcess().fit(self._features[measured], y - self._prior[measured])
+        mean, std = gp.predict(self._features[candidates])
+        mean = mean + self._prior[candidates]
+        return probability * expected_improvement(mean, std, y.min(), self.xi)
+
+    def candidates(self):
+        """Indices of the strategies that may be tried next."""
+        return np.array(sorted(self._remaining), dtype=int)
+
+    def _num_trials(self):
+        return sum(
+            not self.strategies[index].get("pruned", False)
+            and not self.strategies[index].get("cached", False)
+            for index in self.proposed
+        )
+
+    def warm_start(self, results):
+        """Observe the cached results as if the strategies had been tried in this run."""
+        indices = {strategy_key(strategy): index for index, strategy in enumerate(self.strategies)}
+        for key, result in results.items():
+            index = indices.get(key)
+            if index is None or index not in self._remaining:
+                continue
+            self.strategies[index].update(result)
+            self._remaining.discard(index)
+            self.proposed.append(index)
+
+    def search(self):
+        """Return the strategy with the highest acquisition."""
+        if self.has_done():
+            return None
+        candidates = self.candidates()
+        scores = self.acquisition(candidates)
+        index = int(candidates[int(np.argmax(scores))])
+        self._remaining.discard(index)
+        self.proposed.append(index)
+        self.idx += 1
+        self.logger.info(
+            f"{type(self).__name__}: trial {self._num_trials() + 1} picks strategy with "
+            f"score {float(np.max(scores)):.4g} out of {len(candidates)} candidates"
+        )
+        return self.strategies[index]
+
+    def has_done(self):
+        if not self._remaining:
             return True
-        return False
+        return self.max_trials is not None and self._num_trials() >= self.max_trials
+
+    def checkout(self, mode):
+        # The surrogate already ranks the strategies by the measured performance and memory.
+        pass
+
+
+class EvolutionAlgo(BayesianAlgo):
+    """
+    Evolutionary search guided by the same surrogate as BayesianAlgo.
+
+    The best measured strategies form the population. Offspring are the untried strategies
+    that differ from a parent in at most `mutation` dims, or that combine the dims of two
+    parents (crossover); the offspring with the highest expected improvement is tried next.
+    Staying close to strategies that are known to run avoids spending trials on distant
+    regions of large search spaces that the surrogate cannot judge yet.
+    """
+
+    def __init__(self, strategies, config):
+        super().__init__(strategies, config)
+        algo_config = config.experiment.auto_tuner.get("algo", {})
+        self.population_size = algo_config.get("population_size", 4)
+        self.mutation = algo_config.get("mutation", 1)
+
+    def population(self):
+        """Indices of the best measured strategies."""
+        indices, runnable, objectives = self._observations()
+        ranked = sorted((objectives[i], int(indices[i])) for i in np.flatnonzero(runnable))
+        return [index for _, index in ranked[: self.population_size]]
+
+    def candidates(self):
+        remaining = super().candidates()
+        parents = self.population()
+        if not parents:
+            return remaining
+        codes = self._codes[remaining]
+        offspring = np.zeros(len(remaining), dtype=bool)
+        for first, parent in enumerate(parents):
+            differences = (codes != self._codes[parent]).sum(axis=1)
+            offspring |= differences <= self.mutation
+            for other in parents[first + 1 :]:
+                offspring |= ((codes == self._codes[parent]) | (codes == self._codes[other])).all(
+                    axis=1
+                )
+        # Widen the mutation until some strategy is left
+        mutation = self.mutation
+        while not offspring.any():
+            mutation += 1
+            for parent in parents:
+                offspring |= (codes != self._codes[parent]).sum(axis=1) <= mutation
+        return remaining[offspring]
@@ -1,4 +1,3 @@
-import copy
 import itertools
 import json
 import logging
@@ -9,7 +8,8 @@ from functools import reduce
 from omegaconf import OmegaConf
 
 from flagscale.runner.auto_tuner.memory_model import default_model
-from flagscale.runner.auto_tuner.search.algorithm import GridAlgo
+from flagscale.runner.auto_tuner.search.algorithm import BayesianAlgo, EvolutionAlgo, GridAlgo
+from flagscale.runner.auto_tuner.time_model import StepTimeModel
 from flagscale.runner.auto_tuner.utils import divisible
 
 BUILT_IN_STRATEGY_DIMS = [
@@ -70,6 +70,54 @@ _DEFAULT_SERVE_TUNE_SPACE = {
     },
 }
 
+# Dims applied per request by the benchmark client. Sweeping them needs no engine restart,
+# unlike the dims above which are launch args of the engine. The load dims shape the traffic
+# and the sampling dims are sent with every request.
+_SERVE_LOAD_DIMS = ["request_rate", "burstiness", "max_concurrency"]
+_SERVE_SAMPLING_DIMS = ["temperature", "top_p"]
+_SERVE_RUNTIME_DIMS = _SERVE_LOAD_DIMS + _SERVE_SAMPLING_DIMS
+
+
+def _unique(values):
+    """Drop repeated values of a dim, keeping the order."""
+    return list(dict.fromkeys(values))
+
+
+class StrategySpace:
+    """
+    Lazily enumerated candidate strategies of a search space.
+
+    Iterating runs the product of the search space stage by stage and yields one strategy
+    at a time, so building the space costs nothing and the search algorithm only pays for
+    the strategies it pulls. `annotate` is called on every strategy when it is yielded,
+    e.g. to score it by the memory model. Each iteration enumerates the space again.
+    """
+
+    def __init__(self, enumerate_func, annotate=None):
+        self._enumerate = enumerate_func
+        self.annotate = annotate
+        self._size = None
+
+    def __iter__(self):
+        count = 0
+        for strategy in self._enumerate():
+            if self.annotate is not None:
+                self.annotate(strategy)
+            count += 1
+            yield strategy
+        self._size = count
+
+    def __len__(self):
+        """Number of strategies, counted without annotating them on the first call."""
+        if self._size is None:
+            self._size = sum(1 for _ in self._enumerate())
+        return self._size
+
+    @property
+    def size(self):
+        """Number of strategies if already known, None before the space was enumerated."""
+        return self._size
+
 
 def get_first_last_num_layers_for_pp(num_layers, pp_size):
     if pp_size == 2:
@@ -106,16 +154,6 @@ class Searcher:
             )
         )
 
-        # Build strategies by Cartesian product search space
-        start_time = time.time()
-        self.strategies = self.build_strategies(self.space, self.config)
-        end_time = time.time()
-        self.logger.info(
-            "Searcher: build {} candidate strategies in {:.2f} seconds.".format(
-                len(self.strategies), end_time - start_time
-            )
-        )
-
         if "memory_model" in self.config.experiment.auto_tuner:
             # In the future, the memory model will be loaded by yaml
             model_name = self.config.experiment.auto_tuner.memory_model.get("model_name", "default")
@@ -124,16 +162,25 @@ class Searcher:
                     "The memory model {} is not implemented yet.".format(model_name)
                 )
 
-            for strategy in self.strategies:
-                strategy["memory_model"] = default_model(strategy, self.config)
-                strategy["gpu_utilization"] = self.config.experiment.auto_tuner.memory_model.get(
-                    "gpu_utilization", [0.2, 0.8]
-                )
-                self.logger.info(
-                    "Searcher: strategy is {}, memory model is {} MB".format(
-                        strategy, strategy["memory_model"]
-                    )
-                )
+        # Estimate the step time of strategies to sort and prune them before running
+        self.time_model = None
+        if "time_model" in self.config.experiment.auto_tuner:
+            self.time_model = StepTimeModel(self.config)
+
+        # Build strategies by Cartesian product search space
+        start_time = time.time()
+        self.strategies = self.build_strategies(self.space, self.config)
+        end_time = time.time()
+        self.logger.info(
+            "Searcher: build {} in {:.2f} seconds.".format(
+                (
+                    "lazy strategy space"
+                    if isinstance(self.strategies, StrategySpace)
+                    else f"{len(self.strategies)} candidate strategies"
+                ),
+                end_time - start_time,
+            )
+        )
 
         # Build search algorithm to explore strategies
         self.algo = self.build_algo(self.strategies, self.config)
@@ -308,50 +355,96 @@ class Searcher:
         return space
 
     def build_strategies(self, space, config):
-        """Build strategies by Cartesian product search space."""
-        parallelism_part = self._product_parallel_dims(space, config)
-        micro_batch_size_vpp_part = self._product_micro_batch_size_vpp_dims(
-            parallelism_part, space, config
+        """
+        Build strategies by Cartesian product search space.
+        The product is enumerated lazily, stage by stage, so only the strategies the search
+        algorithm pulls are built and scored by the memory model.
+        """
+
+        def enumerate_strategies():
+            # Dims set in the yaml are ListConfigs, iterate plain lists in the loops
+            dims = {key: list(values) for key, values in space.items()}
+            parallelism_part = self._product_parallel_dims(dims, config)
+            micro_batch_size_vpp_part = self._product_micro_batch_size_vpp_dims(
+                parallelism_part, dims, config
+            )
+            return self._product_recompute_dims(micro_batch_size_vpp_part, dims, config)
+
+        annotators = []
+        if "memory_model" in config.experiment.auto_tuner:
+            annotators.append(self._annotate_memory_model)
+        if self.time_model is not None:
+            annotators.append(self._annotate_time_model)
+
+        def annotate(strategy):
+            for annotator in annotators:
+                annotator(strategy)
+
+        return StrategySpace(enumerate_strategies, annotate if annotators else None)
+
+    def _annotate_memory_model(self, strategy):
+        """Score a strategy by the memory model when the search algorithm considers it."""
+        strategy["memory_model"] = default_model(strategy, self.config)
+        strategy["gpu_utilization"] = self.config.experiment.auto_tuner.memory_model.get(
+            "gpu_utilization", [0.2, 0.8]
+        )
+        self.logger.info(
+            "Searcher: strategy is {}, memory model is {} MB".format(
+                strategy, strategy["memory_model"]
+            )
         )
-        recompute_part = self._product_recompute_dims(micro_batch_size_vpp_part, space, config)
 
-        return recompute_part
+    def _annotate_time_model(self, strategy):
+        """Estimate the step time of a strategy when the search algorithm considers it."""
+        strategy["time_model"] = self.time_model(strategy)
+        self.logger.info(
+            "Searcher: strategy is {}, time model is {:.3f} s".format(
+                strategy, strategy["time_model"]
+            )
+        )
 
     def build_algo(self, strategies, config):
         name = self.config.experiment.auto_tuner.algo.name
         if name == "grid":
             return GridAlgo(strategies, self.config)
+        elif name in ("bayes", "bayesian"):
+            return BayesianAlgo(strategies, self.config)
+        elif name == "evolution":
+            return EvolutionAlgo(strategies, self.config)
         else:
-            raise NotImplementedError("Currently only grid search is supported.")
+            raise NotImplementedError(
+                f"Search algorithm {name} is not supported, use grid, bayes or evolution."
+            )
 
-    def _product_parallel_dims(self, space, config):
+    def _iter_parallelism_dims(self, space, config):
+        """Yield the combinations of parallel degrees whose product is the number of cards."""
         # Avoid space explosion after product
         cards = config.experiment.auto_tuner.cards
+        gbs = config.train.model.global_batch_size
+        hidden_size = config.train.model.hidden_size
+        num_attention_size = config.train.model.num_attention_heads
+        num_layers = config.train.model.num_layers
+        seq_length = config.train.model.seq_length
+        context_parallel_sizes = set(space["context_parallel_size"])
 
-        product_parallelism_dims = []
-        for data_parallel_size in space["data_parallel_size"]:
-            dims = {}
+        for data_parallel_size in _unique(space["data_parallel_size"]):
             if not divisible(cards, data_parallel_size):
                 continue
             # prune by local batch size
-            gbs = config.train.model.global_batch_size
             if not divisible(gbs, data_parallel_size):
                 continue
 
-            for tensor_model_parallel_size in space["tensor_model_parallel_size"]:
+            for tensor_model_parallel_size in _unique(space["tensor_model_parallel_size"]):
                 if not divisible(cards, tensor_model_parallel_size):
                     continue
                 if not divisible(cards, data_parallel_size * tensor_model_parallel_size):
                     continue
-
-                hidden_size = config.train.model.hidden_size
-                num_attention_size = config.train.model.num_attention_heads
                 if not divisible(hidden_size, tensor_model_parallel_size):
                     continue
                 if not divisible(num_attention_size, tensor_model_parallel_size):
                     continue
 
-                for pipeline_model_parallel_size in space["pipeline_model_parallel_size"]:
+                for pipeline_model_parallel_size in _unique(space["pipeline_model_parallel_size"]):
                     if not divisible(cards, pipeline_model_parallel_size):
                         continue
                     if not divisible(
@@ -362,7 +455,6 @@ class Searcher:
                     ):
                         continue
 
-                    num_layers = config.train.model.num_layers
                     if not divisible(num_layers, pipeline_model_parallel_size):
                         first_num_layers, last_num_layers = get_first_last_num_layers_for_pp(
                             num_layers, pipeline_model_parallel_size
@@ -378,75 +470,51 @@ class Searcher:
                         first_num_layers = None
                         last_num_layers = None
 
-                    for context_parallel_size in space["context_parallel_size"]:
-                        if not divisible(cards, context_parallel_size):
+                    # The degrees multiply to the number of cards, which leaves a single
+                    # context parallel degree instead of a loop over the whole dim
+                    context_parallel_size = cards // (
+                        data_parallel_size
+                        * tensor_model_parallel_size
+                        * pipeline_model_parallel_size
+                    )
+                    if context_parallel_size not in context_parallel_sizes:
+                        continue
+                    if not divisible(seq_length, context_parallel_size):
+                        continue
+
+                    for expert_model_parallel_size in _unique(space["expert_model_parallel_size"]):
+                        expert_tensor_parallel_size = tensor_model_parallel_size
+                        if not divisible(cards, expert_model_parallel_size):
                             continue
                         if not divisible(
                             cards,
-                            data_parallel_size
-                            * tensor_model_parallel_size
-                            * pipeline_model_parallel_size
-                            * context_parallel_size,
+                            expert_tensor_parallel_size
+                            * expert_model_parallel_size
+                            * pipeline_model_parallel_size,
                         ):
                             continue
-                        if (
-                            data_parallel_size
-                            * tensor_model_parallel_size
-                            * pipeline_model_parallel_size
-                            * context_parallel_size
-                            != cards
-                        ):
-                            continue
-                        seq_length = config.train.model.seq_length
-                        if not divisible(seq_length, context_parallel_size):
-                            continue
-
-                        for expert_model_parallel_size in space["expert_model_parallel_size"]:
-                            expert_tensor_parallel_size = tensor_model_parallel_size
-                            if not divisible(cards, expert_model_parallel_size):
-                                continue
-                            if not divisible(
-                                cards,
-                                expert_tensor_parallel_size
-                                * expert_model_parallel_size
-                                * pipeline_model_parallel_size,
-                            ):
+                        if expert_model_parallel_size > 1:
+                            num_experts = config.train.model.num_experts
+                            if not divisible(num_experts, expert_model_parallel_size):
                                 continue
-                            if expert_model_parallel_size > 1:
-                                num_experts = config.train.model.num_experts
-                                if not divisible(num_experts, expert_model_parallel_size):
-                                    continue
 
-                            dims["data_parallel_size"] = data_parallel_size
-                            dims["tensor_model_parallel_size"] = tensor_model_parallel_size
-                            dims["pipeline_model_parallel_size"] = pipeline_model_parallel_size
-                            dims["expert_model_parallel_size"] = expert_model_parallel_size
-                            dims["context_parallel_size"] = context_parallel_size
-                            dims["decoder_first_pipeline_num_layers"] = first_num_layers
-                            dims["decoder_last_pipeline_num_layers"] = (
+                        yield {
+                            "data_parallel_size": data_parallel_size,
+                            "tensor_model_parallel_size": tensor_model_parallel_size,
+                            "pipeline_model_parallel_size": pipeline_model_parallel_size,
+                            "expert_model_parallel_size": expert_model_parallel_size,
+                            "context_parallel_size": context_parallel_size,
+                            "decoder_first_pipeline_num_layers": first_num_layers,
+                            "decoder_last_pipeline_num_layers": (
                                 last_num_layers if pipeline_model_parallel_size > 2 else None
-                            )
-                            copied_dims = copy.deepcopy(dims)
-                            product_parallelism_dims.append(copied_dims)
-
-        product_dist_opt_dims = []
-        for use_distributed_optimizer in space["use_distributed_optimizer"]:
-            dims = {}
-            dims["use_distributed_optimizer"] = use_distributed_optimizer
-            copied_dims = copy.deepcopy(dims)
-            product_dist_opt_dims.append(copied_dims)
-
-        product_sp_dims = []
-        for sequence_parallel in space["sequence_parallel"]:
-            dims = {}
-            dims["sequence_parallel"] = sequence_parallel
-            copied_dims = copy.deepcopy(dims)
-            product_sp_dims.append(copied_dims)
-
-        result = []
-        unique_result = set()
-        # append sp and dist opt
-        for product_parallelism_dim in product_parallelism_dims:
+                            ),
+                        }
+
+    def _product_parallel_dims(self, space, config):
+        """Yield the parallel degrees combined with sequence parallel and distributed optimizer."""
+        for product_parallelism_dim in self._iter_parallelism_dims(space, config):
+            result = []
+            unique_result = set()
             product_dim = {}
             product_dim.update(product_parallelism_dim)
             if product_parallelism_dim["data_parallel_size"] == 1:
@@ -455,34 +523,36 @@ class Searcher:
                     product_dim["sequence_parallel"] = False
                     self._append(result, unique_result, product_dim)
                 else:
-                    for product_sp_dim in product_sp_dims:
-                        if product_sp_dim["sequence_parallel"]:
+                    for sequence_parallel in space["sequence_parallel"]:
+                        if sequence_parallel:
                             seq_length = config.train.model.seq_length
                             if not divisible(
                                 seq_length, product_parallelism_dim["tensor_model_parallel_size"]
                             ):
                                 continue
-                        product_dim["sequence_parallel"] = product_sp_dim["sequence_parallel"]
+                        product_dim["sequence_parallel"] = sequence_parallel
                         self._append(result, unique_result, product_dim)
             else:
-                for product_dist_opt_dim in product_dist_opt_dims:
-                    product_dim["use_distributed_optimizer"] = product_dist_opt_dim[
-                        "use_distributed_optimizer"
-                    ]
+                for use_distributed_optimizer in space["use_distributed_optimizer"]:
+                    product_dim["use_distributed_optimizer"] = use_distributed_optimizer
 
                     if product_parallelism_dim["tensor_model_parallel_size"] == 1:
                         product_dim["sequence_parallel"] = False
                         self._append(result, unique_result, product_dim)
                     else:
-                        for product_sp_dim in product_sp_dims:
-                            product_dim["sequence_parallel"] = product_sp_dim["sequence_parallel"]
+                        for sequence_parallel in space["sequence_parallel"]:
+                            product_dim["sequence_parallel"] = sequence_parallel
                             self._append(result, unique_result, product_dim)
-        return result
+            yield from result
 
     def _product_recompute_dims(self, micro_batch_size_vpp_part, space, config):
-        result = []
-        unique_result = set()
+        # Read the config once, attribute access on a DictConfig dominates the inner loops
+        num_layers = config.train.model.num_layers
         for micro_batch_size_vpp in micro_batch_size_vpp_part:
+            # Strategies of different parents differ, so duplicates are only searched among
+            # the strategies of one parent
+            result = []
+            unique_result = set()
             product_dim = {}
             product_dim.update(micro_batch_size_vpp)
             for use_recompute in space["use_recompute"]:
@@ -507,31 +577,27 @@ class Searcher:
                                 product_dim["recompute_num_layers"] = None
                             else:
                                 layers_per_stage = (
-                                    config.train.model.num_layers
-                                    // product_dim["pipeline_model_parallel_size"]
+                                    num_layers // product_dim["pipeline_model_parallel_size"]
                                 )
                                 if recompute_num_layers > layers_per_stage:
                                     continue
                                 if recompute_method == "uniform":
-                                    if not divisible(
-                                        config.train.model.num_layers, recompute_num_layers
-                                    ):
+                                    if not divisible(num_layers, recompute_num_layers):
                                         continue
                                     if recompute_num_layers != layers_per_stage:
                                         continue
                                 product_dim["recompute_num_layers"] = recompute_num_layers
                             self._append(result, unique_result, product_dim)
-        return result
+            yield from result
 
     def _product_micro_batch_size_vpp_dims(self, parallelism_part, space, config):
         """Just product micro_batch_size and vpp and pruned by parallel product dims."""
-        result = []
-        unique_result = set()
-
         gbs = config.train.model.global_batch_size
         num_layers = config.train.model.num_layers
 
         for parallelism in parallelism_part:
+            result = []
+            unique_result = set()
             product_dim = {}
             product_dim.update(parallelism)
             for micro_batch_size in space["micro_batch_size"]:
@@ -583,15 +649,14 @@ class Searcher:
                                 num_layers_per_virtual_pipeline_stage
                             )
                         self._append(result, unique_result, product_dim)
-
-        return result
+            yield from result
 
     def _append(self, result, unique_result, product_dim):
         sorted_items = tuple(sorted(product_dim.items()))
         if sorted_items not in unique_result:
             unique_result.add(sorted_items)
-            copied_dim = copy.deepcopy(product_dim)
-            result.append(copied_dim)
+            # The dims are scalars, a shallow copy is enough
+            result.append(dict(product_dim))
 
     def search(self):
         """Search once and return one strategy."""
@@ -724,6 +789,10 @@ class ServeSearcher(Searcher):
                 for key, value in space.items()
                 if key in _DEFAULT_SERVE_TUNE_SPACE[engine]
             }
+            # Runtime dims vary fastest, so strategies sharing an engine launch are adjacent
+            node_unaware_tune_space.update(
+                {key: space[key] for key in _SERVE_RUNTIME_DIMS if key in space}
+            )
             values = list(node_unaware_tune_space.values())
             cartesian_product_unaware_values = list(itertools.product(*values))
             if self._nodes_aware_strategies[engine]:
@@ -735,14 +804,13 @@ class ServeSearcher(Searcher):
                 cartesian_product_values = [
                     tuple(tuple(a) + b) for a, b in cartesian_product_values
                 ]
+                keys = self._nodes_aware_dims[engine] + list(node_unaware_tune_space.keys())
             else:
                 # TDOO: llama.cpp support multi-instance
                 cartesian_product_values = list(cartesian_product_unaware_values)
+                keys = list(node_unaware_tune_space.keys())
 
-            strategies = [
-                dict(zip(self.space[engine].keys(), combination))
-                for combination in cartesian_product_values
-            ]
+            strategies = [dict(zip(keys, combination)) for combination in cartesian_product_values]
             for i in strategies:
                 i["engine"] = engine
             strategies_all.extend(strategies)
@@ -0,0 +1,396 @@
+import logging
+import math
+
+from types import SimpleNamespace
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.utils import convert_config_to_megatron_args
+
+# Nominal profiles of the devices and their interconnects.
+# peak_tflops: dense bf16 peak of a card.
+# efficiency: fraction of the peak reached by the GEMMs of a large model.
+# intra/inter_node_bandwidth: bus bandwidth of collectives in GB/s within and across nodes.
+# latency: fixed cost of a collective or p2p transfer in seconds.
+# launch_overhead: fixed cost of a layer pass (forward or backward) of a micro batch in seconds.
+# overlap_exposed: fraction of the data parallel gradient reduction not hidden by the
+#   backward pass when `overlap_grad_reduce` is set.
+DEVICE_PROFILES = {
+    "A100": {
+        "peak_tflops": 312,
+        "efficiency": 0.5,
+        "intra_node_bandwidth": 230,
+        "inter_node_bandwidth": 22,
+        "latency": 2e-5,
+        "launch_overhead": 5e-5,
+        "overlap_exposed": 0.2,
+    },
+    "H100": {
+        "peak_tflops": 989,
+        "efficiency": 0.45,
+        "intra_node_bandwidth": 360,
+        "inter_node_bandwidth": 45,
+        "latency": 2e-5,
+        "launch_overhead": 4e-5,
+        "overlap_exposed": 0.2,
+    },
+    "H800": {
+        "peak_tflops": 989,
+        "efficiency": 0.45,
+        "intra_node_bandwidth": 160,
+        "inter_node_bandwidth": 45,
+        "latency": 2e-5,
+        "launch_overhead": 4e-5,
+        "overlap_exposed": 0.2,
+    },
+}
+
+# Bytes of an activation or parameter element and of a main gradient element
+_ACTIVATION_BYTES = 2
+_GRAD_BYTES = 4
+
+_ESTIMATOR_MODEL_ID = "auto_tuner_time_model"
+
+
+def _time_options(config):
+    """The `auto_tuner.time_model` config, which can also be just `true`."""
+    time_config = config.experiment.auto_tuner.get("time_model", None)
+    if OmegaConf.is_config(time_config):
+        return OmegaConf.to_container(time_config, resolve=True)
+    return {}
+
+
+def device_profile(config):
+    """
+    The profile named by `time_model.device`, A100 by default, with the profile keys set
+    in `time_model` overriding it.
+    """
+    options = _time_options(config)
+    device = options.get("device", "A100")
+    if device not in DEVICE_PROFILES:
+        raise ValueError(
+            f"Unknown device {device} of the time model, use one of {list(DEVICE_PROFILES)}."
+        )
+    profile = dict(DEVICE_PROFILES[device])
+    profile.update({key: value for key, value in options.items() if key in profile})
+    return profile
+
+
+def _vocab_size(config):
+    """The padded vocab size if set, else the tokenizer vocab size, else 0."""
+    model = config.train.model
+    if model.get("padded_vocab_size", None):
+        return model.padded_vocab_size
+    data = config.train.get("data", None) or {}
+    tokenizer = data.get("tokenizer", None) or {}
+    return tokenizer.get("vocab_size", None) or 0
+
+
+def _model_dims(config):
+    """FFN hidden size, kv channels and query groups with the defaults Megatron derives."""
+    model = config.train.model
+    hidden_size = model.hidden_size
+    ffn_hidden_size = model.get("ffn_hidden_size", None)
+    if ffn_hidden_size is None:
+        if model.get("swiglu", False):
+            ffn_hidden_size = int((4 * hidden_size * 2 / 3) / 64) * 64
+        else:
+            ffn_hidden_size = 4 * hidden_size
+    kv_channels = model.get("kv_channels", None) or hidden_size // model.num_attention_heads
+    num_query_groups = model.num_attention_heads
+    if model.get("group_query_attention", False):
+        num_query_groups = model.num_query_groups
+    return ffn_hidden_size, kv_channels, num_query_groups
+
+
+def megatron_flops(config, strategy):
+    """
+    FLOPs of the forward and backward pass of a sample by `num_floating_point_operations`
+    of the training loop, split into a transformer layer and the output layer.
+    Returns:
+        Tuple[float, float]: FLOPs of a layer and of the output layer.
+    """
+    from flagscale.train.train import num_floating_point_operations
+
+    args = convert_config_to_megatron_args(config, strategy)
+    args.is_hybrid_model = False
+    total = num_floating_point_operations(args, batch_size=1)
+    mtp_num_layers = args.mtp_num_layers or 0
+    # The logit term of the Megatron formula
+    head = 3 * 2 * args.seq_length * args.hidden_size * args.padded_vocab_size
+    head *= mtp_num_layers + 1
+    return (total - head) / (args.num_layers + mtp_num_layers), head
+
+
+def estimator_flops(config):
+    """
+    FLOPs of the forward and backward pass of a sample by the meta modules of the
+    estimator, split into a transformer layer and the output layer. MoE layers are
+    estimated as dense layers.
+    Returns:
+        Tuple[float, float]: FLOPs of a layer and of the output layer.
+    """
+    from flagscale.runner.estimator.meta_gpt import GPTModel
+    from flagscale.runner.estimator.meta_registry import get_registry, register_model
+    from flagscale.runner.estimator.meta_tensor import MetaTensor
+
+    model = config.train.model
+    ffn_hidden_size, kv_channels, num_query_groups = _model_dims(config)
+    meta_config = SimpleNamespace(
+        hidden_size=model.hidden_size,
+        num_layers=1,
+        vocab_size=_vocab_size(config),
+        max_position_embeddings=model.seq_length,
+        num_attention_heads=model.num_attention_heads,
+        num_query_groups=num_query_groups,
+        kv_channels=kv_channels,
+        ffn_hidden_size=ffn_hidden_size,
+        ffn_hidden_size_swiglu=ffn_hidden_size,
+        activation_func="swiglu" if model.get("swiglu", False) else "gelu",
+        # The FLOPs of RMSNorm and LayerNorm are alike and negligible
+        norm_type="layernorm",
+        use_rotary_position_embeddings=model.get("position_embedding_type", None) == "rope",
+        untie_embeddings_and_output_weights=model.get("untie_embeddings_and_output_weights", False),
+        tensor_parallel_size=1,
+        sequence_parallel=False,
+        add_linear_bias=model.get("add_bias_linear", True),
+        add_qkv_bias=model.get("add_qkv_bias", False),
+        hidden_dropout=0.0,
+        embedding_dropout=0.0,
+        attention_dropout_prob=0.0,
+        output_dropout_prob=0.0,
+    )
+    try:
+        registry = get_registry(_ESTIMATOR_MODEL_ID)
+    except ValueError:
+        registry = register_model(_ESTIMATOR_MODEL_ID)
+
+    # Models of one and two layers tell the FLOPs of a layer from those of the output layer
+    flops = []
+    for num_layers in (1, 2):
+        meta_config.num_layers = num_layers
+        registry.reset()
+        GPTModel(meta_config, model_id=_ESTIMATOR_MODEL_ID)(
+            input_ids=MetaTensor([1, model.seq_length])
+        )
+        flops.append(registry.total_flops)
+    layer = flops[1] - flops[0]
+    # The meta modules count the forward pass, the backward pass costs twice as much
+    return 3 * layer, 3 * (flops[0] - layer)
+
+
+def layer_params(config):
+    """Number of parameters of a dense transformer layer."""
+    model = config.train.model
+    hidden_size = model.hidden_size
+    ffn_hidden_size, kv_channels, num_query_groups = _model_dims(config)
+    query_projection_size = kv_channels * model.num_attention_heads
+    attention = hidden_size * (query_projection_size + 2 * kv_channels * num_query_groups)
+    attention += query_projection_size * hidden_size
+    mlp = (3 if model.get("swiglu", False) else 2) * hidden_size * ffn_hidden_size
+    return attention + mlp
+
+
+def stage_layers(strategy, num_layers):
+    """Number of layers of every pipeline stage."""
+    pp = strategy["pipeline_model_parallel_size"]
+    first = strategy.get("decoder_first_pipeline_num_layers")
+    last = strategy.get("decoder_last_pipeline_num_layers")
+    if pp == 1:
+        return [num_layers]
+    if first is None and last is None:
+        return [num_layers // pp + (1 if stage < num_layers % pp else 0) for stage in range(pp)]
+    first = first if first is not None else num_layers // pp
+    last = last if last is not None else num_layers // pp
+    if pp == 2:
+        return [first, last]
+    return [first] + [math.ceil((num_layers - first - last) / (pp - 2))] * (pp - 2) + [last]
+
+
+class StepTimeModel:
+    """
+    Analytical model of the time per iteration of a training strategy.
+
+    The FLOPs of a sample come from `num_floating_point_operations` of the training loop
+    when Megatron is importable, else from the meta modules of the estimator, and run at
+    the efficiency of the device profile. On top of the compute of the slowest pipeline
+    stage, the model adds the recomputed forward passes, the tensor and context parallel
+    communication of every layer, the pipeline bubble and p2p transfers and the exposed
+    data parallel gradient reduction, over the bandwidth within or across nodes depending
+    on the ranks of each group. It is meant to rank and prune strategies, the absolute
+    times are only as good as the profile.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger("FlagScale-AutoTuner")
+        self.flops_source = _time_options(config).get("flops", "auto")
+        if self.flops_source not in ("auto", "megatron", "estimator"):
+            raise ValueError(
+                f"Unknown FLOPs source {self.flops_source} of the time model, "
+                "use auto, megatron or estimator."
+            )
+        self.profile = device_profile(config)
+        self.layer_params = layer_params(config)
+        self._estimator_flops = None
+        # The Megatron FLOPs only depend on the strategy by the vocab padding of tp
+        self._megatron_flops = {}
+
+        # Plain values of the config, read for every strategy
+        model = config.train.model
+        system = config.train.get("system", None) or {}
+        _, kv_channels, num_query_groups = _model_dims(config)
+        self.model = SimpleNamespace(
+            num_layers=model.num_layers,
+            seq_length=model.seq_length,
+            hidden_size=model.hidden_size,
+            num_attention_heads=model.num_attention_heads,
+            global_batch_size=model.global_batch_size,
+            kv_channels=kv_channels,
+            num_query_groups=num_query_groups,
+        )
+        self.overlap_grad_reduce = system.get("overlap_grad_reduce", False)
+        self.nproc_per_node = config.experiment.auto_tuner.nproc_per_node
+        self.nnodes = config.experiment.auto_tuner.get("nnodes", 1)
+
+    def flops(self, strategy):
+        """FLOPs of the forward and backward pass of a sample, of a layer and of the head."""
+        if self.flops_source != "estimator":
+            tp = strategy["tensor_model_parallel_size"]
+            try:
+                if tp not in self._megatron_flops:
+                    self._megatron_flops[tp] = megatron_flops(self.config, strategy)
+                return self._megatron_flops[tp]
+            except ImportError as e:
+                if self.flops_source == "megatron":
+                    raise
+                self.logger.info(f"Time model: Megatron is not importable ({e}), use estimator.")
+                self.flops_source = "estimator"
+        if self._estimator_flops is None:
+            self._estimator_flops = estimator_flops(self.config)
+        return self._estimator_flops
+
+    def _bandwidth(self, span):
+        """Bandwidth in bytes/s of a group whose ranks span `span` consecutive ranks."""
+        if span > self.nproc_per_node and self.nnodes > 1:
+            return self.profile["inter_node_bandwidth"] * 1e9
+        return self.profile["intra_node_bandwidth"] * 1e9
+
+    def _all_reduce(self, size, volume, span):
+        """Seconds of a ring all-reduce of `volume` bytes in a group of `size` ranks."""
+        if size <= 1:
+            return 0.0
+        return 2 * (size - 1) / size * volume / self._bandwidth(span) + self.profile["latency"]
+
+    def estimate(self, strategy):
+        """
+        Returns:
+            dict: Seconds per iteration of each part of the step and their sum as `total`.
+        """
+        model = self.model
+        profile = self.profile
+        seq_length = model.seq_length
+        kv_channels, num_query_groups = model.kv_channels, model.num_query_groups
+        tp = strategy["tensor_model_parallel_size"]
+        pp = strategy["pipeline_model_parallel_size"]
+        dp = strategy["data_parallel_size"]
+        cp = strategy.get("context_parallel_size") or 1
+        micro_batch_size = strategy["micro_batch_size"]
+        num_micro_batches = strategy.get("acc_step") or (
+            model.global_batch_size // dp // micro_batch_size
+        )
+        vpp = 1
+        if strategy.get("num_layers_per_virtual_pipeline_stage"):
+            vpp = model.num_layers // pp // strategy["num_layers_per_virtual_pipeline_stage"]
+
+        layer_flops, head_flops = self.flops(strategy)
+        flops_per_second = profile["peak_tflops"] * 1e12 * profile["efficiency"]
+        # Share of the FLOPs of a sample computed by a card for a micro batch
+        shard = micro_batch_size / (tp * cp)
+
+        # Layers whose forward pass is computed again in the backward pass
+        recompute_fraction = 0.0
+        if strategy.get("use_recompute"):
+            if strategy.get("recompute_granularity") == "selective":
+                # Only the core attention, 2 * s^2 * d FLOPs in the forward of a causal layer
+                core = 2 * seq_length * seq_length * kv_channels * model.num_attention_heads
+                recompute_fraction = min(1.0, 3 * core / layer_flops)
+            else:
+                recompute_fraction = 1.0
+
+        def recomputed_layers(layers):
+            if strategy.get("recompute_method") == "block" and recompute_fraction == 1.0:
+                return min(layers, strategy.get("recompute_num_layers") or layers)
+            return layers * recompute_fraction
+
+        # Tensor parallel all-reduces of the activations, 2 in the forward and 2 in the
+        # backward of a layer, and context parallel exchanges of keys and values
+        activation_volume = micro_batch_size * seq_length / cp * model.hidden_size
+        activation_volume *= _ACTIVATION_BYTES
+        tp_layer = 4 * self._all_reduce(tp, activation_volume, tp)
+        cp_layer = 0.0
+        if cp > 1:
+            kv_volume = 2 * micro_batch_size * seq_length / cp * kv_channels * num_query_groups
+            kv_volume *= _ACTIVATION_BYTES / tp
+            cp_layer = 3 * (cp - 1) * (kv_volume / self._bandwidth(tp * cp) + profile["latency"])
+
+        # Seconds of every pipeline stage for a micro batch
+        stages = []
+        layers_per_stage = stage_layers(strategy, model.num_layers)
+        for stage, layers in enumerate(layers_per_stage):
+            flops = layers * layer_flops * shard
+            if stage == len(layers_per_stage) - 1:
+                flops += head_flops * shard
+            recomputed = recomputed_layers(layers)
+            stages.append(
+                {
+                    "compute": flops / flops_per_second + 3 * layers * profile["launch_overhead"],
+                    "recompute": recomputed * layer_flops * shard / 3 / flops_per_second,
+                    # The recomputed forward of a full layer repeats its 2 forward all-reduces
+                    "tp_comm": (layers + recomputed * (recompute_fraction == 1.0) / 2) * tp_layer,
+                    "cp_comm": layers * cp_layer,
+                }
+            )
+        slowest = max(stages, key=lambda parts: sum(parts.values()))
+
+        # Activations sent to the next stage and gradients sent back, ranks of neighboring
+        # stages are tp * cp * dp ranks apart
+        pp_comm = 0.0
+        if pp > 1:
+            p2p_volume = activation_volume / (tp if strategy.get("sequence_parallel") else 1)
+            span = tp * cp * dp + 1
+            pp_comm = 2 * vpp * (p2p_volume / self._bandwidth(span) + profile["latency"])
+
+        # The slowest stage paces the pipeline, which idles for (pp - 1) / vpp micro batches
+        result = {key: value * num_micro_batches for key, value in slowest.items()}
+        result["pp_comm"] = pp_comm * num_micro_batches
+        result["pp_bubble"] = (pp - 1) / vpp * (sum(slowest.values()) + pp_comm)
+
+        # Gradients of the largest stage reduced over the data parallel ranks
+        grad_volume = max(layers_per_stage) * self.layer_params / tp * _GRAD_BYTES
+        dp_comm = self._all_reduce(dp, grad_volume, tp * cp * dp)
+        if strategy.get("use_distributed_optimizer"):
+            # Reduce-scatter of the gradients and all-gather of the parameters instead
+            dp_comm *= (_GRAD_BYTES + _ACTIVATION_BYTES) / (2 * _GRAD_BYTES)
+        if self.overlap_grad_reduce:
+            dp_comm *= profile["overlap_exposed"]
+        result["dp_comm"] = dp_comm
+        result["total"] = sum(result.values())
+        return result
+
+    def __call__(self, strategy):
+        return self.estimate(strategy)["total"]
+
+
+def rank_strategies(strategies, config, top=None):
+    """
+    Estimate the step time of the strategies.
+    Returns:
+        List[Tuple[dict, dict]]: The strategies and their estimates, fastest first.
+    """
+    time_model = StepTimeModel(config)
+    ranked = sorted(
+        ((strategy, time_model.estimate(strategy)) for strategy in strategies),
+        key=lambda item: item[1]["total"],
+    )
+    return ranked[:top] if top else ranked
@@ -6,11 +6,15 @@ import time
 
 from omegaconf import DictConfig, OmegaConf
 
+from flagscale.runner.auto_tuner.early_stop import EarlyStopper, IterationStream
 from flagscale.runner.auto_tuner.generate import Generator, ServeGenerator
 from flagscale.runner.auto_tuner.platform import set_jiuding_platform_args
 from flagscale.runner.auto_tuner.prune.pruner import Pruner
+from flagscale.runner.auto_tuner.record.cache import TuningCache
 from flagscale.runner.auto_tuner.record.recorder import Recorder, ServeRecorder
+from flagscale.runner.auto_tuner.scheduler import Trial, TrialScheduler
 from flagscale.runner.auto_tuner.search.searcher import Searcher, ServeSearcher
+from flagscale.runner.auto_tuner.utils import StrategyHistory, strategy_key
 from flagscale.runner.runner_base import JobStatus
 from flagscale.runner.runner_serve import SSHServeRunner
 from flagscale.runner.runner_train import SSHTrainRunner
@@ -78,6 +82,12 @@ class AutoTuner:
         self.generator = Generator(self.config)
         self.recorder = Recorder(self.config)
 
+        # Stop tasks early from the iteration times they logged so far
+        self.early_stopper = EarlyStopper(self.config, self.recorder.sorted_order)
+        if self.early_stopper.enabled and self.recorder.metric_column is None:
+            self.logger.info(f"Early stop is not supported for the metric {self.recorder.metric}")
+            self.early_stopper.enabled = False
+
         # Each task has its own runner
         self.runner = None
 
@@ -96,8 +106,8 @@ class AutoTuner:
         # The start time of tuner, used to control the tuner when stop
         self.start_time = time.time()
 
-        # History strategy
-        self.history = []
+        # History strategy, indexed for the history-based prune rules
+        self.history = StrategyHistory()
 
         # Task id
         self.idx = 0
@@ -105,6 +115,20 @@ class AutoTuner:
         # Checkout search mode on the platform
         self.has_checkout = False
 
+        # Results of earlier runs with the same model, hardware and software
+        self.cache = None
+        self.cached = {}
+        if self.config.experiment.auto_tuner.get("cache", None):
+            self.cache = TuningCache(self.config, self.recorder.metric)
+            self.warm_start()
+
+        # Run tasks side by side on slices of the hostfile if a task needs fewer nodes
+        self.scheduler = None
+        if self.config.experiment.auto_tuner.control.get("parallel_trials", 1) > 1:
+            scheduler = TrialScheduler(self.config)
+            if scheduler.slots > 1:
+                self.scheduler = scheduler
+
     def tune(self):
         """
         Tune the model performance, the steps are:
@@ -115,32 +139,20 @@ class AutoTuner:
             Step5. Run the best task
         """
         tuner_start_time = time.time()
-        while not self.need_stop():
-            self.gen()
-            if not self.cur_strategy:
-                break
-            self.logger.info(f"Run task_{self.idx}: {self.cur_strategy}")
-            self.run()
-            self.logger.info(f"Monitor task_{self.idx}:")
-            self.monitor()
-            self.logger.info(f"Record task_{self.idx}:")
-            self.record()
-
-            if (
-                self.cur_strategy["performance"]
-                and self.config.experiment.auto_tuner.platform.get("airs_switch", False)
-                and not self.has_checkout
-            ):
-                self.checkout()
-
-            # get best strategy
-            best_strategy = self.get_best()
-            if best_strategy:
-                self.logger.info(
-                    f"Best strategy tuned so far: {best_strategy}, and performance is {best_strategy['performance']}."
-                )
-            else:
-                self.logger.info(f"No strategy can run so far.")
+        if self.scheduler is not None:
+            self.tune_in_parallel()
+        else:
+            while not self.need_stop():
+                self.gen()
+                if not self.cur_strategy:
+                    break
+                self.logger.info(f"Run task_{self.idx}: {self.cur_strategy}")
+                self.run()
+                self.logger.info(f"Monitor task_{self.idx}:")
+                self.monitor()
+                self.logger.info(f"Record task_{self.idx}:")
+                self.record()
+                self.report(self.cur_strategy)
         tuner_end_time = time.time()
         self.logger.info(f"AutoTuner Ended in {tuner_end_time - tuner_start_time} seconds.")
 
@@ -156,6 +168,82 @@ class AutoTuner:
             runner = SSHTrainRunner(best_task)
             runner.run(monitor=True, interval=60)
 
+    def tune_in_parallel(self):
+        """
+        Tune with a task on every free slice of the cluster, the steps are:
+            Step1. Generate a task for every free slice and run it on the slice
+            Step2. Monitor the running tasks together
+            Step3. Record every finished task and free its slice
+            Step4. Loop 1-3 until stop and all tasks finished
+        The first task runs alone, so that it builds the data cache the other tasks load.
+        """
+        trials = []
+        while True:
+            while len(trials) < self.scheduler.slots and not self.need_stop():
+                # Wait for the first task before filling the other slices
+                if self.idx == 1 and trials:
+                    break
+                hosts = self.scheduler.allocate()
+                if hosts is None:
+                    break
+                self.gen()
+                if not self.cur_strategy:
+                    self.scheduler.release(hosts)
+                    break
+                task = self.scheduler.place(self.cur_task, hosts)
+                self.logger.info(f"Run task_{self.idx} on {hosts}: {self.cur_strategy}")
+                self.run(task)
+                trials.append(
+                    Trial(self.cur_strategy, task, hosts, self.runner, self.task_start_time)
+                )
+            if not trials:
+                break
+
+            time.sleep(self.interval)
+            for trial in list(trials):
+                if not self.poll(trial):
+                    continue
+                trials.remove(trial)
+                self.finish(trial)
+                self.scheduler.release(trial.hosts)
+                self.logger.info(f"Record task_{trial.strategy['idx']}:")
+                self.record(trial.task, trial.strategy)
+                self.report(trial.strategy)
+
+    def report(self, strategy):
+        """Checkout the search mode if needed and log the best strategy so far."""
+        if (
+            strategy["performance"]
+            and self.config.experiment.auto_tuner.platform.get("airs_switch", False)
+            and not self.has_checkout
+        ):
+            self.checkout()
+
+        # get best strategy
+        best_strategy = self.get_best()
+        if best_strategy:
+            self.logger.info(
+                f"Best strategy tuned so far: {best_strategy}, and performance is {best_strategy['performance']}."
+            )
+        else:
+            self.logger.info(f"No strategy can run so far.")
+
+    def warm_start(self):
+        """Start the pruner and the search algorithm from the cached results."""
+        self.cached = self.cache.load()
+        # The history-based prune rules consult the cached results like tried strategies
+        self.history.extend(self.cached.values())
+        self.searcher.algo.warm_start(self.cached)
+
+    def reuse(self, strategy):
+        """Take the result of a strategy from the cache instead of running it again."""
+        result = self.cached.get(strategy_key(strategy)) if self.cached else None
+        if result is None:
+            return False
+        strategy.update(result)
+        self.logger.info(f"Reuse the cached result of strategy {strategy}")
+        return True
+
     def need_stop(self):
         """Judge whether need to stop tuning."""
         end_time = time.time()
@@ -183,7 +271,10 @@ class AutoTuner:
         # 2. Whether prune by pruner
         # 3. If not pruned, generate the task by generator
         strategy = self.searcher.search()
-        while strategy and (self.pruner is not None and self.pruner.prune(strategy, self.history)):
+        while strategy and (
+            self.reuse(strategy)
+            or (self.pruner is not None and self.pruner.prune(strategy, self.history))
+        ):
             strategy = self.searcher.search()
         if strategy:
             self.idx += 1
@@ -192,13 +283,25 @@ class AutoTuner:
             pruned_by_memory_model = (
                 self.pruner.pruned_by_memory_model if self.pruner is not None else 0
             )
-            if "memory_model" in self.config.experiment.auto_tuner:
+            pruned_by_time_model = (
+                self.pruner.pruned_by_time_model if self.pruner is not None else 0
+            )
+            # The size of a lazy strategy space is only known once it was enumerated
+            strategies = self.searcher.strategies
+            num_strategies = strategies.size if hasattr(strategies, "size") else len(strategies)
+            if num_strategies is None:
+                num_strategies = "?"
+            if "time_model" in self.config.experiment.auto_tuner:
+                self.logger.info(
+                    f"Searching {self.idx+pruned_count} / {num_strategies} strategy, Pruned {pruned_count} strategy, {pruned_by_memory_model} by memory model, {pruned_by_time_model} by time model."
+                )
+            elif "memory_model" in self.config.experiment.auto_tuner:
                 self.logger.info(
-                    f"Searching {self.idx+pruned_count} / {len(self.searcher.strategies)} strategy, Pruned {pruned_count} strategy, {pruned_by_memory_model} by memory model."
+                    f"Searching {self.idx+pruned_count} / {num_strategies} strategy, Pruned {pruned_count} strategy, {pruned_by_memory_model} by memory model."
                 )
             else:
                 self.logger.info(
-                    f"Searching {self.idx+pruned_count} / {len(self.searcher.strategies)} strategy, Pruned {pruned_count} strategy."
+                    f"Searching {self.idx+pruned_count} / {num_strategies} strategy, Pruned {pruned_count} strategy."
                 )
             self.logger.info(f"Generate task_{self.idx}")
             self.cur_strategy = strategy
@@ -219,69 +322,104 @@ class AutoTuner:
         """Monitor the task until task timeout or completed."""
         # Sleep 3s to ensure the task is started
         time.sleep(3)
-        running = False
-        sub_process_running = False
-        while True:
-            # If the task timeout, stop monitoring
-            end_time = time.time()
-            # To increase the time to 600s for the first task with data processing and cache.
-            if self.idx == 1:
-                max_time_per_task = 2 * self.max_time_per_task
-            else:
-                max_time_per_task = self.max_time_per_task
-            if end_time - self.task_start_time > max_time_per_task:
-                self.runner.stop()
-                self.cur_strategy["stopped_by_tuner"] = True
-                break
-            # If the task is completed or idle, stop monitoring
-            try:
-                status = self.runner._query_status()
-                self.logger.info(f"task_{self.cur_strategy['idx']} status: {status.name}")
-                if status == JobStatus.COMPLETED_OR_IDLE:
-                    break
-                if status == JobStatus.RUNNING:
-                    running = True
-                if status == JobStatus.TRANSITIONAL:
-                    if running:
-                        self.runner.stop()
-                        break
-
-                # Add sub process monitor
-                sub_process = self.runner._query_sub_process_status()
-                if sub_process:
-                    sub_process_running = True
-
-                elif not sub_process:
-                    if sub_process_running:
-                        self.logger.info("Sub process not working, stop the task.")
-                        self.runner.stop()
-                        self.cur_strategy["stopped_by_tuner"] = True
-                        break
+        trial = Trial(self.cur_strategy, self.cur_task, None, self.runner, self.task_start_time)
+        while not self.poll(trial):
+            time.sleep(self.interval)
+        self.finish(trial)
 
-            except Exception as e:
-                self.logger.info(e)
-                time.sleep(self.interval)
+    def poll(self, trial):
+        """Query a task once. Returns True if the task ended or has been stopped."""
+        # If the task timeout, stop monitoring
+        end_time = time.time()
+        # To increase the time to 600s for the first task with data processing and cache.
+        if trial.strategy["idx"] == 1:
+            max_time_per_task = 2 * self.max_time_per_task
+        else:
+            max_time_per_task = self.max_time_per_task
+        if end_time - trial.start_time > max_time_per_task:
+            trial.runner.stop()
+            trial.strategy["stopped_by_tuner"] = True
+            return True
+        # If the task is completed or idle, stop monitoring
+        try:
+            status = trial.runner._query_status()
+            self.logger.info(f"task_{trial.strategy['idx']} status: {status.name}")
+            if status == JobStatus.COMPLETED_OR_IDLE:
+                return True
+            if status == JobStatus.RUNNING:
+                trial.running = True
+                if self.early_stopper.enabled and self.early_stop(trial):
+                    return True
+            if status == JobStatus.TRANSITIONAL:
+                if trial.running:
+                    trial.runner.stop()
+                    return True
+
+            # Add sub process monitor
+            sub_process = trial.runner._query_sub_process_status()
+            if sub_process:
+                trial.sub_process_running = True
+
+            elif not sub_process:
+                if trial.sub_process_running:
+                    self.logger.info("Sub process not working, stop the task.")
+                    trial.runner.stop()
+                    trial.strategy["stopped_by_tuner"] = True
+                    return True
+
+        except Exception as e:
+            self.logger.info(e)
             time.sleep(self.interval)
+        return False
 
+    def early_stop(self, trial):
+        """Stop a running task whose logged iterations show it is done or cannot be the best."""
+        if trial.stream is None:
+            try:
+                path, _ = self.recorder.get_performance_and_host_path(trial.task)
+            except (AssertionError, ValueError):
+                # The log folders of the task are being created
+                return False
+            if path is None:
+                return False
+            trial.stream = IterationStream(path, self.recorder.metric_column)
+
+        best_strategy = self.get_best()
+        best = best_strategy["performance"] if best_strategy else None
+        reason = self.early_stopper.check(trial.stream.read(), best)
+        if reason is None:
+            return False
+        self.logger.info(f"Early stop task_{trial.strategy['idx']}: {reason}")
+        trial.runner.stop()
+        trial.strategy["stopped_by_tuner"] = True
+        trial.strategy["early_stop"] = reason
+        return True
+
+    def finish(self, trial):
+        """Add the elapsed time and start time of a task that ended."""
         end_time = time.time()
 
         # Add elapsed time
-        self.cur_strategy["elapsed_time"] = round(end_time - self.task_start_time, 2)
+        trial.strategy["elapsed_time"] = round(end_time - trial.start_time, 2)
         # Add start time
-        readable_task_start_time = datetime.datetime.fromtimestamp(self.task_start_time).strftime(
+        readable_task_start_time = datetime.datetime.fromtimestamp(trial.start_time).strftime(
             "%Y-%m-%d %H:%M:%S"
         )
-        self.cur_strategy["start_time"] = readable_task_start_time
+        trial.strategy["start_time"] = readable_task_start_time
 
         self.logger.info(
             "task_{} monitor time: {:.2f}s".format(
-                self.cur_strategy["idx"], self.cur_strategy["elapsed_time"]
+                trial.strategy["idx"], trial.strategy["elapsed_time"]
             )
         )
 
-    def record(self):
+    def record(self, task=None, strategy=None):
         """Record the task result to csv"""
-        self.recorder.record(self.cur_task, self.cur_strategy)
+        if task is None:
+            task, strategy = self.cur_task, self.cur_strategy
+        self.recorder.record(task, strategy)
+        if self.cache is not None:
+            self.cache.put(strategy)
         self.recorder.save(self.history)
 
     def get_best(self):
@@ -349,8 +487,16 @@ class ServeAutoTunner(AutoTuner):
         self.generator = ServeGenerator(self.config)
         self.recorder = ServeRecorder(self.config)
 
-        # Each task has its own runner
+        # Serve results are not cached across runs
+        self.cache = None
+        self.cached = {}
+
+        # Strategies with the same launch args share the warm runner of the engine
         self.runner = None
+        self.launch_key = None
+
+        # The tokenizer and prompts to profile every strategy with
+        self.profile_inputs = None
 
         # The max time per task, unit: second
         # NOTE: The task will be stopped if the time is reached or done.
@@ -387,26 +533,29 @@ class ServeAutoTunner(AutoTuner):
             Step5. Run the best task
         """
         tuner_start_time = time.time()
-        while not self.need_stop():
-            self.logger.addHandler(self.handler)
-            self.gen()
-            if not self.cur_strategy:
-                break
-            self.logger.info(f"Run task_{self.idx}: {self.cur_strategy}")
-            self.run()
-            self.logger.info(f"Monitor task_{self.idx}:")
-            self.monitor()
-            self.logger.info(f"Record task_{self.idx}:")
-            self.record()
-
-            # get best strategy
-            best_strategy = self.get_best()
-            if best_strategy:
-                self.logger.info(
-                    f"Best strategy tuned so far: {best_strategy}, and {self.recorder.metric} is {best_strategy[self.recorder.metric]}."
-                )
-            else:
-                self.logger.info(f"No strategy can run so far.")
+        try:
+            while not self.need_stop():
+                self.logger.addHandler(self.handler)
+                self.gen()
+                if not self.cur_strategy:
+                    break
+                self.logger.info(f"Run task_{self.idx}: {self.cur_strategy}")
+                self.run()
+                self.logger.info(f"Monitor task_{self.idx}:")
+                self.monitor()
+                self.logger.info(f"Record task_{self.idx}:")
+                self.record()
+
+                # get best strategy
+                best_strategy = self.get_best()
+                if best_strategy:
+                    self.logger.info(
+                        f"Best strategy tuned so far: {best_strategy}, and {self.recorder.metric} is {best_strategy[self.recorder.metric]}."
+                    )
+                else:
+                    self.logger.info(f"No strategy can run so far.")
+        finally:
+            self.release()
         tuner_end_time = time.time()
         self.logger.info(f"AutoTuner Ended in {tuner_end_time - tuner_start_time} seconds.")
 
@@ -423,16 +572,37 @@ class ServeAutoTunner(AutoTuner):
             runner.run()
 
     def run(self, task=None):
-        # Instantiate a runner and run the task
+        # Keep the warm engine if the strategy only changes runtime dims, else launch the task
         if task is None:
             task = self.cur_task
-        self.runner = SSHServeRunner(task)
-        self.runner.run()
+        launch_key = self.generator.gen_launch_key(self.cur_strategy)
+        self.cur_strategy["warm"] = launch_key == self.launch_key and self._serve_alive()
+        if self.cur_strategy["warm"]:
+            self.logger.info(f"task_{self.idx} reuses the warm engine")
+        else:
+            self.release()
+            self.runner = SSHServeRunner(task)
+            self.runner.run()
+            self.launch_key = launch_key
         # set start time
         self.task_start_time = time.time()
 
-    def monitor(self):
-        """Monitor the task until task timeout or completed."""
+    def release(self):
+        """Stop the warm engine if any."""
+        if self.launch_key is not None:
+            self.runner.stop()
+        self.runner = None
+        self.launch_key = None
+
+    def _serve_alive(self):
+        try:
+            return self.runner._serve_alive()
+        except Exception as e:
+            self.logger.info(e)
+            return False
+
+    def _wait_serve(self):
+        """Wait until the engine serves, returns whether it ran and whether it serves."""
         # Sleep 3s to ensure the task is started
         time.sleep(3)
         running = False
@@ -470,16 +640,33 @@ class ServeAutoTunner(AutoTuner):
                 self.logger.info(e)
                 time.sleep(self.interval)
             time.sleep(self.interval)
+        return running, serve_alive
 
+    def monitor(self):
+        """Monitor the task until the engine serves, then profile it."""
+        if self.cur_strategy["warm"]:
+            running = serve_alive = True
+        else:
+            running, serve_alive = self._wait_serve()
+
+        self.cur_result = None
         if serve_alive:
             try:
-                result = self.runner._profile_serve()
-                self.cur_result = result
+                # Profile all strategies on the same prompts with the tokenizer loaded once
+                if self.profile_inputs is None:
+                    self.profile_inputs = self.runner._profile_inputs()
+                self.cur_result = self.runner._profile_serve(
+                    self.profile_inputs, **self.generator.gen_profile_args(self.cur_strategy)
+                )
             except Exception as e:
                 self.logger.info(f"fail to get profile result {e}")
-        time.sleep(self.interval)
-        if running:
-            self.runner.stop()
+        if self.cur_result is None:
+            # Do not sweep more strategies on an engine which failed
+            time.sleep(self.interval)
+            if running:
+                self.runner.stop()
+            self.runner = None
+            self.launch_key = None
 
         end_time = time.time()
 
@@ -501,8 +688,19 @@ class ServeAutoTunner(AutoTuner):
         self.recorder.record(self.cur_strategy, self.cur_result)
         self.history.append(self.recorder.cur_strategy)
         self.recorder.save(self.history)
+        report = self.recorder.report(self.history)
+        self.logger.info(
+            f"Pareto front of {report['objectives']}: "
+            f"{[strategy['idx'] for strategy in report['front']]}"
+        )
+        for tier, strategy in report["operating_points"].items():
+            point = f"task_{strategy['idx']}" if strategy else "none"
+            self.logger.info(f"Operating point of SLO tier {tier}: {point}")
 
     def get_best(self):
+        # The best strategy meets the first SLO tier
+        if self.recorder.slo:
+            return next(iter(self.recorder.operating_points(self.history).values()))
         sorted_history = self.recorder.sort(self.history)
         if sorted_history and sorted_history[0] and sorted_history[0][self.recorder.metric]:
             return sorted_history[0]
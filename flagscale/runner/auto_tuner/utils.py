@@ -1,3 +1,6 @@
+import collections
+import json
+import operator
 import os
 import sys
 
@@ -12,6 +15,9 @@ def divisible(x, y):
 
 def beside(keys, strategy, history):
     """Compare strategy with history strategies Whether same besides given keys"""
+    if isinstance(history, StrategyHistory):
+        return history.beside(keys, strategy)
+
     from flagscale.runner.auto_tuner.search.searcher import BUILT_IN_STRATEGY_DIMS
 
     retrieval = []
@@ -30,6 +36,123 @@ def beside(keys, strategy, history):
     return retrieval
 
 
+def trials(history):
+    """Strategies in history that were run or reused rather than pruned."""
+    if isinstance(history, StrategyHistory):
+        return history.trials()
+    return [task for task in history if not task.get("pruned", False)]
+
+
+def strategy_key(strategy):
+    """A hashable key of the built-in dims of a strategy, stable across runs."""
+    from flagscale.runner.auto_tuner.search.searcher import BUILT_IN_STRATEGY_DIMS
+
+    return json.dumps({dim: strategy.get(dim) for dim in BUILT_IN_STRATEGY_DIMS}, sort_keys=True)
+
+
+class StrategyHistory(list):
+    """
+    History of the tuned strategies, indexed for the history-based prune rules.
+
+    A prune rule retrieves the strategies that are the same as the current one besides
+    a few keys. Instead of scanning the whole history for every rule, the history keeps
+    a hash index per set of keys, from the values of the other dims to the strategies in
+    history order. The indexes are built on first use and updated incrementally, so a
+    retrieval costs a dict lookup and pruning a whole space is linear in its size.
+    The results of a strategy may be recorded after it was appended, they are read from
+    the strategy itself. Any other in-place change of the list, e.g. an insert, a sort
+    or an assignment, drops the indexes and they are rebuilt on the next use.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._indexes = {}
+        self._trials = {"size": 0, "tasks": []}
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._invalidate()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._invalidate()
+
+    def __imul__(self, n):
+        result = super().__imul__(n)
+        self._invalidate()
+        return result
+
+    def insert(self, index, task):
+        super().insert(index, task)
+        self._invalidate()
+
+    def pop(self, *args):
+        task = super().pop(*args)
+        self._invalidate()
+        return task
+
+    def remove(self, task):
+        super().remove(task)
+        self._invalidate()
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._invalidate()
+
+    def reverse(self):
+        super().reverse()
+        self._invalidate()
+
+    def _index(self, keys):
+        keys = frozenset(keys)
+        index = self._indexes.get(keys)
+        if index is None:
+            from flagscale.runner.auto_tuner.search.searcher import BUILT_IN_STRATEGY_DIMS
+
+            dims = [dim for dim in BUILT_IN_STRATEGY_DIMS if dim not in keys]
+            index = {"dims": dims, "size": 0, "buckets": collections.defaultdict(list)}
+            index["signature"] = operator.itemgetter(*dims) if dims else lambda task: ()
+            self._indexes[keys] = index
+        if index["size"] < len(self):
+            for task in self[index["size"] :]:
+                index["buckets"][self._signature(index, task)].append(task)
+            index["size"] = len(self)
+        return index
+
+    @staticmethod
+    def _signature(index, task):
+        try:
+            return index["signature"](task)
+        except KeyError:
+            # A strategy without some of the dims is keyed with None for them
+            return tuple(task.get(dim) for dim in index["dims"])
+
+    def beside(self, keys, strategy):
+        """
+        Strategies in history that are the same as strategy besides given keys, skipping
+        the strategies that are still running and have no performance recorded yet.
+        """
+        index = self._index(keys)
+        bucket = index["buckets"].get(self._signature(index, strategy), ())
+        return [task for task in bucket if "performance" in task]
+
+    def trials(self):
+        """Strategies in history that were run or reused rather than pruned, in order."""
+        for task in self[self._trials["size"] :]:
+            # The pruner marks a strategy before appending it
+            if not task.get("pruned", False):
+                self._trials["tasks"].append(task)
+        self._trials["size"] = len(self)
+        return self._trials["tasks"]
+
+
 def sort_by_memory(strategy):
     """Sort strategy by memory."""
     return (
@@ -56,6 +179,11 @@ def sort_by_memory_model(strategy):
     return strategy["memory_model"]
 
 
+def sort_by_time_model(strategy):
+    """Sort strategy by the step time estimated by time_model."""
+    return strategy["time_model"]
+
+
 def sort_by_performance(strategy):
     """Sort strategy by performance potentially."""
     return (
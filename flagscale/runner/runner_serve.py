@@ -1139,7 +1139,8 @@ class SSHServeRunner(RunnerBase):
 
         return True
 
-    def _profile_serve(self):
+    def _profile_inputs(self):
+        """Load the tokenizer and sample the prompts to profile the service with."""
         from vllm.transformers_utils.tokenizer import get_tokenizer
 
         tokenizer_mode = "auto"
@@ -1170,6 +1171,36 @@ class SSHServeRunner(RunnerBase):
             num_prompts=num_prompts,
             range_ratio=range_ratio,
         )
+        return model_name, tokenizer, dummy_input_requests
+
+    def _profile_serve(
+        self,
+        inputs=None,
+        max_concurrency=None,
+        sampling_params=None,
+        request_rate=None,
+        burstiness=None,
+    ):
+        """
+        Benchmark the running service.
+
+        Args:
+            inputs: The (model name, tokenizer, prompts) of _profile_inputs. Pass the same
+                inputs to profile several times without loading the tokenizer again and to
+                compare the results on the same prompts.
+            max_concurrency: The max number of requests in flight, unbounded if None.
+            sampling_params: Sampling params, e.g. temperature, sent with every request.
+            request_rate: The mean requests per second, profile.request_rate if None.
+            burstiness: The burstiness of the arrivals, profile.burstiness if None.
+        """
+        if inputs is None:
+            inputs = self._profile_inputs()
+        model_name, tokenizer, dummy_input_requests = inputs
+        profile_args = _get_profile_args(self.config)
+        if request_rate is None:
+            request_rate = profile_args.get("request_rate", float("inf"))
+        if burstiness is None:
+            burstiness = profile_args.get("burstiness", 1.0)
         api_url = f"http://{self.host}:{self.port}/v1/chat/completions"
         logger.info(f"Profiling API {api_url}")
 
@@ -1183,6 +1214,12 @@ class SSHServeRunner(RunnerBase):
                 input_requests=dummy_input_requests,
                 selected_percentile_metrics="ttft,tpot,itl,e2el".split(","),
                 selected_percentiles=[float(99)],
+                max_concurrency=max_concurrency,
+                extra_body=sampling_params or None,
+                request_rate=request_rate,
+                burstiness=burstiness,
+                warmup_s=profile_args.get("warmup", 0),
+                cooldown_s=profile_args.get("cooldown", 0),
             )
         )
         return result
@@ -1,6 +1,7 @@
 import multiprocessing
 import os
 import shlex
+import subprocess
 import time
 
 from datetime import datetime
@@ -9,19 +10,25 @@ from omegaconf import DictConfig, OmegaConf
 
 from flagscale.runner.runner_base import JobStatus, RunnerBase
 from flagscale.runner.utils import (
+    HostFanout,
     add_decive_extra_config,
     flatten_dict_to_args,
     get_free_port,
     get_host_name_or_ip,
     get_nnodes,
     get_nproc_per_node,
+    get_ssh_pool,
     logger,
     parse_hostfile,
     run_local_command,
     run_scp_command,
     run_ssh_command,
 )
+from flagscale.elastic.agent import StatusCollector
+from flagscale.elastic.heartbeat import HEARTBEAT_FILE_ENV
 from flagscale.elastic.monitor_service import MonitorService
+from flagscale.elastic.recovery import RecoveryManager
+from flagscale.elastic.telemetry import get_metrics_registry
 
 _MAX_CPU_COUNT = multiprocessing.cpu_count()
 
@@ -144,6 +151,20 @@ def _get_runner_cmd_train(
         del runner_args["hostfile"]
     if "ssh_port" in runner_args:
         del runner_args["ssh_port"]
+    if "max_concurrent_hosts" in runner_args:
+        del runner_args["max_concurrent_hosts"]
+    if "host_timeout" in runner_args:
+        del runner_args["host_timeout"]
+    if "agent_interval" in runner_args:
+        del runner_args["agent_interval"]
+    if "collector_addr" in runner_args:
+        del runner_args["collector_addr"]
+    if "collector_port" in runner_args:
+        del runner_args["collector_port"]
+    if "recovery" in runner_args:
+        del runner_args["recovery"]
+    if "metrics_port" in runner_args:
+        del runner_args["metrics_port"]
     if "master_addr" in runner_args:
         del runner_args["master_addr"]
     if "master_port" in runner_args:
@@ -172,6 +193,40 @@ def _get_runner_cmd_train(
     return runner_cmd
 
 
+def _get_agent_cmd_train(
+    config, host, node_rank, host_pid_file, host_output_file, host_heartbeat_file
+):
+    """Return the command of the on-node agent, or None if no collector is configured."""
+    runner_config = config.experiment.runner
+    collector_port = runner_config.get("collector_port", None)
+    if not collector_port:
+        return None
+    collector_addr = runner_config.get("collector_addr", get_host_name_or_ip())
+    monitor_dir = os.path.join(config.train.system.logging.log_dir, "monitor")
+    agent_cmd = [
+        "python",
+        "-m",
+        "flagscale.elastic.agent",
+        "--host",
+        host,
+        "--node-rank",
+        str(node_rank),
+        "--pid-file",
+        host_pid_file,
+        "--log-file",
+        host_output_file,
+        "--monitor-dir",
+        monitor_dir,
+        "--heartbeat-file",
+        host_heartbeat_file,
+        "--interval",
+        str(runner_config.get("agent_interval", 5)),
+        "--collector",
+        f"{collector_addr}:{collector_port}",
+    ]
+    return shlex.join(agent_cmd)
+
+
 def _generate_run_script_train(config, host, node_rank, cmd, background=True, with_test=False):
     system_config = config.train.system
     logging_config = config.train.system.logging
@@ -185,6 +240,16 @@ def _generate_run_script_train(config, host, node_rank, cmd, background=True, wi
         logging_config.scripts_dir, f"host_{node_rank}_{host}_run.sh"
     )
     host_pid_file = os.path.join(logging_config.pids_dir, f"host_{node_rank}_{host}.pid")
+    host_agent_log_file = os.path.join(logging_config.log_dir, f"host_{node_rank}_{host}_agent.log")
+    host_heartbeat_file = os.path.join(
+        logging_config.pids_dir, f"host_{node_rank}_{host}.heartbeat"
+    )
+    # The on-node monitoring agent, it exits with the training process
+    agent_cmd = None
+    if background and not with_test:
+        agent_cmd = _get_agent_cmd_train(
+            config, host, node_rank, host_pid_file, host_output_file, host_heartbeat_file
+        )
 
     os.makedirs(logging_config.scripts_dir, exist_ok=True)
 
@@ -209,92 +274,13 @@ def _generate_run_script_train(config, host, node_rank, cmd, background=True, wi
         f.write(f"cd {root_dir}\n")
         f.write(f"\n")
         f.write(f"export PYTHONPATH={megatron_dir}:{root_dir}:${{PYTHONPATH}}\n")
+        if agent_cmd:
+            # Drop the heartbeat of a previous run before the new one starts
+            f.write(f"rm -f {host_heartbeat_file}\n")
+            f.write(f"export {HEARTBEAT_FILE_ENV}={host_heartbeat_file}\n")
         f.write(f"\n")
         f.write(f'cmd="{cmd}"\n')
         f.write(f"\n")
-        
-        # 创建监控启动脚本
-        monitor_script_path = os.path.join(logging_config.scripts_dir, f"monitor_{node_rank}_{host}.py")
-        with open(monitor_script_path, "w") as monitor_f:
-            monitor_f.write(f'''#!/usr/bin/env python3
-import sys
-import os
-sys.path.insert(0, "{root_dir}")
-
-from omegaconf import OmegaConf
-from flagscale.elastic.monitor_service import MonitorService
-from flagscale.runner.runner_base import JobStatus
-import time
-import subprocess
-
-# 等待训练进程启动
-time.sleep(3)
-
-# 配置
-config = OmegaConf.create({{
-    "train": {{
-        "system": {{
-            "logging": {{
-                "log_dir": "{logging_config.log_dir}"
-            }}
-        }}
-    }},
-    "experiment": {{
-        "runner": {{
-            "no_shared_fs": {str(no_shared_fs)},
-            "ssh_port": 22
-        }}
-    }}
-}})
-
-class DummyRunner:
-    def __init__(self):
-        self.resources = None
-        self.config = config
-    
-    def _query_status(self):
-        pid_file = "{host_pid_file}"
-        if os.path.exists(pid_file):
-            try:
-                with open(pid_file, "r") as f:
-                    pid = int(f.read().strip())
-                result = subprocess.run(["ps", "-p", str(pid)], capture_output=True)
-                if result.returncode == 0:
-                    return JobStatus.RUNNING
-                else:
-                    return JobStatus.COMPLETED_OR_IDLE
-            except:
-                return JobStatus.COMPLETED_OR_IDLE
-        else:
-            return JobStatus.COMPLETED_OR_IDLE
-
-runner = DummyRunner()
-monitor = MonitorService(config, runner, interval=5)
-monitor.start_monitoring(enable_log_collection=True, enable_diagnostic=True)
-
-print("Monitor service started for training process")
-
-# 保持监控运行直到训练结束
-try:
-    while True:
-        status = runner._query_status()
-        if status == JobStatus.COMPLETED_OR_IDLE:
-            print("Training completed, stopping monitor")
-            break
-        time.sleep(10)
-except KeyboardInterrupt:
-    print("Monitor stopped by user")
-finally:
-    monitor.stop()
-''')
-        os.chmod(monitor_script_path, 0o755)
-        
-        # 在shell脚本中启动监控
-        f.write(f'# Start monitoring service in background\n')
-        f.write(f'python {monitor_script_path} > /tmp/monitor_output.log 2>&1 &\n')
-        f.write(f'echo "Monitor service started in background"\n')
-        f.write(f'\n')
-        
         if with_test:
             f.write(f'bash -c "$cmd; sync" \n')
         else:
@@ -304,6 +290,10 @@ finally:
                 f.write(
                     f'nohup bash -c "$cmd; sync" >> {host_output_file} 2>&1 & echo $! > {host_pid_file}\n'
                 )
+                if agent_cmd:
+                    f.write(f"\n")
+                    f.write(f"# Start monitoring agent in background\n")
+                    f.write(f"nohup {agent_cmd} > {host_agent_log_file} 2>&1 &\n")
             else:
                 f.write(f'bash -c "$cmd; sync" >> {host_output_file} 2>&1\n')
         f.write("\n")
@@ -515,7 +505,14 @@ class SSHTrainRunner(RunnerBase):
         # If need monitor, start monitoring service (non-blocking)
         if monitor:
             logger.info("Starting monitoring service...")
-            monitor_service = MonitorService(self.config, self, interval)
+            monitor_service = MonitorService(
+                self.config,
+                self,
+                interval,
+                collector=self._start_status_collector(),
+                recovery=self._get_recovery_manager(),
+                metrics_port=self.config.experiment.runner.get("metrics_port", None),
+            )
             monitor_service.start_monitoring(
                 enable_log_collection=enable_log_collection,
                 enable_diagnostic=enable_diagnostic
@@ -625,72 +622,82 @@ class SSHTrainRunner(RunnerBase):
     def _query_each(self, host, node_rank):
         "Query each node status."
         host_query_script_file = self._generate_query_script(host, node_rank)
-        logging_config = self.config.train.system.logging
         result = ""
-        if host != "localhost":
-            ssh_port = self.config.experiment.runner.get("ssh_port", 22)
-            # Step 1: make sure the scripts_dir exists on the remote host
-            run_ssh_command(host, f"mkdir -p {logging_config.scripts_dir}", ssh_port, query=True)
-            # Step 2: copy the host_run_script_file to the remote host
-            no_shared_fs = self.config.experiment.runner.get("no_shared_fs", False)
-            if no_shared_fs:
-                run_scp_command(host, host_query_script_file, logging_config.scripts_dir, ssh_port)
-            # Step 3: run the host_run_script_file on the remote host
-            try:
-                result = run_ssh_command(
-                    host, f"bash {host_query_script_file}", ssh_port, query=True
-                )
-            except Exception as e:
-                logger.error(f"Failed to query job status on {host}: {e}")
-        else:
-            try:
-                result = run_local_command(f"bash {host_query_script_file}", query=True)
-            except Exception as e:
-                logger.error(f"Failed to query job status on {host}: {e}")
-        result = result.stdout.rstrip() if result else ""
-        return result
+        try:
+            result = self._run_query_script(host, host_query_script_file)
+        except Exception as e:
+            logger.error(f"Failed to query job status on {host}: {e}")
+            get_metrics_registry().inc("flagscale_runner_query_failures_total", host=host)
+        return result.rstrip() if result else ""
 
     def _query_each_sub_process(self, host, node_rank):
         "Query each node sub process status."
         host_query_script_file = self._generate_query_sub_process_script(host, node_rank)
-        logging_config = self.config.train.system.logging
         result = ""
-        if host != "localhost":
-            ssh_port = self.config.experiment.runner.get("ssh_port", 22)
-            # Step 1: make sure the scripts_dir exists on the remote host
-            run_ssh_command(host, f"mkdir -p {logging_config.scripts_dir}", ssh_port, query=True)
-            # Step 2: copy the host_run_script_file to the remote host
-            no_shared_fs = self.config.experiment.runner.get("no_shared_fs", False)
-            if no_shared_fs:
-                run_scp_command(host, host_query_script_file, logging_config.scripts_dir, ssh_port)
-            # Step 3: run the host_run_script_file on the remote host
-            try:
-                result = run_ssh_command(
-                    host, f"bash {host_query_script_file}", ssh_port, query=True
-                )
-            except Exception as e:
-                logger.error(f"Failed to query sub process status on {host}: {e}")
+        try:
+            result = self._run_query_script(host, host_query_script_file)
+        except Exception as e:
+            logger.error(f"Failed to query sub process status on {host}: {e}")
+        return result.rstrip() if result else ""
+
+    def _run_query_script(self, host, host_query_script_file):
+        """
+        Run a query script on a host and return its stdout.
+        On remote hosts, creating the scripts dir, uploading the script (without a shared
+        file system) and running it are sent as one batch over the pooled ssh connection.
+        """
+        timeout = self.config.experiment.runner.get("host_timeout", None)
+        if host == "localhost":
+            result = run_local_command(
+                f"bash {host_query_script_file}", query=True, timeout=timeout
+            )
+            return result.stdout
+
+        logging_config = self.config.train.system.logging
+        ssh_port = self.config.experiment.runner.get("ssh_port", 22)
+        cmds = [f"mkdir -p {logging_config.scripts_dir}"]
+        script_content = None
+        if self.config.experiment.runner.get("no_shared_fs", False):
+            with open(host_query_script_file, "r") as f:
+                script_content = f.read()
+            cmds.append(f"cat > {host_query_script_file}")
+        cmds.append(f"bash {host_query_script_file}")
+        outputs = get_ssh_pool().run_batch(
+            host, cmds, ssh_port, timeout=timeout, input=script_content
+        )
+        # Fail like a single checked ssh command would, the output of a failed query is not a status
+        for cmd, (code, output) in zip(cmds, outputs):
+            if code != 0:
+                raise subprocess.CalledProcessError(code, cmd, output)
+        return outputs[-1][1]
+
+    def _query_hosts(self, query_func):
+        """
+        Run query_func(host, node_rank) on all hosts concurrently.
+        The latency of the query and the failed or timed out hosts are recorded in the
+        process-wide metrics registry.
+        """
+        if self.resources is None:
+            hosts = [("localhost", 0)]
         else:
-            try:
-                result = run_local_command(f"bash {host_query_script_file}", query=True)
-            except Exception as e:
-                logger.error(f"Failed to query sub process status on {host}: {e}")
-        result = result.stdout.rstrip() if result else ""
-        return result
+            hosts = [(host, node_rank) for node_rank, host in enumerate(self.resources.keys())]
+        runner_config = self.config.experiment.runner
+        max_workers = min(len(hosts), runner_config.get("max_concurrent_hosts", 32))
+        metrics = get_metrics_registry()
+        with metrics.timer("flagscale_runner_query_seconds"):
+            with HostFanout(max_workers, runner_config.get("host_timeout", None)) as fanout:
+                results = fanout.map(query_func, hosts)
+        for result in results:
+            metrics.observe("flagscale_runner_query_host_seconds", result.elapsed)
+            if not result.ok:
+                metrics.inc("flagscale_runner_query_failures_total", host=result.host)
+        return results
 
     def _query_status(self):
         "Query Job status."
-        results = []
-        if self.resources is None:
-            result = self._query_each("localhost", 0)
-            results.append(result)
-
-        else:
-            host_list = list(self.resources.keys())
-            for host, _ in self.resources.items():
-                node_rank = host_list.index(host)
-                result = self._query_each(host, node_rank)
-                results.append(result)
+        results = [
+            result.value if result.ok else "" for result in self._query_hosts(self._query_each)
+        ]
         if all((status != "" and status != "Z") for status in results):
             job_status = JobStatus.RUNNING
         elif all((status == "" or status == "Z") for status in results):
@@ -701,17 +708,10 @@ class SSHTrainRunner(RunnerBase):
 
     def _query_sub_process_status(self):
         "Query sub process status."
-        results = []
-        if self.resources is None:
-            result = self._query_each_sub_process("localhost", 0)
-            results.append(result)
-
-        else:
-            host_list = list(self.resources.keys())
-            for host, _ in self.resources.items():
-                node_rank = host_list.index(host)
-                result = self._query_each_sub_process(host, node_rank)
-                results.append(result)
+        results = [
+            result.value if result.ok else ""
+            for result in self._query_hosts(self._query_each_sub_process)
+        ]
         if all(status for status in results):
             status = True
         else:
@@ -731,6 +731,46 @@ class SSHTrainRunner(RunnerBase):
         """
         return self._query_status()
     
+    def _start_status_collector(self):
+        """Start the collector for the on-node agents if a collector port is configured."""
+        collector_port = self.config.experiment.runner.get("collector_port", None)
+        if not collector_port:
+            return None
+        return StatusCollector(port=collector_port).start()
+
+    def _get_recovery_manager(self):
+        """Create the automatic recovery manager if `experiment.runner.recovery` is configured."""
+        recovery_config = self.config.experiment.runner.get("recovery", None)
+        if not recovery_config:
+            return None
+        return RecoveryManager(
+            self,
+            max_restarts=recovery_config.get("max_restarts", 3),
+            backoff=recovery_config.get("backoff", 30),
+            backoff_factor=recovery_config.get("backoff_factor", 2),
+            max_backoff=recovery_config.get("max_backoff", 600),
+            spare_hosts=recovery_config.get("spare_hosts", None),
+            startup_timeout=recovery_config.get("startup_timeout", 600),
+            record_file=os.path.join(
+                self.config.train.system.logging.log_dir, "monitor", "recovery.log"
+            ),
+        )
+
+    def relaunch(self):
+        """
+        Relaunch the job after a failure, resuming from the latest checkpoint.
+
+        If a checkpoint was saved by the failed run, `checkpoint.load` is pointed to the
+        save directory, so a job started from a pretrained checkpoint resumes its own progress.
+        """
+        checkpoint_config = self.config.train.system.checkpoint
+        tracker_file = os.path.join(checkpoint_config.save, "latest_checkpointed_iteration.txt")
+        if checkpoint_config.load != checkpoint_config.save and os.path.exists(tracker_file):
+            logger.info(f"Resuming from the latest checkpoint in {checkpoint_config.save}")
+            checkpoint_config.load = checkpoint_config.save
+            self.user_args = _get_args_megatron(self.config)
+        self.run()
+
     def start_monitoring_service(self, interval=10, enable_log_collection=True, 
                                enable_diagnostic=True):
         """
@@ -744,7 +784,14 @@ class SSHTrainRunner(RunnerBase):
         Returns:
             MonitorService: Monitor service instance
         """
-        monitor_service = MonitorService(self.config, self, interval)
+        monitor_service = MonitorService(
+            self.config,
+            self,
+            interval,
+            collector=self._start_status_collector(),
+            recovery=self._get_recovery_manager(),
+            metrics_port=self.config.experiment.runner.get("metrics_port", None),
+        )
         monitor_service.start_monitoring(
             enable_log_collection=enable_log_collection,
             enable_diagnostic=enable_diagnostic
@@ -0,0 +1,275 @@
+import codecs
+import math
+import os
+import re
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Columns of a training metrics file, one row per logged iteration.
+METRIC_COLUMNS = (
+    "iteration",
+    "elapsed_ms",
+    "throughput",
+    "learning_rate",
+    "loss",
+    "grad_norm",
+    "max_allocated_mb",
+    "max_reserved_mb",
+)
+
+# Fields of Megatron's `training_log` line, keyed by their label in the log.
+_ITERATION_FIELDS = {
+    "elapsed time per iteration (ms)": "elapsed_ms",
+    "throughput per GPU (TFLOP/s/GPU)": "throughput",
+    "learning rate": "learning_rate",
+    "grad norm": "grad_norm",
+}
+
+# Fields of Megatron's `report_memory` line.
+_MEMORY_FIELDS = {"max allocated": "max_allocated_mb", "max reserved": "max_reserved_mb"}
+
+_ITERATION_PATTERN = re.compile(r"\biteration\s+(\d+)\s*/")
+_MEMORY_PATTERN = re.compile(r"\(after (\d+) iterations\) memory \(MB\)")
+
+_READ_SIZE = 1 << 20
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+class TrainingMetricsParser:
+    """
+    Streaming parser turning Megatron `training_log` output into typed per-iteration records.
+
+    Text can be fed in arbitrary chunks, partial lines are carried over to the next call.
+    Only lines containing an iteration or memory report are split into fields, all other
+    lines are skipped with a substring check. Memory reports of several ranks for the same
+    iteration are merged into that iteration's row, keeping the maximum.
+
+    With `max_rows`, the columns keep only the latest rows; once the parser saves to a
+    file, only the rows already saved are dropped.
+    """
+
+    def __init__(self, max_rows=None):
+        self.columns = {name: [] for name in METRIC_COLUMNS}
+        self.max_rows = max_rows
+        self.dirty = False
+        # Rows dropped from the front of the columns, and rows of the columns already saved
+        self.rows_dropped = 0
+        self._saved = 0
+        self._saving = False
+        self._partial = ""
+
+    def __len__(self):
+        return len(self.columns["iteration"])
+
+    @property
+    def total_rows(self):
+        """Number of rows parsed so far, including the dropped ones."""
+        return self.rows_dropped + len(self)
+
+    def feed(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def flush(self):
+        """Parse the pending partial line, e.g. at the end of a file."""
+        if self._partial:
+            self._parse_line(self._partial)
+            self._partial = ""
+
+    def _parse_line(self, line):
+        if "elapsed time per iteration" in line:
+            self._parse_iteration(line)
+        elif "memory (MB)" in line:
+            self._parse_memory(line)
+
+    def _parse_iteration(self, line):
+        fields = line.split("|")
+        match = _ITERATION_PATTERN.search(fields[0])
+        if not match:
+            return
+        row = dict.fromkeys(METRIC_COLUMNS, math.nan)
+        row["iteration"] = int(match.group(1))
+        for field in fields[1:]:
+            key, _, value = field.partition(":")
+            key = key.strip()
+            column = _ITERATION_FIELDS.get(key)
+            if column is not None:
+                row[column] = _to_float(value)
+            elif key.endswith("loss") and math.isnan(row["loss"]):
+                # "lm loss" for GPT models, the first reported loss for other models
+                row["loss"] = _to_float(value)
+        self._append(row)
+
+    def _parse_memory(self, line):
+        match = _MEMORY_PATTERN.search(line)
+        if not match:
+            return
+        iteration = int(match.group(1))
+        values = {}
+        for field in line[match.end() :].split("|"):
+            key, _, value = field.partition(":")
+            column = _MEMORY_FIELDS.get(key.strip())
+            if column is not None:
+                values[column] = _to_float(value)
+        iterations = self.columns["iteration"]
+        if not iterations or iterations[-1] != iteration:
+            row = dict.fromkeys(METRIC_COLUMNS, math.nan)
+            row["iteration"] = iteration
+            self._append(row)
+        for column, value in values.items():
+            last = self.columns[column][-1]
+            self.columns[column][-1] = value if math.isnan(last) else max(last, value)
+        self.dirty = True
+
+    def _append(self, row):
+        for name in METRIC_COLUMNS:
+            self.columns[name].append(row[name])
+        self.dirty = True
+        self._trim()
+
+    def _trim(self):
+        if self.max_rows is None or len(self) <= self.max_rows:
+            return
+        excess = len(self) - self.max_rows
+        if self._saving:
+            excess = min(excess, self._saved)
+            self._saved -= excess
+        for values in self.columns.values():
+            del values[:excess]
+        self.rows_dropped += excess
+
+    def to_arrays(self, start=0, end=None):
+        """Return the parsed metrics as a dict of numpy arrays, NaN marks missing values."""
+        arrays = {
+            name: np.asarray(values[start:end], dtype=np.float64)
+            for name, values in self.columns.items()
+        }
+        arrays["iteration"] = arrays["iteration"].astype(np.int64)
+        return arrays
+
+    def save(self, path, final=False):
+        """
+        Append the rows parsed since the previous save to a columnar metrics file.
+
+        The last row is held back until the next one is parsed, since the memory reports of
+        later ranks may still be merged into it, unless final is set. The first save starts
+        the file over.
+        """
+        if not self._saving and os.path.exists(path):
+            os.remove(path)
+        self._saving = True
+        end = len(self) if final else len(self) - 1
+        if end > self._saved:
+            append_metrics(self.to_arrays(self._saved, end), path)
+            self._saved = end
+        self.dirty = self._saved < len(self)
+        self._trim()
+
+
+def metrics_file(directory, name="training_metrics"):
+    """Path of a metrics file, Arrow IPC if pyarrow is installed and npz otherwise."""
+    return os.path.join(directory, name + (".arrow" if pa is not None else ".npz"))
+
+
+def save_metrics(arrays, path):
+    """
+    Atomically write metric columns to an Arrow IPC (`.arrow`) or numpy (`.npz`) file.
+    Args:
+        arrays (dict): Column name to numpy array.
+        path (str): Destination, the format is chosen by the extension.
+    """
+    tmp_path = path + ".tmp"
+    if path.endswith(".arrow"):
+        table = pa.table(arrays)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def append_metrics(arrays, path):
+    """
+    Append metric rows to a metrics file, creating it if needed.
+
+    An Arrow file is an IPC stream that every call extends by one record batch, so the
+    cost of a call does not grow with the file. An npz file, the fallback without pyarrow,
+    is rewritten as a whole.
+    Args:
+        arrays (dict): Column name to numpy array of the new rows.
+        path (str): Destination, the format is chosen by the extension.
+    """
+    if not path.endswith(".arrow"):
+        if os.path.exists(path):
+            old = load_metrics(path)
+            arrays = {name: np.concatenate([old[name], arrays[name]]) for name in arrays}
+        save_metrics(arrays, path)
+        return
+    batch = pa.record_batch(arrays)
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(batch.schema.serialize())
+        f.write(batch.serialize())
+
+
+def load_metrics(path):
+    """
+    Load a metrics file written by `save_metrics` or `append_metrics`.
+    Returns:
+        dict: Column name to numpy array.
+    """
+    if path.endswith(".arrow"):
+        with pa.OSFile(path, "rb") as source:
+            if source.read(6) == b"ARROW1":
+                source.seek(0)
+                table = pa.ipc.open_file(source).read_all()
+            else:
+                source.seek(0)
+                table = _read_stream(source)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def _read_stream(source):
+    reader = pa.ipc.open_stream(source)
+    batches = []
+    while True:
+        try:
+            batches.append(reader.read_next_batch())
+        except StopIteration:
+            break
+        except (pa.ArrowInvalid, OSError):
+            # A batch cut short by a crash while appending, the rows before it are intact
+            break
+    return pa.Table.from_batches(batches, schema=reader.schema)
+
+
+def parse_metrics_file(path):
+    """
+    Parse a whole log file in one streaming pass.
+    Returns:
+        TrainingMetricsParser: Parser holding the metrics of the file.
+    """
+    parser = TrainingMetricsParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            parser.feed(decoder.decode(block))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.flush()
+    return parser
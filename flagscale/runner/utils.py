@@ -1,16 +1,19 @@
 import asyncio
 import collections
+import contextlib
 import json
 import os
 import re
 import socket
 import subprocess
 import sys
+import threading
 import time
 import traceback
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, Sequence
 
 import aiohttp
 import numpy as np
@@ -116,7 +119,7 @@ def get_addr():
     return socket.gethostname()
 
 
-def run_local_command(cmd, dryrun=False, query=False):
+def run_local_command(cmd, dryrun=False, query=False, timeout=None):
     logger.info(f"Run the local command: {cmd}")
     if dryrun:
         return
@@ -129,6 +132,7 @@ def run_local_command(cmd, dryrun=False, query=False):
             text=True,
             encoding="utf-8",
             errors="replace",
+            timeout=timeout,
         )
         return result
     else:
@@ -140,6 +144,7 @@ def run_local_command(cmd, dryrun=False, query=False):
             text=True,
             encoding="utf-8",
             errors="replace",
+            timeout=timeout,
         )
         if result.returncode != 0:
             print(f"Command {cmd} failed with return code {result.returncode}.")
@@ -148,24 +153,34 @@ def run_local_command(cmd, dryrun=False, query=False):
             sys.exit(result.returncode)
 
 
-def run_ssh_command(host, cmd, port=None, dryrun=False, query=False):
+def run_ssh_command(host, cmd, port=None, dryrun=False, query=False, timeout=None):
+    pool = get_ssh_pool()
+    ssh_opts = pool.ssh_options_str()
+    ssh_opts = f"{ssh_opts} " if ssh_opts else ""
     if port:
-        ssh_cmd = f"ssh -f -n -p {port} {host} '{cmd}'"
+        ssh_cmd = f"ssh {ssh_opts}-f -n -p {port} {host} '{cmd}'"
     else:
-        ssh_cmd = f"ssh -f -n {host} '{cmd}'"
+        ssh_cmd = f"ssh {ssh_opts}-f -n {host} '{cmd}'"
     if not query:
         logger.info(f"Running the ssh command: {ssh_cmd}")
     if dryrun:
         return
-    result = subprocess.run(
-        ssh_cmd,
-        shell=True,
-        check=True,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            ssh_cmd,
+            shell=True,
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=timeout,
+        )
+    except Exception:
+        pool.record(host, time.perf_counter() - start, ok=False)
+        raise
+    pool.record(host, time.perf_counter() - start)
     if result.returncode != 0:
         print(f"SSH command {ssh_cmd} failed with return code {result.returncode}.")
         print(f"Output: {result.stdout}")
@@ -175,23 +190,33 @@ def run_ssh_command(host, cmd, port=None, dryrun=False, query=False):
         return result
 
 
-def run_scp_command(host, src, dst, port=None, dryrun=False):
+def run_scp_command(host, src, dst, port=None, dryrun=False, timeout=None):
+    pool = get_ssh_pool()
+    scp_opts = pool.ssh_options_str()
+    scp_opts = f"{scp_opts} " if scp_opts else ""
     if port:
-        scp_cmd = f"scp -P {port} -r {src} {host}:{dst} "
+        scp_cmd = f"scp {scp_opts}-P {port} -r {src} {host}:{dst} "
     else:
-        scp_cmd = f"scp -r {src} {host}:{dst} "
+        scp_cmd = f"scp {scp_opts}-r {src} {host}:{dst} "
     logger.info(f"Run the scp command: {scp_cmd}")
     if dryrun:
         return
-    result = subprocess.run(
-        scp_cmd,
-        shell=True,
-        check=True,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            scp_cmd,
+            shell=True,
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=timeout,
+        )
+    except Exception:
+        pool.record(host, time.perf_counter() - start, ok=False)
+        raise
+    pool.record(host, time.perf_counter() - start)
     if result.returncode != 0:
         print(f"SCP command {scp_cmd} failed with return code {result.returncode}.")
         print(f"Output: {result.stdout}")
@@ -199,6 +224,291 @@ def run_scp_command(host, src, dst, port=None, dryrun=False):
         sys.exit(result.returncode)
 
 
+@dataclass
+class SSHHostMetrics:
+    round_trips: int = 0
+    commands: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: float = 0.0
+
+    def to_dict(self):
+        mean = self.total_latency / self.round_trips if self.round_trips else 0.0
+        return {
+            "round_trips": self.round_trips,
+            "commands": self.commands,
+            "failures": self.failures,
+            "mean_latency_ms": mean * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+            "last_latency_ms": self.last_latency * 1000,
+        }
+
+
+class SSHConnectionPool:
+    """
+    Keep one multiplexed OpenSSH master connection per host and run commands over it.
+
+    The pool relies on ControlMaster/ControlPersist: the first command to a host opens a
+    master connection in the background and every later ssh/scp to that host reuses its
+    socket, skipping the TCP and key-exchange handshake. Several commands can also be
+    sent in one round trip with `run_batch`. Set FLAGSCALE_SSH_MULTIPLEX=0 to disable.
+    """
+
+    def __init__(self, control_dir=None, persist=600, enabled=True):
+        self.control_dir = control_dir or os.path.join(
+            "/tmp", f"flagscale_ssh_{os.getuid() if hasattr(os, 'getuid') else 'user'}"
+        )
+        self.persist = persist
+        self.enabled = enabled
+        self._metrics = collections.defaultdict(SSHHostMetrics)
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+
+    def ssh_options(self):
+        """Return the ssh/scp `-o` options that route a connection through the pool."""
+        if not self.enabled:
+            return []
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={self.control_dir}/%C",
+            "-o",
+            f"ControlPersist={self.persist}s",
+            "-o",
+            "ServerAliveInterval=15",
+        ]
+
+    def ssh_options_str(self):
+        return " ".join(self.ssh_options())
+
+    def record(self, host, latency, ok=True, commands=1):
+        with self._lock:
+            metrics = self._metrics[host]
+            metrics.round_trips += 1
+            metrics.commands += commands
+            metrics.failures += 0 if ok else 1
+            metrics.total_latency += latency
+            metrics.max_latency = max(metrics.max_latency, latency)
+            metrics.last_latency = latency
+
+    def metrics(self):
+        """Return the per-host round trip, failure and latency counters."""
+        with self._lock:
+            return {host: metrics.to_dict() for host, metrics in self._metrics.items()}
+
+    def _ssh_argv(self, host, port):
+        argv = ["ssh", "-o", "BatchMode=yes"] + self.ssh_options()
+        if port:
+            argv += ["-p", str(port)]
+        return argv + [host]
+
+    def run(self, host, cmd, port=None, timeout=None, input=None, commands=1):
+        """
+        Run a command on the host over its pooled connection.
+        Returns:
+            subprocess.CompletedProcess: The result, raising CalledProcessError on failure.
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = subprocess.run(
+                self._ssh_argv(host, port) + [cmd],
+                check=True,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=timeout,
+                **_stdin_kwargs(input),
+            )
+            ok = True
+            return result
+        finally:
+            self.record(host, time.perf_counter() - start, ok, commands)
+
+    def run_batch(self, host, cmds, port=None, timeout=None, input=None):
+        """
+        Run several commands on the host in a single round trip.
+        Each command runs in its own subshell, so a failing command does not stop the others.
+        `input` is passed to the stdin of the batch and can be consumed by its first reader.
+        Returns:
+            List[Tuple[int, str]]: The exit code and stdout of each command.
+        """
+        marker = f"__flagscale_batch_{os.urandom(8).hex()}__"
+        script = "".join(f"({cmd})\nprintf '\\n{marker} %d\\n' $?\n" for cmd in cmds)
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = subprocess.run(
+                self._ssh_argv(host, port) + [script],
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=timeout,
+                **_stdin_kwargs(input),
+            )
+            outputs = _split_batch_output(result.stdout, marker)
+            if len(outputs) != len(cmds):
+                raise subprocess.CalledProcessError(
+                    result.returncode, script, result.stdout, result.stderr
+                )
+            ok = all(code == 0 for code, _ in outputs)
+            return outputs
+        finally:
+            self.record(host, time.perf_counter() - start, ok, len(cmds))
+
+    def warm(self, hosts, port=None, max_workers=32, timeout=30):
+        """Open the master connections of the hosts concurrently."""
+        hosts = [host for host in hosts if host != "localhost"]
+        if not self.enabled or not hosts:
+            return []
+        with HostFanout(min(len(hosts), max_workers), timeout) as fanout:
+            return fanout.map(
+                lambda host: self.run(host, "true", port, timeout), [(host,) for host in hosts]
+            )
+
+    def close(self, host, port=None):
+        """Stop the master connection of a host."""
+        if not self.enabled:
+            return
+        argv = ["ssh"] + self.ssh_options() + ["-O", "exit"]
+        if port:
+            argv += ["-p", str(port)]
+        subprocess.run(argv + [host], capture_output=True)
+
+
+def _stdin_kwargs(input):
+    # Never let a remote command read the stdin of the calling process.
+    return {"input": input} if input is not None else {"stdin": subprocess.DEVNULL}
+
+
+def _split_batch_output(stdout, marker):
+    # Every command output is followed by "\n<marker> <exit code>\n".
+    results = []
+    pieces = stdout.split(f"\n{marker} ")
+    for index in range(1, len(pieces)):
+        code = pieces[index].partition("\n")[0]
+        output = pieces[index - 1]
+        if index > 1:
+            output = output.partition("\n")[2]
+        results.append((int(code), output))
+    return results
+
+
+_ssh_pool = None
+_ssh_pool_lock = threading.Lock()
+
+
+def get_ssh_pool():
+    """Return the process-wide SSH connection pool."""
+    global _ssh_pool
+    # Called from the HostFanout worker threads, create the pool only once
+    with _ssh_pool_lock:
+        if _ssh_pool is None:
+            enabled = os.environ.get("FLAGSCALE_SSH_MULTIPLEX", "1") != "0"
+            _ssh_pool = SSHConnectionPool(enabled=enabled)
+        return _ssh_pool
+
+
+@dataclass
+class HostResult:
+    host: str
+    value: Any = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class HostFanout:
+    """
+    Run a blocking per-host call (ssh, scp, local shell, ...) on many hosts concurrently.
+
+    At most `max_workers` calls run at the same time. A call that runs longer than
+    `timeout` seconds is reported as failed without waiting for it, so one unreachable
+    host cannot stall the others. A running thread cannot be cancelled, so the call
+    itself must be time-bounded, e.g. by a subprocess timeout or a read deadline on its
+    channel; otherwise every call on a hung host leaks a thread that also delays the
+    interpreter exit.
+    """
+
+    def __init__(self, max_workers=32, timeout=None):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="host_fanout"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def map(self, func: Callable, args_list: Sequence[tuple]) -> List[HostResult]:
+        """
+        Call func(*args) for every tuple in args_list, the first item of each tuple being the host.
+        Returns:
+            List[HostResult]: One result per tuple, in the order of args_list. Calls that raised
+            or timed out carry an error message instead of a value.
+        """
+        results = [HostResult(host=args[0]) for args in args_list]
+        started = {}
+        lock = threading.Lock()
+
+        def _call(index, args):
+            with lock:
+                started[index] = time.monotonic()
+            return func(*args)
+
+        futures = {
+            self._executor.submit(_call, index, args): index
+            for index, args in enumerate(args_list)
+        }
+        pending = set(futures)
+        while pending:
+            wait_time = None
+            if self.timeout is not None:
+                now = time.monotonic()
+                with lock:
+                    deadlines = [
+                        started[futures[f]] + self.timeout for f in pending if futures[f] in started
+                    ]
+                wait_time = max(0.0, min(deadlines) - now) if deadlines else self.timeout
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = results[futures[future]]
+                result.elapsed = time.monotonic() - started.get(futures[future], time.monotonic())
+                try:
+                    result.value = future.result()
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+            if self.timeout is None:
+                continue
+            now = time.monotonic()
+            for future in list(pending):
+                index = futures[future]
+                with lock:
+                    start = started.get(index)
+                if start is not None and now - start >= self.timeout:
+                    pending.discard(future)
+                    results[index].elapsed = now - start
+                    results[index].error = f"Timed out after {self.timeout}s"
+        for result in results:
+            if not result.ok:
+                logger.warning(f"Call on host {result.host} failed: {result.error}")
+        return results
+
+
 def flatten_dict_to_args_verl(config_dict, pre_str=""):
     args = []
     if 'config-path' in config_dict:
@@ -377,11 +687,13 @@ def run_scp(host, src_file, dest_file, ssh_port=22, dryrun=False, incremental=Fa
         dryrun (bool): If True, log command without executing.
         incremental (bool): If True, use incremental copy.
     """
+    scp_opts = get_ssh_pool().ssh_options_str()
+    scp_opts = f"{scp_opts} " if scp_opts else ""
     if incremental:
         # For incremental, assume tail command is handled externally
-        command = f"scp -P {ssh_port} {host}:{src_file} {dest_file}"
+        command = f"scp {scp_opts}-P {ssh_port} {host}:{src_file} {dest_file}"
     else:
-        command = f"scp -P {ssh_port} {host}:{src_file} {dest_file}"
+        command = f"scp {scp_opts}-P {ssh_port} {host}:{src_file} {dest_file}"
     if dryrun:
         logger.info(f"Dryrun: {command}")
     else:
@@ -465,15 +777,27 @@ def dummy_random_input(
     return input_requests
 
 
+@contextlib.asynccontextmanager
+async def _client_session(session=None):
+    """Yield the shared session if given, else a session of its own."""
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession(trust_env=True, timeout=AIOHTTP_TIMEOUT) as session:
+        yield session
+
+
 async def async_request_openai_chat_completions(
-    request_func_input: RequestFuncInput, pbar: Optional[tqdm] = None
+    request_func_input: RequestFuncInput,
+    pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
     api_url = request_func_input.api_url
     assert api_url.endswith(
         ("chat/completions", "profile")
     ), "OpenAI Chat Completions API URL must end with 'chat/completions'."
 
-    async with aiohttp.ClientSession(trust_env=True, timeout=AIOHTTP_TIMEOUT) as session:
+    async with _client_session(session) as session:
         content = [{"type": "text", "text": request_func_input.prompt}]
         if request_func_input.multi_modal_content:
             content.append(request_func_input.multi_modal_content)
@@ -557,47 +881,126 @@ async def async_request_openai_chat_completions(
     return output
 
 
-async def get_request(input_requests):
+async def get_request(input_requests, request_rate=float("inf"), burstiness=1.0):
+    """
+    Yield the requests at the arrival times of a gamma process.
+
+    Args:
+        input_requests: The requests to send.
+        request_rate: The mean number of requests per second, all at once if inf.
+        burstiness: The shape of the gamma distributed intervals. 1 is a Poisson process,
+            lower values send burstier and higher values more regular traffic.
+    """
+    assert burstiness > 0, f"burstiness must be positive, but now is {burstiness}"
+    assert request_rate > 0, f"request_rate must be positive, but now is {request_rate}"
     input_requests = iter(input_requests)
     # Calculate scale parameter theta to maintain the desired request_rate.
+    theta = 1.0 / (request_rate * burstiness)
     for request in input_requests:
         yield request
+        if request_rate == float("inf"):
+            continue
+        await asyncio.sleep(np.random.gamma(shape=burstiness, scale=theta))
+
+
+def _steady_window(arrivals, finishes, start, warmup_s, cooldown_s):
+    """
+    Return the indices of the requests arriving in the steady state and their duration.
+
+    The requests of the warm-up and the cool-down windows keep the service loaded while the
+    requests in between are measured.
+    """
+    begin = start + warmup_s
+    end = arrivals[-1] - cooldown_s
+    measured = [i for i, arrival in enumerate(arrivals) if begin <= arrival <= end]
+    if not measured:
+        raise ValueError(
+            f"No request arrives between the warm-up of {warmup_s}s and the cool-down of "
+            f"{cooldown_s}s, send more prompts or lower the request rate."
+        )
+    duration = max(finishes[i] for i in measured) - arrivals[measured[0]]
+    return measured, duration
 
 
 async def benchmark(
-    api_url, model, tokenizer, input_requests, selected_percentile_metrics, selected_percentiles
+    api_url,
+    model,
+    tokenizer,
+    input_requests,
+    selected_percentile_metrics,
+    selected_percentiles,
+    max_concurrency=None,
+    extra_body=None,
+    request_rate=float("inf"),
+    burstiness=1.0,
+    warmup_s=0,
+    cooldown_s=0,
 ):
+    """
+    Send the requests open-loop at a request rate and measure the service.
+
+    The requests arrive by a gamma process (see get_request) regardless of the responses,
+    at most max_concurrency of them are in flight. Only the requests arriving after the
+    warm-up and before the cool-down windows, in seconds, are measured.
+    """
+    # Bound the requests in flight like a client with a fixed number of connections
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
 
     async def limited_request_func(request_func_input, pbar):
-        return await request_func(request_func_input=request_func_input, pbar=pbar)
+        if semaphore is None:
+            output = await request_func(
+                request_func_input=request_func_input, pbar=pbar, session=session
+            )
+        else:
+            async with semaphore:
+                output = await request_func(
+                    request_func_input=request_func_input, pbar=pbar, session=session
+                )
+        return output, time.perf_counter()
 
     request_func = async_request_openai_chat_completions
     req_model_id = req_model_name = model
     pbar = tqdm(total=len(input_requests))
 
-    benchmark_start_time = time.perf_counter()
-    tasks = []
-    async for request in get_request(input_requests):
-        prompt, prompt_len, output_len, mm_content = request
-
-        request_func_input = RequestFuncInput(
-            model=req_model_id,
-            model_name=req_model_name,
-            prompt=prompt,
-            api_url=api_url,
-            prompt_len=prompt_len,
-            output_len=output_len,
-            multi_modal_content=mm_content,
-        )
-        tasks.append(
-            asyncio.create_task(
-                limited_request_func(request_func_input=request_func_input, pbar=pbar)
+    # All requests share the pooled connections of one session
+    connector = aiohttp.TCPConnector(limit=max_concurrency or 0)
+    async with aiohttp.ClientSession(
+        connector=connector, trust_env=True, timeout=AIOHTTP_TIMEOUT
+    ) as session:
+        benchmark_start_time = time.perf_counter()
+        tasks = []
+        arrivals = []
+        async for request in get_request(input_requests, request_rate, burstiness):
+            prompt, prompt_len, output_len, mm_content = request
+
+            request_func_input = RequestFuncInput(
+                model=req_model_id,
+                model_name=req_model_name,
+                prompt=prompt,
+                api_url=api_url,
+                prompt_len=prompt_len,
+                output_len=output_len,
+                multi_modal_content=mm_content,
+                extra_body=extra_body,
             )
-        )
-    outputs = await asyncio.gather(*tasks)
+            arrivals.append(time.perf_counter())
+            tasks.append(
+                asyncio.create_task(
+                    limited_request_func(request_func_input=request_func_input, pbar=pbar)
+                )
+            )
+        outputs, finishes = zip(*await asyncio.gather(*tasks))
     pbar.close()
 
     benchmark_duration = time.perf_counter() - benchmark_start_time
+    if warmup_s or cooldown_s:
+        measured, benchmark_duration = _steady_window(
+            arrivals, finishes, benchmark_start_time, warmup_s, cooldown_s
+        )
+        input_requests = [input_requests[i] for i in measured]
+        outputs = [outputs[i] for i in measured]
+    else:
+        outputs = list(outputs)
 
     ### import here to avoid dependency issue
     from flagscale.serve.metric import calculate_metrics
@@ -612,6 +1015,8 @@ async def benchmark(
     )
 
     print("{s:{c}^{n}}".format(s=" Serving Benchmark Result ", n=50, c="="))
+    print("{:<40} {:<10}".format("Request rate (req/s):", request_rate))
+    print("{:<40} {:<10}".format("Measured requests:", len(outputs)))
     print("{:<40} {:<10}".format("Successful requests:", metrics.completed))
     print("{:<40} {:<10.2f}".format("Benchmark duration (s):", benchmark_duration))
     print("{:<40} {:<10}".format("Total input tokens:", metrics.total_input))
@@ -623,6 +1028,10 @@ async def benchmark(
     )
 
     result = {
+        "request_rate": request_rate,
+        "burstiness": burstiness,
+        "max_concurrency": max_concurrency,
+        "measured": len(outputs),
         "duration": benchmark_duration,
         "completed": metrics.completed,
         "total_input_tokens": metrics.total_input,
@@ -680,6 +1089,14 @@ async def benchmark(
     return result
 
 
+async def benchmark_sweep(request_rates, **kwargs):
+    """Benchmark at each request rate in turn for the latencies versus the load."""
+    results = []
+    for request_rate in request_rates:
+        results.append(await benchmark(request_rate=request_rate, **kwargs))
+    return results
+
+
 class ResourceManager:
     def __init__(self, nodes):
         """
@@ -785,6 +1202,19 @@ class ResourceManager:
             f"Require number {num} of resource_type {resource_type} But there is insufficient resources: \n{resource_status}"
         )
 
+    def release_card_ids(self, resource_type="gpu", address=None, num=1):
+        """
+        Release the 'num' most recently allocated cards of a node, so they can be allocated again.
+        Cards are allocated as consecutive indices, so they are released in the reverse order.
+        """
+        for node in self.nodes:
+            if node["address"] == address and node["type"] == resource_type:
+                if node["used"] < num:
+                    raise ValueError(f"Node {address} has only {node['used']} cards allocated")
+                node["used"] -= num
+                return
+        raise ValueError(f"Node {address} does not exist or resource type mismatch")
+
     def get_status(self):
         """
         Return the status of all nodes as a dictionary.
@@ -0,0 +1,206 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import math
+import time
+import weakref
+
+from typing import Any, Callable, Dict, Optional
+
+_DEFAULT_CLASSES = {
+    "interactive": {"queue_size": 256, "max_wait": 5},
+    "batch": {"queue_size": 1024, "max_wait": 60},
+}
+
+
+class Rejected(Exception):
+    """A request shed by the admission control, answered by status with a Retry-After."""
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def parse_timeout(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the timeout header of a request, None if absent.
+
+    Raises:
+        ValueError: the value is not a finite, non-negative number of seconds.
+    """
+    if value is None:
+        return None
+    timeout = float(value)
+    if not math.isfinite(timeout) or timeout < 0:
+        raise ValueError(f"Invalid timeout: {value}")
+    return timeout
+
+
+def _release_on(loop, release):
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(release)
+
+
+class Reservation:
+    """
+    Capacity reserved for a request that release gives back exactly once.
+
+    The reservation can be handed from the handler to the response stream, both may call
+    release. A reservation dropped without a release, e.g. with a response stream the
+    server never started because the client went away, is released when it is garbage
+    collected, on the event loop it was made on.
+    """
+
+    def __init__(self, release: Callable[[], None]):
+        self._release = release
+        self._finalizer = weakref.finalize(self, _release_on, asyncio.get_running_loop(), release)
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+    def release(self):
+        if self._finalizer.detach() is not None:
+            self._release()
+
+
+class AdmissionController:
+    """
+    Admit the requests of a proxy only while the upstream instances have capacity.
+
+    The requests wait in a bounded queue per priority class, the classes are given in the
+    order of their priority, e.g. interactive before batch. A request is admitted once
+    try_acquire reserves the capacity for it, the higher classes first and within a class the
+    earliest deadline first. The deadline of a request is the max_wait of its class, or the
+    timeout of the request if sooner.
+
+    A request finding its queue full is rejected with 429, a request whose deadline passes
+    in the queue with 503. Both carry a Retry-After estimated from the recent admission rate.
+
+    The controller must be used on a single event loop, dispatch is called whenever the
+    reserved capacity is released.
+    """
+
+    def __init__(
+        self,
+        classes: Optional[Dict[str, Dict[str, float]]] = None,
+        default_class: Optional[str] = None,
+        retry_after: int = 1,
+        window: float = 10,
+    ):
+        classes = classes or _DEFAULT_CLASSES
+        self.classes = list(classes)
+        self._queue_size = {name: cfg.get("queue_size", 256) for name, cfg in classes.items()}
+        self._max_wait = {name: cfg.get("max_wait", 5) for name, cfg in classes.items()}
+        self.default_class = default_class or self.classes[0]
+        if self.default_class not in self.classes:
+            raise ValueError(f"Unknown default priority class: {self.default_class}")
+        self._retry_after = retry_after
+        self._window = window
+        # Entries of (rank, deadline, seq, future, try_acquire), done futures are skipped
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = {name: 0 for name in self.classes}
+        self._admitted_at = collections.deque()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0}
+
+    def priority_class(self, name: Optional[str]) -> str:
+        """Return the class of a requested priority, the default class if unknown."""
+        return name if name in self._queued else self.default_class
+
+    def retry_after(self) -> int:
+        """Return the seconds the queued requests likely need to be admitted."""
+        now = time.monotonic()
+        while self._admitted_at and now - self._admitted_at[0] > self._window:
+            self._admitted_at.popleft()
+        rate = len(self._admitted_at) / self._window
+        if rate == 0:
+            return self._retry_after
+        queued = sum(self._queued.values())
+        return min(60, max(self._retry_after, math.ceil(queued / rate)))
+
+    def _admit(self, ticket):
+        self.admitted += 1
+        self._admitted_at.append(time.monotonic())
+        return ticket
+
+    def _ahead(self, rank: int) -> bool:
+        return any(self._queued[name] for name in self.classes[: rank + 1])
+
+    def dispatch(self):
+        """Admit the queued requests in order while try_acquire reserves their capacity."""
+        while self._heap:
+            rank, _, _, future, try_acquire = self._heap[0]
+            if future.done():
+                heapq.heappop(self._heap)
+                continue
+            ticket = try_acquire()
+            if ticket is None:
+                break
+            heapq.heappop(self._heap)
+            self._queued[self.classes[rank]] -= 1
+            future.set_result(self._admit(ticket))
+
+    async def admit(
+        self,
+        priority: str,
+        try_acquire: Callable[[], Any],
+        release: Callable[[Any], None],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Wait until try_acquire returns a ticket of the reserved capacity and return it.
+
+        try_acquire returns None while there is no capacity. A ticket reserved for a request
+        abandoned meanwhile, e.g. by a disconnected client, is given back by release.
+
+        Raises:
+            Rejected: the queue of the class is full or the deadline passed.
+        """
+        name = self.priority_class(priority)
+        rank = self.classes.index(name)
+        # Nobody of the same or a higher class waits, try to pass the queue
+        if not self._ahead(rank):
+            ticket = try_acquire()
+            if ticket is not None:
+                return self._admit(ticket)
+
+        if self._queued[name] >= self._queue_size[name]:
+            self.rejected["queue_full"] += 1
+            raise Rejected(429, self.retry_after(), f"The {name} queue is full")
+
+        wait = self._max_wait[name] if timeout is None else min(timeout, self._max_wait[name])
+        future = asyncio.get_running_loop().create_future()
+        self._queued[name] += 1
+        heapq.heappush(
+            self._heap, (rank, time.monotonic() + wait, next(self._seq), future, try_acquire)
+        )
+        try:
+            await asyncio.wait([future], timeout=wait)
+        except BaseException:
+            if future.cancel():
+                self._queued[name] -= 1
+                self.dispatch()
+            else:
+                release(future.result())
+            raise
+        if future.done():
+            return future.result()
+        future.cancel()
+        self._queued[name] -= 1
+        self.rejected["deadline"] += 1
+        # The requests behind may fit where this one did not
+        self.dispatch()
+        raise Rejected(503, self.retry_after(), f"Not admitted in {wait}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": dict(self._queued),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1,79 @@
+from typing import Dict, Optional
+
+# vLLM prometheus metrics scraped from an instance, summed or maxed over the label sets
+_VLLM_METRICS = {
+    "vllm:num_requests_running": ("running", sum),
+    "vllm:num_requests_waiting": ("waiting", sum),
+    # Renamed from gpu_cache_usage_perc in newer versions
+    "vllm:gpu_cache_usage_perc": ("kv_usage", max),
+    "vllm:kv_cache_usage_perc": ("kv_usage", max),
+    "vllm:prompt_tokens_total": ("prompt_tokens", sum),
+    "vllm:generation_tokens_total": ("generation_tokens", sum),
+}
+
+
+def parse_vllm_metrics(text: str) -> Dict[str, float]:
+    """Parse the load of an instance from the text of its /metrics endpoint."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        if "{" in line:
+            name = line[: line.index("{")]
+            value = line[line.rindex("}") + 1 :].split()[0]
+        else:
+            name, value = line.split()[:2]
+        if name in _VLLM_METRICS:
+            samples.setdefault(name, []).append(float(value))
+
+    metrics = {}
+    for name, values in samples.items():
+        key, reduce = _VLLM_METRICS[name]
+        metrics[key] = reduce(values)
+    return metrics
+
+
+class TokenRate:
+    """
+    Moving average of the tokens per second of an instance from a token counter.
+
+    Only the intervals the instance was busy in are averaged, so the rate follows what the
+    instance can process rather than what it was sent.
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.rate: Optional[float] = None
+        self._total = None
+        self._time = None
+
+    def update(self, total: float, now: float, busy: bool):
+        if self._total is not None and busy and now > self._time and total >= self._total:
+            rate = (total - self._total) / (now - self._time)
+            if rate > 0:
+                self.rate = (
+                    rate
+                    if self.rate is None
+                    else (self.alpha * rate + (1 - self.alpha) * self.rate)
+                )
+        # A counter going backwards belongs to a restarted instance, start over from it
+        self._total = total
+        self._time = now
+
+    def __repr__(self):
+        return f"TokenRate({self.rate})"
+
+
+def compute_ratios(
+    rates: Dict[str, Optional[float]], low: float = 0.1, high: float = 10.0
+) -> Dict[str, float]:
+    """
+    Return the compute ratio of each instance, its token rate relative to the mean rate.
+
+    Instances without a rate yet get 1.0, the ratios are clipped to [low, high].
+    """
+    known = [rate for rate in rates.values() if rate]
+    if not known:
+        return {addr: 1.0 for addr in rates}
+    mean = sum(known) / len(known)
+    return {addr: min(high, max(low, rate / mean)) if rate else 1.0 for addr, rate in rates.items()}
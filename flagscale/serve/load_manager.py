@@ -0,0 +1,283 @@
+import itertools
+import random
+import threading
+import time
+
+from typing import Dict, List, Optional
+
+from flagscale.logger import logger
+from flagscale.serve.instance_metrics import TokenRate, compute_ratios
+from flagscale.serve.prefix_cache import PrefixCacheIndex
+
+
+class LoadManager:
+    """
+    Registry of the P/D instances of a proxy and of the load the proxy put on them.
+
+    Every registration of a new instance gets a new generation. The load of a request is
+    released against the generation it was taken on, so the release of a request still in
+    flight when its instance expired and registered again is ignored instead of driving
+    the load of the new registration negative.
+    """
+
+    def __init__(
+        self,
+        prefix_index: PrefixCacheIndex = None,
+        prefix_hit_weight: float = 1.0,
+        max_failures: int = 2,
+        kv_usage_limit: float = 0.98,
+        max_prefill_tokens: float = float("inf"),
+        max_decode_tokens: float = float("inf"),
+    ):
+        # Reentrant, acquire selects and loads the instances under one hold
+        self._lock = threading.RLock()
+        # Each resource type 'P' or 'D' maps to {http_addr: {'zmq': zmq_addr, 'load_num': int, 'load_len': int, 'compute_ratio': float}}
+        # load_num: num of req, load_len: num of tokens, generation: the registration
+        # last_seen, healthy, running, waiting, kv_usage and token_rate follow the heartbeats
+        # and the scraped metrics of the instance
+        self._instances: dict[str, dict[str, dict[str, object]]] = {"P": {}, "D": {}}
+        # Prompt prefixes routed to each P-instance, guarded by the lock as well
+        self._prefix_index = prefix_index or PrefixCacheIndex()
+        # How much a cached prompt token offsets a token of queued load
+        self._prefix_hit_weight = prefix_hit_weight
+        # Consecutive failed scrapes before an instance is skipped
+        self._max_failures = max_failures
+        # KV cache usage above which an instance is skipped while others have room
+        self._kv_usage_limit = kv_usage_limit
+        # Tokens in flight an instance takes, beyond them the requests wait for admission
+        self._max_tokens = {"P": max_prefill_tokens, "D": max_decode_tokens}
+        self._generations = itertools.count()
+
+    def register(self, rtype: str, http_addr: str, zmq_addr: str):
+        # The instances register periodically, each registration is a heartbeat
+        with self._lock:
+            if http_addr not in self._instances[rtype]:
+                self._instances[rtype][http_addr] = {
+                    "zmq": zmq_addr,
+                    "generation": next(self._generations),
+                    "load_num": 0,
+                    "load_len": 0,
+                    "compute_ratio": 1.0,
+                    "last_seen": time.monotonic(),
+                    "healthy": True,
+                    "failures": 0,
+                    "running": 0,
+                    "waiting": 0,
+                    "kv_usage": 0.0,
+                    "token_rate": TokenRate(),
+                }
+                logger.info(f"Registered new {rtype}-instance {http_addr} (zmq={zmq_addr})")
+            else:
+                # If zmq address changed, synchronize it
+                if self._instances[rtype][http_addr]["zmq"] != zmq_addr:
+                    # A new zmq address means a restarted instance with an empty cache
+                    self._prefix_index.remove(http_addr)
+                self._instances[rtype][http_addr]["zmq"] = zmq_addr
+                self._instances[rtype][http_addr]["last_seen"] = time.monotonic()
+
+    def expire(self, ttl: float) -> List[tuple[str, str]]:
+        """Remove the instances without a heartbeat in the last ttl seconds."""
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            for rtype, instances in self._instances.items():
+                for http_addr, info in list(instances.items()):
+                    if now - info["last_seen"] > ttl:
+                        del instances[http_addr]
+                        self._prefix_index.remove(http_addr)
+                        expired.append((rtype, http_addr))
+        return expired
+
+    def addresses(self) -> List[tuple[str, str]]:
+        with self._lock:
+            return [
+                (rtype, http_addr)
+                for rtype, instances in self._instances.items()
+                for http_addr in instances
+            ]
+
+    def update_metrics(
+        self, rtype: str, http_addr: str, metrics: Optional[Dict[str, float]], now: float
+    ):
+        """
+        Update an instance by its scraped metrics, None if the scrape failed.
+
+        The compute ratios of the instances of rtype follow their tokens per second while
+        busy, prompt tokens for prefill and generated tokens for decode.
+        """
+        with self._lock:
+            instances = self._instances[rtype]
+            info = instances.get(http_addr, None)
+            if info is None:
+                return
+            if metrics is None:
+                info["failures"] += 1
+                if info["healthy"] and info["failures"] >= self._max_failures:
+                    info["healthy"] = False
+                    logger.warning(f"{rtype}-instance {http_addr} is unhealthy, skip it")
+                return
+            if not info["healthy"]:
+                logger.info(f"{rtype}-instance {http_addr} is healthy again")
+            info["healthy"] = True
+            info["failures"] = 0
+            info["running"] = metrics.get("running", 0)
+            info["waiting"] = metrics.get("waiting", 0)
+            info["kv_usage"] = metrics.get("kv_usage", 0.0)
+            tokens = metrics.get("prompt_tokens" if rtype == "P" else "generation_tokens", None)
+            if tokens is not None:
+                info["token_rate"].update(tokens, now, busy=info["running"] > 0)
+            ratios = compute_ratios({addr: i["token_rate"].rate for addr, i in instances.items()})
+            for addr, ratio in ratios.items():
+                instances[addr]["compute_ratio"] = ratio
+
+    def status(self) -> Dict[str, Dict[str, Dict[str, object]]]:
+        with self._lock:
+            return {
+                rtype: {
+                    http_addr: {
+                        **{key: value for key, value in info.items() if key != "token_rate"},
+                        "tokens_per_s": info["token_rate"].rate,
+                    }
+                    for http_addr, info in instances.items()
+                }
+                for rtype, instances in self._instances.items()
+            }
+
+    def _fits(self, rtype: str, info: Dict[str, object], token_num: int) -> bool:
+        # An idle instance takes a request of any length
+        return info["load_len"] == 0 or info["load_len"] + token_num <= self._max_tokens[rtype]
+
+    def _candidates(self, rtype: str, token_num: int = 0) -> List[tuple[str, Dict[str, object]]]:
+        """
+        Return the healthy instances with KV cache to spare, or all if there is none, and of
+        them the ones with room for token_num tokens if any.
+        """
+        instances = self._instances[rtype]
+        if not instances:
+            raise ValueError(f"No {rtype}-instance is registered")
+        ready = [
+            (http_addr, info)
+            for http_addr, info in instances.items()
+            if info["healthy"] and info["kv_usage"] < self._kv_usage_limit
+        ] or list(instances.items())
+        return [item for item in ready if self._fits(rtype, item[1], token_num)] or ready
+
+    def acquire(
+        self, load_type: str, token_num: int = 0, prefix_hashes: List[int] = ()
+    ) -> Optional[tuple[tuple[str, str, int], tuple[str, str, int]]]:
+        """
+        Select a P and a D-instance with room for the prompt tokens and load both.
+
+        Return the (http_addr, zmq_addr, generation) of both, or None if any type has no
+        room. The generations are passed to decrement_load to release the loads.
+        """
+        with self._lock:
+            for rtype in ("P", "D"):
+                if not self._instances[rtype]:
+                    return None
+                if not any(
+                    self._fits(rtype, info, token_num)
+                    for _, info in self._candidates(rtype, token_num)
+                ):
+                    return None
+            prefill = self.get_loaded("P", load_type, token_num, prefix_hashes)
+            decode = self.get_loaded("D", load_type, token_num)
+            prefill_generation = self.increment_load("P", prefill[0], token_num)
+            decode_generation = self.increment_load("D", decode[0], token_num)
+        return (*prefill, prefill_generation), (*decode, decode_generation)
+
+    def increment_load(self, rtype: str, http_addr: str, tokens=0) -> int:
+        """Load an instance and return its generation to release the load against."""
+        with self._lock:
+            self._instances[rtype][http_addr]["load_num"] += 1
+            self._instances[rtype][http_addr]["load_len"] += tokens
+            logger.debug(
+                f"[{rtype}] +1 load on {http_addr}, now={self._instances[rtype][http_addr]['load_num']}"
+            )
+            return self._instances[rtype][http_addr]["generation"]
+
+    def decrement_load(self, rtype: str, http_addr: str, tokens=0, generation=None):
+        with self._lock:
+            info = self._instances[rtype].get(http_addr, None)
+            # The instance expired while the request was in flight, and may have registered
+            # again since with a load of its own
+            if info is None or (generation is not None and info["generation"] != generation):
+                return
+            self._instances[rtype][http_addr]["load_num"] -= 1
+            self._instances[rtype][http_addr]["load_len"] -= tokens
+            logger.debug(
+                f"[{rtype}] -1 load on {http_addr}, now={self._instances[rtype][http_addr]['load_num']}"
+            )
+
+    def get_random(self, rtype: str, token_num: int = 0) -> tuple[str, str]:
+        with self._lock:
+            items = self._candidates(rtype, token_num)
+            logger.info(f"========== whole instance status {self._instances}==========")
+        http_addr, info = random.choice(items)
+        return http_addr, info["zmq"]
+
+    def get_robin_loaded(self, rtype: str, token_num: int = 0) -> tuple[str, str]:
+        with self._lock:
+            # The queue of the instance also holds the requests of other proxies
+            http_addr, info = min(
+                self._candidates(rtype, token_num),
+                key=lambda kv: max(kv[1]["load_num"], kv[1]["running"] + kv[1]["waiting"]),
+            )
+            logger.info(f"========== whole instance status {self._instances}==========")
+        return http_addr, info["zmq"]
+
+    def get_slo_loaded(self, rtype: str, token_num: int = -1) -> tuple[str, str]:
+        with self._lock:
+            http_addr, info = min(
+                self._candidates(rtype, token_num),
+                key=lambda kv: (kv[1]["load_len"] + token_num) / kv[1]["compute_ratio"],
+            )
+            logger.info(f"========== whole instance status {self._instances}==========")
+        return http_addr, info["zmq"]
+
+    def get_prefix_loaded(
+        self, rtype: str, token_num: int = 0, prefix_hashes: List[int] = ()
+    ) -> tuple[str, str]:
+        """
+        Choose the instance of the least load after the prompt tokens it already caches.
+
+        The tokens of the prompt prefix cached on an instance need no prefill, so they are
+        taken off its token load like the slo strategy, weighted by prefix_hit_weight.
+        """
+        block_size = self._prefix_index.block_size
+        with self._lock:
+
+            def cost(item):
+                http_addr, info = item
+                hit_tokens = self._prefix_index.match(http_addr, prefix_hashes) * block_size
+                load = info["load_len"] + token_num - self._prefix_hit_weight * hit_tokens
+                return load / info["compute_ratio"]
+
+            http_addr, info = min(self._candidates(rtype, token_num), key=cost)
+            hit_blocks = self._prefix_index.match(http_addr, prefix_hashes)
+            self._prefix_index.insert(http_addr, prefix_hashes)
+        logger.info(
+            f"[{rtype}] prefix cache hit {hit_blocks}/{len(prefix_hashes)} blocks on {http_addr}"
+        )
+        return http_addr, info["zmq"]
+
+    def get_loaded(
+        self,
+        rtype: str,
+        load_type: str = "robin",
+        token_num: int = 0,
+        prefix_hashes: List[int] = (),
+    ) -> tuple[str, str]:
+        if load_type == "random":
+            return self.get_random(rtype, token_num)
+        elif load_type == "robin":
+            return self.get_robin_loaded(rtype, token_num)
+        elif load_type == "slo":
+            return self.get_slo_loaded(rtype, token_num)
+        elif load_type == "prefix":
+            # D-instances receive the whole KV cache from prefill, only prefill reuses prefixes
+            if rtype == "P":
+                return self.get_prefix_loaded(rtype, token_num, prefix_hashes)
+            return self.get_slo_loaded(rtype, token_num)
+        else:
+            raise ValueError(f"Unknown load type: {load_type}")
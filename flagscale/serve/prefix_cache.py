@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+
+class PrefixCacheIndex:
+    """
+    Bounded index of the prompt prefixes recently routed to each instance.
+
+    A prompt is split into blocks of block_size tokens like the prefix cache of the engine,
+    and every full block is keyed by a hash chained over the blocks before it. An instance
+    holding the key of a block thus likely holds the KV cache of the whole prefix up to the
+    block. Each instance keeps at most max_blocks keys and evicts the least recently used.
+
+    The index is not thread safe, the callers serialize the access.
+    """
+
+    def __init__(self, block_size: int = 16, max_blocks: int = 65536):
+        assert block_size > 0, f"block_size must be positive, but now is {block_size}"
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self._blocks: Dict[str, OrderedDict] = {}
+
+    def block_hashes(self, tokens: Sequence[int]) -> List[int]:
+        """Return the chained hashes of the full blocks of a prompt."""
+        hashes = []
+        parent = None
+        for start in range(0, len(tokens) - self.block_size + 1, self.block_size):
+            parent = hash((parent, tuple(tokens[start : start + self.block_size])))
+            hashes.append(parent)
+        return hashes
+
+    def match(self, instance: str, hashes: List[int]) -> int:
+        """Return the number of leading blocks of a prompt cached on an instance."""
+        blocks = self._blocks.get(instance, None)
+        if not blocks:
+            return 0
+        matched = 0
+        for block_hash in hashes:
+            if block_hash not in blocks:
+                break
+            matched += 1
+        return matched
+
+    def insert(self, instance: str, hashes: List[int]):
+        """Record that an instance caches the blocks of a prompt routed to it."""
+        blocks = self._blocks.setdefault(instance, OrderedDict())
+        # Touch the tail first, a prefix is only useful while its head blocks are kept
+        for block_hash in reversed(hashes):
+            blocks[block_hash] = None
+            blocks.move_to_end(block_hash)
+        while len(blocks) > self.max_blocks:
+            blocks.popitem(last=False)
+
+    def remove(self, instance: str):
+        """Forget the blocks of an instance, e.g. when it restarted."""
+        self._blocks.pop(instance, None)
+
+    def size(self, instance: str) -> int:
+        return len(self._blocks.get(instance, ()))
@@ -6,14 +6,16 @@
 #
 
 
+import asyncio
+import json
 import os
-import random
 import socket
 import threading
+import time
 import uuid
 
 from functools import lru_cache
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import aiohttp
 import msgpack
@@ -29,16 +31,36 @@ except Exception as e:
 
 from flagscale import serve
 from flagscale.logger import logger
+from flagscale.serve.admission import AdmissionController, Rejected, Reservation, parse_timeout
+from flagscale.serve.instance_metrics import parse_vllm_metrics
+from flagscale.serve.load_manager import LoadManager
+from flagscale.serve.prefix_cache import PrefixCacheIndex
+from flagscale.serve.token_counter import TokenCounter
+from flagscale.serve.upstream_pool import UpstreamPool
 from flagscale.utils import flatten_dict_to_args
 
 serve.load_args()
 TASK_CONFIG = serve.task_config
 MODEL_PATH = TASK_CONFIG.serve[0].get("engine_args", {}).get("model", None)
 
-# Scheduling strategy: 'random', 'robin', 'slo'
+# Scheduling strategy: 'random', 'robin', 'slo', 'prefix'
 SCHEDULING_STRATEGY = (
     TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("prefill_decode_strategy", "slo")
 )
+# Prefix cache aware routing of the 'prefix' strategy, the blocks match the engine's blocks
+PREFIX_CACHE_CONFIG = (
+    TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("prefix_cache", {})
+)
+# Token counting of the 'slo' and 'prefix' strategies
+TOKEN_COUNTER_CONFIG = (
+    TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("token_counter", {})
+)
+# Heartbeat expiry and metrics scraping of the registered instances
+HEALTH_CONFIG = (
+    TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("instance_health", {})
+)
+# Priority queues and in-flight token limits of the requests, disabled if not configured
+ADMISSION_CONFIG = TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("admission", None)
 
 
 @lru_cache(maxsize=32)
@@ -46,104 +68,38 @@ def load_hf_tokenizer(model_path: str):
     return AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
 
 
-def count_chat_tokens(messages: List[Dict[str, Any]]) -> int:
-    tokenizer = load_hf_tokenizer(MODEL_PATH)
-    normalized_message = []
-    for msg in messages:
-        content = msg["content"]
-        if isinstance(content, list):
-            content = "".join(part["text"] for part in content if part.get("type") == "text")
-        normalized_message.append({"role": msg["role"], "content": content})
-    text = tokenizer.apply_chat_template(
-        normalized_message, add_generation_prompt=False, tokenize=False
-    )
-    return len(tokenizer.encode(text, add_special_tokens=False))
-
-
-def count_text_tokens(prompt: str) -> int:
-    tokenizer = load_hf_tokenizer(MODEL_PATH)
-    return len(tokenizer.encode(prompt, add_special_tokens=False))
-
-
-# -----------------------------------------------------------------------------
-# LoadManager: unified management of P/D instances and their load
-# -----------------------------------------------------------------------------
-class LoadManager:
-    def __init__(self):
-        self._lock = threading.Lock()
-        # Each resource type 'P' or 'D' maps to {http_addr: {'zmq': zmq_addr, 'load_num': int, 'load_len': int, 'compute_ratio': float}}
-        # load_num: num of req, load_len: num of tokens
-        self._instances: dict[str, dict[str, dict[str, object]]] = {"P": {}, "D": {}}
-
-    def register(self, rtype: str, http_addr: str, zmq_addr: str):
-        with self._lock:
-            if http_addr not in self._instances[rtype]:
-                self._instances[rtype][http_addr] = {
-                    "zmq": zmq_addr,
-                    "load_num": 0,
-                    "load_len": 0,
-                    "compute_ratio": 1.0,
-                }
-                logger.info(f"Registered new {rtype}-instance {http_addr} (zmq={zmq_addr})")
-            else:
-                # If zmq address changed, synchronize it
-                self._instances[rtype][http_addr]["zmq"] = zmq_addr
-
-    def increment_load(self, rtype: str, http_addr: str, tokens=0):
-        with self._lock:
-            self._instances[rtype][http_addr]["load_num"] += 1
-            self._instances[rtype][http_addr]["load_len"] += tokens
-            logger.debug(
-                f"[{rtype}] +1 load on {http_addr}, now={self._instances[rtype][http_addr]['load_num']}"
-            )
-
-    def decrement_load(self, rtype: str, http_addr: str, tokens=0):
-        with self._lock:
-            self._instances[rtype][http_addr]["load_num"] -= 1
-            self._instances[rtype][http_addr]["load_len"] -= tokens
-            logger.debug(
-                f"[{rtype}] -1 load on {http_addr}, now={self._instances[rtype][http_addr]['load_num']}"
-            )
-
-    def get_random(self, rtype: str) -> tuple[str, str]:
-        with self._lock:
-            items = list(self._instances[rtype].items())
-            logger.info(f"========== whole instance status {self._instances}==========")
-        http_addr, info = random.choice(items)
-        return http_addr, info["zmq"]
-
-    def get_robin_loaded(self, rtype: str) -> tuple[str, str]:
-        with self._lock:
-            http_addr, info = min(self._instances[rtype].items(), key=lambda kv: kv[1]["load_num"])
-            logger.info(f"========== whole instance status {self._instances}==========")
-        return http_addr, info["zmq"]
-
-    def get_slo_loaded(self, rtype: str, token_num: int = -1) -> tuple[str, str]:
-        with self._lock:
-            http_addr, info = min(
-                self._instances[rtype].items(),
-                key=lambda kv: (kv[1]["load_len"] + token_num) / kv[1]["compute_ratio"],
-            )
-            logger.info(f"========== whole instance status {self._instances}==========")
-        return http_addr, info["zmq"]
-
-    def get_loaded(
-        self, rtype: str, load_type: str = "robin", token_num: int = 0
-    ) -> tuple[str, str]:
-        if load_type == "random":
-            return self.get_random(rtype)
-        elif load_type == "robin":
-            return self.get_robin_loaded(rtype)
-        elif load_type == "slo":
-            return self.get_slo_loaded(rtype, token_num)
-        else:
-            raise ValueError(f"Unknown load type: {load_type}")
-
-
 # -----------------------------------------------------------------------------
 # Globals & configuration
 # -----------------------------------------------------------------------------
-lm = LoadManager()
+prefix_index = PrefixCacheIndex(
+    block_size=PREFIX_CACHE_CONFIG.get(
+        "block_size", TASK_CONFIG.serve[0].get("engine_args", {}).get("block_size", 16)
+    ),
+    max_blocks=PREFIX_CACHE_CONFIG.get("max_blocks", 65536),
+)
+lm = LoadManager(
+    prefix_index,
+    PREFIX_CACHE_CONFIG.get("hit_weight", 1.0),
+    max_failures=HEALTH_CONFIG.get("max_failures", 2),
+    kv_usage_limit=HEALTH_CONFIG.get("kv_usage_limit", 0.98),
+    max_prefill_tokens=(ADMISSION_CONFIG or {}).get("max_prefill_tokens", float("inf")),
+    max_decode_tokens=(ADMISSION_CONFIG or {}).get("max_decode_tokens", float("inf")),
+)
+admission = (
+    AdmissionController(
+        ADMISSION_CONFIG.get("classes", None), ADMISSION_CONFIG.get("default_class", None)
+    )
+    if ADMISSION_CONFIG is not None
+    else None
+)
+token_counter = TokenCounter(
+    lambda: load_hf_tokenizer(MODEL_PATH),
+    mode=TOKEN_COUNTER_CONFIG.get("mode", "exact"),
+    workers=TOKEN_COUNTER_CONFIG.get("workers", 4),
+    cache_size=TOKEN_COUNTER_CONFIG.get("cache_size", 4096),
+    calibrate_every=TOKEN_COUNTER_CONFIG.get("calibrate_every", 32),
+    max_error=TOKEN_COUNTER_CONFIG.get("max_error", 0.1),
+)
 
 # Legacy registration dicts & Conditions retained for external waiting
 prefill_instances: dict[str, str] = {}
@@ -202,24 +158,111 @@ def start_service_discovery(hostname, port):
 AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=6 * 60 * 60)
 app = Quart(__name__)
 
+# Keep-alive connections to each P/D instance, reused by all requests
+POOL_CONFIG = TASK_CONFIG.experiment.get("runner", {}).get("deploy", {}).get("proxy_pool", {})
+pool = UpstreamPool(
+    limit=POOL_CONFIG.get("limit", 1024),
+    keepalive_timeout=POOL_CONFIG.get("keepalive_timeout", 60),
+    timeout=AIOHTTP_TIMEOUT,
+)
+
 
 def random_uuid() -> str:
     return uuid.uuid4().hex
 
 
-async def forward_request(url, data, request_id):
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
-        headers = {
-            "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}",
-            "X-Request-Id": request_id,
-        }
-        async with session.post(url=url, json=data, headers=headers) as resp:
-            if resp.status == 200:
-                async for chunk in resp.content.iter_chunked(1024):
-                    yield chunk
-            else:
-                content = await resp.read()
-                yield content
+def _expire_instances(ttl: float):
+    for rtype, http_addr in lm.expire(ttl):
+        if rtype == "P":
+            with prefill_cv:
+                prefill_instances.pop(http_addr, None)
+        else:
+            with decode_cv:
+                decode_instances.pop(http_addr, None)
+        logger.warning(f"{rtype}-instance {http_addr} missed its heartbeats for {ttl}s, removed")
+
+
+async def _scrape_instance(rtype: str, http_addr: str, timeout: float):
+    try:
+        async with pool.session(http_addr).get(
+            f"http://{http_addr}/metrics", timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            resp.raise_for_status()
+            metrics = parse_vllm_metrics(await resp.text())
+    except Exception as e:
+        logger.debug(f"Failed to scrape the metrics of {rtype}-instance {http_addr}: {e}")
+        metrics = None
+    lm.update_metrics(rtype, http_addr, metrics, time.monotonic())
+
+
+async def monitor_instances():
+    """Expire the silent instances and scrape the load of the others periodically."""
+    interval = HEALTH_CONFIG.get("scrape_interval", 2)
+    timeout = HEALTH_CONFIG.get("scrape_timeout", 1)
+    ttl = HEALTH_CONFIG.get("ttl", 10)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            _expire_instances(ttl)
+            await asyncio.gather(
+                *(
+                    _scrape_instance(rtype, http_addr, timeout)
+                    for rtype, http_addr in lm.addresses()
+                )
+            )
+            # New or recovered instances may take the queued requests
+            if admission is not None:
+                admission.dispatch()
+        except Exception as e:
+            logger.error(f"Error in monitoring the instances: {e}")
+
+
+monitor_task = None
+
+
+@app.before_serving
+async def start_monitor():
+    global monitor_task
+    monitor_task = asyncio.ensure_future(monitor_instances())
+
+
+def release_load(rtype, addr, tokens, generation=None):
+    lm.decrement_load(rtype, addr, tokens, generation)
+    if admission is not None:
+        admission.dispatch()
+
+
+def release_ticket(ticket, tokens):
+    (prefill_addr, _, prefill_generation), (decode_addr, _, decode_generation) = ticket
+    release_load("P", prefill_addr, tokens, prefill_generation)
+    release_load("D", decode_addr, tokens, decode_generation)
+
+
+async def forward_request(addr, endpoint, body, request_id):
+    headers = {
+        "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}",
+        "X-Request-Id": request_id,
+    }
+    async for chunk in pool.forward(addr, endpoint, body, headers):
+        yield chunk
+
+
+@app.after_serving
+async def close_pool():
+    if monitor_task is not None:
+        monitor_task.cancel()
+    await pool.close()
+    token_counter.shutdown()
+
+
+@app.route("/proxy/metrics", methods=["GET"])
+async def proxy_metrics():
+    return {
+        "upstreams": pool.stats(),
+        "token_counter": token_counter.stats(),
+        "instances": lm.status(),
+        "admission": admission.stats() if admission is not None else None,
+    }
 
 
 # support both /v1/completions and /v1/chat/completions
@@ -227,55 +270,95 @@ async def forward_request(url, data, request_id):
 @app.route("/v1/chat/completions", methods=["POST"])
 async def handle_request():
     try:
-        original_data = await request.get_json()
+        # Parse the body once, the decode leg forwards the raw bytes
+        original_body = await request.get_data()
+        original_data = json.loads(original_body)
         endpoint = request.path  # this will be '/v1/completions' or '/v1/chat/completions'
 
         # calculate tokens num
         prompt_tokens_num = 0
-        if SCHEDULING_STRATEGY == "slo":
+        prefix_hashes = []
+        # The admission limits the tokens in flight, it counts them for every strategy
+        if SCHEDULING_STRATEGY in ("slo", "prefix") or admission is not None:
+            # Tokenize in the worker threads of the counter, not on the event loop
             if request.path.endswith("/chat/completions"):
-                prompt_tokens_num = count_chat_tokens(original_data["messages"])
+                prompt = {"messages": original_data["messages"]}
             else:
-                prompt_tokens_num = count_text_tokens(original_data["prompt"])
+                prompt = {"prompt": original_data["prompt"]}
+            prompt_tokens_num, prefix_hashes = await token_counter.analyze(
+                **prompt, prefix_index=prefix_index if SCHEDULING_STRATEGY == "prefix" else None
+            )
         logger.info(f"---------------- prompt_tokens_num {prompt_tokens_num} -------------- ")
 
         # Prefill request: max_tokens=1
-        prefill_request = original_data.copy()
-        prefill_request["max_tokens"] = 1
+        prefill_body = json.dumps({**original_data, "max_tokens": 1}).encode()
 
-        # Select Prefill instance
-        prefill_addr, prefill_zmq = lm.get_loaded("P", SCHEDULING_STRATEGY, prompt_tokens_num)
-        logger.info(f"Selected P-instance {prefill_addr} via '{SCHEDULING_STRATEGY}'")
+        # Select and load the P and D-instances, waiting in the queue of the priority
+        def try_acquire():
+            return lm.acquire(SCHEDULING_STRATEGY, prompt_tokens_num, prefix_hashes)
 
-        # Select Decode instance
-        decode_addr, decode_zmq = lm.get_loaded("D", SCHEDULING_STRATEGY, prompt_tokens_num)
+        if admission is not None:
+            priority = request.headers.get(
+                ADMISSION_CONFIG.get("priority_header", "X-Priority"), None
+            )
+            try:
+                timeout = parse_timeout(request.headers.get("X-Request-Timeout", None))
+            except ValueError:
+                return {"error": "X-Request-Timeout must be a number of seconds"}, 400
+            try:
+                ticket = await admission.admit(
+                    priority,
+                    try_acquire,
+                    lambda ticket: release_ticket(ticket, prompt_tokens_num),
+                    timeout=timeout,
+                )
+            except Rejected as e:
+                logger.warning(f"Rejected a {priority} request: {e.reason}")
+                return {"error": e.reason}, e.status, {"Retry-After": str(e.retry_after)}
+        else:
+            ticket = try_acquire()
+            if ticket is None:
+                raise ValueError("No P or D-instance is registered")
+        prefill_addr, prefill_zmq, prefill_generation = ticket[0]
+        decode_addr, decode_zmq, decode_generation = ticket[1]
+        logger.info(f"Selected P-instance {prefill_addr} via '{SCHEDULING_STRATEGY}'")
         logger.info(f"Selected D-instance {decode_addr} via '{SCHEDULING_STRATEGY}'")
 
         # Keep original request_id composition format
         request_id = f"___prefill_addr_{prefill_zmq}___decode_addr_{decode_zmq}_{random_uuid()}"
 
+        # The decode load was reserved with the prefill load, the handler holds it until
+        # the response stream takes it over
+        decode_reservation = Reservation(
+            lambda: release_load("D", decode_addr, prompt_tokens_num, decode_generation)
+        )
+
         # Execute Prefill and update load
-        lm.increment_load("P", prefill_addr, prompt_tokens_num)
         try:
-            async for _ in forward_request(
-                f"http://{prefill_addr}{endpoint}", prefill_request, request_id
-            ):
+            async for _ in forward_request(prefill_addr, endpoint, prefill_body, request_id):
                 pass
+        except BaseException:
+            decode_reservation.release()
+            raise
         finally:
-            lm.decrement_load("P", prefill_addr, prompt_tokens_num)
+            release_load("P", prefill_addr, prompt_tokens_num, prefill_generation)
 
         # Execute Decode and update load
         async def tracked_decode():
-            lm.increment_load("D", decode_addr, prompt_tokens_num)
             try:
                 async for chunk in forward_request(
-                    f"http://{decode_addr}{endpoint}", original_data, request_id
+                    decode_addr, endpoint, original_body, request_id
                 ):
                     yield chunk
             finally:
-                lm.decrement_load("D", decode_addr, prompt_tokens_num)
+                decode_reservation.release()
 
-        resp = await make_response(tracked_decode())
+        # A stream the server never starts is released when it is garbage collected
+        try:
+            resp = await make_response(tracked_decode())
+        except BaseException:
+            decode_reservation.release()
+            raise
         resp.timeout = None
         return resp
 
@@ -0,0 +1,172 @@
+import asyncio
+import collections
+import hashlib
+import json
+import math
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flagscale.logger import logger
+from flagscale.serve.prefix_cache import PrefixCacheIndex
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Keep the role and the text of chat messages, joining the text parts of a content."""
+    normalized_message = []
+    for msg in messages:
+        content = msg["content"]
+        if isinstance(content, list):
+            content = "".join(part["text"] for part in content if part.get("type") == "text")
+        normalized_message.append({"role": msg["role"], "content": content})
+    return normalized_message
+
+
+class TokenCounter:
+    """
+    Count the prompt tokens of requests off the event loop of the proxy.
+
+    The chat template and the tokenizer run in a pool of worker threads, the fast tokenizers
+    release the GIL while encoding, so long prompts do not stall the streams of the other
+    requests. The results are cached by the hash of the prompt in an LRU of cache_size.
+
+    In the estimate mode the tokens are counted from the characters of the prompt by a
+    chars per token ratio, calibrated by the exact counts: every calibrate_every-th prompt is
+    counted exactly in the background. While the relative error of the recent estimates
+    exceeds max_error, the prompts are counted exactly instead until the ratio fits again.
+    """
+
+    def __init__(
+        self,
+        load_tokenizer: Callable[[], Any],
+        mode: str = "exact",
+        workers: int = 4,
+        cache_size: int = 4096,
+        calibrate_every: int = 32,
+        max_error: float = 0.1,
+        chars_per_token: float = 4.0,
+    ):
+        if mode not in ["exact", "estimate"]:
+            raise ValueError(f"Unknown token count mode: {mode}")
+        self.mode = mode
+        self._load_tokenizer = load_tokenizer
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tokenizer")
+        self._cache_size = cache_size
+        self._cache: collections.OrderedDict = collections.OrderedDict()
+        self._calibrate_every = calibrate_every
+        self._max_error = max_error
+        self.chars_per_token = chars_per_token
+        # Relative errors of the recent estimates, against the exact counts
+        self._errors = collections.deque(maxlen=64)
+        self._estimates = 0
+        # Keep the background calibrations referenced until they are done
+        self._calibrations = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _text(self, messages, prompt) -> str:
+        if messages is not None:
+            return json.dumps(normalize_messages(messages), ensure_ascii=False)
+        return prompt
+
+    def _encode(self, messages, prompt) -> List[int]:
+        tokenizer = self._load_tokenizer()
+        if messages is not None:
+            prompt = tokenizer.apply_chat_template(
+                normalize_messages(messages), add_generation_prompt=False, tokenize=False
+            )
+        return tokenizer.encode(prompt, add_special_tokens=False)
+
+    def _analyze(self, messages, prompt, prefix_index):
+        tokens = self._encode(messages, prompt)
+        hashes = prefix_index.block_hashes(tokens) if prefix_index is not None else None
+        return len(tokens), hashes
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key, None)
+        if entry is not None:
+            self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def estimate_error(self) -> Optional[float]:
+        """Return the max relative error of the recent estimates, None before calibration."""
+        return max(self._errors) if self._errors else None
+
+    def _estimating(self) -> bool:
+        error = self.estimate_error()
+        return self.mode == "estimate" and (error is None or error <= self._max_error)
+
+    def _observe(self, chars, token_num):
+        """Calibrate the estimate by an exact count."""
+        if self.mode != "estimate" or token_num == 0:
+            return
+        estimate = math.ceil(chars / self.chars_per_token)
+        self._errors.append(abs(estimate - token_num) / token_num)
+        # A moving average follows a drifting mix of languages and templates
+        self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * (chars / token_num)
+
+    async def _calibrate(self, messages, prompt, chars):
+        try:
+            loop = asyncio.get_running_loop()
+            token_num, _ = await loop.run_in_executor(
+                self._executor, self._analyze, messages, prompt, None
+            )
+        except Exception as e:
+            logger.warning(f"Failed to calibrate the token estimate: {e}")
+            return
+        self._observe(chars, token_num)
+
+    async def analyze(
+        self,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        prompt: Optional[str] = None,
+        prefix_index: Optional[PrefixCacheIndex] = None,
+    ) -> Tuple[int, Optional[List[int]]]:
+        """
+        Return the number of prompt tokens of a chat (messages) or a completion (prompt)
+        request, and the block hashes of the prompt if prefix_index is given.
+        """
+        text = self._text(messages, prompt)
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        entry = self._cache_get(key)
+        if entry is not None and (prefix_index is None or entry[1] is not None):
+            self.hits += 1
+            return entry
+
+        # The block hashes need the tokens, they are never estimated
+        if prefix_index is None and self._estimating():
+            if self._estimates % self._calibrate_every == 0:
+                task = asyncio.ensure_future(self._calibrate(messages, prompt, len(text)))
+                self._calibrations.add(task)
+                task.add_done_callback(self._calibrations.discard)
+            self._estimates += 1
+            return math.ceil(len(text) / self.chars_per_token), None
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(
+            self._executor, self._analyze, messages, prompt, prefix_index
+        )
+        self._observe(len(text), entry[0])
+        self._cache_put(key, entry)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "estimating": self._estimating(),
+            "chars_per_token": self.chars_per_token,
+            "estimate_error": self.estimate_error(),
+            "cache_size": len(self._cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
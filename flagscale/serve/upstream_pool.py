@@ -0,0 +1,134 @@
+import collections
+import time
+
+from typing import AsyncIterator, Dict, Optional
+
+import aiohttp
+
+
+class _UpstreamStats:
+    def __init__(self, window: int):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        # Seconds to the first byte and to the end of the recent responses
+        self.ttfb = collections.deque(maxlen=window)
+        self.latency = collections.deque(maxlen=window)
+
+
+def _summary(samples) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"mean_ms": None, "p99_ms": None}
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return {"mean_ms": 1000 * sum(ordered) / len(ordered), "p99_ms": 1000 * p99}
+
+
+class UpstreamPool:
+    """
+    Long-lived keep-alive connection pools of the upstream instances of a proxy.
+
+    Each upstream, e.g. "10.0.0.1:8000", gets its own session whose connector holds at most
+    limit connections, so a busy instance cannot take the connections of the others. The
+    sessions must be used and closed on the event loop they were created on.
+    """
+
+    def __init__(
+        self,
+        limit: int = 1024,
+        keepalive_timeout: float = 60,
+        timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=6 * 60 * 60),
+        window: int = 1024,
+    ):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.window = window
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._stats: Dict[str, _UpstreamStats] = {}
+
+    def _trace_config(self, stats: _UpstreamStats) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_create(session, context, params):
+            stats.connections_created += 1
+
+        async def on_reuse(session, context, params):
+            stats.connections_reused += 1
+
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def session(self, upstream: str) -> aiohttp.ClientSession:
+        """Return the session of an upstream, created on first use."""
+        session = self._sessions.get(upstream, None)
+        if session is None or session.closed:
+            stats = self._stats.setdefault(upstream, _UpstreamStats(self.window))
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, keepalive_timeout=self.keepalive_timeout
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, trace_configs=[self._trace_config(stats)]
+            )
+            self._sessions[upstream] = session
+        return session
+
+    async def forward(
+        self, upstream: str, path: str, body: bytes, headers: Dict[str, str]
+    ) -> AsyncIterator[bytes]:
+        """
+        POST a serialized json body to an upstream and yield the response bytes.
+
+        The bytes are passed through as they arrive, server-sent events are not re-chunked.
+        The body of a failed response is yielded as a whole.
+        """
+        session = self.session(upstream)
+        stats = self._stats[upstream]
+        stats.requests += 1
+        stats.in_flight += 1
+        start = time.perf_counter()
+        first = None
+        headers = {**headers, "Content-Type": "application/json"}
+        try:
+            async with session.post(f"http://{upstream}{path}", data=body, headers=headers) as resp:
+                if resp.status == 200:
+                    async for chunk in resp.content.iter_any():
+                        if first is None:
+                            first = time.perf_counter()
+                        yield chunk
+                else:
+                    stats.errors += 1
+                    yield await resp.read()
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            end = time.perf_counter()
+            if first is not None:
+                stats.ttfb.append(first - start)
+                stats.latency.append(end - start)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Return the pool and latency metrics of every upstream."""
+        result = {}
+        for upstream, stats in self._stats.items():
+            result[upstream] = {
+                "limit": self.limit,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "in_flight": stats.in_flight,
+                "connections_created": stats.connections_created,
+                "connections_reused": stats.connections_reused,
+                "ttfb": _summary(stats.ttfb),
+                "latency": _summary(stats.latency),
+            }
+        return result
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
@@ -134,6 +134,7 @@ from flagscale.train.stablelm2_scheduler import StableLM2SchedulerConfig
 from flagscale.train.global_vars import get_parallel_context, get_spiky_loss_detector
 from flagscale.train.hetero.p2p_communication import get_device_type_for_comm
 from flagscale.train.theoretical_memory_usage import report_theoretical_memory as fs_report_theoretical_memory
+from flagscale.elastic.heartbeat import get_heartbeat_writer
 
 stimer = StragglerDetector()
 
@@ -2242,6 +2243,13 @@ def post_training_step_callbacks(
         stimer.report(num_floating_point_operations_since_last_log_event, args.log_interval)
         num_floating_point_operations_since_last_log_event = 0.0
 
+    ########## FlagScale Begin ##########
+    # Per-node progress for the monitoring agent, which detects hangs and stragglers.
+    heartbeat_writer = get_heartbeat_writer()
+    if heartbeat_writer is not None:
+        heartbeat_writer.write(iteration)
+    ########## FlagScale End ##########
+
     # Check weight hash across DP replicas.
     if (
         args.check_weight_hash_across_dp_replicas_interval is not None
@@ -0,0 +1,208 @@
+import subprocess
+import time
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.elastic.agent import NodeAgent, StatusCollector
+from flagscale.elastic.heartbeat import HeartbeatWriter
+from flagscale.runner.runner_base import JobStatus
+from flagscale.runner.runner_train import _get_agent_cmd_train
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestNodeAgent:
+    """Test cases for the on-node agent and the master-side collector"""
+
+    @pytest.fixture
+    def collector(self):
+        collector = StatusCollector(port=0, host="127.0.0.1").start()
+        yield collector
+        collector.stop()
+
+    @pytest.fixture
+    def job(self, tmp_path):
+        process = subprocess.Popen(["sleep", "30"])
+        pid_file = tmp_path / "host.pid"
+        pid_file.write_text(str(process.pid))
+        log_file = tmp_path / "host.output"
+        log_file.write_text("iteration 1\n")
+        yield process, pid_file, log_file
+        process.kill()
+        process.wait()
+
+    def _agent(self, tmp_path, job, collector=None):
+        _, pid_file, log_file = job
+        # An unreachable collector when the test does not push
+        addr = f"127.0.0.1:{collector.port}" if collector else "127.0.0.1:1"
+        return NodeAgent(
+            "worker0",
+            0,
+            str(pid_file),
+            str(log_file),
+            str(tmp_path / "monitor"),
+            addr,
+            interval=0.05,
+        )
+
+    def test_snapshot(self, tmp_path, job):
+        agent = self._agent(tmp_path, job)
+        snapshot = agent.snapshot()
+
+        assert snapshot["status"] not in ("", "Z")
+        assert snapshot["log_offset"] == len("iteration 1\n")
+
+    def test_progress_from_heartbeat(self, tmp_path, job):
+        agent = self._agent(tmp_path, job)
+        writer = HeartbeatWriter(str(tmp_path / "host.heartbeat"))
+        agent.heartbeat_file = writer.path
+
+        # The log of the node shows no iterations, the heartbeat does
+        writer.write(10, now=100.0)
+        assert (agent.snapshot()["iteration"], agent.snapshot()["elapsed_ms"]) == (10, None)
+        writer.write(20, now=105.0)
+        snapshot = agent.snapshot()
+        assert (snapshot["iteration"], snapshot["elapsed_ms"]) == (20, 500.0)
+        # A restart from a checkpoint starts a new rate
+        writer.write(5, now=110.0)
+        assert agent.snapshot()["elapsed_ms"] is None
+
+    def test_messages_are_deltas(self, tmp_path, job):
+        agent = self._agent(tmp_path, job)
+        first = agent.build_message(agent.snapshot())
+        agent._last_sent = agent.snapshot()
+        agent._sent_counts = dict(agent.matcher.counts)
+        second = agent.build_message(agent.snapshot())
+
+        assert first["full"] and "status" in first
+        assert second["seq"] == first["seq"] + 1
+        assert set(second) == {"seq", "host", "node_rank", "time"}
+
+    def test_push_to_collector(self, tmp_path, job, collector):
+        _, _, log_file = job
+        agent = self._agent(tmp_path, job, collector)
+        assert agent.push(agent.snapshot())
+        assert _wait_for(lambda: collector.get_node("worker0", 0) is not None)
+        assert collector.get_job_status([("worker0", 0)]) == JobStatus.RUNNING
+
+        with open(log_file, "a") as f:
+            f.write("CUDA out of memory\n")
+        assert agent.push(agent.snapshot())
+        assert _wait_for(
+            lambda: collector.get_node("worker0", 0)["counts"].get("out of memory") == 1
+        )
+        assert collector.get_node("worker0", 0)["line_numbers"]["out of memory"] == [2]
+
+        with open(log_file, "a") as f:
+            f.write(" iteration        5/     100 | elapsed time per iteration (ms): 250.0 |\n")
+        assert agent.push(agent.snapshot())
+        assert _wait_for(lambda: collector.get_node("worker0", 0)["iteration"] == 5)
+        assert collector.get_node("worker0", 0)["elapsed_ms"] == 250.0
+
+    def test_agent_exits_with_job(self, tmp_path, job, collector):
+        process, _, _ = job
+        agent = self._agent(tmp_path, job, collector)
+        snapshot = agent.snapshot
+
+        def exit_after_first_snapshot():
+            result = snapshot()
+            process.kill()
+            process.wait()
+            return result
+
+        agent.snapshot = exit_after_first_snapshot
+        agent.run()
+
+        assert _wait_for(
+            lambda: collector.get_job_status([("worker0", 0)]) == JobStatus.COMPLETED_OR_IDLE
+        )
+
+
+class TestStatusCollector:
+    """Test cases for the collector state machine"""
+
+    def test_unknown_node_is_transitional(self):
+        collector = StatusCollector(port=0, host="127.0.0.1")
+        assert collector.get_job_status([("worker0", 0)]) == JobStatus.TRANSITIONAL
+        collector.stop()
+
+    def test_stale_messages_are_dropped(self):
+        collector = StatusCollector(port=0, host="127.0.0.1")
+        base = {"host": "worker0", "node_rank": 0, "time": time.time()}
+        collector.apply({**base, "seq": 1, "full": True, "status": "R"})
+        collector.apply({**base, "seq": 3, "status": ""})
+        collector.apply({**base, "seq": 2, "status": "S"})
+
+        assert collector.get_node("worker0", 0)["status"] == ""
+        assert collector.get_node("worker0", 0)["seq"] == 3
+        collector.stop()
+
+    def test_mixed_status_is_transitional(self):
+        collector = StatusCollector(port=0, host="127.0.0.1")
+        collector.apply({"host": "a", "node_rank": 0, "seq": 1, "full": True, "status": "R"})
+        collector.apply({"host": "b", "node_rank": 1, "seq": 1, "full": True, "status": ""})
+
+        assert collector.get_job_status([("a", 0), ("b", 1)]) == JobStatus.TRANSITIONAL
+        assert collector.get_job_status([("a", 0)]) == JobStatus.RUNNING
+        collector.stop()
+
+    def test_nodes_exiting_apart_complete(self):
+        collector = StatusCollector(port=0, host="127.0.0.1", stale_after=0.1)
+        collector.apply({"host": "a", "node_rank": 0, "seq": 1, "full": True, "status": "R"})
+        collector.apply({"host": "b", "node_rank": 1, "seq": 1, "full": True, "status": "R"})
+        hosts = [("a", 0), ("b", 1)]
+
+        # a exits and its agent stops pushing, b keeps running past stale_after
+        collector.apply({"host": "a", "node_rank": 0, "seq": 2, "status": ""})
+        time.sleep(0.2)
+        collector.apply({"host": "b", "node_rank": 1, "seq": 2, "status": "R"})
+        assert collector.get_job_status(hosts) == JobStatus.TRANSITIONAL
+
+        collector.apply({"host": "b", "node_rank": 1, "seq": 3, "status": "Z"})
+        time.sleep(0.2)
+        assert collector.get_job_status(hosts) == JobStatus.COMPLETED_OR_IDLE
+        collector.stop()
+
+    def test_silent_running_node_is_stale(self):
+        collector = StatusCollector(port=0, host="127.0.0.1", stale_after=0.1)
+        collector.apply({"host": "a", "node_rank": 0, "seq": 1, "full": True, "status": "R"})
+        assert collector.get_job_status([("a", 0)]) == JobStatus.RUNNING
+        time.sleep(0.2)
+        assert collector.get_job_status([("a", 0)]) == JobStatus.TRANSITIONAL
+        collector.stop()
+
+
+class TestAgentCommand:
+    """Test cases for launching the agent from the run script"""
+
+    def _config(self, **runner):
+        return OmegaConf.create(
+            {
+                "experiment": {"runner": runner},
+                "train": {"system": {"logging": {"log_dir": "/log"}}},
+            }
+        )
+
+    def test_no_agent_without_collector(self):
+        config = self._config()
+        assert (
+            _get_agent_cmd_train(config, "worker0", 0, "host.pid", "host.output", "host.heartbeat")
+            is None
+        )
+
+    def test_agent_pushes_to_collector(self):
+        config = self._config(collector_addr="master", collector_port=7000)
+        cmd = _get_agent_cmd_train(
+            config, "worker0", 0, "host.pid", "host.output", "host.heartbeat"
+        )
+        assert "--collector master:7000" in cmd
+        assert "--heartbeat-file host.heartbeat" in cmd
@@ -3,7 +3,7 @@ import tempfile
 import pytest
 from unittest.mock import mock_open, patch, MagicMock
 
-from flagscale.elastic.diagnostic import generate_diagnostic_report, error_types
+from flagscale.elastic.diagnostic import DiagnosticMatcher, generate_diagnostic_report, error_types
 
 
 class TestDiagnostic:
@@ -173,4 +173,65 @@ class TestDiagnostic:
             assert "TimeoutError" in report
             assert "ProcessKilled" in report
         finally:
-            os.unlink(temp_path)
\ No newline at end of file
+            os.unlink(temp_path)
+
+class TestDiagnosticMatcher:
+    """Test cases for the streaming signature matcher"""
+
+    def test_counts_and_line_numbers(self):
+        matcher = DiagnosticMatcher()
+        matcher.feed("ok\nCUDA out of memory\nok\ncuda out of memory again\n")
+
+        assert matcher.counts["cuda out of memory"] == 2
+        assert matcher.line_numbers["cuda out of memory"] == [2, 4]
+        # Signatures contained in a longer match are counted as well
+        assert matcher.counts["out of memory"] == 2
+        assert matcher.counts["cuda"] == 2
+
+    def test_overlapping_signatures(self):
+        matcher = DiagnosticMatcher()
+        matcher.feed("RendezvousConnectionError\nImportError: x\n")
+
+        assert "rendezvousconne" in matcher.counts
+        assert "rendezvous" in matcher.counts
+        assert "importerror" in matcher.counts
+        assert matcher.line_numbers["error"] == [1, 2]
+
+    def test_incremental_chunks(self):
+        matcher = DiagnosticMatcher()
+        # The signature is split across two chunks
+        matcher.feed("line 1\nsegmentation fa")
+        assert "segmentation fault" not in matcher.counts
+        matcher.feed("ult (core dumped)\nline 3\n")
+
+        assert matcher.counts["segmentation fault"] == 1
+        assert matcher.line_numbers["core dumped"] == [2]
+        assert matcher.num_lines == 3
+
+    def test_flush_scans_last_line(self):
+        matcher = DiagnosticMatcher()
+        matcher.feed("killed")
+        assert not matcher.counts
+        matcher.flush()
+        assert matcher.counts["killed"] == 1
+
+    def test_matched_keeps_signature_order(self):
+        matcher = DiagnosticMatcher()
+        matcher.feed("timeout\ncompleted\n")
+        keys = list(error_types)
+        assert matcher.matched() == sorted(matcher.matched(), key=keys.index)
+
+    def test_report_accumulates_across_chunks(self, tmp_path):
+        matcher = DiagnosticMatcher()
+        first = tmp_path / "first.log"
+        first.write_text("Traceback (most recent call last)\n")
+        second = tmp_path / "second.log"
+        second.write_text("permission denied\n")
+
+        generate_diagnostic_report(None, "localhost", 0, str(first), True, matcher=matcher)
+        report = generate_diagnostic_report(
+            None, "localhost", 0, str(second), True, matcher=matcher
+        )
+
+        assert "CodeError" in report
+        assert "PermissionError: File permission denied. (count: 1, lines: 2)" in report
@@ -0,0 +1,40 @@
+from flagscale.elastic import heartbeat
+from flagscale.elastic.heartbeat import HEARTBEAT_FILE_ENV, HeartbeatWriter, read_heartbeat
+
+
+class TestHeartbeat:
+    """Test cases for the training heartbeat read by the node agent"""
+
+    def test_write_and_read(self, tmp_path):
+        path = str(tmp_path / "host.heartbeat")
+        writer = HeartbeatWriter(path, min_interval=1.0)
+
+        assert read_heartbeat(path) is None
+        writer.write(10, now=100.0)
+        assert read_heartbeat(path) == (10, 100.0)
+
+    def test_writes_are_throttled(self, tmp_path):
+        path = str(tmp_path / "host.heartbeat")
+        writer = HeartbeatWriter(path, min_interval=1.0)
+        writer.write(10, now=100.0)
+        writer.write(11, now=100.5)
+
+        assert read_heartbeat(path) == (10, 100.0)
+        writer.write(12, now=101.0)
+        assert read_heartbeat(path) == (12, 101.0)
+
+    def test_only_first_local_rank_writes(self, tmp_path, monkeypatch):
+        monkeypatch.setenv(HEARTBEAT_FILE_ENV, str(tmp_path / "host.heartbeat"))
+        monkeypatch.setenv("LOCAL_RANK", "1")
+        monkeypatch.setattr(heartbeat, "_writer", None)
+        assert heartbeat.get_heartbeat_writer() is None
+
+        monkeypatch.setenv("LOCAL_RANK", "0")
+        monkeypatch.setattr(heartbeat, "_writer", None)
+        assert heartbeat.get_heartbeat_writer().path == str(tmp_path / "host.heartbeat")
+
+    def test_no_writer_without_agent(self, monkeypatch):
+        monkeypatch.delenv(HEARTBEAT_FILE_ENV, raising=False)
+        monkeypatch.setattr(heartbeat, "_writer", None)
+
+        assert heartbeat.get_heartbeat_writer() is None
@@ -1,22 +1,40 @@
 import os
-import tempfile
+import subprocess
+import threading
+import time
 import pytest
-from unittest.mock import MagicMock, patch, call
+from unittest.mock import patch
 from omegaconf import OmegaConf
 
-from flagscale.elastic.log_collector import collect_logs, _log_offsets
+from flagscale.elastic.log_collector import (
+    LogTailer,
+    _log_tailers,
+    close_log_tailers,
+    collect_logs,
+)
+from flagscale.runner.utils import HostFanout
 
 
 class TestLogCollector:
     """Test cases for log collector module"""
-    
+
+    @pytest.fixture
+    def log_dir(self, tmp_path):
+        path = tmp_path / "logs"
+        path.mkdir()
+        return path
+
+    @pytest.fixture
+    def dest_dir(self, tmp_path):
+        return str(tmp_path / "monitor")
+
     @pytest.fixture
-    def mock_config(self):
+    def mock_config(self, log_dir):
         return OmegaConf.create({
             'train': {
                 'system': {
                     'logging': {
-                        'log_dir': '/tmp/test_logs'
+                        'log_dir': str(log_dir)
                     }
                 }
             },
@@ -27,177 +45,212 @@ class TestLogCollector:
                 }
             }
         })
-    
+
     @pytest.fixture
-    def mock_config_no_shared_fs(self):
-        return OmegaConf.create({
-            'train': {
-                'system': {
-                    'logging': {
-                        'log_dir': '/tmp/test_logs'
-                    }
-                }
-            },
-            'experiment': {
-                'runner': {
-                    'no_shared_fs': True,
-                    'ssh_port': 22
-                }
-            }
-        })
-    
+    def mock_config_no_shared_fs(self, mock_config):
+        mock_config.experiment.runner.no_shared_fs = True
+        return mock_config
+
     def setup_method(self):
-        """Reset log offsets before each test"""
-        _log_offsets.clear()
-    
-    def test_collect_logs_localhost_initial(self, mock_config):
+        """Drop cached tailers before each test"""
+        close_log_tailers()
+
+    def teardown_method(self):
+        close_log_tailers()
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_collect_logs_localhost_initial(self, mock_config, log_dir, dest_dir):
         """Test initial log collection from localhost"""
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-            f.write("Initial log content\nLine 2\nLine 3\n")
-            src_log_path = f.name
-        
-        # Mock the source log file path
-        expected_src = "/tmp/test_logs/host_0_localhost.output"
-        
-        with patch('os.path.join', return_value=expected_src):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local') as mock_run_local:
-                            result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                            
-                            # Should call run_local for localhost
-                            mock_run_local.assert_called()
-                            
-                            # Should return a destination file path
-                            assert result is not None
-                            assert "host_0_localhost_temp_" in result
-                            assert result.endswith(".log")
-        
-        # Cleanup
-        try:
-            os.unlink(src_log_path)
-        except:
-            pass
-    
-    def test_collect_logs_localhost_incremental(self, mock_config):
-        """Test incremental log collection"""
-        # Set initial offset
-        _log_offsets["localhost_0"] = 50
-        
-        expected_src = "/tmp/test_logs/host_0_localhost.output"
-        
-        with patch('os.path.join', return_value=expected_src):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=200):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local') as mock_run_local:
-                            result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                            
-                            mock_run_local.assert_called()
-                            args, kwargs = mock_run_local.call_args
-                            command = args[0]
-                            assert "tail -c +51" in command  # offset + 1
-                            
-                            assert _log_offsets["localhost_0"] == 200
-    
-    def test_collect_logs_remote_host(self, mock_config):
-        expected_src = "/tmp/test_logs/host_0_worker1.output"
-        
-        with patch('os.path.join', return_value=expected_src):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_scp') as mock_run_scp:
-                            result = collect_logs(mock_config, "worker1", 0, "/tmp/dest", dryrun=False)
-                            
-                            mock_run_scp.assert_called_with(
-                                "worker1", expected_src, result, 22, False, incremental=True
-                            )
-    
-    def test_collect_logs_no_shared_fs(self, mock_config_no_shared_fs):
-        expected_src = "/tmp/test_logs/host.output"
-        
-        with patch('os.path.join', return_value=expected_src):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local') as mock_run_local:
-                            result = collect_logs(mock_config_no_shared_fs, "localhost", 0, "/tmp/dest", dryrun=False)
-                            
-                            mock_run_local.assert_called()
-    
-    def test_collect_logs_file_not_found(self, mock_config):
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=False):
-                with patch('os.makedirs'):
-                    with patch('flagscale.elastic.log_collector.logger') as mock_logger:
-                        result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                        
-                        assert result is None
-                        mock_logger.warning.assert_called()
-    
-    def test_collect_logs_empty_file(self, mock_config):
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=0):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.logger') as mock_logger:
-                            result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                            
-                            assert result is None
-                            mock_logger.warning.assert_called()
-    
-    def test_collect_logs_dryrun(self, mock_config):
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local') as mock_run_local:
-                            result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=True)
-                            
-                            mock_run_local.assert_called()
-                            args, kwargs = mock_run_local.call_args
-                            assert kwargs['dryrun'] == True
-    
-    def test_collect_logs_exception_handling(self, mock_config):
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local', side_effect=Exception("Test error")):
-                            with patch('flagscale.elastic.log_collector.logger') as mock_logger:
-                                result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                                
-                                assert result is None
-                                mock_logger.error.assert_called()
-    
-    def test_log_offsets_management(self, mock_config):
-        assert "localhost_0" not in _log_offsets
-        
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=True):
-                with patch('os.path.getsize', return_value=100):
-                    with patch('os.makedirs'):
-                        with patch('flagscale.elastic.log_collector.run_local'):
-                            collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                            assert _log_offsets["localhost_0"] == 100
-                            
-                            with patch('os.path.getsize', return_value=200):
-                                collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                                assert _log_offsets["localhost_0"] == 200
-    
-    def test_destination_file_cleanup_on_failure(self, mock_config):
-        dest_file = "/tmp/dest/host_0_localhost_temp_test.log"
-        
-        with patch('os.path.join'):
-            with patch('os.path.exists', return_value=False):
-                with patch('os.makedirs'):
-                    with patch('os.path.exists') as mock_exists:
-                        with patch('os.remove') as mock_remove:
-                            # Mock that dest file exists
-                            mock_exists.side_effect = lambda path: path == dest_file
-                            
-                            result = collect_logs(mock_config, "localhost", 0, "/tmp/dest", dryrun=False)
-                            
-                            assert result is None
+        (log_dir / "host_0_localhost.output").write_text("Initial log content\nLine 2\n")
+
+        result = collect_logs(mock_config, "localhost", 0, dest_dir, dryrun=False)
+
+        assert result is not None
+        assert "host_0_localhost_temp_" in result
+        assert result.endswith(".log")
+        assert self._read(result) == b"Initial log content\nLine 2\n"
+
+    def test_collect_logs_localhost_incremental(self, mock_config, log_dir, dest_dir):
+        """Only the appended bytes are collected on the next call"""
+        src = log_dir / "host_0_localhost.output"
+        src.write_text("line 1\n")
+        collect_logs(mock_config, "localhost", 0, dest_dir)
+
+        with open(src, "a") as f:
+            f.write("line 2\n")
+        with patch("flagscale.elastic.log_collector.datetime") as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = "next"
+            result = collect_logs(mock_config, "localhost", 0, dest_dir)
+
+        assert self._read(result) == b"line 2\n"
+        assert _log_tailers["localhost_0"].offset == len("line 1\nline 2\n")
+
+    def test_collect_logs_no_new_bytes(self, mock_config, log_dir, dest_dir):
+        (log_dir / "host_0_localhost.output").write_text("line 1\n")
+        collect_logs(mock_config, "localhost", 0, dest_dir)
+
+        assert collect_logs(mock_config, "localhost", 0, dest_dir) is None
+
+    def test_collect_logs_no_shared_fs(self, mock_config_no_shared_fs, log_dir, dest_dir):
+        (log_dir / "host.output").write_text("shared name\n")
+
+        result = collect_logs(mock_config_no_shared_fs, "localhost", 0, dest_dir)
+
+        assert self._read(result) == b"shared name\n"
+
+    def test_collect_logs_file_not_found(self, mock_config, dest_dir):
+        with patch('flagscale.elastic.log_collector.logger') as mock_logger:
+            result = collect_logs(mock_config, "localhost", 0, dest_dir, dryrun=False)
+
+            assert result is None
+            mock_logger.warning.assert_called()
+
+    def test_collect_logs_empty_file(self, mock_config, log_dir, dest_dir):
+        (log_dir / "host_0_localhost.output").write_text("")
+
+        assert collect_logs(mock_config, "localhost", 0, dest_dir) is None
+        assert not [f for f in os.listdir(dest_dir) if f.endswith(".log")]
+
+    def test_collect_logs_dryrun(self, mock_config, log_dir, dest_dir):
+        (log_dir / "host_0_localhost.output").write_text("line 1\n")
+
+        assert collect_logs(mock_config, "localhost", 0, dest_dir, dryrun=True) is None
+        assert _log_tailers["localhost_0"].offset == 0
+
+    def test_collect_logs_exception_handling(self, mock_config, log_dir, dest_dir):
+        (log_dir / "host_0_localhost.output").write_text("line 1\n")
+
+        with patch.object(LogTailer, "poll", side_effect=Exception("Test error")):
+            with patch('flagscale.elastic.log_collector.logger') as mock_logger:
+                result = collect_logs(mock_config, "localhost", 0, dest_dir, dryrun=False)
+
+                assert result is None
+                mock_logger.error.assert_called()
+
+    def test_offsets_persist_across_restart(self, mock_config, log_dir, dest_dir):
+        src = log_dir / "host_0_localhost.output"
+        src.write_text("before restart\n")
+        collect_logs(mock_config, "localhost", 0, dest_dir)
+        close_log_tailers()
+
+        with open(src, "a") as f:
+            f.write("after restart\n")
+        with patch("flagscale.elastic.log_collector.datetime") as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = "next"
+            result = collect_logs(mock_config, "localhost", 0, dest_dir)
+
+        assert self._read(result) == b"after restart\n"
+
+    def test_truncation_rereads_from_start(self, tmp_path):
+        src = tmp_path / "src.output"
+        src.write_text("a long first line\n")
+        tailer = LogTailer("localhost", str(src), str(tmp_path / "state.json"))
+        tailer.poll(str(tmp_path / "first.log"))
+
+        src.write_text("short\n")
+        assert tailer.poll(str(tmp_path / "second.log")) == len("short\n")
+        assert self._read(tmp_path / "second.log") == b"short\n"
+
+    def test_rotation_rereads_from_start(self, tmp_path):
+        src = tmp_path / "src.output"
+        src.write_text("old log\n")
+        tailer = LogTailer("localhost", str(src), str(tmp_path / "state.json"))
+        tailer.poll(str(tmp_path / "first.log"))
+
+        os.rename(src, tmp_path / "src.output.1")
+        src.write_text("new log, longer than the old one\n")
+        tailer.poll(str(tmp_path / "second.log"))
+
+        assert self._read(tmp_path / "second.log") == b"new log, longer than the old one\n"
+
+    def test_remote_channel_streams_new_bytes(self, tmp_path):
+        """The remote poll script is run through a local shell instead of ssh"""
+        src = tmp_path / "src.output"
+        src.write_bytes(b"remote line 1\n")
+        tailer = LogTailer("worker1", str(src), str(tmp_path / "state.json"))
+
+        def open_local_channel():
+            tailer._channel = subprocess.Popen(
+                ["bash", "-s"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+
+        with patch.object(tailer, "_open_channel", side_effect=open_local_channel) as mock_open:
+            assert tailer.poll(str(tmp_path / "first.log")) == len(b"remote line 1\n")
+            with open(src, "ab") as f:
+                f.write(b"remote line 2\n")
+            assert tailer.poll(str(tmp_path / "second.log")) == len(b"remote line 2\n")
+            assert tailer.poll(str(tmp_path / "third.log")) == 0
+
+            # One channel serves every poll
+            assert mock_open.call_count == 1
+
+        assert self._read(tmp_path / "second.log") == b"remote line 2\n"
+        tailer.close()
+
+    def test_remote_missing_file(self, tmp_path):
+        tailer = LogTailer("worker1", str(tmp_path / "absent.output"), str(tmp_path / "s.json"))
+
+        def open_local_channel():
+            tailer._channel = subprocess.Popen(
+                ["bash", "-s"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+
+        with patch.object(tailer, "_open_channel", side_effect=open_local_channel):
+            assert tailer.poll(str(tmp_path / "out.log")) is None
+        tailer.close()
+
+    def test_remote_hung_channel_is_reopened(self, tmp_path):
+        src = tmp_path / "src.output"
+        src.write_bytes(b"remote line 1\n")
+        tailer = LogTailer("worker1", str(src), str(tmp_path / "s.json"), read_timeout=0.2)
+        channels = []
+
+        def open_channel():
+            # The first channel hangs without answering, the second one works
+            cmd = ["sleep", "60"] if not channels else ["bash", "-s"]
+            tailer._channel = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            channels.append(tailer._channel)
+
+        with patch.object(tailer, "_open_channel", side_effect=open_channel):
+            with pytest.raises(TimeoutError):
+                tailer.poll(str(tmp_path / "out.log"))
+            assert channels[0].poll() is not None
+            assert tailer.offset == 0
+
+            assert tailer.poll(str(tmp_path / "out.log")) == len(b"remote line 1\n")
+        assert self._read(tmp_path / "out.log") == b"remote line 1\n"
+        tailer.close()
+
+    def test_hung_host_does_not_leak_fanout_threads(self, tmp_path):
+        src = tmp_path / "src.output"
+        src.write_bytes(b"remote line 1\n")
+        tailer = LogTailer("worker1", str(src), str(tmp_path / "s.json"), read_timeout=0.3)
+        channels = []
+
+        def open_hung_channel():
+            tailer._channel = subprocess.Popen(
+                ["sleep", "60"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            channels.append(tailer._channel)
+
+        def fanout_threads():
+            return [t for t in threading.enumerate() if t.name.startswith("host_fanout")]
+
+        with patch.object(tailer, "_open_channel", side_effect=open_hung_channel):
+            # The fanout gives up before the read deadline at every monitor tick
+            for _ in range(4):
+                with HostFanout(max_workers=1, timeout=0.1) as fanout:
+                    (result,) = fanout.map(
+                        lambda host: tailer.poll(str(tmp_path / "out.log")), [("worker1",)]
+                    )
+                assert not result.ok
+
+            deadline = time.monotonic() + 5
+            while fanout_threads() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        assert not fanout_threads()
+        assert all(channel.poll() is not None for channel in channels)
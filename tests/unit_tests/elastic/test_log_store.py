@@ -0,0 +1,134 @@
+import gzip
+import os
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.elastic.log_collector import close_log_tailers
+from flagscale.elastic.log_store import SegmentedLogStore
+from flagscale.elastic.monitor_service import MonitorService
+from flagscale.runner.train_metrics import load_metrics
+
+
+class TestSegmentedLogStore:
+    """Test cases for the per-host segmented log store"""
+
+    def _store(self, tmp_path, **kwargs):
+        return SegmentedLogStore(str(tmp_path / "host_0_localhost"), compression="gzip", **kwargs)
+
+    def test_append_to_active_segment(self, tmp_path):
+        store = self._store(tmp_path)
+        store.write(b"line 1\n")
+        store.write(b"line 2\n")
+        store.close()
+
+        assert store.segments() == [store.latest_segment]
+        with open(store.latest_segment, "rb") as f:
+            assert f.read() == b"line 1\nline 2\n"
+
+    def test_size_rotation_compresses_sealed_segments(self, tmp_path):
+        store = self._store(tmp_path, max_segment_bytes=10)
+        store.write(b"0123456789")
+        store.write(b"abc")
+        store.close()
+
+        sealed, active = store.segments()
+        assert sealed.endswith("segment_000000.log.gz")
+        assert active.endswith("segment_000001.log")
+        with gzip.open(sealed, "rb") as f:
+            assert f.read() == b"0123456789"
+
+    def test_time_rotation(self, tmp_path):
+        store = self._store(tmp_path, max_segment_age=0)
+        store.write(b"a")
+        store.write(b"b")
+        store.close()
+
+        assert len(store.segments()) == 2
+
+    def test_retention_bounds_segments(self, tmp_path):
+        store = self._store(tmp_path, max_segment_bytes=1, max_segments=2)
+        for block in (b"a", b"b", b"c", b"d"):
+            store.write(block)
+        store.close()
+
+        assert len(store.segments()) == 3
+        assert sorted(os.listdir(store.directory)) == [
+            os.path.basename(path) for path in store.segments()
+        ]
+
+    def test_resume_after_restart(self, tmp_path):
+        store = self._store(tmp_path, max_segment_bytes=4)
+        store.write(b"1234")
+        store.write(b"56")
+        store.close()
+
+        store = self._store(tmp_path, max_segment_bytes=4)
+        store.write(b"7")
+        store.close()
+
+        assert len(store.segments()) == 2
+        with open(store.latest_segment, "rb") as f:
+            assert f.read() == b"567"
+
+    def test_retention_after_restart_keeps_newest(self, tmp_path):
+        directory = tmp_path / "host_0_localhost"
+        directory.mkdir()
+        # A previous run left an unsealed old segment next to a compressed newer one
+        (directory / "segment_000000.log").write_bytes(b"old")
+        with gzip.open(directory / "segment_000001.log.gz", "wb") as f:
+            f.write(b"middle")
+        (directory / "segment_000002.log").write_bytes(b"new")
+
+        store = self._store(tmp_path, max_segments=1)
+        store.close()
+
+        assert [os.path.basename(path) for path in store.segments()] == [
+            "segment_000001.log.gz",
+            "segment_000002.log",
+        ]
+
+
+class TestMonitorLogPipeline:
+    """The monitor appends new log bytes to the store and diagnoses them in one pass"""
+
+    @pytest.fixture
+    def monitor(self, tmp_path):
+        config = OmegaConf.create(
+            {
+                "train": {"system": {"logging": {"log_dir": str(tmp_path)}}},
+                "experiment": {"runner": {"no_shared_fs": False}},
+            }
+        )
+        runner = MagicMock()
+        runner.resources = None
+        close_log_tailers()
+        monitor = MonitorService(config, runner, interval=1)
+        yield monitor
+        close_log_tailers()
+
+    def test_process_host(self, tmp_path, monitor):
+        src = tmp_path / "host_0_localhost.output"
+        src.write_text(
+            " iteration        1/     100 | elapsed time per iteration (ms): 1500.0 |"
+            " lm loss: 2.5 |\n"
+        )
+        monitor._process_host("localhost", 0)
+        with open(src, "a") as f:
+            f.write("CUDA out of memory\n")
+        monitor._process_host("localhost", 0)
+
+        store = monitor.log_stores["localhost_0"]
+        with open(store.latest_segment, "rb") as f:
+            assert f.read().endswith(b"|\nCUDA out of memory\n")
+        with open(os.path.join(monitor.monitor_log_dir, "host_0_localhost_diagnostic.txt")) as f:
+            assert "OutOfMemoryError" in f.read()
+        assert not [name for name in os.listdir(monitor.monitor_log_dir) if "_temp_" in name]
+        # The last row is written once the monitor stops
+        monitor._flush_metrics()
+        metrics = load_metrics(monitor._metrics_file("localhost", 0))
+        assert metrics["elapsed_ms"].tolist() == [1500.0]
+        assert monitor.progress.summary()[0]["step_seconds"] == 1.5
@@ -0,0 +1,87 @@
+from flagscale.elastic.progress import ProgressTracker
+
+
+class TestProgressTracker:
+    """Test cases for hang and straggler detection"""
+
+    def _tracker(self, **kwargs):
+        return ProgressTracker(min_hang_timeout=60, **kwargs)
+
+    def test_straggler_detected_by_mad(self):
+        tracker = self._tracker()
+        for rank, elapsed_ms in enumerate([1000, 1010, 990, 1005, 1500]):
+            tracker.record_progress(f"node{rank}", 10, elapsed_ms, now=0)
+
+        assert [source for source, _, _ in tracker.find_stragglers(now=0)] == ["node4"]
+        alerts = tracker.check(now=1)
+        assert [(alert.kind, alert.source) for alert in alerts] == [("straggler", "node4")]
+
+    def test_uniform_ranks_are_not_stragglers(self):
+        tracker = self._tracker()
+        for rank in range(8):
+            tracker.record_progress(f"node{rank}", 10, 1000 + rank, now=0)
+
+        assert tracker.find_stragglers(now=0) == []
+
+    def test_too_few_sources(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 10, 1000, now=0)
+        tracker.record_progress("node1", 10, 5000, now=0)
+
+        assert tracker.find_stragglers(now=0) == []
+
+    def test_silent_sources_are_left_out(self):
+        tracker = self._tracker()
+        for rank, elapsed_ms in enumerate([1000, 1010, 990, 1500]):
+            tracker.record_progress(f"node{rank}", 10, elapsed_ms, now=0)
+        for rank in range(3):
+            tracker.record_heartbeat(f"node{rank}", now=100)
+
+        # node3 went silent, its step time is stale and too few live sources remain
+        assert tracker.find_stragglers(now=100) == []
+
+    def test_step_time_from_wall_time(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 10, now=100)
+        tracker.record_progress("node0", 20, now=150)
+
+        assert tracker.median_step_seconds() == 5.0
+
+    def test_hang_timeout_follows_job_speed(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 10, 30000, now=0)
+
+        assert tracker.hang_timeout() == 300
+        assert tracker.check(now=200) == []
+        alerts = tracker.check(now=301)
+        assert [(alert.kind, alert.source) for alert in alerts] == [("hang", "node0")]
+        # Alerts are only raised once while they hold
+        assert tracker.check(now=400) == []
+        assert len(tracker.active_alerts) == 1
+
+    def test_heartbeat_does_not_hide_hang(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 10, 1000, now=0)
+        tracker.record_heartbeat("node0", now=100)
+
+        alerts = tracker.check(now=100)
+        assert [alert.kind for alert in alerts] == ["hang"]
+        assert "last heartbeat 0s ago" in alerts[0].message
+
+    def test_progress_resolves_hang(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 10, 1000, now=0)
+        tracker.check(now=100)
+        tracker.record_progress("node0", 11, 1000, now=101)
+
+        assert tracker.check(now=102) == []
+        assert tracker.active_alerts == {}
+
+    def test_restart_resets_rate(self):
+        tracker = self._tracker()
+        tracker.record_progress("node0", 100, now=0)
+        tracker.record_progress("node0", 110, now=10)
+        tracker.record_progress("node0", 50, now=20)
+
+        assert tracker.summary()[0]["iteration"] == 50
+        assert tracker.summary()[0]["step_seconds"] is None
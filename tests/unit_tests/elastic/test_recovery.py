@@ -0,0 +1,193 @@
+import json
+import time
+
+from collections import OrderedDict
+from unittest.mock import MagicMock
+
+import pytest
+
+from flagscale.elastic.diagnostic import DiagnosticMatcher
+from flagscale.elastic.log_collector import close_log_tailers
+from flagscale.elastic.monitor_service import MonitorService
+from flagscale.elastic.recovery import (
+    ABORT,
+    EXCLUDE_HOST,
+    REPLACE_HOST,
+    RESTART,
+    RecoveryDecision,
+    RecoveryManager,
+    RecoveryPolicy,
+)
+from flagscale.elastic.simulatedFault import LocalFaultHarness
+
+
+class TestRecoveryPolicy:
+    """Test cases for mapping diagnoses to recovery actions"""
+
+    @pytest.mark.parametrize(
+        "signature, action",
+        [
+            ("out of memory", RESTART),
+            ("rendezvousconne", RESTART),
+            ("segmentation fault", REPLACE_HOST),
+            ("traceback", ABORT),
+        ],
+    )
+    def test_decide(self, signature, action):
+        decision = RecoveryPolicy().decide({("a", 0): {}, ("b", 1): {signature: 2}})
+
+        assert decision.action == action
+        assert decision.host == ("b", 1)
+
+    def test_transient_error_wins_over_traceback(self):
+        decision = RecoveryPolicy().decide({("a", 0): {"traceback": 1, "out of memory": 1}})
+        assert decision.action == RESTART
+
+    def test_healthy_job_signatures_are_no_failure(self):
+        counts = {"completed": 1, "gpu": 20, "timeout": 1, "rendezvous": 2, "error": 1}
+        assert RecoveryPolicy().decide({("a", 0): counts}) is None
+
+    def test_fatal_lines_only(self):
+        matcher = DiagnosticMatcher()
+        # Retried connections and torchrun info logs of a healthy job
+        matcher.feed(
+            "[W socket.cpp:464] [c10d] The server socket has failed to listen on port 29500"
+            " (errno: 98 - address already in use), connection refused, retrying\n"
+            "INFO: workers of the previous attempt were killed, restarting the rendezvous\n"
+        )
+        assert RecoveryPolicy().decide({("a", 0): matcher.counts}) is None
+
+        matcher.feed(
+            "  rank      : 3 (local_rank: 3)\n"
+            "  exitcode  : -9 (pid: 4242)\n"
+            "  traceback : Signal 9 (SIGKILL) received by PID 4242\n"
+        )
+        decision = RecoveryPolicy().decide({("a", 0): matcher.counts})
+        assert (decision.action, decision.signature) == (RESTART, "sigkill")
+
+        matcher = DiagnosticMatcher()
+        matcher.feed("ConnectionRefusedError: [Errno 111] Connection refused\n")
+        decision = RecoveryPolicy().decide({("a", 0): matcher.counts})
+        assert (decision.action, decision.signature) == (RESTART, "connectionrefusederror")
+
+
+class TestRecoveryManager:
+    """Test cases for the restart budget, backoff and host changes"""
+
+    def _manager(self, tmp_path, **kwargs):
+        runner = MagicMock()
+        runner.resources = OrderedDict([("a", {"slots": 8}), ("b", {"slots": 8})])
+        manager = RecoveryManager(
+            runner, backoff=10, record_file=str(tmp_path / "recovery.log"), **kwargs
+        )
+        return manager, runner
+
+    def test_restart_with_backoff_and_budget(self, tmp_path):
+        manager, runner = self._manager(tmp_path, max_restarts=2)
+
+        start = time.time()
+        assert manager.recover(RecoveryDecision(RESTART, "sigkill", ("a", 0)))
+        # The relaunch waits for the backoff without blocking the caller
+        assert time.time() - start < 1
+        assert not manager.poll(now=start + 5)
+        assert manager.summary()["relaunch_pending"]
+        assert not manager.startup_timed_out(now=start + 3600)
+        assert manager.poll(now=start + 11)
+        assert manager.recover(RecoveryDecision(RESTART, "sigkill", ("a", 0)))
+        assert not manager.poll(now=start + 11)
+        assert manager.poll(now=start + 31)
+        assert not manager.recover(RecoveryDecision(RESTART, "sigkill", ("a", 0)))
+        assert not manager.poll(now=start + 3600)
+        assert runner.stop.call_count == 2
+        assert runner.relaunch.call_count == 2
+        with open(tmp_path / "recovery.log") as f:
+            events = [json.loads(line) for line in f]
+        assert [event["backoff"] for event in events if event["event"] == "relaunch"] == [10, 20]
+        assert events[-1]["event"] == "abort"
+
+    def test_abort(self, tmp_path):
+        manager, runner = self._manager(tmp_path)
+
+        assert not manager.recover(RecoveryDecision(ABORT, "traceback", ("a", 0)))
+        runner.stop.assert_not_called()
+
+    def test_replace_host_keeps_rank(self, tmp_path):
+        manager, runner = self._manager(tmp_path, spare_hosts=["c"])
+        manager.recover(RecoveryDecision(REPLACE_HOST, "segmentation fault", ("a", 0)))
+
+        assert list(runner.resources) == ["c", "b"]
+        assert runner.resources["c"] == {"slots": 8}
+
+    def test_replace_host_without_spare_restarts_in_place(self, tmp_path):
+        manager, runner = self._manager(tmp_path)
+
+        assert manager.recover(RecoveryDecision(REPLACE_HOST, "core dumped", ("a", 0)))
+        assert list(runner.resources) == ["a", "b"]
+
+    def test_exclude_host(self, tmp_path):
+        manager, runner = self._manager(tmp_path)
+        manager.recover(RecoveryDecision(EXCLUDE_HOST, "sigkill", ("b", 1)))
+
+        assert list(runner.resources) == ["a"]
+
+    def test_mttr(self, tmp_path):
+        manager, _ = self._manager(tmp_path)
+        manager.recover(RecoveryDecision(RESTART, "sigkill", ("a", 0), time=time.time() - 4))
+        manager.on_running()
+
+        assert not manager.awaiting_start
+        assert 4 <= manager.mttr < 5
+
+
+class TestFaultInjectionLoop:
+    """End-to-end: inject faults into a local simulated job and let the monitor recover it"""
+
+    def _run(self, tmp_path, faults, **kwargs):
+        harness = LocalFaultHarness(str(tmp_path), faults=faults, iterations=12, step_time=0.05)
+        recovery = RecoveryManager(
+            harness, backoff=0, record_file=str(tmp_path / "recovery.log"), **kwargs
+        )
+        close_log_tailers()
+        monitor = MonitorService(
+            harness.config, harness, interval=0.1, min_hang_timeout=1.0, recovery=recovery
+        )
+        harness.run()
+        monitor.start_monitoring()
+        monitor.monitor_thread.join(timeout=60)
+        monitor.stop()
+        harness.stop()
+        with open(harness.log_file) as f:
+            return harness, recovery, f.read()
+
+    def test_recover_from_oom(self, tmp_path):
+        harness, recovery, log = self._run(tmp_path, [("oom", 7)])
+
+        assert harness.attempts == 2
+        assert recovery.restarts == 1
+        assert recovery.mttr is not None
+        # The relaunch resumed after the checkpoint saved at iteration 5
+        assert "at iteration 5" in log
+        assert log.count("iteration        6/") == 2
+        assert "iteration       12/" in log
+
+    def test_recover_from_hang(self, tmp_path):
+        harness, recovery, log = self._run(tmp_path, [("hang", 4)])
+
+        assert harness.attempts == 2
+        assert recovery.restarts == 1
+        assert "iteration       12/" in log
+
+    def test_code_error_is_not_restarted(self, tmp_path):
+        harness, recovery, log = self._run(tmp_path, [("code", 3)])
+
+        assert harness.attempts == 1
+        assert recovery.restarts == 0
+        assert "ValueError: Simulated code error" in log
+
+    def test_restart_budget(self, tmp_path):
+        harness, recovery, _ = self._run(
+            tmp_path, [("kill", 2), ("kill", 2), ("kill", 2)], max_restarts=1
+        )
+
+        assert harness.attempts == 2
+        assert recovery.restarts == 1
@@ -0,0 +1,141 @@
+import json
+import os
+import urllib.request
+
+from unittest.mock import MagicMock
+
+from omegaconf import OmegaConf
+
+from flagscale.elastic.agent import StatusCollector
+from flagscale.elastic.log_collector import close_log_tailers
+from flagscale.elastic.monitor_service import MonitorService
+from flagscale.elastic.telemetry import Histogram, MetricsRegistry, MetricsServer
+
+
+class TestMetricsRegistry:
+    """Test cases for the monitor's counters, gauges and histograms"""
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 1.5, 1.5, 4, 10):
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [(1, 1), (2, 3), (5, 4), (float("inf"), 5)]
+        assert histogram.quantile(0.5) == 2
+        assert histogram.quantile(1.0) == 10
+        assert histogram.to_dict()["sum"] == 17.5
+
+    def test_snapshot(self):
+        registry = MetricsRegistry()
+        registry.inc("flagscale_monitor_log_bytes_total", 100, host="a")
+        registry.inc("flagscale_monitor_log_bytes_total", 50, host="a")
+        registry.observe("flagscale_monitor_phase_seconds", 0.2, phase="status")
+        registry.add_collector(lambda r: r.set("queue_depth", 3))
+
+        snapshot = registry.snapshot()
+        assert snapshot["flagscale_monitor_log_bytes_total"]["series"] == [
+            {"labels": {"host": "a"}, "value": 150}
+        ]
+        phase = snapshot["flagscale_monitor_phase_seconds"]["series"][0]
+        assert phase["labels"] == {"phase": "status"}
+        assert phase["value"]["count"] == 1
+        assert snapshot["queue_depth"]["type"] == "gauge"
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry()
+        registry.inc("flagscale_monitor_ticks_total")
+        registry.observe("flagscale_monitor_tick_seconds", 0.3, buckets=(0.1, 1))
+        registry.set("host_info", 1, host='a"b')
+
+        text = registry.render()
+        assert "# TYPE flagscale_monitor_ticks_total counter\n" in text
+        assert "\nflagscale_monitor_ticks_total 1\n" in text
+        assert 'flagscale_monitor_tick_seconds_bucket{le="0.1"} 0' in text
+        assert 'flagscale_monitor_tick_seconds_bucket{le="1"} 1' in text
+        assert 'flagscale_monitor_tick_seconds_bucket{le="+Inf"} 1' in text
+        assert "flagscale_monitor_tick_seconds_count 1" in text
+        assert 'host_info{host="a\\"b"} 1' in text
+
+    def test_http_endpoint(self):
+        registry = MetricsRegistry()
+        registry.inc("flagscale_monitor_ticks_total", 2)
+        server = MetricsServer(registry).start()
+        try:
+            base = f"http://127.0.0.1:{server.port}"
+            with urllib.request.urlopen(f"{base}/metrics") as response:
+                assert "flagscale_monitor_ticks_total 2" in response.read().decode()
+            with urllib.request.urlopen(f"{base}/metrics.json") as response:
+                snapshot = json.loads(response.read())
+            assert snapshot["flagscale_monitor_ticks_total"]["series"][0]["value"] == 2
+        finally:
+            server.stop()
+
+
+class TestMonitorInstrumentation:
+    """The monitor records phase latencies, bytes per host and tick overruns"""
+
+    def test_process_host_and_tick(self, tmp_path):
+        config = OmegaConf.create(
+            {
+                "train": {"system": {"logging": {"log_dir": str(tmp_path)}}},
+                "experiment": {"runner": {"no_shared_fs": False}},
+            }
+        )
+        runner = MagicMock()
+        runner.resources = None
+        registry = MetricsRegistry()
+        close_log_tailers()
+        monitor = MonitorService(config, runner, interval=1, metrics_registry=registry)
+        (tmp_path / "host_0_localhost.output").write_text("CUDA out of memory\n")
+
+        monitor._process_host("localhost", 0)
+        monitor._record_tick(2.5)
+        close_log_tailers()
+
+        assert registry.get("flagscale_monitor_log_bytes_total", host="localhost") == 19
+        assert registry.get("flagscale_monitor_phase_seconds", phase="collect").count == 1
+        assert registry.get("flagscale_monitor_phase_seconds", phase="diagnose").count == 1
+        assert registry.get("flagscale_monitor_tick_overruns_total") == 1
+        with open(os.path.join(monitor.monitor_log_dir, "metrics.json")) as f:
+            snapshot = json.load(f)
+        assert snapshot["flagscale_monitor_ticks_total"]["series"][0]["value"] == 1
+
+    def test_stragglers_from_agents(self, tmp_path):
+        config = OmegaConf.create(
+            {
+                "train": {"system": {"logging": {"log_dir": str(tmp_path)}}},
+                "experiment": {"runner": {"no_shared_fs": False}},
+            }
+        )
+        runner = MagicMock()
+        runner.resources = {f"node{rank}": {} for rank in range(4)}
+        registry = MetricsRegistry()
+        collector = StatusCollector(port=0, host="127.0.0.1")
+        monitor = MonitorService(
+            config, runner, interval=1, collector=collector, metrics_registry=registry
+        )
+        for rank, elapsed_ms in enumerate([1000, 1010, 990, 2000]):
+            collector.apply(
+                {
+                    "host": f"node{rank}",
+                    "node_rank": rank,
+                    "seq": 1,
+                    "full": True,
+                    "status": "R",
+                    "iteration": 10,
+                    "elapsed_ms": elapsed_ms,
+                }
+            )
+
+        monitor._check_progress()
+        monitor._collect_progress_metrics(registry)
+        collector.stop()
+
+        summary = monitor.get_status_summary()
+        assert [straggler["source"] for straggler in summary["stragglers"]] == ["node3_3"]
+        assert all(source["last_heartbeat"] is not None for source in summary["progress"])
+        assert registry.get("flagscale_node_straggler", node="node3_3") == 1
+        assert registry.get("flagscale_node_straggler", node="node0_0") == 0
+        assert registry.get("flagscale_node_step_seconds", node="node3_3") == 2.0
+        with open(os.path.join(monitor.monitor_log_dir, "alerts.log")) as f:
+            assert "STRAGGLER: node3_3 is a straggler" in f.read()
@@ -0,0 +1,104 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.early_stop import EarlyStopper, IterationStream, t_quantile
+from flagscale.runner.auto_tuner.scheduler import Trial
+from flagscale.runner.auto_tuner.tuner import AutoTuner
+
+
+def _stopper(early_stop=True, order="ascend"):
+    control = {"early_stop": early_stop}
+    config = OmegaConf.create({"experiment": {"auto_tuner": {"control": control}}})
+    return EarlyStopper(config, order)
+
+
+def _iteration(iteration, elapsed):
+    return (
+        f" [2025-01-01 00:00:00] iteration {iteration:8d}/      20 | consumed samples: "
+        f"{iteration * 32} | elapsed time per iteration (ms): {elapsed:.1f} | lm loss: 1.0E+01 |\n"
+    )
+
+
+class TestEarlyStopper:
+    """A trial is stopped once its iteration times cannot beat the best or have converged"""
+
+    @pytest.mark.parametrize("dof, expected", [(2, 4.303), (5, 2.571), (30, 2.042)])
+    def test_t_quantile(self, dof, expected):
+        assert t_quantile(0.975, dof) == pytest.approx(expected, rel=0.04)
+
+    def test_disabled_by_default(self):
+        config = OmegaConf.create({"experiment": {"auto_tuner": {"control": {}}}})
+        assert not EarlyStopper(config).enabled
+
+    def test_worse_than_best(self):
+        stopper = _stopper()
+        slow = np.array([900.0, 205.0, 195.0, 210.0])
+
+        assert stopper.check(slow[:3], best=100.0) is None
+        assert stopper.check(slow, best=100.0).startswith("worse than best 100.0")
+        assert stopper.check(slow, best=250.0) is None
+        assert _stopper(order="descend").check(slow, best=250.0).startswith("worse")
+
+    def test_converged(self):
+        stopper = _stopper({"warmup": 2, "tolerance": 0.02})
+        values = np.array([900.0, 300.0, 200.0, 204.0, 196.0, 200.5, 199.5, 200.0])
+
+        assert stopper.check(values[:5]) is None
+        assert stopper.check(values).startswith("converged: 200.000")
+        assert stopper.check(values, best=150.0).startswith("worse than best")
+
+
+class TestIterationStream:
+    """The stream parses the iterations appended to a log since the last read"""
+
+    def test_read_incrementally(self, tmp_path):
+        path = tmp_path / "stdout.log"
+        path.write_text("building model\n" + _iteration(1, 900))
+        stream = IterationStream(str(path))
+        assert stream.read().tolist() == [900.0]
+
+        line = _iteration(2, 200)
+        with open(path, "a") as f:
+            f.write(line[:40])
+        assert stream.read().tolist() == [900.0]
+        with open(path, "a") as f:
+            f.write(line[40:] + _iteration(3, 210))
+        assert stream.read().tolist() == [900.0, 200.0, 210.0]
+
+
+class TestTunerEarlyStop:
+    """The tuner stops a running trial early and records the reason"""
+
+    def _tuner(self, path, best):
+        tuner = MagicMock()
+        tuner.early_stopper = _stopper()
+        tuner.recorder.metric_column = "elapsed_ms"
+        tuner.recorder.get_performance_and_host_path.return_value = (str(path), None)
+        tuner.get_best.return_value = {"performance": best} if best else None
+        return tuner
+
+    def test_stop_slower_trial(self, tmp_path):
+        path = tmp_path / "stdout.log"
+        path.write_text(_iteration(1, 900) + _iteration(2, 200))
+        tuner = self._tuner(path, best=100.0)
+        trial = Trial({"idx": 2}, None, runner=MagicMock())
+
+        assert not AutoTuner.early_stop(tuner, trial)
+        with open(path, "a") as f:
+            f.write(_iteration(3, 210) + _iteration(4, 205))
+        assert AutoTuner.early_stop(tuner, trial)
+        trial.runner.stop.assert_called_once()
+        assert trial.strategy["stopped_by_tuner"]
+        assert trial.strategy["early_stop"].startswith("worse than best 100.0")
+
+    def test_log_not_created_yet(self, tmp_path):
+        tuner = self._tuner(tmp_path / "stdout.log", best=None)
+        tuner.recorder.get_performance_and_host_path.side_effect = ValueError("no folder")
+        trial = Trial({"idx": 1}, None, runner=MagicMock())
+
+        assert not AutoTuner.early_stop(tuner, trial)
+        assert trial.stream is None
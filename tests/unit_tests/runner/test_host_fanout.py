@@ -0,0 +1,62 @@
+import threading
+import time
+
+from flagscale.runner.utils import HostFanout
+
+
+def test_host_fanout_keeps_input_order():
+    with HostFanout(max_workers=4) as fanout:
+        results = fanout.map(lambda host, rank: f"{host}:{rank}", [("a", 0), ("b", 1), ("c", 2)])
+    assert [r.host for r in results] == ["a", "b", "c"]
+    assert [r.value for r in results] == ["a:0", "b:1", "c:2"]
+    assert all(r.ok for r in results)
+
+
+def test_host_fanout_runs_concurrently():
+    barrier = threading.Barrier(4, timeout=5)
+
+    def query(host, rank):
+        # Deadlocks unless all four calls are in flight at the same time
+        barrier.wait()
+        return rank
+
+    with HostFanout(max_workers=4) as fanout:
+        results = fanout.map(query, [(f"host{i}", i) for i in range(4)])
+    assert [r.value for r in results] == [0, 1, 2, 3]
+
+
+def test_host_fanout_bounds_concurrency():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def query(host, rank):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    with HostFanout(max_workers=2) as fanout:
+        fanout.map(query, [(f"host{i}", i) for i in range(8)])
+    assert peak[0] <= 2
+
+
+def test_host_fanout_partial_results():
+    def query(host, rank):
+        if host == "bad":
+            raise RuntimeError("ssh failed")
+        if host == "slow":
+            time.sleep(2)
+        return rank
+
+    start = time.monotonic()
+    with HostFanout(max_workers=4, timeout=0.2) as fanout:
+        results = fanout.map(query, [("good", 0), ("bad", 1), ("slow", 2)])
+    assert time.monotonic() - start < 1.5
+
+    good, bad, slow = results
+    assert good.ok and good.value == 0
+    assert not bad.ok and "ssh failed" in bad.error
+    assert not slow.ok and "Timed out" in slow.error
@@ -0,0 +1,126 @@
+import copy
+import itertools
+import random
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.prune.pruner import Pruner
+from flagscale.runner.auto_tuner.utils import StrategyHistory, beside, trials
+
+
+def _config():
+    return OmegaConf.create(
+        {
+            "train": {"model": {"num_layers": 8, "global_batch_size": 32}},
+            "experiment": {"auto_tuner": {"nproc_per_node": 8, "cards": 8}},
+        }
+    )
+
+
+def _strategies():
+    strategies = []
+    for tp, pp, mbs, recompute_num_layers, sp, dist_opt in itertools.product(
+        [1, 2, 4], [1, 2], [1, 2, 4], [None, 1, 2, 4], [False, True], [False, True]
+    ):
+        use_recompute = recompute_num_layers is not None
+        strategies.append(
+            {
+                "data_parallel_size": 8 // tp // pp,
+                "use_distributed_optimizer": dist_opt,
+                "tensor_model_parallel_size": tp,
+                "sequence_parallel": sp,
+                "pipeline_model_parallel_size": pp,
+                "num_layers_per_virtual_pipeline_stage": None,
+                "use_recompute": use_recompute,
+                "recompute_method": "block" if use_recompute else None,
+                "recompute_granularity": "full" if use_recompute else None,
+                "recompute_num_layers": recompute_num_layers,
+                "micro_batch_size": mbs,
+                "acc_step": 32 // (8 // tp // pp) // mbs,
+                "context_parallel_size": 1,
+                "expert_model_parallel_size": 1,
+            }
+        )
+    return strategies
+
+
+def _run(strategy):
+    memory = strategy["micro_batch_size"] / strategy["tensor_model_parallel_size"]
+    memory *= 0.5 if strategy["use_recompute"] else 1.0
+    memory += 0.2 if strategy["use_distributed_optimizer"] else 0.6
+    if memory > 1.0:
+        return "OOM", None
+    return int(memory * 1000), random.Random(str(strategy)).randint(100, 200)
+
+
+def _tune(history):
+    pruner = Pruner(_config())
+    for strategy in _strategies():
+        if not pruner.prune(strategy, history):
+            strategy["max_mem"], strategy["performance"] = _run(strategy)
+    return [(s.get("pruned", False), s["max_mem"], s["performance"]) for s in history]
+
+
+class TestStrategyHistory:
+    """The indexed history retrieves the same strategies as a scan of the history"""
+
+    def test_beside_matches_scan(self):
+        history = StrategyHistory()
+        scanned = []
+        keys = [["micro_batch_size", "acc_step"], ["use_recompute", "recompute_num_layers"], []]
+        for strategy in random.Random(0).sample(_strategies(), 100):
+            for dims in keys:
+                assert history.beside(dims, strategy) == beside(dims, strategy, scanned)
+            strategy["max_mem"], strategy["performance"] = _run(strategy)
+            history.append(strategy)
+            scanned.append(strategy)
+
+    def test_results_recorded_after_append(self):
+        history = StrategyHistory()
+        first = _strategies()[0]
+        second = dict(first, micro_batch_size=2)
+        history.append(first)
+        # A strategy still running has no results to prune by
+        assert beside(["micro_batch_size"], second, history) == []
+
+        first["max_mem"], first["performance"] = "OOM", None
+        assert beside(["micro_batch_size"], second, history) == [first]
+
+    def test_pruning_matches_scan(self):
+        indexed = _tune(StrategyHistory())
+
+        assert indexed == _tune([])
+        assert 0 < sum(pruned for pruned, _, _ in indexed) < len(indexed)
+
+    def test_copy(self):
+        history = StrategyHistory(dict(s, performance=100.0) for s in _strategies()[:3])
+        history.beside(["micro_batch_size"], history[0])
+        copied = copy.deepcopy(history)
+        copied.append(dict(history[0], micro_batch_size=4))
+
+        assert len(history.beside(["micro_batch_size"], history[0])) == 1
+        assert len(copied.beside(["micro_batch_size"], history[0])) == 2
+
+    def test_in_place_mutations(self):
+        strategies = [dict(s, performance=100.0) for s in _strategies()[:40]]
+        history = StrategyHistory(strategies[:20])
+        scanned = list(strategies[:20])
+        mutations = [
+            lambda h: h.insert(0, strategies[20]),
+            lambda h: h.__setitem__(1, strategies[21]),
+            lambda h: h.__setitem__(slice(2, 4), strategies[22:25]),
+            lambda h: h.__delitem__(5),
+            lambda h: h.pop(),
+            lambda h: h.remove(strategies[10]),
+            lambda h: h.sort(key=lambda task: task["micro_batch_size"]),
+            lambda h: h.reverse(),
+            lambda h: h.clear(),
+            lambda h: h.extend(strategies[25:]),
+        ]
+        keys = ["micro_batch_size", "acc_step"]
+        for mutate in mutations:
+            mutate(history)
+            mutate(scanned)
+            for strategy in strategies:
+                assert history.beside(keys, strategy) == beside(keys, strategy, scanned)
+            assert history.trials() == trials(scanned)
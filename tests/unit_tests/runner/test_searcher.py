@@ -0,0 +1,123 @@
+from unittest.mock import patch
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.search.algorithm import GridAlgo
+from flagscale.runner.auto_tuner.search.searcher import Searcher, StrategySpace
+from flagscale.runner.auto_tuner.utils import (
+    sort_by_memory_model,
+    sort_by_performance,
+    strategy_key,
+)
+
+
+def _config(space=None, **auto_tuner):
+    return OmegaConf.create(
+        {
+            "train": {
+                "model": {
+                    "num_layers": 24,
+                    "global_batch_size": 64,
+                    "hidden_size": 2048,
+                    "num_attention_heads": 16,
+                    "seq_length": 4096,
+                }
+            },
+            "experiment": {
+                "auto_tuner": {
+                    "cards": 16,
+                    "nproc_per_node": 8,
+                    "platform": {},
+                    "space": space or {"micro_batch_size": [1, 2, 4]},
+                    **auto_tuner,
+                }
+            },
+        }
+    )
+
+
+class TestLazyStrategySpace:
+    """The searcher enumerates the space on demand and scores only the pulled strategies"""
+
+    def test_build_is_lazy(self):
+        searcher = Searcher(_config())
+
+        assert isinstance(searcher.strategies, StrategySpace)
+        assert searcher.strategies.size is None
+        num_strategies = len(searcher.strategies)
+        assert num_strategies > 100
+        strategies = list(searcher.strategies)
+        assert len({tuple(sorted(strategy.items())) for strategy in strategies}) == num_strategies
+
+    def test_parallel_degrees_use_all_cards(self):
+        for strategy in Searcher(_config()).strategies:
+            assert (
+                strategy["data_parallel_size"]
+                * strategy["tensor_model_parallel_size"]
+                * strategy["pipeline_model_parallel_size"]
+                * strategy["context_parallel_size"]
+                == 16
+            )
+
+    def test_grid_pulls_strategies_one_at_a_time(self):
+        searcher = Searcher(_config())
+        expected = list(searcher.strategies)
+        pulled = []
+        searcher.strategies.annotate = pulled.append
+        searcher.algo = GridAlgo(searcher.strategies, searcher.config)
+
+        assert searcher.search() == expected[0]
+        assert searcher.search() == expected[1]
+        assert len(pulled) == 2
+
+    def test_memory_model_scores_considered_strategies_only(self):
+        config = _config(memory_model={"gpu_memory": 80000}, algo={"name": "grid", "window": 8})
+        with patch(
+            "flagscale.runner.auto_tuner.search.searcher.default_model", return_value=1000.0
+        ) as memory_model:
+            searcher = Searcher(config)
+            assert memory_model.call_count == 0
+
+            strategy = searcher.search()
+            assert memory_model.call_count == 8
+            assert strategy["memory_model"] == 1000.0
+            assert strategy["gpu_utilization"] == [0.2, 0.8]
+
+    def test_checkout_sorts_remaining_windows(self):
+        searcher = Searcher(_config(algo={"name": "grid", "window": 100}))
+        algo = searcher.algo
+        first = algo.search()
+        algo.checkout("performance")
+        remaining = []
+        while not algo.has_done():
+            remaining.append(algo.search())
+
+        assert first not in remaining
+        assert len(remaining) == len(searcher.strategies) - 1
+        for start in range(0, len(remaining), 100):
+            window = remaining[start : start + 100]
+            assert window == sorted(window, key=sort_by_performance)
+
+    def test_default_window_sorts_whole_space(self):
+        config = _config(memory_model={"gpu_memory": 80000}, algo={"name": "grid"})
+        with patch(
+            "flagscale.runner.auto_tuner.search.searcher.default_model",
+            side_effect=lambda strategy, config: float(hash(strategy_key(strategy)) % 1000),
+        ):
+            searcher = Searcher(config)
+            order = []
+            while not searcher.algo.has_done():
+                order.append(searcher.algo.search())
+
+        assert len(order) == len(searcher.strategies) > 1024
+        assert order == sorted(order, key=sort_by_memory_model, reverse=True)
+
+    @pytest.mark.parametrize("name", ["bayes", "evolution"])
+    def test_model_based_algo_on_lazy_space(self, name):
+        searcher = Searcher(_config(algo={"name": name}))
+
+        # Spaces larger than max_candidates are sampled
+        assert len(searcher.algo.strategies) == min(len(searcher.strategies), 4096)
+        assert searcher.search() in list(searcher.strategies)
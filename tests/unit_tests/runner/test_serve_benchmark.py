@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from aiohttp import web
+
+from flagscale.runner.utils import benchmark, benchmark_sweep, get_request
+
+
+def _intervals(num_requests, request_rate, burstiness=1.0):
+    """Return the intervals get_request sleeps between the requests."""
+    intervals = []
+
+    async def sleep(delay):
+        intervals.append(delay)
+
+    async def collect():
+        return [r async for r in get_request(range(num_requests), request_rate, burstiness)]
+
+    with patch("flagscale.runner.utils.asyncio.sleep", sleep):
+        assert asyncio.run(collect()) == list(range(num_requests))
+    return np.array(intervals)
+
+
+class _FakeService:
+    """An OpenAI chat completions endpoint streaming a few tokens"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peers = set()
+        self.bodies = []
+
+    async def chat(self, request):
+        self.bodies.append(await request.json())
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.005)
+            chunk = {"choices": [{"delta": {"content": token}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        usage = {"choices": [], "usage": {"completion_tokens": 3}}
+        await response.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode())
+        self.in_flight -= 1
+        return response
+
+
+async def _serve_and_run(service, run):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", service.chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await run(f"http://127.0.0.1:{port}/v1/chat/completions")
+    finally:
+        await runner.cleanup()
+
+
+def _kwargs(api_url, num_prompts=40):
+    return dict(
+        api_url=api_url,
+        model="model",
+        tokenizer=None,
+        input_requests=[(f"prompt {i}", 8, 3, None) for i in range(num_prompts)],
+        selected_percentile_metrics=["ttft", "tpot", "itl", "e2el"],
+        selected_percentiles=[99.0],
+    )
+
+
+class TestLoadGenerator:
+    """The serve benchmark sends open-loop traffic at a request rate"""
+
+    def test_arrival_rate(self):
+        np.random.seed(0)
+        poisson = _intervals(10000, request_rate=10)
+        assert poisson.mean() == pytest.approx(0.1, rel=0.05)
+        assert poisson.std() == pytest.approx(0.1, rel=0.05)
+        # Bursty traffic keeps the mean rate with much more variable intervals
+        bursty = _intervals(10000, request_rate=10, burstiness=0.25)
+        assert bursty.mean() == pytest.approx(0.1, rel=0.05)
+        assert bursty.std() == pytest.approx(0.2, rel=0.05)
+        assert len(_intervals(100, float("inf"))) == 0
+        with pytest.raises(AssertionError):
+            _intervals(10, 10, burstiness=0)
+        with pytest.raises(AssertionError):
+            _intervals(10, 0)
+
+    def test_concurrency_and_shared_session(self):
+        service = _FakeService()
+
+        async def run(api_url):
+            return await benchmark(
+                **_kwargs(api_url), max_concurrency=4, extra_body={"temperature": 0.7}
+            )
+
+        result = asyncio.run(_serve_and_run(service, run))
+
+        assert result["completed"] == 40 and result["measured"] == 40
+        assert service.max_in_flight <= 4
+        # The requests reuse the connections of one pool
+        assert len(service.peers) <= 4
+        assert all(body["temperature"] == 0.7 for body in service.bodies)
+
+    def test_warmup_and_cooldown(self):
+        service = _FakeService()
+
+        async def run(api_url):
+            return await benchmark(
+                **_kwargs(api_url), request_rate=200, warmup_s=0.05, cooldown_s=0.05
+            )
+
+        np.random.seed(0)
+        result = asyncio.run(_serve_and_run(service, run))
+        assert len(service.bodies) == 40
+        assert 0 < result["measured"] < 40
+        assert result["completed"] == result["measured"]
+
+        async def run_all_at_once(api_url):
+            return await benchmark(**_kwargs(api_url), warmup_s=1)
+
+        with pytest.raises(ValueError):
+            asyncio.run(_serve_and_run(_FakeService(), run_all_at_once))
+
+    def test_sweep(self):
+        async def run(api_url):
+            return await benchmark_sweep([100, 400], **_kwargs(api_url, num_prompts=20))
+
+        results = asyncio.run(_serve_and_run(_FakeService(), run))
+        assert [result["request_rate"] for result in results] == [100, 400]
+        assert all(result["completed"] == 20 for result in results)
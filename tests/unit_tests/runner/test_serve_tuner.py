@@ -0,0 +1,186 @@
+import json
+
+from unittest.mock import patch
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.record.recorder import ServeRecorder
+from flagscale.runner.auto_tuner.tuner import ServeAutoTunner
+from flagscale.runner.runner_base import JobStatus
+
+
+def _config(tmp_path, performance=None):
+    config = OmegaConf.create(
+        {
+            "serve": [
+                {
+                    "serve_id": "vllm_model",
+                    "engine": "vllm",
+                    "engine_args": {"model": "/models/Qwen2.5-7B-Instruct"},
+                    "engine_args_specific": {"vllm": {}},
+                }
+            ],
+            "experiment": {
+                "exp_dir": str(tmp_path / "outputs"),
+                "task": {"type": "serve"},
+                "runner": {"nnodes": 1, "nproc_per_node": 2},
+                "auto_tuner": {
+                    "engines": ["vllm"],
+                    "space": {
+                        "vllm": {
+                            "tensor_model_parallel_size": [1, 2],
+                            "pipeline_model_parallel_size": [1],
+                            "instance": "auto",
+                            "max_num_seqs": [128],
+                            "max_concurrency": [8, 16],
+                            "temperature": [0.0, 1.0],
+                        }
+                    },
+                    "control": {"interval": 0, "run_best": False},
+                },
+            },
+        }
+    )
+    if performance is not None:
+        config.experiment.auto_tuner.performance = performance
+    return config
+
+
+class _FakeServeRunner:
+    launched = []
+    stopped = 0
+    inputs_loaded = 0
+
+    def __init__(self, config):
+        self.config = config
+        self.alive = True
+
+    def run(self):
+        _FakeServeRunner.launched.append(self)
+
+    def stop(self):
+        _FakeServeRunner.stopped += 1
+        self.alive = False
+
+    def _query_status(self):
+        return JobStatus.RUNNING
+
+    def _serve_alive(self):
+        return self.alive
+
+    def _profile_inputs(self):
+        _FakeServeRunner.inputs_loaded += 1
+        return "model", "tokenizer", ["prompt"]
+
+    def _profile_serve(self, inputs=None, max_concurrency=None, sampling_params=None):
+        assert inputs == ("model", "tokenizer", ["prompt"])
+        tp = self.config.serve[0].engine_args_specific.vllm.tensor_parallel_size
+        latency = 100.0 / tp + max_concurrency + sampling_params["temperature"]
+        return {
+            "mean_e2el_ms": latency,
+            "request_throughput": 1.0,
+            "total_token_throughput": 10.0 * tp * max_concurrency,
+            "mean_ttft_ms": latency,
+            "mean_itl_ms": latency,
+            "mean_tpot_ms": latency,
+            "p99_ttft_ms": 2 * latency,
+        }
+
+
+def _tune(config):
+    _FakeServeRunner.launched = []
+    _FakeServeRunner.stopped = 0
+    _FakeServeRunner.inputs_loaded = 0
+    with patch("flagscale.runner.auto_tuner.tuner.SSHServeRunner", _FakeServeRunner), patch(
+        "flagscale.runner.auto_tuner.tuner.time.sleep"
+    ):
+        tuner = ServeAutoTunner(config)
+        tuner.tune()
+    return tuner
+
+
+class TestServeAutoTuner:
+    """Strategies differing only in runtime dims are profiled on one warm engine"""
+
+    def test_sweep_on_warm_engine(self, tmp_path):
+        tuner = _tune(_config(tmp_path))
+
+        assert tuner.idx == 8
+        # One launch per tensor parallel size, all stopped when the tuning ends
+        assert len(_FakeServeRunner.launched) == 2
+        assert _FakeServeRunner.stopped == 2
+        assert [strategy["warm"] for strategy in tuner.history].count(False) == 2
+        # The tokenizer and the prompts are loaded once for all the strategies
+        assert _FakeServeRunner.inputs_loaded == 1
+        best = tuner.get_best()
+        assert best["tensor_model_parallel_size"] == 2
+        assert best["max_concurrency"] == 8 and best["temperature"] == 0.0
+
+    def test_restart_a_dead_engine(self, tmp_path):
+        def _profile_serve(self, inputs=None, max_concurrency=None, sampling_params=None):
+            if max_concurrency == 16:
+                # The engine crashes under the higher load
+                self.alive = False
+                raise RuntimeError("connection refused")
+            return profile_serve(self, inputs, max_concurrency, sampling_params)
+
+        profile_serve = _FakeServeRunner._profile_serve
+        with patch.object(_FakeServeRunner, "_profile_serve", _profile_serve):
+            tuner = _tune(_config(tmp_path))
+
+        failed = [strategy for strategy in tuner.history if strategy["itl"] is None]
+        assert len(failed) == 4
+        # Every strategy after a crash launches the engine again
+        assert len(_FakeServeRunner.launched) == 2 + 2
+        assert tuner.get_best()["max_concurrency"] == 8
+
+
+def _trial(idx, token_throughput, p99_ttft):
+    return {"idx": idx, "token_throughput": token_throughput, "p99_ttft": p99_ttft}
+
+
+class TestServePareto:
+    """Serve strategies are compared on several metrics and chosen under SLO tiers"""
+
+    _PERFORMANCE = {
+        "metric": "token_throughput",
+        "order": "descend",
+        "slo": {"interactive": {"p99_ttft": 120}, "batch": {"p99_ttft": 500}},
+    }
+
+    def test_pareto_front_and_operating_points(self, tmp_path):
+        recorder = ServeRecorder(_config(tmp_path, self._PERFORMANCE))
+        history = [
+            _trial(1, 100, 50),
+            _trial(2, 200, 100),
+            _trial(3, 150, 150),
+            _trial(4, 300, 400),
+            _trial(5, None, None),
+        ]
+
+        assert recorder.objectives == ["token_throughput", "p99_ttft"]
+        assert [s["idx"] for s in recorder.pareto_front(history)] == [1, 2, 4]
+        points = recorder.operating_points(history)
+        assert points["interactive"]["idx"] == 2 and points["batch"]["idx"] == 4
+        assert recorder.operating_points(history[:1] + history[4:])["batch"]["idx"] == 1
+        assert recorder.operating_points(history[2:3])["interactive"] is None
+
+    def test_unknown_metric(self, tmp_path):
+        with pytest.raises(ValueError):
+            ServeRecorder(_config(tmp_path, {"slo": {"interactive": {"p95_ttft": 100}}}))
+
+    def test_best_meets_first_tier(self, tmp_path):
+        # Higher concurrency raises both the throughput and the p99 TTFT
+        performance = dict(self._PERFORMANCE, slo={"strict": {"p99_ttft": 120}})
+        performance["slo"]["relaxed"] = {"p99_ttft": 1000}
+        tuner = _tune(_config(tmp_path, performance))
+
+        best = tuner.get_best()
+        assert best["token_throughput"] == 160 and best["p99_ttft"] == 116
+        report = json.load(open(tuner.recorder.report_path))
+        assert report["objectives"] == ["token_throughput", "p99_ttft"]
+        assert report["operating_points"]["strict"]["idx"] == best["idx"]
+        assert report["operating_points"]["relaxed"]["token_throughput"] == 320
+        assert best["idx"] in [strategy["idx"] for strategy in report["front"]]
@@ -0,0 +1,88 @@
+import subprocess
+import threading
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner import utils
+from flagscale.runner.runner_train import SSHTrainRunner
+from flagscale.runner.utils import SSHConnectionPool, get_ssh_pool
+
+
+@pytest.fixture
+def local_pool(tmp_path, mocker):
+    """A pool whose 'ssh' runs the remote command in a local shell"""
+    pool = SSHConnectionPool(control_dir=str(tmp_path))
+    mocker.patch.object(pool, "_ssh_argv", return_value=["bash", "-c"])
+    return pool
+
+
+def test_ssh_options_use_control_master(tmp_path):
+    pool = SSHConnectionPool(control_dir=str(tmp_path), persist=30)
+    options = pool.ssh_options()
+    assert "ControlMaster=auto" in options
+    assert f"ControlPath={tmp_path}/%C" in options
+    assert "ControlPersist=30s" in options
+
+
+def test_ssh_options_disabled(tmp_path):
+    pool = SSHConnectionPool(control_dir=str(tmp_path), enabled=False)
+    assert pool.ssh_options() == []
+    assert pool.ssh_options_str() == ""
+
+
+def test_run_batch_splits_outputs(local_pool):
+    outputs = local_pool.run_batch("worker0", ["echo one", "false", "printf 'a\\nb'"])
+    assert outputs == [(0, "one\n"), (1, ""), (0, "a\nb")]
+
+
+def test_run_batch_passes_input(local_pool):
+    outputs = local_pool.run_batch("worker0", ["cat", "echo done"], input="payload")
+    assert outputs == [(0, "payload"), (0, "done\n")]
+
+
+def test_metrics(local_pool):
+    local_pool.run("worker0", "true")
+    local_pool.run_batch("worker0", ["true", "false"])
+
+    metrics = local_pool.metrics()["worker0"]
+    assert metrics["round_trips"] == 2
+    assert metrics["commands"] == 3
+    assert metrics["failures"] == 1
+    assert metrics["max_latency_ms"] >= metrics["mean_latency_ms"] > 0
+
+
+def test_get_ssh_pool_is_created_once(mocker):
+    mocker.patch.object(utils, "_ssh_pool", None)
+    barrier = threading.Barrier(8, timeout=5)
+    pools = []
+
+    def get():
+        barrier.wait()
+        pools.append(get_ssh_pool())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pools) == 8
+    assert all(pool is pools[0] for pool in pools)
+
+
+def test_failed_query_script_raises(local_pool, mocker, tmp_path):
+    runner = SSHTrainRunner.__new__(SSHTrainRunner)
+    runner.config = OmegaConf.create(
+        {"experiment": {"runner": {}}, "train": {"system": {"logging": {"scripts_dir": "."}}}}
+    )
+    mocker.patch("flagscale.runner.runner_train.get_ssh_pool", return_value=local_pool)
+    script = tmp_path / "query.sh"
+
+    script.write_text("echo R\n")
+    assert runner._run_query_script("worker0", str(script)) == "R\n"
+
+    # The output of a failed query is not parsed as a status
+    script.write_text("echo R\nexit 1\n")
+    with pytest.raises(subprocess.CalledProcessError):
+        runner._run_query_script("worker0", str(script))
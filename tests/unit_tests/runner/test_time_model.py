@@ -0,0 +1,161 @@
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.prune.pruner import Pruner
+from flagscale.runner.auto_tuner.search.algorithm import GridAlgo
+from flagscale.runner.auto_tuner.search.searcher import Searcher
+from flagscale.runner.auto_tuner.time_model import (
+    StepTimeModel,
+    device_profile,
+    estimator_flops,
+    layer_params,
+    rank_strategies,
+)
+from flagscale.runner.auto_tuner.utils import StrategyHistory
+
+
+def _config(nnodes=2, time_model=None, space=None):
+    return OmegaConf.create(
+        {
+            "train": {
+                "model": {
+                    "num_layers": 32,
+                    "global_batch_size": 512,
+                    "hidden_size": 4096,
+                    "num_attention_heads": 32,
+                    "seq_length": 4096,
+                    "swiglu": True,
+                    "ffn_hidden_size": 11008,
+                    "padded_vocab_size": 32000,
+                },
+                "system": {},
+            },
+            "experiment": {
+                "auto_tuner": {
+                    "nnodes": nnodes,
+                    "nproc_per_node": 8,
+                    "cards": nnodes * 8,
+                    "platform": {},
+                    "space": space
+                    or {
+                        "micro_batch_size": [1, 2, 4],
+                        "context_parallel_size": [1],
+                        "expert_model_parallel_size": [1],
+                    },
+                    "time_model": time_model or {"flops": "estimator"},
+                }
+            },
+        }
+    )
+
+
+def _strategy(tp=1, pp=1, dp=16, mbs=1, **kwargs):
+    strategy = dict(
+        tensor_model_parallel_size=tp,
+        pipeline_model_parallel_size=pp,
+        data_parallel_size=dp,
+        context_parallel_size=1,
+        expert_model_parallel_size=1,
+        micro_batch_size=mbs,
+        num_layers_per_virtual_pipeline_stage=None,
+        sequence_parallel=False,
+        use_distributed_optimizer=False,
+        use_recompute=False,
+        recompute_method=None,
+        recompute_granularity=None,
+        recompute_num_layers=None,
+    )
+    strategy.update(kwargs)
+    return strategy
+
+
+class TestStepTimeModel:
+    """The step time model ranks strategies by their compute and communication"""
+
+    def test_estimator_flops(self):
+        config = _config()
+        layer, head = estimator_flops(config)
+        s, h = 4096, 4096
+
+        assert layer_params(config) == 4 * h * h + 3 * h * 11008
+        # 2 FLOPs per parameter and token and the attention scores, forward and backward
+        expected = 3 * (2 * s * layer_params(config) + 4 * s * s * h)
+        assert layer == pytest.approx(expected, rel=1e-3)
+        assert head == pytest.approx(3 * 2 * s * h * 32000, rel=1e-3)
+
+    def test_device_profile(self):
+        assert device_profile(_config())["peak_tflops"] == 312
+        profile = device_profile(_config(time_model={"device": "H100", "efficiency": 0.3}))
+        assert profile["peak_tflops"] == 989 and profile["efficiency"] == 0.3
+        with pytest.raises(ValueError):
+            device_profile(_config(time_model={"device": "TPU"}))
+
+    def test_overheads(self):
+        time_model = StepTimeModel(_config())
+        base = time_model.estimate(_strategy())
+
+        assert base["pp_bubble"] == 0 and base["tp_comm"] == 0
+        assert base["total"] == pytest.approx(sum(v for k, v in base.items() if k != "total"))
+        # Pipeline bubbles shrink with more micro batches and virtual stages
+        pp = time_model.estimate(_strategy(pp=4, dp=4, mbs=4))
+        assert pp["pp_bubble"] > time_model.estimate(_strategy(pp=4, dp=4))["pp_bubble"]
+        vpp = time_model.estimate(
+            _strategy(pp=4, dp=4, mbs=4, num_layers_per_virtual_pipeline_stage=2)
+        )
+        assert vpp["pp_bubble"] == pytest.approx(pp["pp_bubble"] / 4, rel=0.01)
+        # Tensor parallel across nodes is much slower than within a node
+        assert time_model(_strategy(tp=16, dp=1)) > 2 * time_model(_strategy(tp=8, dp=2))
+        # Full recompute repeats a third of the compute
+        recompute = time_model.estimate(_strategy(use_recompute=True, recompute_granularity="full"))
+        assert recompute["recompute"] == pytest.approx(base["compute"] / 3, rel=0.05)
+        selective = time_model.estimate(
+            _strategy(use_recompute=True, recompute_granularity="selective")
+        )
+        assert 0 < selective["recompute"] < recompute["recompute"] / 2
+
+    def test_gradient_overlap(self):
+        strategy = _strategy()
+        exposed = StepTimeModel(_config()).estimate(strategy)["dp_comm"]
+        config = _config()
+        config.train.system.overlap_grad_reduce = True
+
+        assert StepTimeModel(config).estimate(strategy)["dp_comm"] == pytest.approx(exposed * 0.2)
+
+    def test_rank_strategies(self):
+        config = _config()
+        ranked = rank_strategies(Searcher(config).strategies, config, top=5)
+
+        assert len(ranked) == 5
+        totals = [estimate["total"] for _, estimate in ranked]
+        assert totals == sorted(totals)
+
+
+class TestTimeModelSearch:
+    """The search sorts by the estimated step time and prunes much slower strategies"""
+
+    def test_grid_sorts_by_time_model(self):
+        config = _config(time_model={"flops": "estimator"})
+        config.experiment.auto_tuner.algo = {"name": "grid", "window": 10000}
+        searcher = Searcher(config)
+        assert isinstance(searcher.algo, GridAlgo)
+
+        times = []
+        while not searcher.algo.has_done():
+            times.append(searcher.algo.search()["time_model"])
+        assert times == sorted(times)
+
+    def test_prune_by_time_model(self):
+        config = _config(time_model={"flops": "estimator", "prune_ratio": 1.5})
+        pruner = Pruner(config)
+        history = StrategyHistory()
+        fast = _strategy(time_model=10.0)
+        slow = _strategy(pp=2, dp=8, time_model=16.0)
+
+        assert not pruner.prune(dict(slow), history)
+        assert not pruner.prune(fast, history)
+        fast["performance"] = 12000.0
+        assert pruner.prune(slow, history)
+        assert slow["pruned"] and pruner.pruned_by_time_model == 1
+        assert not pruner.prune(_strategy(pp=4, dp=4, time_model=14.0), history)
+        assert history.trials()[-1]["time_model"] == 14.0
@@ -0,0 +1,153 @@
+import math
+
+from unittest.mock import MagicMock
+
+import pytest
+
+import flagscale.runner.train_metrics as train_metrics
+
+from flagscale.runner.train_metrics import (
+    TrainingMetricsParser,
+    load_metrics,
+    metrics_file,
+    parse_metrics_file,
+)
+
+ITERATION_LINE = (
+    "[default7]: [2025-09-11 01:53:17] iteration {it:8d}/     100 | consumed samples:"
+    "          640 | elapsed time per iteration (ms): {ms:.1f} | throughput per GPU"
+    " (TFLOP/s/GPU): 123.4 | learning rate: 1.000000E-04 | global batch size:    64 |"
+    " lm loss: 2.500000E+00 | loss scale: 1.0 | grad norm: 1.234 | number of skipped"
+    " iterations:   0 | number of nan iterations:   0 |\n"
+)
+MEMORY_LINE = (
+    "[Rank {rank}] (after {it} iterations) memory (MB) | allocated: 100.0 | max allocated:"
+    " {alloc} | reserved: 300.0 | max reserved: {reserved}\n"
+)
+
+
+class TestTrainingMetricsParser:
+    """Test cases for the streaming training_log parser"""
+
+    def test_parse_iteration(self):
+        parser = TrainingMetricsParser()
+        parser.feed(ITERATION_LINE.format(it=10, ms=1500.0))
+        arrays = parser.to_arrays()
+
+        assert arrays["iteration"].tolist() == [10]
+        assert arrays["elapsed_ms"][0] == 1500.0
+        assert arrays["throughput"][0] == 123.4
+        assert arrays["loss"][0] == 2.5
+        assert arrays["grad_norm"][0] == 1.234
+        assert math.isnan(arrays["max_reserved_mb"][0])
+
+    def test_memory_merged_over_ranks(self):
+        parser = TrainingMetricsParser()
+        parser.feed(ITERATION_LINE.format(it=10, ms=1500.0))
+        parser.feed(MEMORY_LINE.format(rank=0, it=10, alloc=200.0, reserved=400.0))
+        parser.feed(MEMORY_LINE.format(rank=1, it=10, alloc=250.0, reserved=350.0))
+        arrays = parser.to_arrays()
+
+        assert len(parser) == 1
+        assert arrays["max_allocated_mb"][0] == 250.0
+        assert arrays["max_reserved_mb"][0] == 400.0
+
+    def test_partial_lines(self):
+        parser = TrainingMetricsParser()
+        line = ITERATION_LINE.format(it=1, ms=99.0)
+        parser.feed(line[:40])
+        assert len(parser) == 0
+        parser.feed(line[40:])
+
+        assert parser.to_arrays()["elapsed_ms"].tolist() == [99.0]
+
+    @pytest.mark.parametrize("use_arrow", [True, False])
+    def test_save_and_load(self, tmp_path, monkeypatch, use_arrow):
+        if not use_arrow:
+            monkeypatch.setattr(train_metrics, "pa", None)
+        elif train_metrics.pa is None:
+            pytest.skip("pyarrow is not installed")
+        parser = TrainingMetricsParser()
+        parser.feed(ITERATION_LINE.format(it=1, ms=10.0) + ITERATION_LINE.format(it=2, ms=20.0))
+        path = metrics_file(str(tmp_path))
+        parser.save(path)
+        # The last row waits for the memory reports of the other ranks
+        assert parser.dirty
+        assert load_metrics(path)["iteration"].tolist() == [1]
+        parser.feed(MEMORY_LINE.format(rank=0, it=2, alloc=200.0, reserved=400.0))
+        parser.feed(ITERATION_LINE.format(it=3, ms=30.0))
+        parser.save(path)
+        parser.save(path, final=True)
+
+        assert path.endswith(".arrow" if use_arrow else ".npz")
+        assert not parser.dirty
+        metrics = load_metrics(path)
+        assert metrics["iteration"].tolist() == [1, 2, 3]
+        assert metrics["elapsed_ms"].tolist() == [10.0, 20.0, 30.0]
+        assert metrics["max_reserved_mb"][1] == 400.0
+
+        # A new parser starts the file over
+        parser = TrainingMetricsParser()
+        parser.feed(ITERATION_LINE.format(it=1, ms=40.0))
+        parser.save(path, final=True)
+        assert load_metrics(path)["elapsed_ms"].tolist() == [40.0]
+
+    def test_truncated_append_and_file_format(self, tmp_path):
+        if train_metrics.pa is None:
+            pytest.skip("pyarrow is not installed")
+        parser = TrainingMetricsParser()
+        path = metrics_file(str(tmp_path))
+        for it in range(1, 4):
+            parser.feed(ITERATION_LINE.format(it=it, ms=10.0 * it))
+            parser.save(path, final=True)
+        with open(path, "r+b") as f:
+            f.truncate(f.seek(0, 2) - 8)
+        assert load_metrics(path)["iteration"].tolist() == [1, 2]
+
+        # Files written whole in the Arrow file format are still read
+        train_metrics.save_metrics(parser.to_arrays(), path)
+        assert load_metrics(path)["iteration"].tolist() == [1, 2, 3]
+
+    def test_max_rows(self, tmp_path):
+        parser = TrainingMetricsParser(max_rows=2)
+        for it in range(1, 5):
+            parser.feed(ITERATION_LINE.format(it=it, ms=10.0 * it))
+        assert parser.columns["iteration"] == [3, 4]
+        assert parser.total_rows == 4
+
+        # Once saving, only the saved rows are dropped
+        parser = TrainingMetricsParser(max_rows=2)
+        path = metrics_file(str(tmp_path))
+        for it in range(1, 5):
+            parser.feed(ITERATION_LINE.format(it=it, ms=10.0 * it))
+            if it == 1:
+                parser.save(path)
+        assert parser.columns["iteration"] == [1, 2, 3, 4]
+        parser.save(path)
+        assert parser.columns["iteration"] == [3, 4]
+        parser.save(path, final=True)
+        assert load_metrics(path)["iteration"].tolist() == [1, 2, 3, 4]
+        assert parser.total_rows == 4
+
+
+class TestRecorderMetrics:
+    """The tuner's recorder reads iteration time and memory through the parser"""
+
+    def test_grep_performance_and_memory(self, tmp_path):
+        pytest.importorskip("pandas")
+        from flagscale.runner.auto_tuner.record.recorder import Recorder
+
+        log = tmp_path / "host_0_localhost.output"
+        log.write_text(
+            ITERATION_LINE.format(it=1, ms=900.0)
+            + MEMORY_LINE.format(rank=0, it=1, alloc=200.0, reserved=512.0)
+            + ITERATION_LINE.format(it=2, ms=100.0)
+            + ITERATION_LINE.format(it=3, ms=200.0)
+        )
+        recorder = Recorder.__new__(Recorder)
+        recorder.logger = MagicMock()
+        recorder.cur_strategy = {"idx": 1}
+
+        assert recorder.grep_performance(str(log)) == 150.0
+        assert recorder.grep_max_memory(str(tmp_path)) == 512.0
+        assert parse_metrics_file(str(log)).to_arrays()["iteration"].tolist() == [1, 2, 3]
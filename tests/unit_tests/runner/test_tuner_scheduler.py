@@ -0,0 +1,153 @@
+from unittest.mock import patch
+
+import pytest
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.scheduler import TrialScheduler
+from flagscale.runner.auto_tuner.tuner import AutoTuner
+from flagscale.runner.runner_base import JobStatus
+from flagscale.runner.utils import parse_hostfile
+
+
+def _config(tmp_path, num_hosts=4, parallel_trials=4):
+    hostfile = tmp_path / "hostfile"
+    hostfile.write_text("".join(f"node{i} slots=8\n" for i in range(num_hosts)))
+    return OmegaConf.create(
+        {
+            "train": {
+                "model": {
+                    "num_layers": 8,
+                    "global_batch_size": 32,
+                    "hidden_size": 1024,
+                    "num_attention_heads": 8,
+                    "seq_length": 1024,
+                    "optimizer": {"lr_scheduler": {}},
+                },
+                "system": {"logging": {}},
+            },
+            "experiment": {
+                "exp_dir": str(tmp_path / "outputs"),
+                "task": {"type": "train"},
+                "runner": {"nnodes": 1, "nproc_per_node": 8, "hostfile": str(hostfile)},
+                "auto_tuner": {
+                    "space": {
+                        "data_parallel_size": "auto",
+                        "use_distributed_optimizer": [False],
+                        "tensor_model_parallel_size": [1, 2, 4],
+                        "sequence_parallel": [False],
+                        "pipeline_model_parallel_size": [1, 2],
+                        "context_parallel_size": [1],
+                        "expert_model_parallel_size": [1],
+                        "micro_batch_size": [1, 2],
+                        "use_recompute": [False],
+                    },
+                    "control": {
+                        "interval": 0,
+                        "run_best": False,
+                        "parallel_trials": parallel_trials,
+                    },
+                },
+            },
+        }
+    )
+
+
+class _FakeRunner:
+    """A job that runs for two status queries on the hosts of its hostfile."""
+
+    running = []
+    launched = []
+    max_running = 0
+
+    def __init__(self, config):
+        self.config = config
+        self.hosts = list(parse_hostfile(config.experiment.runner.hostfile))
+        self.polls = 0
+
+    def run(self):
+        for runner in _FakeRunner.running:
+            assert not set(runner.hosts) & set(self.hosts)
+        _FakeRunner.running.append(self)
+        _FakeRunner.launched.append(self)
+        self.running_at_start = len(_FakeRunner.running)
+        _FakeRunner.max_running = max(_FakeRunner.max_running, len(_FakeRunner.running))
+
+    def _query_status(self):
+        self.polls += 1
+        if self.polls > 2:
+            self.stop()
+            return JobStatus.COMPLETED_OR_IDLE
+        return JobStatus.RUNNING
+
+    def _query_sub_process_status(self):
+        return True
+
+    def stop(self):
+        if self in _FakeRunner.running:
+            _FakeRunner.running.remove(self)
+
+
+def _record(task, strategy):
+    strategy["performance"] = 100.0 * strategy["tensor_model_parallel_size"]
+    strategy["max_mem"] = 1000
+    strategy["error"] = None
+
+
+@pytest.fixture
+def fake_runner():
+    _FakeRunner.running, _FakeRunner.launched, _FakeRunner.max_running = [], [], 0
+    with patch("flagscale.runner.auto_tuner.tuner.SSHTrainRunner", _FakeRunner):
+        yield _FakeRunner
+
+
+class TestTrialScheduler:
+    """Tuning tasks run side by side on disjoint slices of the hostfile"""
+
+    def test_allocate_and_release(self, tmp_path):
+        config = _config(tmp_path, num_hosts=5)
+        config.experiment.auto_tuner.nnodes = 2
+        config.experiment.auto_tuner.control = {"parallel_trials": 4}
+        scheduler = TrialScheduler(config)
+
+        assert scheduler.slots == 2
+        first, second = scheduler.allocate(), scheduler.allocate()
+        assert first == ["node0", "node1"] and second == ["node2", "node3"]
+        assert scheduler.allocate() is None
+        scheduler.release(first)
+        assert scheduler.allocate() == first
+
+    def test_place(self, tmp_path):
+        config = _config(tmp_path)
+        config.experiment.auto_tuner.nnodes = 1
+        task = OmegaConf.create({"experiment": {"exp_dir": str(tmp_path / "task_1"), "runner": {}}})
+
+        placed = TrialScheduler(config).place(task, ["node2"])
+
+        assert placed.experiment.runner.nnodes == 1
+        assert list(parse_hostfile(placed.experiment.runner.hostfile)) == ["node2"]
+        assert "hostfile" not in task.experiment.runner
+
+    def test_tune_in_parallel(self, tmp_path, fake_runner):
+        tuner = AutoTuner(_config(tmp_path))
+        tuner.recorder.record = _record
+        tuner.tune()
+
+        assert fake_runner.max_running == 4
+        # The first task runs alone to build the data cache
+        assert [runner.running_at_start for runner in fake_runner.launched[:2]] == [1, 1]
+        trials = [s for s in tuner.history if not s.get("pruned", False)]
+        assert len(trials) == len(fake_runner.launched) == tuner.idx > 4
+        assert all(s["performance"] and "elapsed_time" in s for s in trials)
+        assert tuner.get_best()["tensor_model_parallel_size"] == 1
+        assert not fake_runner.running
+
+    def test_sequential_without_parallel_trials(self, tmp_path, fake_runner):
+        tuner = AutoTuner(_config(tmp_path, parallel_trials=1))
+        tuner.recorder.record = _record
+        with patch("flagscale.runner.auto_tuner.tuner.time.sleep"):
+            tuner.tune()
+
+        assert tuner.scheduler is None
+        assert fake_runner.max_running == 1
+        assert len(fake_runner.launched) == tuner.idx > 1
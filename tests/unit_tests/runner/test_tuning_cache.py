@@ -0,0 +1,144 @@
+from unittest.mock import patch
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.record.cache import TuningCache, model_shape
+from flagscale.runner.auto_tuner.search.algorithm import BayesianAlgo
+from flagscale.runner.auto_tuner.search.searcher import Searcher
+from flagscale.runner.auto_tuner.tuner import AutoTuner
+from flagscale.runner.auto_tuner.utils import strategy_key
+from flagscale.runner.runner_base import JobStatus
+
+
+def _config(tmp_path, **model):
+    return OmegaConf.create(
+        {
+            "train": {
+                "model": {
+                    "num_layers": 8,
+                    "global_batch_size": 32,
+                    "hidden_size": 1024,
+                    "num_attention_heads": 8,
+                    "seq_length": 1024,
+                    "optimizer": {"lr_scheduler": {}},
+                    **model,
+                },
+                "system": {"logging": {}, "precision": {"bf16": True}},
+            },
+            "experiment": {
+                "exp_dir": str(tmp_path / "outputs"),
+                "task": {"type": "train"},
+                "runner": {"nnodes": 1, "nproc_per_node": 8},
+                "auto_tuner": {
+                    "space": {
+                        "data_parallel_size": "auto",
+                        "use_distributed_optimizer": [False],
+                        "tensor_model_parallel_size": [1, 2, 4],
+                        "sequence_parallel": [False],
+                        "pipeline_model_parallel_size": [1, 2],
+                        "context_parallel_size": [1],
+                        "expert_model_parallel_size": [1],
+                        "micro_batch_size": [1, 2],
+                        "use_recompute": [False],
+                    },
+                    "control": {"interval": 0, "run_best": False},
+                    "cache": {"path": str(tmp_path / "cache.db"), "hardware": "A100"},
+                },
+            },
+        }
+    )
+
+
+def _prepared(config):
+    """Fill in the keys the tuner derives from the runner config."""
+    config.experiment.auto_tuner.update(nnodes=1, nproc_per_node=8, cards=8, platform={})
+    return config
+
+
+def _result(strategy, performance=100.0):
+    return dict(strategy, performance=performance, max_mem=1000, error=None)
+
+
+class _FakeRunner:
+    launched = 0
+
+    def __init__(self, config):
+        pass
+
+    def run(self):
+        _FakeRunner.launched += 1
+
+    def _query_status(self):
+        return JobStatus.COMPLETED_OR_IDLE
+
+    def stop(self):
+        pass
+
+
+def _record(task, strategy):
+    strategy["performance"] = 100.0 * strategy["tensor_model_parallel_size"]
+    strategy["max_mem"] = 1000
+    strategy["error"] = None
+
+
+def _tune(config):
+    _FakeRunner.launched = 0
+    with patch("flagscale.runner.auto_tuner.tuner.SSHTrainRunner", _FakeRunner), patch(
+        "flagscale.runner.auto_tuner.tuner.time.sleep"
+    ):
+        tuner = AutoTuner(config)
+        tuner.recorder.record = _record
+        tuner.tune()
+    return tuner, _FakeRunner.launched
+
+
+class TestTuningCache:
+    """Tuning results are reused by later runs with the same signature"""
+
+    def test_normalized_model_shape(self, tmp_path):
+        implicit = _config(tmp_path)
+        explicit = _config(tmp_path, ffn_hidden_size=4096, num_query_groups=8, swiglu=False)
+
+        assert model_shape(implicit) == model_shape(explicit)
+        assert model_shape(implicit)["precision"] == "bf16"
+        assert model_shape(_config(tmp_path, swiglu=True))["ffn_hidden_size"] == 2688
+
+    def test_put_and_load(self, tmp_path):
+        config = _prepared(_config(tmp_path))
+        strategy = next(iter(Searcher(config).strategies))
+        cache = TuningCache(config, "elapsed")
+        cache.put(_result(strategy))
+        cache.put(dict(_result(strategy), pruned=True, micro_batch_size=8))
+        cache.put(dict(strategy, performance=None, max_mem=None))
+
+        results = list(TuningCache(config, "elapsed").load().values())
+        assert len(results) == 1
+        assert results[0]["cached"] and results[0]["performance"] == 100.0
+        assert results[0]["decoder_first_pipeline_num_layers"] is None
+        config.experiment.auto_tuner.cache.hardware = "H100"
+        assert not TuningCache(config, "elapsed").load()
+        assert not TuningCache(_prepared(_config(tmp_path)), "throughput").load()
+
+    def test_bayesian_warm_start(self, tmp_path):
+        config = _prepared(_config(tmp_path))
+        strategies = list(Searcher(config).strategies)
+        cache = TuningCache(config, "elapsed")
+        cache.put(_result(strategies[0]))
+        config.experiment.auto_tuner.algo = {"name": "bayes", "max_trials": 1}
+        algo = BayesianAlgo(strategies, config)
+        algo.warm_start(cache.load())
+
+        assert strategies[0]["cached"]
+        assert algo._observations()[0].tolist() == [0]
+        assert algo.search() is not strategies[0]
+        assert algo.has_done()
+
+    def test_second_run_reuses_results(self, tmp_path):
+        first, launched = _tune(_config(tmp_path))
+        assert launched == first.idx > 1
+
+        second, launched = _tune(_config(tmp_path))
+        assert launched == 0
+        assert second.get_best()["cached"]
+        assert strategy_key(second.get_best()) == strategy_key(first.get_best())
+        assert second.get_best()["performance"] == first.get_best()["performance"]
@@ -0,0 +1,207 @@
+import asyncio
+import gc
+
+import pytest
+
+from flagscale.serve.admission import AdmissionController, Rejected, Reservation, parse_timeout
+
+
+class _Capacity:
+    def __init__(self, slots):
+        self.slots = slots
+        self.issued = 0
+
+    def try_acquire(self):
+        if self.slots == 0:
+            return None
+        self.slots -= 1
+        self.issued += 1
+        return self.issued
+
+    def release(self, ticket=None):
+        self.slots += 1
+
+
+def _controller():
+    return AdmissionController(
+        {"interactive": {"queue_size": 2, "max_wait": 5}, "batch": {"queue_size": 2}}
+    )
+
+
+def test_admit_immediately_with_capacity():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(1)
+        ticket = await controller.admit("batch", capacity.try_acquire, capacity.release)
+        return ticket, controller.stats()
+
+    ticket, stats = asyncio.run(run())
+    assert ticket == 1
+    assert stats["admitted"] == 1
+    assert stats["queued"] == {"interactive": 0, "batch": 0}
+
+
+def test_priority_before_arrival_order():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(0)
+        order = []
+
+        async def request(priority):
+            await controller.admit(priority, capacity.try_acquire, capacity.release)
+            order.append(priority)
+
+        tasks = [asyncio.ensure_future(request("batch"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("interactive")))
+        await asyncio.sleep(0)
+        # An unknown priority falls back to the default class, interactive
+        tasks.append(asyncio.ensure_future(request("urgent")))
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == {"interactive": 2, "batch": 1}
+        for _ in range(3):
+            capacity.release()
+            controller.dispatch()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "urgent", "batch"]
+
+
+def test_earliest_deadline_first_within_class():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(0)
+        order = []
+
+        async def request(name, timeout):
+            await controller.admit(
+                "interactive", capacity.try_acquire, capacity.release, timeout=timeout
+            )
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(request("late", None))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("soon", 1)))
+        await asyncio.sleep(0)
+        for _ in range(2):
+            capacity.release()
+            controller.dispatch()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["soon", "late"]
+
+
+def test_full_queue_rejected_with_429():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(0)
+        waiting = [
+            asyncio.ensure_future(controller.admit("batch", capacity.try_acquire, capacity.release))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as e:
+            await controller.admit("batch", capacity.try_acquire, capacity.release)
+        # The other class has its own queue
+        interactive = asyncio.ensure_future(
+            controller.admit("interactive", capacity.try_acquire, capacity.release)
+        )
+        await asyncio.sleep(0)
+        queued = controller.stats()["queued"]
+        for task in waiting + [interactive]:
+            task.cancel()
+        await asyncio.gather(*waiting, interactive, return_exceptions=True)
+        return e.value, queued, controller.stats()
+
+    rejected, queued, stats = asyncio.run(run())
+    assert rejected.status == 429
+    assert rejected.retry_after >= 1
+    assert queued == {"interactive": 1, "batch": 2}
+    assert stats["queued"] == {"interactive": 0, "batch": 0}
+    assert stats["rejected"]["queue_full"] == 1
+
+
+def test_deadline_rejected_with_503():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(0)
+        with pytest.raises(Rejected) as e:
+            await controller.admit(
+                "interactive", capacity.try_acquire, capacity.release, timeout=0.01
+            )
+        return e.value, controller.stats()
+
+    rejected, stats = asyncio.run(run())
+    assert rejected.status == 503
+    assert stats["rejected"]["deadline"] == 1
+    assert stats["queued"]["interactive"] == 0
+
+
+def test_abandoned_ticket_released():
+    async def run():
+        controller = _controller()
+        capacity = _Capacity(0)
+        released = []
+        task = asyncio.ensure_future(
+            controller.admit("interactive", capacity.try_acquire, released.append)
+        )
+        await asyncio.sleep(0)
+        capacity.release()
+        # Admitted and cancelled before the waiter resumes
+        controller.dispatch()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return released
+
+    assert asyncio.run(run()) == [1]
+
+
+def test_unknown_default_class():
+    with pytest.raises(ValueError):
+        AdmissionController({"batch": {}}, default_class="interactive")
+
+
+def test_parse_timeout():
+    assert parse_timeout(None) is None
+    assert parse_timeout("2.5") == 2.5
+    for value in ["soon", "", "-1", "nan", "inf"]:
+        with pytest.raises(ValueError):
+            parse_timeout(value)
+
+
+def test_reservation_released_once():
+    async def run():
+        released = []
+        reservation = Reservation(lambda: released.append(1))
+        reservation.release()
+        reservation.release()
+        return released, reservation.released
+
+    assert asyncio.run(run()) == ([1], True)
+
+
+def test_reservation_of_unstarted_stream_released():
+    async def run():
+        released = []
+        reservation = Reservation(lambda: released.append(1))
+
+        async def stream():
+            try:
+                yield b"chunk"
+            finally:
+                reservation.release()
+
+        # The server drops the response before iterating it, the finally never runs
+        body = stream()
+        del reservation, stream
+        await body.aclose()
+        del body
+        gc.collect()
+        await asyncio.sleep(0)
+        return released
+
+    assert asyncio.run(run()) == [1]
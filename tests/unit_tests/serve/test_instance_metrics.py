@@ -0,0 +1,61 @@
+import pytest
+
+from flagscale.serve.instance_metrics import TokenRate, compute_ratios, parse_vllm_metrics
+
+_METRICS = """# HELP vllm:num_requests_running Number of requests in model execution batches.
+# TYPE vllm:num_requests_running gauge
+vllm:num_requests_running{engine="0",model_name="qwen"} 3.0
+vllm:num_requests_running{engine="1",model_name="qwen"} 2.0
+vllm:num_requests_waiting{engine="0",model_name="qwen"} 4.0
+vllm:kv_cache_usage_perc{engine="0",model_name="qwen"} 0.25
+vllm:kv_cache_usage_perc{engine="1",model_name="qwen"} 0.5
+# TYPE vllm:prompt_tokens_total counter
+vllm:prompt_tokens_total{engine="0",model_name="qwen"} 1200.0
+vllm:generation_tokens_total{engine="0",model_name="qwen"} 300.0
+vllm:generation_tokens_created{engine="0",model_name="qwen"} 1.7e+09
+process_open_fds 21.0
+"""
+
+
+def test_parse_vllm_metrics():
+    metrics = parse_vllm_metrics(_METRICS)
+    assert metrics == {
+        "running": 5.0,
+        "waiting": 4.0,
+        "kv_usage": 0.5,
+        "prompt_tokens": 1200.0,
+        "generation_tokens": 300.0,
+    }
+
+
+def test_parse_vllm_metrics_legacy_names():
+    text = 'vllm:gpu_cache_usage_perc{model_name="qwen"} 0.75\nvllm:num_requests_waiting 1\n'
+    assert parse_vllm_metrics(text) == {"kv_usage": 0.75, "waiting": 1.0}
+
+
+def test_token_rate_only_busy_intervals():
+    rate = TokenRate(alpha=0.5)
+    rate.update(0, now=0.0, busy=True)
+    assert rate.rate is None
+    rate.update(100, now=1.0, busy=True)
+    assert rate.rate == pytest.approx(100)
+    # An idle interval does not lower the rate
+    rate.update(110, now=2.0, busy=False)
+    assert rate.rate == pytest.approx(100)
+    rate.update(310, now=3.0, busy=True)
+    assert rate.rate == pytest.approx(150)
+    # A restarted instance resets its counter
+    rate.update(10, now=4.0, busy=True)
+    assert rate.rate == pytest.approx(150)
+    rate.update(60, now=5.0, busy=True)
+    assert rate.rate == pytest.approx(100)
+
+
+def test_compute_ratios():
+    assert compute_ratios({"a": None, "b": None}) == {"a": 1.0, "b": 1.0}
+    ratios = compute_ratios({"a": 300.0, "b": 100.0, "c": None})
+    assert ratios["a"] == pytest.approx(1.5)
+    assert ratios["b"] == pytest.approx(0.5)
+    assert ratios["c"] == 1.0
+    ratios = compute_ratios({"a": 1000.0, "b": 1.0}, low=0.1, high=10.0)
+    assert ratios["b"] == pytest.approx(0.1)
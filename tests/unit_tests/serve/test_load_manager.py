@@ -0,0 +1,87 @@
+import pytest
+
+from flagscale.serve.load_manager import LoadManager
+
+
+def _manager(**kwargs):
+    lm = LoadManager(**kwargs)
+    lm.register("P", "p0:8000", "p0:9000")
+    lm.register("D", "d0:8000", "d0:9000")
+    return lm
+
+
+def _load(lm, rtype, http_addr):
+    info = lm.status()[rtype][http_addr]
+    return info["load_num"], info["load_len"]
+
+
+def _release(lm, ticket, tokens):
+    (prefill_addr, _, prefill_generation), (decode_addr, _, decode_generation) = ticket
+    lm.decrement_load("P", prefill_addr, tokens, prefill_generation)
+    lm.decrement_load("D", decode_addr, tokens, decode_generation)
+
+
+def test_acquire_and_release():
+    lm = _manager()
+    ticket = lm.acquire("slo", 100)
+
+    assert [item[:2] for item in ticket] == [("p0:8000", "p0:9000"), ("d0:8000", "d0:9000")]
+    assert _load(lm, "P", "p0:8000") == (1, 100)
+    assert _load(lm, "D", "d0:8000") == (1, 100)
+    _release(lm, ticket, 100)
+    assert _load(lm, "P", "p0:8000") == (0, 0)
+    assert _load(lm, "D", "d0:8000") == (0, 0)
+
+
+def test_acquire_waits_for_token_room():
+    lm = _manager(max_decode_tokens=150)
+    first = lm.acquire("slo", 100)
+
+    assert lm.acquire("slo", 100) is None
+    # A request fits an idle instance whatever its length
+    _release(lm, first, 100)
+    assert lm.acquire("slo", 1000) is not None
+
+
+def test_release_after_expiry():
+    lm = _manager()
+    ticket = lm.acquire("robin", 10)
+
+    assert sorted(lm.expire(ttl=-1)) == [("D", "d0:8000"), ("P", "p0:8000")]
+    _release(lm, ticket, 10)
+    assert lm.status() == {"P": {}, "D": {}}
+
+
+def test_release_after_reregistration():
+    lm = _manager()
+    stale = lm.acquire("slo", 10)
+    lm.expire(ttl=-1)
+    lm.register("P", "p0:8000", "p0:9000")
+    lm.register("D", "d0:8000", "d0:9000")
+    fresh = lm.acquire("slo", 20)
+
+    # The request of the expired registration does not release the new load
+    _release(lm, stale, 10)
+    assert _load(lm, "P", "p0:8000") == (1, 20)
+    assert _load(lm, "D", "d0:8000") == (1, 20)
+    _release(lm, fresh, 20)
+    assert _load(lm, "P", "p0:8000") == (0, 0)
+    assert _load(lm, "D", "d0:8000") == (0, 0)
+
+
+def test_unhealthy_instance_skipped():
+    lm = _manager(max_failures=1)
+    lm.register("D", "d1:8000", "d1:9000")
+    lm.update_metrics("D", "d0:8000", None, now=0.0)
+
+    for _ in range(3):
+        assert lm.acquire("robin", 10)[1][0] == "d1:8000"
+    assert not lm.status()["D"]["d0:8000"]["healthy"]
+
+
+def test_no_instance_registered():
+    lm = LoadManager()
+
+    assert lm.acquire("slo", 10) is None
+    with pytest.raises(ValueError):
+        lm.get_loaded("D", "slo", 10)
@@ -0,0 +1,45 @@
+from flagscale.serve.prefix_cache import PrefixCacheIndex
+
+
+def _prompt(system, question, system_len=64, question_len=20):
+    return [system] * system_len + [question + i for i in range(question_len)]
+
+
+class TestPrefixCacheIndex:
+    """The index tracks the prompt prefix blocks routed to each instance"""
+
+    def test_block_hashes(self):
+        index = PrefixCacheIndex(block_size=16)
+        first = index.block_hashes(_prompt(1, 100))
+        second = index.block_hashes(_prompt(1, 200))
+
+        # 84 tokens make 5 full blocks, the 4 blocks of the system prompt are shared
+        assert len(first) == 5
+        assert first[:4] == second[:4] and first[4] != second[4]
+        # A block matches only after the same prefix
+        assert index.block_hashes([7] * 32)[1] != index.block_hashes([8] * 16 + [7] * 16)[1]
+        assert index.block_hashes([1] * 15) == []
+
+    def test_match(self):
+        index = PrefixCacheIndex(block_size=16)
+        index.insert("p0", index.block_hashes(_prompt(1, 100)))
+
+        assert index.match("p0", index.block_hashes(_prompt(1, 200))) == 4
+        assert index.match("p0", index.block_hashes(_prompt(1, 100))) == 5
+        assert index.match("p0", index.block_hashes(_prompt(2, 100))) == 0
+        assert index.match("p1", index.block_hashes(_prompt(1, 100))) == 0
+        index.remove("p0")
+        assert index.match("p0", index.block_hashes(_prompt(1, 100))) == 0
+
+    def test_lru_eviction(self):
+        index = PrefixCacheIndex(block_size=16, max_blocks=6)
+        old = index.block_hashes(_prompt(1, 100))
+        index.insert("p0", old)
+        index.insert("p0", index.block_hashes(_prompt(2, 100, system_len=32, question_len=16)))
+
+        assert index.size("p0") == 6
+        # The tail of the old prompt is evicted first, its head still matches
+        assert index.match("p0", old) == 3
+        # Routing a prompt again refreshes its blocks
+        index.insert("p0", old)
+        assert index.match("p0", old) == 5
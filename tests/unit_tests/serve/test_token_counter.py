@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from flagscale.serve.prefix_cache import PrefixCacheIndex
+from flagscale.serve.token_counter import TokenCounter
+
+
+class _Tokenizer:
+    """One token per word, slow like a long prompt"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def apply_chat_template(self, messages, add_generation_prompt, tokenize):
+        return " ".join(f"{m['role']}: {m['content']}" for m in messages)
+
+    def encode(self, text, add_special_tokens):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [hash(word) % 1000 for word in text.split()]
+
+
+def _messages(content):
+    return [{"role": "user", "content": [{"type": "text", "text": content}]}]
+
+
+class TestTokenCounter:
+    """Prompt tokens are counted in worker threads and cached"""
+
+    def test_off_event_loop(self):
+        tokenizer = _Tokenizer(delay=0.2)
+        counter = TokenCounter(lambda: tokenizer)
+        ticks = []
+
+        async def tick():
+            while len(ticks) < 10:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        async def run():
+            return (await asyncio.gather(counter.analyze(_messages("a b c")), tick()))[0]
+
+        assert asyncio.run(run()) == (4, None)
+        # The loop kept ticking while the tokenizer was busy
+        assert ticks[-1] - ticks[0] < 0.2
+
+    def test_cache(self):
+        tokenizer = _Tokenizer()
+        counter = TokenCounter(lambda: tokenizer, cache_size=2)
+        index = PrefixCacheIndex(block_size=2)
+
+        async def run():
+            results = [await counter.analyze(prompt="a b c d e") for _ in range(3)]
+            results.append(await counter.analyze(prompt="a b c d e", prefix_index=index))
+            results.append(await counter.analyze(prompt="a b c d e", prefix_index=index))
+            results.append(await counter.analyze(prompt="a b c d e"))
+            return results
+
+        results = asyncio.run(run())
+        assert [result[0] for result in results] == [5] * 6
+        assert results[3][1] == index.block_hashes(tokenizer.encode("a b c d e", False))
+        # Counted once, then once more for the block hashes
+        assert tokenizer.calls == 1 + 2
+        assert counter.stats()["cache_hits"] == 4
+
+        async def evict():
+            await counter.analyze(prompt="x")
+            await counter.analyze(prompt="y")
+            await counter.analyze(prompt="a b c d e")
+
+        asyncio.run(evict())
+        assert counter.stats()["cache_misses"] == 5
+
+    def test_estimate(self):
+        tokenizer = _Tokenizer()
+        counter = TokenCounter(lambda: tokenizer, mode="estimate", calibrate_every=4, max_error=0.1)
+
+        async def run(words, n):
+            counts = []
+            for i in range(n):
+                counts.append((await counter.analyze(prompt=" ".join(words(i))))[0])
+                # Requests arrive while the background calibrations run
+                await asyncio.sleep(0.01)
+            return counts
+
+        # Words of 3 letters and a space are 4 chars per token, the default ratio
+        counts = asyncio.run(run(lambda i: [f"a{i:02d}"] * 100, 8))
+        assert counts == [100] * 8
+        assert tokenizer.calls == 2
+        assert counter.estimate_error() == pytest.approx(0.0, abs=0.01)
+
+        # Longer words break the ratio, the prompts are counted exactly until it fits again
+        counts = asyncio.run(run(lambda i: [f"abcdefg{i:02d}"] * 100, 40))
+        assert counts[:5] == [250, 100, 100, 100, 100]
+        assert not counter.stats()["estimating"]
+        assert counter.chars_per_token == pytest.approx(10, rel=0.01)
+        with pytest.raises(ValueError):
+            TokenCounter(lambda: tokenizer, mode="guess")
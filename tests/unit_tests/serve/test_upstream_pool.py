@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+from flagscale.serve.upstream_pool import UpstreamPool
+
+
+async def _stream(request):
+    body = await request.json()
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for i in range(3):
+        await asyncio.sleep(0.01)
+        await response.write(f"data: {json.dumps({'i': i, 'n': body['n']})}\n\n".encode())
+    return response
+
+
+async def _fail(request):
+    return web.Response(status=500, text="overloaded")
+
+
+async def _with_upstream(run):
+    app = web.Application()
+    app.router.add_post("/v1/completions", _stream)
+    app.router.add_post("/v1/fail", _fail)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    upstream = f"127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    pool = UpstreamPool(limit=4)
+    try:
+        return await run(pool, upstream)
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+
+async def _collect(pool, upstream, path, n):
+    body = json.dumps({"n": n}).encode()
+    return [chunk async for chunk in pool.forward(upstream, path, body, {"X-Request-Id": "id"})]
+
+
+class TestUpstreamPool:
+    """The proxy forwards requests over pooled keep-alive connections"""
+
+    def test_pass_through_and_reuse(self):
+        async def run(pool, upstream):
+            chunks = [await _collect(pool, upstream, "/v1/completions", n) for n in range(5)]
+            return chunks, pool.stats()[upstream]
+
+        chunks, stats = asyncio.run(_with_upstream(run))
+
+        # The events arrive as they are sent, not buffered into one chunk
+        assert all(len(c) == 3 for c in chunks)
+        assert chunks[4][2] == b'data: {"i": 2, "n": 4}\n\n'
+        assert stats["requests"] == 5 and stats["errors"] == 0 and stats["in_flight"] == 0
+        assert stats["connections_created"] == 1 and stats["connections_reused"] == 4
+        assert stats["ttfb"]["mean_ms"] < stats["latency"]["mean_ms"]
+
+    def test_connection_limit(self):
+        async def run(pool, upstream):
+            await asyncio.gather(
+                *[_collect(pool, upstream, "/v1/completions", n) for n in range(16)]
+            )
+            return pool.stats()[upstream]
+
+        stats = asyncio.run(_with_upstream(run))
+        assert stats["requests"] == 16
+        assert stats["connections_created"] <= 4
+
+    def test_error_response(self):
+        async def run(pool, upstream):
+            return await _collect(pool, upstream, "/v1/fail", 0), pool.stats()[upstream]
+
+        chunks, stats = asyncio.run(_with_upstream(run))
+        assert chunks == [b"overloaded"]
+        assert stats["errors"] == 1 and stats["latency"]["mean_ms"] is None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+from omegaconf import OmegaConf
+
+from flagscale.runner.auto_tuner.search.searcher import Searcher
+from flagscale.runner.auto_tuner.time_model import DEVICE_PROFILES, rank_strategies
+
+_COLUMNS = [
+    ("tp", "tensor_model_parallel_size"),
+    ("pp", "pipeline_model_parallel_size"),
+    ("dp", "data_parallel_size"),
+    ("cp", "context_parallel_size"),
+    ("ep", "expert_model_parallel_size"),
+    ("mbs", "micro_batch_size"),
+    ("vpp_layers", "num_layers_per_virtual_pipeline_stage"),
+    ("sp", "sequence_parallel"),
+    ("distopt", "use_distributed_optimizer"),
+    ("recompute", "recompute_granularity"),
+]
+
+_PARTS = ["compute", "recompute", "tp_comm", "cp_comm", "pp_comm", "pp_bubble", "dp_comm"]
+
+
+def load_config(config_path, config_name, overrides):
+    """Compose the experiment config the way run.py does."""
+    from hydra import compose, initialize_config_dir
+
+    with initialize_config_dir(config_dir=os.path.abspath(config_path), version_base=None):
+        return compose(config_name=config_name, overrides=overrides)
+
+
+def prepare_config(config, device=None, flops=None):
+    """Fill in the auto tuner config like AutoTuner does and enable the time model."""
+    OmegaConf.set_struct(config, False)
+    if "auto_tuner" not in config.experiment:
+        config.experiment.auto_tuner = {}
+    auto_tuner_config = config.experiment.auto_tuner
+    auto_tuner_config.nnodes = config.experiment.runner.get("nnodes", 1)
+    auto_tuner_config.nproc_per_node = config.experiment.runner.get("nproc_per_node", 8)
+    auto_tuner_config.cards = auto_tuner_config.nnodes * auto_tuner_config.nproc_per_node
+    if "platform" not in auto_tuner_config:
+        auto_tuner_config.platform = {}
+    if not OmegaConf.is_config(auto_tuner_config.get("time_model", None)):
+        auto_tuner_config.time_model = {}
+    if device is not None:
+        auto_tuner_config.time_model.device = device
+    if flops is not None:
+        auto_tuner_config.time_model.flops = flops
+    return config
+
+
+def print_ranking(ranked):
+    header = [name for name, _ in _COLUMNS] + _PARTS + ["total"]
+    rows = []
+    for strategy, estimate in ranked:
+        row = [str(strategy.get(key)) for _, key in _COLUMNS]
+        row += [f"{estimate[part]:.3f}" for part in _PARTS + ["total"]]
+        rows.append(row)
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rank the strategies of an auto tuner search space by estimated step time"
+    )
+    parser.add_argument("--config-path", required=True, help="Directory of the experiment yaml")
+    parser.add_argument("--config-name", required=True, help="Name of the experiment yaml")
+    parser.add_argument(
+        "--device", choices=list(DEVICE_PROFILES.keys()), default=None, help="Device profile"
+    )
+    parser.add_argument(
+        "--flops",
+        choices=["auto", "megatron", "estimator"],
+        default=None,
+        help="Source of the FLOPs of the model",
+    )
+    parser.add_argument("--top", type=int, default=20, help="Number of strategies to print")
+    parser.add_argument("overrides", nargs="*", help="Hydra overrides of the config")
+    args = parser.parse_args()
+
+    config = prepare_config(
+        load_config(args.config_path, args.config_name, args.overrides), args.device, args.flops
+    )
+    strategies = Searcher(config).strategies
+    memory_config = config.experiment.auto_tuner.get("memory_model", None)
+    if memory_config is not None and "gpu_memory" in memory_config:
+        # Strategies out of memory cannot run however fast they would be
+        strategies = [
+            strategy
+            for strategy in strategies
+            if strategy["memory_model"] <= memory_config.gpu_memory
+        ]
+    ranked = rank_strategies(strategies, config, top=args.top)
+    print(f"Estimated seconds per iteration of the fastest {len(ranked)} strategies:")
+    print_ranking(ranked)
+
+
+if __name__ == "__main__":
+    main()
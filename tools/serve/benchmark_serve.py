@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+
+from flagscale.runner.utils import benchmark_sweep, dummy_random_input
+
+_COLUMNS = [
+    ("req/s", "request_rate"),
+    ("done", "completed"),
+    ("tok/s", "total_token_throughput"),
+    ("p99_ttft", "p99_ttft_ms"),
+    ("p99_tpot", "p99_tpot_ms"),
+    ("p99_itl", "p99_itl_ms"),
+    ("p99_e2el", "p99_e2el_ms"),
+]
+
+
+def parse_rates(rates):
+    """Parse comma separated request rates, inf sends all requests at once."""
+    return [float(rate) for rate in rates.split(",")]
+
+
+def print_curve(results):
+    header = [name for name, _ in _COLUMNS]
+    rows = []
+    for result in results:
+        row = []
+        for _, key in _COLUMNS:
+            value = result.get(key, None)
+            row.append(f"{value:.2f}" if isinstance(value, float) else str(value))
+        rows.append(row)
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the latencies of a served model versus the request rate"
+    )
+    parser.add_argument("--url", required=True, help="Base url of the service, e.g. host:port")
+    parser.add_argument("--model", required=True, help="Name of the served model")
+    parser.add_argument("--tokenizer", default=None, help="Tokenizer, the model by default")
+    parser.add_argument("--trust-remote-code", action="store_true")
+    parser.add_argument("--num-prompts", type=int, default=200)
+    parser.add_argument("--prefix-len", type=int, default=0)
+    parser.add_argument("--input-len", type=int, default=1024)
+    parser.add_argument("--output-len", type=int, default=1024)
+    parser.add_argument("--range-ratio", type=float, default=0.5)
+    parser.add_argument(
+        "--request-rates", type=parse_rates, default=[float("inf")], help="e.g. 1,2,4,inf"
+    )
+    parser.add_argument(
+        "--burstiness", type=float, default=1.0, help="1 for Poisson, <1 burstier arrivals"
+    )
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--warmup", type=float, default=0, help="Unmeasured seconds at start")
+    parser.add_argument("--cooldown", type=float, default=0, help="Unmeasured seconds at end")
+    parser.add_argument("--output", default=None, help="Json file of the results")
+    args = parser.parse_args()
+
+    from vllm.transformers_utils.tokenizer import get_tokenizer
+
+    tokenizer = get_tokenizer(
+        args.tokenizer or args.model,
+        tokenizer_mode="auto",
+        trust_remote_code=args.trust_remote_code,
+    )
+    # The same prompts at every request rate
+    input_requests = dummy_random_input(
+        tokenizer=tokenizer,
+        prefix_len=args.prefix_len,
+        input_len=args.input_len,
+        output_len=args.output_len,
+        num_prompts=args.num_prompts,
+        range_ratio=args.range_ratio,
+    )
+    url = args.url if "://" in args.url else f"http://{args.url}"
+    results = asyncio.run(
+        benchmark_sweep(
+            args.request_rates,
+            api_url=f"{url.rstrip('/')}/v1/chat/completions",
+            model=args.model,
+            tokenizer=tokenizer,
+            input_requests=input_requests,
+            selected_percentile_metrics=["ttft", "tpot", "itl", "e2el"],
+            selected_percentiles=[99.0],
+            max_concurrency=args.max_concurrency,
+            burstiness=args.burstiness,
+            warmup_s=args.warmup,
+            cooldown_s=args.cooldown,
+        )
+    )
+    print("Latencies (ms) versus the request rate:")
+    print_curve(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()